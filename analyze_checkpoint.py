@@ -3,23 +3,29 @@
 Analyze checkpoint file and generate remaining work distribution
 """
 
-import pickle
 import logging
+import argparse
 from dotenv import load_dotenv
 
 from src.s3_client import S3Client
+from src.caption_index import CaptionIndex
+from src.s3_inventory import InventoryManifest
+from src.file_manager import FileManager
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 def main():
+    parser = argparse.ArgumentParser(description="Analyze checkpoint and generate remaining work distribution")
+    parser.add_argument("--refresh", action="store_true", help="Pick up new images in the cached S3 inventory")
+    args = parser.parse_args()
+
     load_dotenv()
     
     try:
         # Load checkpoint
         logging.info("Loading checkpoint.pkl...")
-        with open('checkpoint.pkl', 'rb') as f:
-            processed_files = pickle.load(f)
+        processed_files = FileManager().load_checkpoint('checkpoint.pkl')
         
         print(f"📊 Checkpoint Analysis:")
         print(f"   Processed by coworker: {len(processed_files)} images")
@@ -37,7 +43,7 @@ def main():
         
         # Get all images from S3
         logging.info("Scanning S3 for all images...")
-        all_images = s3_client.list_all_images()
+        all_images = InventoryManifest.load_or_build(s3_client, refresh=args.refresh).image_keys()
         
         # Find remaining images to process
         remaining_images = []
@@ -68,7 +74,8 @@ def main():
         workers = input(f"\nHow many workers do you want to split the remaining {len(remaining_images)} images? (default: 4): ")
         workers = int(workers) if workers.strip() else 4
         
-        work_chunks = s3_client.generate_work_distribution(remaining_images, workers)
+        caption_index = CaptionIndex.load_or_build(s3_client)
+        work_chunks = s3_client.generate_work_distribution(remaining_images, workers, caption_index)
         distribution_files = s3_client.save_work_distribution_files(work_chunks, "./work_distribution_remaining")
         
         print(f"\n✅ Generated work distribution for remaining images:")
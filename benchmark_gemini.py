@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Gemini Client Benchmark - Compare threaded and asyncio request throughput
+against a local fake Gemini endpoint (no API quota is used).
+"""
+
+import time
+import asyncio
+import logging
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+from google.genai import types
+
+from src.config import DEFAULT_MAX_WORKERS, DEFAULT_ASYNC_CONCURRENCY
+from src.gemini_client import GeminiClient
+from src.async_image_processor import run_bounded
+from tests.fake_gemini import FakeGeminiServer
+
+# Configure logging
+logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+
+IMAGE_BYTES = b'\xff\xd8\xff\xe0' + b'\0' * 60000
+
+
+def run_threaded(server, requests, max_workers, rpm, tpm):
+    """Send requests from a thread pool using the synchronous client."""
+    client = GeminiClient(api_keys=['benchmark-key'], http_options=types.HttpOptions(base_url=server.base_url),
+                          rpm=rpm, tpm=tpm)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        list(executor.map(lambda i: client.process_image_bytes(IMAGE_BYTES, f"image_{i}.jpg", 0),
+                          range(requests)))
+
+
+def run_async(server, requests, concurrency, rpm, tpm):
+    """Send requests from one event loop using the asyncio client."""
+    client = GeminiClient(api_keys=['benchmark-key'], http_options=types.HttpOptions(base_url=server.base_url),
+                          async_concurrency=concurrency, rpm=rpm, tpm=tpm)
+
+    async def send(i):
+        await client.process_image_bytes_async(IMAGE_BYTES, f"image_{i}.jpg", 0)
+
+    asyncio.run(run_bounded(range(requests), send, concurrency))
+
+
+def measure(name, server, func, *args):
+    """Run one benchmark and print its throughput."""
+    server.peak_in_flight = 0
+    start = time.time()
+    func(server, *args)
+    elapsed = time.time() - start
+    requests = args[0]
+    print(f"{name:<10} {requests:>6} requests in {elapsed:7.2f}s  "
+          f"{requests / elapsed:8.1f} req/s  peak in flight {server.peak_in_flight}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark threaded vs asyncio Gemini requests against a fake endpoint")
+    parser.add_argument("--requests", type=int, default=2000, help="Requests per run (default: 2000)")
+    parser.add_argument("--latency", type=float, default=0.5, help="Simulated Gemini latency in seconds (default: 0.5)")
+    parser.add_argument("--max-workers", type=int, default=DEFAULT_MAX_WORKERS, help="Threads for the threaded run (default: 10)")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_ASYNC_CONCURRENCY, help="In-flight requests for the async run (default: 256)")
+    parser.add_argument("--key-rpm", type=int, default=0, help="Requests per minute to pace at (default: 0, unpaced)")
+    parser.add_argument("--key-tpm", type=int, default=0, help="Tokens per minute to pace at (default: 0, unpaced)")
+    parser.add_argument("--skip-threaded", action="store_true", help="Only run the async benchmark")
+
+    args = parser.parse_args()
+
+    with FakeGeminiServer(latency=args.latency) as server:
+        print(f"Fake Gemini endpoint at {server.base_url} ({args.latency}s latency)")
+        if not args.skip_threaded:
+            measure("threaded", server, run_threaded, args.requests, args.max_workers,
+                    args.key_rpm, args.key_tpm)
+        measure("async", server, run_async, args.requests, args.concurrency, args.key_rpm, args.key_tpm)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Generation Profile Benchmark - Caption the same local sample of frames with
+each generation profile and compare latency and token usage per image.
+Uses real Gemini quota unless --fake is given.
+"""
+
+import os
+import time
+import logging
+import argparse
+
+from google.genai import types
+
+from src.config import INPUT_DIR, IMAGE_EXTENSIONS, GENERATION_PROFILES
+from src.gemini_client import GeminiClient
+from tests.fake_gemini import FakeGeminiServer
+
+# Configure logging
+logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+def load_sample(image_dir, sample):
+    """Return ``(image_bytes, image_path)`` for ``sample`` frames spread evenly over the sorted directory."""
+    paths = sorted(os.path.join(root, name)
+                   for root, _, files in os.walk(image_dir)
+                   for name in files if name.lower().endswith(IMAGE_EXTENSIONS))
+    step = max(1, len(paths) // max(1, sample))
+    images = []
+    for path in paths[::step][:sample]:
+        with open(path, 'rb') as f:
+            images.append((f.read(), path))
+    return images
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, round(fraction * (len(ordered) - 1)))]
+
+
+def run_profile(profile, images, max_retries=2, api_keys=None, http_options=None, structured_output=True):
+    """Caption ``images`` one at a time with a profile and return its latency and per-image token usage."""
+    client = GeminiClient(api_keys=api_keys, http_options=http_options, structured_output=structured_output,
+                          profile=profile)
+    latencies = []
+    failures = 0
+    for image_bytes, image_path in images:
+        start = time.monotonic()
+        result = client.process_image_bytes(image_bytes, image_path, max_retries)
+        latencies.append(time.monotonic() - start)
+        failures += not result.ok
+
+    usage = dict(client.usage)
+    count = max(1, usage['images'])
+    return {
+        'profile': profile,
+        'model': client.model,
+        'images': len(images),
+        'failures': failures,
+        'mean_latency': sum(latencies) / len(latencies),
+        'p50_latency': percentile(latencies, 0.5),
+        'p95_latency': percentile(latencies, 0.95),
+        'prompt_tokens': usage['prompt_tokens'] / count,
+        'output_tokens': usage['output_tokens'] / count,
+        'thinking_tokens': usage['thinking_tokens'] / count,
+    }
+
+
+def print_report(rows):
+    """Print one line per profile."""
+    print(f"{'profile':<10} {'model':<24} {'images':>6} {'failed':>6} {'mean s':>7} {'p50 s':>7} {'p95 s':>7} "
+          f"{'in tok':>7} {'out tok':>7} {'think':>7}")
+    for row in rows:
+        print(f"{row['profile']:<10} {row['model']:<24} {row['images']:>6} {row['failures']:>6} "
+              f"{row['mean_latency']:>7.2f} {row['p50_latency']:>7.2f} {row['p95_latency']:>7.2f} "
+              f"{row['prompt_tokens']:>7.0f} {row['output_tokens']:>7.0f} {row['thinking_tokens']:>7.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare latency and tokens per image across generation profiles")
+    parser.add_argument("--images", default=INPUT_DIR, help="Directory of frames to sample from (default: INPUT_DIR)")
+    parser.add_argument("--sample", type=int, default=20, help="Frames captioned with each profile (default: 20)")
+    parser.add_argument("--profiles", nargs='+', choices=sorted(GENERATION_PROFILES), default=list(GENERATION_PROFILES),
+                        help="Profiles to compare (default: all)")
+    parser.add_argument("--retries", type=int, default=2, help="Max retries per frame (default: 2)")
+    parser.add_argument("--no-response-schema", action="store_true", help="Don't constrain output to the caption schema")
+    parser.add_argument("--fake", type=float, metavar="LATENCY", default=None,
+                        help="Use a local fake endpoint with this latency in seconds instead of Gemini")
+
+    args = parser.parse_args()
+
+    images = load_sample(args.images, args.sample)
+    if not images:
+        parser.error(f"No images found in {args.images}")
+    print(f"Sample: {len(images)} frames from {args.images}")
+
+    server = None
+    http_options = None
+    if args.fake is not None:
+        server = FakeGeminiServer(latency=args.fake).start()
+        http_options = types.HttpOptions(base_url=server.base_url)
+        print(f"Fake Gemini endpoint at {server.base_url} ({args.fake}s latency)")
+    # The fake endpoint's caption does not follow the caption schema
+    structured_output = not args.no_response_schema and server is None
+    try:
+        rows = [run_profile(profile, images, args.retries, ['benchmark-key'] if server else None, http_options,
+                            structured_output)
+                for profile in args.profiles]
+    finally:
+        if server is not None:
+            server.stop()
+    print_report(rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,12 +3,14 @@
 Generate work distribution for remaining images (non-interactive)
 """
 
-import pickle
 import logging
-import sys
+import argparse
 from dotenv import load_dotenv
 
 from src.s3_client import S3Client
+from src.caption_index import CaptionIndex
+from src.s3_inventory import InventoryManifest
+from src.file_manager import FileManager
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -17,12 +19,15 @@ def main():
     
     try:
         # Get number of workers from command line
-        workers = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+        parser = argparse.ArgumentParser(description="Generate work distribution for remaining images")
+        parser.add_argument("workers", type=int, nargs="?", default=4, help="Number of workers (default: 4)")
+        parser.add_argument("--refresh", action="store_true", help="Pick up new images in the cached S3 inventory")
+        args = parser.parse_args()
+        workers = args.workers
         
         # Load checkpoint
         logging.info("Loading checkpoint.pkl...")
-        with open('checkpoint.pkl', 'rb') as f:
-            processed_files = pickle.load(f)
+        processed_files = FileManager().load_checkpoint('checkpoint.pkl')
         
         # Convert local paths to S3 keys format
         processed_s3_keys = set()
@@ -36,7 +41,7 @@ def main():
         
         # Get all images from S3
         logging.info("Scanning S3 for all images...")
-        all_images = s3_client.list_all_images()
+        all_images = InventoryManifest.load_or_build(s3_client, refresh=args.refresh).image_keys()
         
         # Find remaining images to process
         remaining_images = []
@@ -51,7 +56,8 @@ def main():
         print(f"   Progress: {len(processed_files)/len(all_images)*100:.1f}%")
         
         # Generate work distribution for remaining images
-        work_chunks = s3_client.generate_work_distribution(remaining_images, workers)
+        caption_index = CaptionIndex.load_or_build(s3_client)
+        work_chunks = s3_client.generate_work_distribution(remaining_images, workers, caption_index)
         distribution_files = s3_client.save_work_distribution_files(work_chunks, "./work_distribution_remaining")
         
         print(f"\n🎯 Generated work distribution for {workers} workers:")
@@ -6,12 +6,18 @@ Handles CLI interface, signal handling, and orchestrates the processing workflow
 import sys
 import logging
 import signal
+from itertools import chain
 from tqdm import tqdm
 
 from src.config import parse_arguments, GENAI_API_KEYS, OUTPUT_DIR
+from src.caption_cache import CaptionCache
+from src.prompt_cache import PromptCache
 from src.gemini_client import GeminiClient
 from src.image_processor import ImageProcessor
+from src.async_image_processor import AsyncImageProcessor
 from src.file_manager import FileManager
+from src.dedupe import FrameDeduplicator
+from src.preprocess import ImagePreprocessor
 
 
 # Configure logging
@@ -42,47 +48,101 @@ def validate_api_keys():
         sys.exit(1)
 
 
-def process_directory(checkpoint_file='checkpoint.pkl', max_workers=10, retry_errors=True, max_retries=5, key_rotation_delay=1.0):
-    """Process all images in the input directory."""
+def create_preprocessor(args):
+    """Create the image preprocessor when --preprocess was given."""
+    if not args.preprocess:
+        return None
+    logging.info(f"🗜️  Preprocessing images to {args.image_format} ≤{args.max_edge}px at quality {args.image_quality}")
+    return ImagePreprocessor(args.max_edge, args.image_format, args.image_quality)
+
+
+def create_deduplicator(args):
+    """Create the near-duplicate frame detector when --dedupe was given."""
+    if not args.dedupe:
+        return None
+    logging.info(f"🪞 Near-duplicate detection on (threshold: {args.dedupe_threshold} bits)")
+    return FrameDeduplicator(args.dedupe_threshold)
+
+
+def create_gemini_client(args):
+    """Create the Gemini client with the caches, preprocessing and output settings given on the command line."""
+    settings = dict(cache=None if args.no_caption_cache else CaptionCache(),
+                    preprocessor=create_preprocessor(args),
+                    prompt_cache=None if args.no_prompt_cache else PromptCache(),
+                    structured_output=not args.no_response_schema, compact=args.compact_captions,
+                    profile=args.profile, cascade=args.cascade)
+    if args.use_async:
+        return GeminiClient(async_concurrency=args.concurrency, **settings)
+    return GeminiClient(**settings)
+
+
+def create_image_processor(args, status_index=None, deduplicator=None):
+    """Create the threaded or asyncio image processor."""
+    if args.batch_size > 1:
+        logging.info(f"📦 Sending up to {args.batch_size} frames of a video per request")
+    gemini_client = create_gemini_client(args)
+    if args.use_async:
+        logging.info(f"⚡ Async mode: up to {args.concurrency} requests in flight")
+        return AsyncImageProcessor(gemini_client, concurrency=args.concurrency, status_index=status_index,
+                                   deduplicator=deduplicator, batch_size=args.batch_size)
+    return ImageProcessor(gemini_client, status_index=status_index, deduplicator=deduplicator,
+                          batch_size=args.batch_size)
+
+
+def dedupe_pending_files(pending_files, deduplicator):
+    """Pass on one frame per near-duplicate cluster; the processor copies its caption to the rest."""
+    if deduplicator is None:
+        return pending_files
+    return deduplicator.iter_representatives(pending_files, key=lambda file_info: file_info['input_path'],
+                                             load=lambda file_info: file_info['input_path'])
+
+
+def update_progress_total(pbar, total):
+    """Fill in the progress bar total once the background file count finishes."""
+    pbar.total = total
+    pbar.refresh()
+    logging.info(f"📊 Total files: {total}")
+
+
+def process_directory(args, checkpoint_file='checkpoint.pkl'):
+    """Process all images in the input directory with the settings in ``args``."""
     global shutdown_requested
 
     logging.info(f"🚀 Starting processing with {len(GENAI_API_KEYS)} Gemini API keys")
 
     # Initialize components
     file_manager = FileManager()
-    gemini_client = GeminiClient()
-    image_processor = ImageProcessor(gemini_client)
+    deduplicator = create_deduplicator(args)
+    image_processor = create_image_processor(args, file_manager.status_index, deduplicator)
 
     # Load checkpoint
     processed_files = file_manager.load_checkpoint(checkpoint_file)
 
-    # If retry_errors is True, scan for error files and remove them from processed_files
-    if retry_errors:
-        file_manager.mark_error_files_for_retry(processed_files, checkpoint_file)
-
-    # Get file counts and remaining work
-    total_files = file_manager.count_total_files()
-    remaining_files = total_files - len(processed_files)
-
-    logging.info(f"📊 Total files: {total_files}, Already processed: {len(processed_files)}, Remaining: {remaining_files}")
-
-    if remaining_files == 0:
+    # Pending files (and error files to retry) stream in while the input directory is scanned
+    pending_files = file_manager.iter_pending_files(processed_files, not args.no_retry_errors, checkpoint_file)
+    pending_files = dedupe_pending_files(pending_files, deduplicator)
+    first_file = next(pending_files, None)
+    if first_file is None:
         logging.info("🎉 All files have been processed!")
         return
 
-    # Get pending files to process
-    pending_files = file_manager.get_pending_files(processed_files)
+    logging.info(f"📊 Already processed: {len(processed_files)}, starting on pending files while the scan continues")
+
+    # Process files with progress bar; the total is filled in once the background count finishes
+    try:
+        with tqdm(total=None, initial=len(processed_files), unit='file', desc='Processing', leave=True, ncols=100) as pbar:
+            file_manager.count_total_files_async(lambda total: update_progress_total(pbar, total))
 
-    # Process files with progress bar
-    with tqdm(total=total_files, initial=len(processed_files), unit='file', desc='Processing', leave=True, ncols=100) as pbar:
-        # Prepare tasks
-        tasks = file_manager.prepare_image_tasks(pending_files, processed_files, checkpoint_file, pbar)
+            # Prepare tasks
+            tasks = file_manager.iter_image_tasks(chain([first_file], pending_files), processed_files, checkpoint_file, pbar)
 
-        # Set shutdown flag on processor
-        image_processor.set_shutdown_flag(shutdown_requested)
+            # Let the processor see the shutdown flag the signal handler sets
+            image_processor.set_shutdown_check(lambda: shutdown_requested)
 
-        # Process images
-        image_processor.process_images_batch(tasks, max_workers, max_retries)
+            # Process images
+            image_processor.process_images_batch(tasks, args.max_workers, args.retries)
+    finally:
+        image_processor.close()
 
     # Log final statistics
     image_processor.log_stats()
@@ -100,13 +160,12 @@ def process_directory(checkpoint_file='checkpoint.pkl', max_workers=10, retry_er
         logging.info("💾 Progress saved. You can resume by running the script again.")
 
 
-def fix_error_files(max_workers=10, max_retries=5):
-    """Fix files that contain errors."""
+def fix_error_files(args):
+    """Fix files that contain errors, with the settings in ``args``."""
     global shutdown_requested
 
     file_manager = FileManager()
-    gemini_client = GeminiClient()
-    image_processor = ImageProcessor(gemini_client)
+    image_processor = create_image_processor(args, file_manager.status_index)
 
     error_file_inputs = file_manager.get_error_file_inputs()
 
@@ -117,15 +176,18 @@ def fix_error_files(max_workers=10, max_retries=5):
     logging.info(f"🔧 Attempting to fix {len(error_file_inputs)} files with errors using {len(GENAI_API_KEYS)} Gemini API keys...")
 
     # Process error files with progress bar
-    with tqdm(total=len(error_file_inputs), unit='file', desc='Fixing', ncols=100) as pbar:
-        # Prepare tasks (no checkpoint needed for fixing)
-        tasks = file_manager.prepare_image_tasks(error_file_inputs, pbar=pbar)
+    try:
+        with tqdm(total=len(error_file_inputs), unit='file', desc='Fixing', ncols=100) as pbar:
+            # Prepare tasks (no checkpoint needed for fixing)
+            tasks = file_manager.iter_image_tasks(error_file_inputs, pbar=pbar)
 
-        # Set shutdown flag on processor
-        image_processor.set_shutdown_flag(shutdown_requested)
+            # Let the processor see the shutdown flag the signal handler sets
+            image_processor.set_shutdown_check(lambda: shutdown_requested)
 
-        # Process error files
-        image_processor.process_images_batch(tasks, max_workers, max_retries)
+            # Process error files
+            image_processor.process_images_batch(tasks, args.max_workers, args.retries)
+    finally:
+        image_processor.close()
 
     # Log final statistics
     image_processor.log_stats()
@@ -153,6 +215,11 @@ def main():
         gemini_client.log_key_stats()
         sys.exit(0)
 
+    # Rebuild the caption status index if requested
+    if args.rebuild_status_index:
+        FileManager().rebuild_status_index()
+        sys.exit(0)
+
     # Log configuration
     logging.info(f"🔄 Retry configuration: max {args.retries} retries with exponential backoff")
     logging.info(f"⏱️  Key rotation delay: {args.key_rotation_delay}s")
@@ -160,14 +227,9 @@ def main():
 
     try:
         if args.fix:
-            fix_error_files(max_workers=args.max_workers, max_retries=args.retries)
+            fix_error_files(args)
         else:
-            process_directory(
-                max_workers=args.max_workers,
-                retry_errors=not args.no_retry_errors,
-                max_retries=args.retries,
-                key_rotation_delay=args.key_rotation_delay
-            )
+            process_directory(args)
 
         if not shutdown_requested:
             print(f"🎉 Processing complete using Gemini API with key rotation. Results saved to {OUTPUT_DIR}")
@@ -3,19 +3,25 @@ Main application entry point for Gemini Image Captioner with S3 support.
 Handles CLI interface, signal handling, and orchestrates the processing workflow.
 """
 
+import os
 import sys
+import socket
 import logging
 import signal
+import argparse
+from itertools import chain
 from tqdm import tqdm
 
-from src.config import (
-    parse_arguments, GENAI_API_KEYS, OUTPUT_DIR, ProcessingMode,
-    get_image_list_from_worker_file
-)
+from main import create_gemini_client, create_deduplicator, create_image_processor
+from src.config import parse_arguments, GENAI_API_KEYS, OUTPUT_DIR, ProcessingMode, get_image_list_from_worker_file
 from src.gemini_client import GeminiClient
-from src.image_processor import ImageProcessor
 from src.file_manager import FileManager
 from src.s3_client import S3Client
+from src.s3_inventory import InventoryManifest
+from src.caption_index import CaptionIndex
+from src.sharding import select_shard, shard_spec
+from src.s3_pipeline import S3CaptionPipeline, AsyncS3CaptionPipeline
+from src.work_queue import LeaseQueue, run_leased
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -41,40 +47,77 @@ def validate_api_keys():
         logging.error("No valid GenAI API keys found.")
         sys.exit(1)
 
-def is_error_response(caption):
-    """Check if the caption response is an error (JSON error format)."""
-    if not caption:
-        return True
-    try:
-        import json
-        parsed = json.loads(caption)
-        return 'error' in parsed
-    except (json.JSONDecodeError, TypeError):
-        return False
-
-def process_s3_worker_mode(worker_file_path, worker_id, checkpoint_file='checkpoint.pkl', 
-                          max_workers=10, retry_errors=True, max_retries=5, key_rotation_delay=1.0):
-    """Process images from S3 using worker assignment file."""
+def load_shard_images(s3_client, shard, refresh_inventory=False):
+    """Select a shard's uncaptioned images from the cached S3 inventory."""
+    manifest = InventoryManifest.load_or_build(s3_client, refresh=refresh_inventory)
+    shard_images = list(select_shard(manifest.image_keys(), shard))
+    caption_index = CaptionIndex.load_or_build(s3_client)
+    remaining = caption_index.missing(shard_images, s3_client.get_caption_key_from_image_key)
+    logging.info(f"📋 Shard {shard[0]}/{shard[1]}: {len(shard_images)} of {len(manifest)} images, "
+                 f"{len(shard_images) - len(remaining)} already captioned")
+    return remaining
+
+def seed_work_queue(work_queue, s3_client, refresh_inventory=False):
+    """Queue every uncaptioned image in the cached S3 inventory that is not queued yet."""
+    manifest = InventoryManifest.load_or_build(s3_client, refresh=refresh_inventory)
+    caption_index = CaptionIndex.load_or_build(s3_client)
+    remaining = caption_index.missing(manifest.image_keys(), s3_client.get_caption_key_from_image_key)
+    added = work_queue.seed(remaining)
+    logging.info(f"📋 Queued {added} new images ({len(manifest) - len(remaining)} of {len(manifest)} already captioned)")
+
+def create_s3_pipeline(args, s3_client, gemini_client, file_manager, checkpoint_file, deduplicator=None):
+    """Create the threaded or asyncio download → caption → upload pipeline."""
+    if args.use_async:
+        return AsyncS3CaptionPipeline(
+            s3_client, gemini_client, file_manager, checkpoint_file,
+            concurrency=args.concurrency,
+            max_retries=args.retries,
+            key_rotation_delay=args.key_rotation_delay,
+            deduplicator=deduplicator,
+            batch_size=args.batch_size
+        )
+    return S3CaptionPipeline(
+        s3_client, gemini_client, file_manager, checkpoint_file,
+        download_workers=args.download_workers,
+        caption_workers=args.max_workers,
+        upload_workers=args.upload_workers,
+        queue_size=args.pipeline_queue_size,
+        max_retries=args.retries,
+        key_rotation_delay=args.key_rotation_delay,
+        deduplicator=deduplicator,
+        batch_size=args.batch_size
+    )
+
+def process_s3_worker_mode(args, worker_id, checkpoint_file='checkpoint.pkl'):
+    """Process images from S3 using a worker assignment file or a hash shard of the inventory."""
     global shutdown_requested
-    
-    logging.info(f"🔍 Worker Mode: Processing images from {worker_file_path}")
-    logging.info(f"👤 Worker ID: {worker_id}")
-    
-    # Load assigned images from worker file
-    try:
-        assigned_images = get_image_list_from_worker_file(worker_file_path)
-        logging.info(f"📋 Loaded {len(assigned_images)} assigned images from worker file")
-    except Exception as e:
-        logging.error(f"❌ Failed to load worker file: {e}")
-        sys.exit(1)
+
+    s3_client = S3Client()
+    shard = args.shard
+
+    if shard:
+        logging.info(f"🔍 Shard Mode: Processing shard {shard[0]}/{shard[1]} of the S3 inventory")
+        logging.info(f"👤 Worker ID: {worker_id}")
+        assigned_images = load_shard_images(s3_client, shard, args.refresh_inventory)
+    else:
+        logging.info(f"🔍 Worker Mode: Processing images from {args.worker_file}")
+        logging.info(f"👤 Worker ID: {worker_id}")
+
+        # Load assigned images from worker file
+        try:
+            assigned_images = get_image_list_from_worker_file(args.worker_file)
+            logging.info(f"📋 Loaded {len(assigned_images)} assigned images from worker file")
+        except Exception as e:
+            logging.error(f"❌ Failed to load worker file: {e}")
+            sys.exit(1)
     
     if not assigned_images:
-        logging.warning("⚠️ No images found in worker file!")
+        logging.warning("⚠️ No images to process for this worker!")
         return
     
     # Initialize components
-    s3_client = S3Client()
-    gemini_client = GeminiClient()
+    gemini_client = create_gemini_client(args)
+    deduplicator = create_deduplicator(args)
     
     # Load checkpoint to see what we've already processed
     file_manager = FileManager()
@@ -94,71 +137,25 @@ def process_s3_worker_mode(worker_file_path, worker_id, checkpoint_file='checkpo
         logging.info("🎉 All assigned images have been processed!")
         return
     
-    # Process images
-    processed_count = 0
+    # Process images through the download → caption → upload pipeline
     total_assigned = len(assigned_images)
     already_processed = total_assigned - len(remaining_images)
-    
-    with tqdm(total=total_assigned, initial=already_processed, unit='file', desc=f'Worker {worker_id}', leave=True, ncols=100) as pbar:
-        for img_key in remaining_images:
-            if shutdown_requested:
-                break
-                
-            try:
-                # Convert S3 key to relative path for processing
-                relative_path = img_key.replace('frames/', '')
-                
-                # Download image temporarily
-                import tempfile
-                import os
-                
-                with tempfile.NamedTemporaryFile(suffix=os.path.splitext(relative_path)[1], delete=False) as tmp_file:
-                    temp_path = tmp_file.name
-                
-                logging.info(f"🔄 Processing: {img_key}")
-                # Download from S3
-                if s3_client.download_image(img_key, temp_path):
-                    # Process with Gemini
-                    caption = gemini_client.process_image_with_gemini(temp_path)
-                    
-                    # Check if caption is valid (not an error response)
-                    if caption and not is_error_response(caption):
-                        # Upload caption to S3
-                        caption_key = s3_client.get_caption_key_from_image_key(img_key)
-                        
-                        # Save caption to temp file first
-                        with tempfile.NamedTemporaryFile(mode='w', suffix='.txt', delete=False, encoding='utf-8') as caption_file:
-                            caption_file.write(caption)
-                            caption_temp_path = caption_file.name
-                        
-                        # Upload to S3
-                        if s3_client.upload_caption(caption_temp_path, caption_key):
-                            # Mark as processed in checkpoint
-                            processed_files.add(relative_path)
-                            file_manager.save_checkpoint(processed_files, checkpoint_file)
-                            processed_count += 1
-                            pbar.update(1)
-                            logging.info(f"✅ Processed: {img_key} -> {caption_key}")
-                        else:
-                            logging.error(f"❌ Failed to upload caption for {img_key}")
-                        
-                        # Clean up caption temp file
-                        os.unlink(caption_temp_path)
-                    else:
-                        if caption:
-                            logging.error(f"❌ Failed to generate caption for {img_key}: {caption}")
-                        else:
-                            logging.error(f"❌ Failed to generate caption for {img_key}")
-                    
-                    # Clean up image temp file
-                    os.unlink(temp_path)
-                else:
-                    logging.error(f"❌ Failed to download {img_key}")
-                    
-            except Exception as e:
-                logging.error(f"❌ Error processing {img_key}: {e}")
-                continue
-    
+    pipeline = create_s3_pipeline(args, s3_client, gemini_client, file_manager, checkpoint_file, deduplicator)
+    pipeline.set_shutdown_check(lambda: shutdown_requested)
+
+    try:
+        with tqdm(total=total_assigned, initial=already_processed, unit='file', desc=f'Worker {worker_id}', leave=True, ncols=100) as pbar:
+            stats = pipeline.run(remaining_images, processed_files, pbar)
+    finally:
+        gemini_client.close()
+    processed_count = stats['processed']
+
+    logging.info(f"📊 Failures: {stats['download_failed']} downloads, "
+                 f"{stats['caption_failed']} captions, {stats['upload_failed']} uploads")
+    gemini_client.log_key_stats()
+    if deduplicator is not None:
+        deduplicator.log_stats()
+
     logging.info(f"✅ Worker {worker_id} processed {processed_count} new images")
     
     if not shutdown_requested:
@@ -166,7 +163,56 @@ def process_s3_worker_mode(worker_file_path, worker_id, checkpoint_file='checkpo
     else:
         logging.info(f"💾 Worker {worker_id} progress saved. Resume by running the same command.")
 
-def process_local_mode(checkpoint_file='checkpoint.pkl', max_workers=10, retry_errors=True, max_retries=5, key_rotation_delay=1.0):
+def process_s3_queue_mode(args, worker_id, checkpoint_file='checkpoint.pkl'):
+    """Process images leased in batches from a queue shared by all workers."""
+    global shutdown_requested
+
+    logging.info(f"🔍 Queue Mode: Leasing batches of {args.lease_batch_size} images from {args.queue}")
+    logging.info(f"👤 Worker ID: {worker_id}")
+
+    s3_client = S3Client()
+    work_queue = LeaseQueue(args.queue, lease_seconds=args.lease_seconds, batch_size=args.lease_batch_size)
+    # The first worker to start fills the queue; later ones only add new images on --refresh-inventory
+    if args.refresh_inventory or not len(work_queue):
+        seed_work_queue(work_queue, s3_client, args.refresh_inventory)
+    logging.info(f"📊 Queue: {work_queue.stats()}")
+
+    gemini_client = create_gemini_client(args)
+    deduplicator = create_deduplicator(args)
+    file_manager = FileManager()
+    processed_files = file_manager.load_checkpoint(checkpoint_file)
+
+    pipeline = create_s3_pipeline(args, s3_client, gemini_client, file_manager, checkpoint_file, deduplicator)
+    pipeline.set_shutdown_check(lambda: shutdown_requested)
+
+    try:
+        with tqdm(unit='file', desc=f'Worker {worker_id}', leave=True, ncols=100) as pbar:
+            stats = run_leased(pipeline, work_queue, worker_id, processed_files, pbar)
+    finally:
+        gemini_client.close()
+
+    logging.info(f"📊 Failures: {stats['download_failed']} downloads, "
+                 f"{stats['caption_failed']} captions, {stats['upload_failed']} uploads")
+    logging.info(f"📊 Queue: {work_queue.stats()}")
+    gemini_client.log_key_stats()
+    if deduplicator is not None:
+        deduplicator.log_stats()
+    work_queue.close()
+
+    logging.info(f"✅ Worker {worker_id} processed {stats['processed']} new images")
+    if not shutdown_requested:
+        logging.info(f"🎉 Worker {worker_id} found no work left in the queue!")
+    else:
+        logging.info(f"💾 Worker {worker_id} returned its unfinished keys to the queue.")
+
+def update_progress_total(pbar, total):
+    """Fill in the progress bar total once the background file count finishes."""
+    pbar.total = total
+    pbar.refresh()
+    logging.info(f"📊 Total files: {total}")
+
+
+def process_local_mode(args, checkpoint_file='checkpoint.pkl'):
     """Original local filesystem processing mode."""
     global shutdown_requested
 
@@ -174,39 +220,39 @@ def process_local_mode(checkpoint_file='checkpoint.pkl', max_workers=10, retry_e
 
     # Initialize components
     file_manager = FileManager()
-    gemini_client = GeminiClient()
-    image_processor = ImageProcessor(gemini_client)
+    deduplicator = create_deduplicator(args)
+    image_processor = create_image_processor(args, file_manager.status_index, deduplicator)
 
     # Load checkpoint
     processed_files = file_manager.load_checkpoint(checkpoint_file)
 
-    # If retry_errors is True, scan for error files and remove them from processed_files
-    if retry_errors:
-        file_manager.mark_error_files_for_retry(processed_files, checkpoint_file)
-
-    # Get file counts and remaining work
-    total_files = file_manager.count_total_files()
-    remaining_files = total_files - len(processed_files)
-
-    logging.info(f"📊 Total files: {total_files}, Already processed: {len(processed_files)}, Remaining: {remaining_files}")
-
-    if remaining_files == 0:
+    # Pending files (and error files to retry) stream in while the input directory is scanned
+    pending_files = file_manager.iter_pending_files(processed_files, not args.no_retry_errors, checkpoint_file)
+    if deduplicator is not None:
+        pending_files = deduplicator.iter_representatives(pending_files, key=lambda file_info: file_info['input_path'],
+                                                          load=lambda file_info: file_info['input_path'])
+    first_file = next(pending_files, None)
+    if first_file is None:
         logging.info("🎉 All files have been processed!")
         return
 
-    # Get pending files to process
-    pending_files = file_manager.get_pending_files(processed_files)
+    logging.info(f"📊 Already processed: {len(processed_files)}, starting on pending files while the scan continues")
+
+    # Process files with progress bar; the total is filled in once the background count finishes
+    try:
+        with tqdm(total=None, initial=len(processed_files), unit='file', desc='Processing', leave=True, ncols=100) as pbar:
+            file_manager.count_total_files_async(lambda total: update_progress_total(pbar, total))
 
-    # Process files with progress bar
-    with tqdm(total=total_files, initial=len(processed_files), unit='file', desc='Processing', leave=True, ncols=100) as pbar:
-        # Prepare tasks
-        tasks = file_manager.prepare_image_tasks(pending_files, processed_files, checkpoint_file, pbar)
+            # Prepare tasks
+            tasks = file_manager.iter_image_tasks(chain([first_file], pending_files), processed_files, checkpoint_file, pbar)
 
-        # Set shutdown flag on processor
-        image_processor.set_shutdown_flag(shutdown_requested)
+            # Let the processor see the shutdown flag the signal handler sets
+            image_processor.set_shutdown_check(lambda: shutdown_requested)
 
-        # Process images
-        image_processor.process_images_batch(tasks, max_workers, max_retries)
+            # Process images
+            image_processor.process_images_batch(tasks, args.max_workers, args.retries)
+    finally:
+        image_processor.close()
 
     # Log final statistics
     image_processor.log_stats()
@@ -231,6 +277,12 @@ def main():
     setup_signal_handlers()
     validate_api_keys()
     args = parse_arguments()
+    if args.shard:
+        try:
+            args.shard = shard_spec(args.shard)
+        except argparse.ArgumentTypeError as e:
+            logging.error(f"❌ Invalid --shard: {e}")
+            sys.exit(2)
 
     # Show key statistics if requested
     if args.show_key_stats:
@@ -238,29 +290,39 @@ def main():
         gemini_client.log_key_stats()
         sys.exit(0)
 
+    # Rebuild the caption status index if requested
+    if args.rebuild_status_index:
+        FileManager().rebuild_status_index()
+        sys.exit(0)
+
     # Log configuration
     logging.info(f"🔄 Retry configuration: max {args.retries} retries with exponential backoff")
     logging.info(f"⏱️  Key rotation delay: {args.key_rotation_delay}s")
     logging.info(f"🔑 Available API keys: {len(GENAI_API_KEYS)}")
 
     try:
-        # Determine processing mode
-        processing_mode = args.processing_mode
+        # Determine processing mode (a shard or queue always runs as an S3 worker)
+        processing_mode = ProcessingMode.S3_WORKER if args.shard or args.queue else args.processing_mode
         
-        if processing_mode == ProcessingMode.S3_WORKER:
+        if processing_mode == ProcessingMode.S3_WORKER and args.queue:
+            # Leases need an ID no other worker uses
+            worker_id = args.worker_id
+            if worker_id == "default":
+                worker_id = f"{socket.gethostname()}-{os.getpid()}"
+
+            process_s3_queue_mode(args, worker_id)
+
+        elif processing_mode == ProcessingMode.S3_WORKER:
             # S3 Worker mode
-            if not args.worker_file:
-                logging.error("❌ Worker file required for S3 worker mode. Use --worker-file option.")
+            if not args.worker_file and not args.shard:
+                logging.error("❌ Worker file or shard required for S3 worker mode. Use --worker-file or --shard i/N.")
                 sys.exit(1)
             
-            process_s3_worker_mode(
-                worker_file_path=args.worker_file,
-                worker_id=args.worker_id,
-                max_workers=args.max_workers,
-                retry_errors=not args.no_retry_errors,
-                max_retries=args.retries,
-                key_rotation_delay=args.key_rotation_delay
-            )
+            worker_id = args.worker_id
+            if args.shard and worker_id == "default":
+                worker_id = f"shard_{args.shard[0]}_of_{args.shard[1]}"
+
+            process_s3_worker_mode(args, worker_id)
             
         elif processing_mode == ProcessingMode.S3_FULL:
             # S3 Full mode - process all S3 images
@@ -273,12 +335,7 @@ def main():
                 logging.error("❌ Fix mode not implemented for S3. Use local mode.")
                 sys.exit(1)
             else:
-                process_local_mode(
-                    max_workers=args.max_workers,
-                    retry_errors=not args.no_retry_errors,
-                    max_retries=args.retries,
-                    key_rotation_delay=args.key_rotation_delay
-                )
+                process_local_mode(args)
 
         if not shutdown_requested:
             if processing_mode == ProcessingMode.S3_WORKER:
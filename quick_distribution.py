@@ -3,27 +3,31 @@
 Quick work distribution - skip S3 caption checking since we have checkpoint
 """
 
-import pickle
 import os
 import logging
+import argparse
 from dotenv import load_dotenv
 from src.s3_client import S3Client
+from src.s3_inventory import InventoryManifest
+from src.file_manager import FileManager
 
 logging.basicConfig(level=logging.INFO)
 
 def main():
+    parser = argparse.ArgumentParser(description="Quick work distribution from checkpoint")
+    parser.add_argument("--refresh", action="store_true", help="Pick up new images in the cached S3 inventory")
+    args = parser.parse_args()
     workers = 4
     
     # Load what coworker already processed
-    with open('checkpoint.pkl', 'rb') as f:
-        processed_files = pickle.load(f)
+    processed_files = FileManager().load_checkpoint('checkpoint.pkl')
     
     # Convert to S3 key format
     processed_s3_keys = {f"frames/{file_path}" for file_path in processed_files}
     
     # Get all S3 images (we already know this list)
     s3_client = S3Client()
-    all_images = s3_client.list_all_images()
+    all_images = InventoryManifest.load_or_build(s3_client, refresh=args.refresh).image_keys()
     
     # Simple subtraction - no S3 API calls needed!
     remaining_images = [img for img in all_images if img not in processed_s3_keys]
@@ -9,6 +9,9 @@ import argparse
 from dotenv import load_dotenv
 
 from src.s3_client import S3Client
+from src.caption_index import CaptionIndex
+from src.s3_inventory import InventoryManifest
+from src.config import DEFAULT_CAPTION_INDEX_FILE, DEFAULT_INVENTORY_FILE, DEFAULT_LIST_WORKERS
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -18,6 +21,12 @@ def main():
     parser.add_argument("--num-workers", type=int, default=4, help="Number of workers for distribution (default: 4)")
     parser.add_argument("--dry-run", action="store_true", help="Only scan, don't generate distribution files")
     parser.add_argument("--output-dir", default="./work_distribution", help="Output directory for distribution files")
+    parser.add_argument("--list-workers", type=int, default=DEFAULT_LIST_WORKERS, help="Concurrent prefix listings (default: 16)")
+    parser.add_argument("--inventory", default=DEFAULT_INVENTORY_FILE, help="Path of the cached S3 inventory manifest")
+    parser.add_argument("--refresh", action="store_true", help="Pick up new images in the cached inventory before scanning")
+    parser.add_argument("--rebuild", action="store_true", help="Re-list the whole bucket instead of using the cached inventory")
+    parser.add_argument("--caption-index", default=DEFAULT_CAPTION_INDEX_FILE, help="Path of the cached caption existence index")
+    parser.add_argument("--refresh-caption-index", action="store_true", help="Re-list captions/ instead of reusing the cached index")
     
     args = parser.parse_args()
     
@@ -29,9 +38,14 @@ def main():
         logging.info("Initializing S3 client...")
         s3_client = S3Client()
         
-        # Scan all images
-        logging.info("Scanning S3 bucket for all image files...")
-        all_images = s3_client.list_all_images()
+        # Scan all images (from the cached inventory unless a rebuild is requested)
+        if args.rebuild:
+            logging.info("Scanning S3 bucket for all image files...")
+            manifest = InventoryManifest.build(s3_client, args.list_workers)
+            manifest.save(args.inventory)
+        else:
+            manifest = InventoryManifest.load_or_build(s3_client, args.inventory, args.refresh, args.list_workers)
+        all_images = manifest.image_keys()
         
         if not all_images:
             logging.warning("No image files found in S3 bucket!")
@@ -57,7 +71,9 @@ def main():
         
         # Generate work distribution
         logging.info(f"Generating work distribution for {args.num_workers} workers...")
-        work_chunks = s3_client.generate_work_distribution(all_images, args.num_workers)
+        caption_index = CaptionIndex.load_or_build(s3_client, args.caption_index,
+                                                   refresh=args.refresh_caption_index)
+        work_chunks = s3_client.generate_work_distribution(all_images, args.num_workers, caption_index)
         
         # Save distribution files
         distribution_files = s3_client.save_work_distribution_files(work_chunks, args.output_dir)
@@ -0,0 +1,143 @@
+"""
+Asyncio image processing module.
+Runs Gemini requests on a single event loop with a bounded number in flight,
+instead of one blocked thread per request.
+"""
+
+import asyncio
+import logging
+
+from .config import DEFAULT_ASYNC_CONCURRENCY, DEFAULT_BATCH_SIZE
+from .gemini_client import GeminiClient
+from .image_processor import ImageProcessor, _read_bytes
+from .batching import iter_video_batches
+
+
+_EXHAUSTED = object()
+
+
+async def run_bounded(items, worker, concurrency, should_stop=lambda: False):
+    """Await ``worker(item)`` for each item with at most ``concurrency`` running.
+
+    Tasks are created only as slots free up, so memory stays proportional to
+    ``concurrency`` rather than to the number of items. Items are pulled from
+    the iterable in a worker thread, since generators that scan directories,
+    poll the lease queue or download frames would otherwise block the loop.
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    running = set()
+    items = iter(items)
+
+    async def guarded(item):
+        try:
+            await worker(item)
+        except Exception as e:
+            logging.error(f"Error in async task: {str(e)}")
+        finally:
+            semaphore.release()
+
+    while True:
+        await semaphore.acquire()
+        if should_stop():
+            semaphore.release()
+            logging.info("⏹️  Shutdown requested, waiting for in-flight requests...")
+            break
+        item = await asyncio.to_thread(next, items, _EXHAUSTED)
+        if item is _EXHAUSTED:
+            semaphore.release()
+            break
+        task = asyncio.create_task(guarded(item))
+        running.add(task)
+        task.add_done_callback(running.discard)
+
+    if running:
+        await asyncio.gather(*running)
+
+
+class AsyncImageProcessor(ImageProcessor):
+    """Image processor that awaits Gemini calls on an asyncio event loop."""
+
+    def __init__(self, gemini_client=None, concurrency=DEFAULT_ASYNC_CONCURRENCY, status_index=None,
+                 deduplicator=None, batch_size=DEFAULT_BATCH_SIZE):
+        """Initialize with a Gemini client and the in-flight request limit."""
+        super().__init__(gemini_client or GeminiClient(async_concurrency=concurrency), status_index, deduplicator,
+                         batch_size)
+        self.concurrency = concurrency
+
+    async def process_image_async(self, image_path, max_retries=5):
+        """Process an image file using the async Gemini client."""
+        image_bytes = await asyncio.to_thread(_read_bytes, image_path)
+        return await self.gemini_client.process_image_bytes_async(image_bytes, image_path, max_retries)
+
+    async def process_and_save_async(self, input_path, output_path, processed_files, checkpoint_file, pbar,
+                                     max_retries=5):
+        """Process a single image and save the result."""
+        if self.shutdown_requested:
+            pbar.update(1)
+            return
+
+        try:
+            result = await self.process_image_async(input_path, max_retries)
+        except Exception as e:
+            result = self._caption_failure(input_path, e)
+        try:
+            # Writing the caption, the status index and the checkpoint all block, so they run off the loop
+            await asyncio.to_thread(self.save_result, input_path, output_path, result, processed_files,
+                                    checkpoint_file, pbar)
+        except Exception as e:
+            logging.error(f"Error in process_and_save for {input_path}: {str(e)}")
+            self.drop_duplicates(input_path, pbar)
+        finally:
+            pbar.update(1)
+
+    async def process_and_save_batch_async(self, tasks, max_retries=5):
+        """Caption several frames of one video with a single request and save each result."""
+        if self.shutdown_requested:
+            for task in tasks:
+                task['pbar'].update(1)
+            return
+
+        try:
+            images = [(await asyncio.to_thread(_read_bytes, task['input_path']), task['input_path'])
+                      for task in tasks]
+            results = await self.gemini_client.process_image_batch_async(images, max_retries)
+        except Exception as e:
+            results = [self._caption_failure(task['input_path'], e) for task in tasks]
+
+        for task, result in zip(tasks, results):
+            try:
+                await asyncio.to_thread(self.save_result, task['input_path'], task['output_path'], result,
+                                        task.get('processed_files'), task.get('checkpoint_file'), task['pbar'])
+            except Exception as e:
+                logging.error(f"Error in process_and_save for {task['input_path']}: {str(e)}")
+                self.drop_duplicates(task['input_path'], task['pbar'])
+            finally:
+                task['pbar'].update(1)
+
+    async def process_images_batch_async(self, image_tasks, max_retries=5):
+        """Process a batch of images with at most ``concurrency`` requests in flight."""
+        if self.batch_size > 1:
+            batches = iter_video_batches(image_tasks, self.batch_size, key=lambda task: task['input_path'])
+            await run_bounded(batches, lambda tasks: self.process_and_save_batch_async(tasks, max_retries),
+                              self.concurrency, lambda: self.shutdown_requested)
+            return
+
+        async def process(task):
+            await self.process_and_save_async(
+                task['input_path'],
+                task['output_path'],
+                task.get('processed_files'),
+                task.get('checkpoint_file'),
+                task['pbar'],
+                max_retries
+            )
+
+        await run_bounded(image_tasks, process, self.concurrency, lambda: self.shutdown_requested)
+
+    def process_images_batch(self, image_tasks, max_workers=None, max_retries=5):
+        """Process a batch of images on a new event loop.
+
+        ``max_workers`` is accepted for compatibility with ImageProcessor and
+        ignored; ``concurrency`` bounds the requests in flight.
+        """
+        asyncio.run(self.process_images_batch_async(image_tasks, max_retries))
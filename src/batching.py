@@ -0,0 +1,72 @@
+"""
+Multi-frame request module.
+Packs several frames of one video into a single Gemini request, so the prompt
+and the round-trip are paid once per batch, and splits the JSON array the
+model returns back into one caption per frame.
+"""
+
+import os
+import json
+from itertools import groupby, islice
+
+from .config import BATCH_PROMPT, BATCH_INDEX_FIELD
+from .results import CaptionResult, strip_fence
+from .caption_schema import parse_caption, format_caption
+
+
+def iter_video_batches(items, batch_size, key=lambda item: item):
+    """Yield lists of up to ``batch_size`` consecutive items from the same video (parent directory)."""
+    batch_size = max(1, batch_size)
+    for _, group in groupby(items, key=lambda item: os.path.dirname(key(item))):
+        while True:
+            batch = list(islice(group, batch_size))
+            if not batch:
+                break
+            yield batch
+
+
+def batch_contents(prompt, image_parts):
+    """Request contents: the prompt with batch instructions, then each image after its index label."""
+    contents = [prompt + BATCH_PROMPT.format(count=len(image_parts), index_field=BATCH_INDEX_FIELD)]
+    for index, image_part in enumerate(image_parts):
+        contents += [f"Ảnh {index}:", image_part]
+    return contents
+
+
+def split_batch_response(text, count, structured=False, compact=False, metadata=None):
+    """Split a batched response into one CaptionResult per image.
+
+    Entries are matched by their index field, not their position. Images the
+    model omitted, repeated or answered without a caption come back as None,
+    as do entries that do not match the caption schema when ``structured``.
+    """
+    captions = [None] * count
+    try:
+        entries = json.loads(strip_fence(text))
+    except ValueError:
+        return captions
+    if not isinstance(entries, list):
+        return captions
+
+    seen = set()
+    for entry in entries:
+        if not isinstance(entry, dict):
+            continue
+        index = entry.get(BATCH_INDEX_FIELD)
+        if type(index) is not int or not 0 <= index < count:
+            continue
+        if index in seen:
+            # Two answers for one image: trust neither
+            captions[index] = None
+            continue
+        seen.add(index)
+        if structured:
+            fields = parse_caption(entry, batch=True)
+            if fields is None:
+                continue
+        else:
+            fields = {key: value for key, value in entry.items() if key != BATCH_INDEX_FIELD}
+        caption = fields.get('caption')
+        if isinstance(caption, str) and caption.strip():
+            captions[index] = CaptionResult.success(format_caption(fields, compact, metadata))
+    return captions
@@ -0,0 +1,118 @@
+"""
+Content-addressed caption cache module.
+Stores captions under a hash of the image bytes and the request settings, so
+an image seen before (under another key, after a lost checkpoint or in --fix)
+is answered without calling Gemini.
+"""
+
+import os
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+
+from .config import DEFAULT_CAPTION_CACHE_DIR, DEFAULT_CAPTION_CACHE_MEMORY_ENTRIES
+from .results import CaptionResult
+
+
+def request_fingerprint(model, prompt, *settings):
+    """Hash of everything besides the image that decides the caption."""
+    digest = hashlib.sha256()
+    for part in (model, prompt) + settings:
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class CaptionCache:
+    """Two-tier caption cache: an LRU dict in memory in front of one file per caption on disk.
+
+    Only captions are stored, never error outputs, so failed images are
+    always sent again.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CAPTION_CACHE_DIR, memory_entries=DEFAULT_CAPTION_CACHE_MEMORY_ENTRIES):
+        """Initialize with the cache directory and the in-memory tier size."""
+        self.cache_dir = cache_dir
+        self.memory_entries = memory_entries
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'stores': 0}
+
+    @staticmethod
+    def key(image_bytes, fingerprint):
+        """Cache key for an image under a request fingerprint."""
+        digest = hashlib.sha256(image_bytes)
+        digest.update(fingerprint.encode('utf-8'))
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + '.txt')
+
+    def _remember(self, key, caption):
+        """Add a caption to the in-memory tier, evicting the least recently used."""
+        with self.lock:
+            self.memory[key] = caption
+            self.memory.move_to_end(key)
+            while len(self.memory) > self.memory_entries:
+                self.memory.popitem(last=False)
+
+    def _count(self, stat):
+        with self.lock:
+            self.stats[stat] += 1
+
+    def get(self, key):
+        """Return the cached caption for ``key``, or None."""
+        with self.lock:
+            caption = self.memory.get(key)
+            if caption is not None:
+                self.memory.move_to_end(key)
+                self.stats['memory_hits'] += 1
+                return CaptionResult.success(caption)
+
+        try:
+            with open(self._path(key), 'r', encoding='utf-8') as f:
+                caption = f.read()
+        except FileNotFoundError:
+            self._count('misses')
+            return None
+        except OSError as e:
+            logging.warning(f"⚠️  Could not read cached caption {key}: {e}")
+            self._count('misses')
+            return None
+
+        self._remember(key, caption)
+        self._count('disk_hits')
+        return CaptionResult.success(caption)
+
+    def put(self, key, caption):
+        """Store a caption; error outputs are ignored."""
+        if not CaptionResult.parse(caption).ok:
+            return
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write then rename, so concurrent readers never see a partial caption
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(caption)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logging.warning(f"⚠️  Could not cache caption {key}: {e}")
+            return
+        self._remember(key, str(caption))
+        self._count('stores')
+
+    def hits(self):
+        """Number of lookups answered from either tier."""
+        return self.stats['memory_hits'] + self.stats['disk_hits']
+
+    def log_stats(self):
+        """Log cache hits (API calls skipped) and misses."""
+        stats = dict(self.stats)
+        lookups = self.hits() + stats['misses']
+        hit_rate = self.hits() / lookups * 100 if lookups else 0
+        logging.info(f"💾 Caption cache: {self.hits()} hits ({stats['memory_hits']} memory, "
+                     f"{stats['disk_hits']} disk), {stats['misses']} misses, {hit_rate:.1f}% of images "
+                     f"skipped the API")
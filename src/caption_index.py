@@ -0,0 +1,93 @@
+"""
+Caption existence index module.
+Builds the set of caption keys from a single paginated listing of the captions
+prefix and caches it on disk so helper scripts can share it.
+"""
+
+import os
+import gzip
+import json
+import time
+import logging
+from typing import Callable, Iterable, List, Optional
+
+from .config import DEFAULT_CAPTION_INDEX_FILE, DEFAULT_CAPTION_INDEX_MAX_AGE
+
+
+class CaptionIndex:
+    """Set of caption keys that already exist in S3."""
+
+    def __init__(self, caption_keys: Iterable[str] = (), bucket_name: Optional[str] = None,
+                 created_at: Optional[float] = None):
+        """Initialize from an iterable of caption keys."""
+        self.caption_keys = set(caption_keys)
+        self.bucket_name = bucket_name
+        self.created_at = created_at if created_at is not None else time.time()
+
+    def __contains__(self, caption_key: str) -> bool:
+        return caption_key in self.caption_keys
+
+    def __len__(self) -> int:
+        return len(self.caption_keys)
+
+    @classmethod
+    def build(cls, s3_client) -> 'CaptionIndex':
+        """Build the index from one listing of the captions prefix."""
+        return cls(s3_client.list_caption_keys(), bucket_name=s3_client.bucket_name)
+
+    @classmethod
+    def load(cls, path: str = DEFAULT_CAPTION_INDEX_FILE) -> 'CaptionIndex':
+        """Load a cached index written by save()."""
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            header = json.loads(f.readline())
+            caption_keys = (line.rstrip('\n') for line in f)
+            return cls(caption_keys, bucket_name=header.get('bucket'),
+                       created_at=header.get('created_at'))
+
+    def save(self, path: str = DEFAULT_CAPTION_INDEX_FILE):
+        """Write the index to disk atomically."""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        tmp_path = f"{path}.tmp"
+        with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+            header = {'bucket': self.bucket_name, 'created_at': self.created_at,
+                      'count': len(self.caption_keys)}
+            f.write(json.dumps(header) + '\n')
+            for caption_key in sorted(self.caption_keys):
+                f.write(f"{caption_key}\n")
+        os.replace(tmp_path, path)
+
+    def age(self) -> float:
+        """Seconds since the index was built."""
+        return time.time() - self.created_at
+
+    @classmethod
+    def load_or_build(cls, s3_client, path: str = DEFAULT_CAPTION_INDEX_FILE,
+                      max_age: float = DEFAULT_CAPTION_INDEX_MAX_AGE, refresh: bool = False) -> 'CaptionIndex':
+        """Reuse a fresh cached index for this bucket, otherwise rebuild and cache it."""
+        if not refresh and os.path.exists(path):
+            try:
+                index = cls.load(path)
+                if index.bucket_name == s3_client.bucket_name and index.age() <= max_age:
+                    logging.info(f"📂 Loaded caption index with {len(index)} captions "
+                                 f"({index.age() / 60:.0f} min old) from {path}")
+                    return index
+                logging.info(f"Caption index at {path} is stale, rebuilding...")
+            except (OSError, ValueError) as e:
+                logging.warning(f"Could not read caption index {path}: {e}")
+
+        index = cls.build(s3_client)
+        index.save(path)
+        logging.info(f"💾 Cached caption index with {len(index)} captions to {path}")
+        return index
+
+    def add(self, caption_key: str):
+        """Record a caption that was uploaded after the index was built."""
+        self.caption_keys.add(caption_key)
+
+    def missing(self, image_keys: Iterable[str], caption_key_for: Callable[[str], str]) -> List[str]:
+        """Return the image keys that have no caption in the index, preserving order."""
+        return [image_key for image_key in image_keys
+                if caption_key_for(image_key) not in self.caption_keys]
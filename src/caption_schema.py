@@ -0,0 +1,142 @@
+"""
+Caption schema module.
+Pydantic models for the caption JSON described in PROMPT, passed to Gemini as
+``response_schema`` so outputs are always parseable, plus the serialization
+of validated captions for storage.
+
+The Gemini Developer API does not accept free-form object keys in a schema,
+so the open-ended ``objects`` and ``scene_text`` groups are requested as
+lists of named entries and turned back into the keyed objects the prompt
+describes when a caption is stored.
+"""
+
+import json
+
+from pydantic import BaseModel, Field, ValidationError
+
+from .config import BATCH_INDEX_FIELD
+from .results import strip_fence
+
+
+class Camera(BaseModel):
+    angle: str = Field(description="Góc quay")
+    shot_type: str = Field(description="Loại shot")
+    movement: str = Field(description="Chuyển động camera")
+
+
+class Setting(BaseModel):
+    location: str = Field(description="Địa điểm")
+    environment: str = Field(description="Môi trường")
+    venue_type: str = Field(description="Loại địa điểm")
+    time_of_day: str = Field(description="Thời gian")
+
+
+class ObjectGroup(BaseModel):
+    name: str = Field(description="Tên nhóm đối tượng cụ thể, có thể tìm kiếm: people, vehicles, boats, signs, ...")
+    count: int = Field(description="Số lượng (số nguyên dương)")
+    description: str = Field(description="Mô tả chi tiết")
+
+
+class Spatial(BaseModel):
+    left_side: str
+    right_side: str
+    center: str
+    top: str
+    bottom: str
+    foreground: str
+    background: str
+
+
+class Activity(BaseModel):
+    primary_action: str
+    secondary_actions: list[str]
+    movement_patterns: str
+
+
+class SceneTextGroup(BaseModel):
+    name: str = Field(description="Tên nhóm văn bản: street_signs, billboards, shop_names, numbers, ...")
+    texts: list[str]
+
+
+class TextElements(BaseModel):
+    time_display: str
+    channel_logo: str
+    news_ticker: str
+    graphics_overlay: str
+    scene_text: list[SceneTextGroup]
+
+
+class Caption(BaseModel):
+    """Structured caption for one image, in the field order of PROMPT."""
+
+    camera: Camera
+    setting: Setting
+    objects: list[ObjectGroup] = Field(description="CHỈ các nhóm đối tượng thực sự tồn tại trong cảnh")
+    spatial: Spatial
+    activity: Activity
+    text_elements: TextElements
+    caption: str = Field(description="Mô tả tự nhiên, chi tiết, LOẠI TRỪ hoàn toàn đồ họa tin tức")
+
+
+class BatchCaption(Caption):
+    """Caption for one image of a multi-frame request."""
+
+    image_index: int = Field(description="Số của ảnh, bắt đầu từ 0")
+
+
+def response_schema(batch=False):
+    """Schema for a single-image response, or for the array a multi-frame request returns.
+
+    The array must be a builtin ``list``: google-genai rejects ``typing.List`` as a schema type.
+    """
+    return list[BatchCaption] if batch else Caption
+
+
+def schema_fingerprint(batch=False):
+    """Stable text identifying the response schema, for caption cache keys."""
+    model = BatchCaption if batch else Caption
+    return json.dumps(model.model_json_schema(), sort_keys=True, ensure_ascii=False)
+
+
+def caption_fields(caption):
+    """Caption fields in the stored layout, with object and scene-text groups keyed by name."""
+    fields = caption.model_dump(exclude={BATCH_INDEX_FIELD})
+    fields['objects'] = {group.name: {'count': group.count, 'description': group.description}
+                         for group in caption.objects}
+    fields['text_elements']['scene_text'] = {group.name: group.texts for group in caption.text_elements.scene_text}
+    return fields
+
+
+def parse_caption(data, batch=False):
+    """Validate model output (JSON text or a parsed entry) and return its stored fields, or None if invalid."""
+    model = BatchCaption if batch else Caption
+    try:
+        if isinstance(data, str):
+            return caption_fields(model.model_validate_json(strip_fence(data)))
+        return caption_fields(model.model_validate(data))
+    except ValidationError:
+        return None
+
+
+def _compact(value):
+    """Drop empty and "None" values, which carry no information."""
+    if isinstance(value, dict):
+        value = {key: _compact(item) for key, item in value.items()}
+        return {key: item for key, item in value.items() if item not in ('', 'None', [], {}, None)}
+    if isinstance(value, list):
+        return [_compact(item) for item in value if item not in ('', 'None', None)]
+    return value
+
+
+def format_caption(fields, compact=False, metadata=None):
+    """Serialize caption fields for storage: indented, or minified without empty fields when ``compact``.
+
+    ``metadata`` (e.g. the generation profile) is stored under a trailing "metadata" key.
+    """
+    if metadata is not None:
+        fields = {**fields, 'metadata': metadata}
+    if compact:
+        fields = _compact(fields)
+        fields.setdefault('caption', '')
+        return json.dumps(fields, ensure_ascii=False, separators=(',', ':'))
+    return json.dumps(fields, ensure_ascii=False, indent=2)
@@ -0,0 +1,104 @@
+"""
+Model cascade module.
+Cheap local checks that decide whether a caption from a lighter generation
+profile is good enough to keep, and per-tier statistics for the cascade that
+escalates the frames failing them to a stronger profile.
+"""
+
+import json
+import logging
+import threading
+
+from .config import GENERATION_PROFILES, DEFAULT_CASCADE_MIN_CAPTION_CHARS
+from .results import strip_fence
+
+# Top-level fields of the caption JSON described in PROMPT
+REQUIRED_FIELDS = ('camera', 'setting', 'objects', 'spatial', 'activity', 'text_elements', 'caption')
+
+
+def validate_caption(text, compact=False, min_caption_chars=DEFAULT_CASCADE_MIN_CAPTION_CHARS):
+    """Return the reasons a caption looks too poor to keep; empty when it passes.
+
+    Checks that every top-level field is present, that the caption text is
+    not too short and that at least one object group has a positive count.
+    Compact captions omit empty fields, so only the caption must be present.
+    """
+    try:
+        fields = json.loads(strip_fence(text))
+    except ValueError:
+        return ["not JSON"]
+    if not isinstance(fields, dict):
+        return ["not a JSON object"]
+
+    problems = []
+    missing = [field for field in REQUIRED_FIELDS if field not in fields and not (compact and field != 'caption')]
+    if missing:
+        problems.append(f"missing {', '.join(missing)}")
+
+    caption = fields.get('caption')
+    if not isinstance(caption, str) or len(caption.strip()) < min_caption_chars:
+        problems.append("caption too short")
+
+    objects = fields.get('objects') or {}
+    groups = objects.values() if isinstance(objects, dict) else objects if isinstance(objects, list) else []
+    counts = [group.get('count') for group in groups if isinstance(group, dict)]
+    if not counts or not all(type(count) is int and count > 0 for count in counts):
+        problems.append("no object counts")
+    return problems
+
+
+class CascadeStats:
+    """Per-tier outcomes of a model cascade, and what running it saved over the strongest tier alone."""
+
+    def __init__(self, tiers):
+        """Initialize with the profile names tried in order, strongest last."""
+        self.tiers = list(tiers)
+        self.lock = threading.Lock()
+        self.stats = {tier: {'images': 0, 'accepted': 0, 'seconds': 0.0, 'tokens': 0} for tier in self.tiers}
+
+    def record(self, tier, accepted, seconds):
+        """Count a frame answered by a tier, whether its caption was kept, and the request time it took."""
+        with self.lock:
+            stats = self.stats[tier]
+            stats['images'] += 1
+            stats['accepted'] += bool(accepted)
+            stats['seconds'] += seconds
+
+    def add_tokens(self, tier, tokens):
+        """Count tokens spent on a tier."""
+        with self.lock:
+            self.stats[tier]['tokens'] += tokens
+
+    def savings(self):
+        """Estimate request seconds, tokens and strongest-model requests saved against sending every frame
+        to the strongest tier, using its measured cost per frame; None until it has answered a frame."""
+        with self.lock:
+            stats = {tier: dict(tier_stats) for tier, tier_stats in self.stats.items()}
+        top = stats[self.tiers[-1]]
+        if not top['images']:
+            return None
+        frames = sum(tier_stats['accepted'] for tier_stats in stats.values())
+        spent_seconds = sum(tier_stats['seconds'] for tier_stats in stats.values())
+        spent_tokens = sum(tier_stats['tokens'] for tier_stats in stats.values())
+        return {
+            'seconds': frames * top['seconds'] / top['images'] - spent_seconds,
+            'tokens': round(frames * top['tokens'] / top['images'] - spent_tokens),
+            'requests': frames - top['images'],
+        }
+
+    def log_stats(self):
+        """Log each tier's hit rate and the estimated savings."""
+        with self.lock:
+            stats = {tier: dict(tier_stats) for tier, tier_stats in self.stats.items()}
+        for tier in self.tiers:
+            tier_stats = stats[tier]
+            hit_rate = tier_stats['accepted'] / tier_stats['images'] * 100 if tier_stats['images'] else 0
+            seconds = tier_stats['seconds'] / tier_stats['images'] if tier_stats['images'] else 0
+            logging.info(f"🪜 Tier {tier} ({GENERATION_PROFILES[tier]['model']}): {tier_stats['accepted']}/"
+                         f"{tier_stats['images']} frames kept ({hit_rate:.1f}%), {seconds:.2f}s per frame, "
+                         f"{tier_stats['tokens']} tokens")
+        saved = self.savings()
+        if saved is not None:
+            logging.info(f"🪜 Cascade saved ~{saved['seconds']:.0f}s of request time, ~{saved['tokens']} tokens "
+                         f"and {saved['requests']} {GENERATION_PROFILES[self.tiers[-1]]['model']} requests "
+                         f"compared with {self.tiers[-1]} alone")
@@ -0,0 +1,192 @@
+"""
+Checkpoint journal module for tracking processed files.
+
+The checkpoint is stored as a pickled snapshot (the historical ``checkpoint.pkl``
+format) plus an append-only journal of per-image records. Completing an image
+appends a single line to the journal instead of re-pickling the whole set, and
+the journal is folded back into the snapshot periodically on a background thread.
+"""
+
+import os
+import pickle
+import logging
+import threading
+
+from .config import DEFAULT_CHECKPOINT_COMPACT_EVERY
+
+ADD_RECORD = '+'
+DISCARD_RECORD = '-'
+
+
+class CheckpointJournal:
+    """Append-only checkpoint store with background compaction."""
+
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, checkpoint_file='checkpoint.pkl', compact_every=DEFAULT_CHECKPOINT_COMPACT_EVERY):
+        """Initialize journal paths next to the snapshot file."""
+        self.checkpoint_file = checkpoint_file
+        self.journal_file = f"{checkpoint_file}.journal"
+        self.segment_file = f"{checkpoint_file}.journal.compacting"
+        self.compact_every = compact_every
+
+        self.lock = threading.Lock()
+        self.compaction_lock = threading.Lock()
+        self.compaction_thread = None
+        self.records_since_compaction = 0
+        self.fd = None
+
+    @classmethod
+    def for_path(cls, checkpoint_file):
+        """Return the shared journal instance for a checkpoint path."""
+        path = os.path.abspath(checkpoint_file)
+        with cls._instances_lock:
+            journal = cls._instances.get(path)
+            if journal is None:
+                journal = cls(checkpoint_file)
+                cls._instances[path] = journal
+            return journal
+
+    @classmethod
+    def release(cls, checkpoint_file):
+        """Close and forget the shared journal instance for a checkpoint path."""
+        path = os.path.abspath(checkpoint_file)
+        with cls._instances_lock:
+            journal = cls._instances.pop(path, None)
+        if journal is not None:
+            journal.close()
+
+    def exists(self):
+        """Check whether any part of the checkpoint exists on disk."""
+        return any(os.path.exists(path) for path in
+                   (self.checkpoint_file, self.segment_file, self.journal_file))
+
+    def _read_snapshot(self):
+        """Load the pickled snapshot, or an empty set if there is none."""
+        if not os.path.exists(self.checkpoint_file):
+            return set()
+        with open(self.checkpoint_file, 'rb') as f:
+            return set(pickle.load(f))
+
+    def _replay(self, path, processed_files):
+        """Apply the records of one journal file to a set in a single pass."""
+        if not os.path.exists(path):
+            return processed_files
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                # A torn final line from a crash has no newline; skip it
+                if not line.endswith('\n'):
+                    break
+                op, relative_path = line[0], line[1:-1]
+                if op == ADD_RECORD:
+                    processed_files.add(relative_path)
+                elif op == DISCARD_RECORD:
+                    processed_files.discard(relative_path)
+        return processed_files
+
+    def load(self):
+        """Load snapshot and replay pending journal records."""
+        with self.compaction_lock:
+            processed_files = self._read_snapshot()
+            self._replay(self.segment_file, processed_files)
+            self._replay(self.journal_file, processed_files)
+        return processed_files
+
+    def _open_journal(self):
+        """Open the journal for appending if it is not open already."""
+        if self.fd is None:
+            self.fd = os.open(self.journal_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+    def _append(self, op, relative_path):
+        """Append a single record and trigger compaction when due."""
+        record = f"{op}{relative_path}\n".encode('utf-8')
+        with self.lock:
+            self._open_journal()
+            os.write(self.fd, record)
+            self.records_since_compaction += 1
+            compaction_due = (self.compact_every and
+                              self.records_since_compaction >= self.compact_every)
+        if compaction_due:
+            self.compact_async()
+
+    def add(self, relative_path):
+        """Record a processed file."""
+        self._append(ADD_RECORD, relative_path)
+
+    def discard(self, relative_path):
+        """Record that a file must be processed again."""
+        self._append(DISCARD_RECORD, relative_path)
+
+    def _rotate_journal(self):
+        """Move the live journal aside so appends continue into a fresh file."""
+        with self.lock:
+            if self.fd is not None:
+                os.close(self.fd)
+                self.fd = None
+            if os.path.exists(self.journal_file):
+                if os.path.exists(self.segment_file):
+                    # Leftover segment from an interrupted compaction: merge into it
+                    with open(self.journal_file, 'rb') as src, open(self.segment_file, 'ab') as dst:
+                        dst.write(src.read())
+                    os.remove(self.journal_file)
+                else:
+                    os.replace(self.journal_file, self.segment_file)
+            self.records_since_compaction = 0
+
+    def _write_snapshot(self, processed_files):
+        """Atomically replace the snapshot with the given set."""
+        tmp_file = f"{self.checkpoint_file}.tmp"
+        with open(tmp_file, 'wb') as f:
+            pickle.dump(processed_files, f)
+        os.replace(tmp_file, self.checkpoint_file)
+
+    def compact(self):
+        """Fold journal records into the snapshot."""
+        with self.compaction_lock:
+            self._rotate_journal()
+            if not os.path.exists(self.segment_file):
+                return
+            processed_files = self._replay(self.segment_file, self._read_snapshot())
+            self._write_snapshot(processed_files)
+            os.remove(self.segment_file)
+            logging.debug(f"Compacted checkpoint journal into {self.checkpoint_file} "
+                          f"({len(processed_files)} entries)")
+
+    def compact_async(self):
+        """Start a background compaction unless one is already running."""
+        with self.lock:
+            if self.compaction_thread and self.compaction_thread.is_alive():
+                return
+            self.compaction_thread = threading.Thread(target=self._compact_safely, daemon=True)
+            self.compaction_thread.start()
+
+    def _compact_safely(self):
+        """Run compaction from a background thread, logging failures."""
+        try:
+            self.compact()
+        except Exception as e:
+            logging.warning(f"⚠️  Checkpoint compaction failed: {e}")
+
+    def rewrite(self, processed_files):
+        """Replace the whole checkpoint with the given set and reset the journal."""
+        with self.compaction_lock:
+            with self.lock:
+                if self.fd is not None:
+                    os.close(self.fd)
+                    self.fd = None
+                self._write_snapshot(processed_files)
+                for path in (self.segment_file, self.journal_file):
+                    if os.path.exists(path):
+                        os.remove(path)
+                self.records_since_compaction = 0
+
+    def close(self):
+        """Wait for background compaction and close the journal."""
+        thread = self.compaction_thread
+        if thread is not None:
+            thread.join()
+        with self.lock:
+            if self.fd is not None:
+                os.close(self.fd)
+                self.fd = None
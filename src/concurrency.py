@@ -0,0 +1,109 @@
+"""
+Adaptive concurrency module.
+An AIMD (additive increase, multiplicative decrease) window per API key that
+finds how many requests a key can have in flight without being throttled.
+"""
+
+import time
+import asyncio
+import threading
+from collections import deque
+
+from .config import (
+    DEFAULT_AIMD_INITIAL_WINDOW, DEFAULT_AIMD_MIN_WINDOW, DEFAULT_AIMD_MAX_WINDOW,
+    DEFAULT_AIMD_DECREASE, DEFAULT_AIMD_LATENCY_TOLERANCE
+)
+
+# Request outcomes reported to AIMDController.release()
+SUCCESS = 'success'
+OVERLOAD = 'overload'
+FAILURE = 'failure'
+
+# Weight of the newest sample in the success latency average
+_LATENCY_ALPHA = 0.1
+
+
+class AIMDController:
+    """Limits in-flight requests for one key to an adaptive window.
+
+    Each success whose latency stays within ``latency_tolerance`` times the
+    running average grows the window by ``1 / window``, i.e. by one request
+    per window's worth of successes. Until the first cut each such success
+    adds a whole request instead (slow start), so the window doubles every
+    round trip while searching for the limit. A 429/503 multiplies it by
+    ``decrease``.
+    Only requests started after the last cut can cut again, so a burst of
+    throttled requests that were already in flight shrinks the window once.
+    """
+
+    def __init__(self, initial_window=DEFAULT_AIMD_INITIAL_WINDOW, min_window=DEFAULT_AIMD_MIN_WINDOW,
+                 max_window=DEFAULT_AIMD_MAX_WINDOW, decrease=DEFAULT_AIMD_DECREASE,
+                 latency_tolerance=DEFAULT_AIMD_LATENCY_TOLERANCE):
+        """Initialize the window bounds and adjustment factors."""
+        self.window = float(initial_window)
+        self.min_window = min_window
+        self.max_window = max_window
+        self.decrease = decrease
+        self.latency_tolerance = latency_tolerance
+        self.in_flight = 0
+        self.latency = None
+        self.last_cut = 0.0
+        self.cuts = 0
+        self.condition = threading.Condition()
+        self.async_waiters = deque()
+
+    def limit(self):
+        """Current whole-request window."""
+        return max(self.min_window, int(self.window))
+
+    def _try_acquire(self):
+        if self.in_flight < self.limit():
+            self.in_flight += 1
+            return True
+        return False
+
+    def acquire(self):
+        """Block until a slot is free; return a token to pass to release()."""
+        with self.condition:
+            while not self._try_acquire():
+                self.condition.wait()
+        return time.monotonic()
+
+    async def acquire_async(self):
+        """Await a free slot without blocking the event loop."""
+        loop = asyncio.get_running_loop()
+        while True:
+            with self.condition:
+                if self._try_acquire():
+                    return time.monotonic()
+                waiter = loop.create_future()
+                self.async_waiters.append((loop, waiter))
+            await waiter
+
+    def _wake(self):
+        """Wake waiters after a slot frees up or the window grows."""
+        self.condition.notify_all()
+        while self.async_waiters:
+            loop, waiter = self.async_waiters.popleft()
+            loop.call_soon_threadsafe(_resolve, waiter)
+
+    def release(self, token, outcome, latency=None):
+        """Free a slot and adapt the window to the request's outcome."""
+        with self.condition:
+            self.in_flight -= 1
+            if outcome == SUCCESS and latency is not None:
+                if self.latency is None or latency <= self.latency * self.latency_tolerance:
+                    step = 1.0 if not self.cuts else 1.0 / self.window
+                    self.window = min(self.max_window, self.window + step)
+                self.latency = latency if self.latency is None else (
+                    self.latency + _LATENCY_ALPHA * (latency - self.latency))
+            elif outcome == OVERLOAD and token >= self.last_cut:
+                self.window = max(self.min_window, self.window * self.decrease)
+                self.last_cut = time.monotonic()
+                self.cuts += 1
+            self._wake()
+
+
+def _resolve(waiter):
+    if not waiter.done():
+        waiter.set_result(None)
@@ -39,6 +39,7 @@ PROCESSING_MODE = os.getenv('PROCESSING_MODE', ProcessingMode.LOCAL)
 # Local directory paths (for backward compatibility)
 INPUT_DIR = "/Volumes/Bobbie/AIO2025/scr/S3/images"
 OUTPUT_DIR = "/Volumes/Bobbie/AIO2025/scr/S3/captions"
+STATUS_INDEX_NAME = ".caption_status.sqlite"  # Caption status index kept inside the output directory
 
 # ==============================================================================
 # S3 CONFIGURATION
@@ -64,7 +65,8 @@ WORKER_ID = os.getenv('WORKER_ID', 'default')
 # ERROR DETECTION AND RATE LIMITING
 # ==============================================================================
 
-# Error detection patterns
+# Error patterns for plain-text outputs from older versions; current error
+# outputs carry a machine-readable marker (see src/results.py)
 ERROR_MESSAGES = [
     "An internal error has occurred. Please retry or report in https://developers.generativeai.google/guide/troubleshooting",
     "Error in process_and_save for",
@@ -92,6 +94,24 @@ RATE_LIMIT_MESSAGES = [
     "rate_limit_exceeded"
 ]
 
+# Gemini model used for captions
+GEMINI_MODEL = 'gemini-2.5-flash'
+
+# Generation profiles (--profile): model and generation settings per latency/cost tier.
+# None leaves a setting at the model's default; max_output_tokens is per image.
+GENERATION_PROFILES = {
+    'fast': {'model': 'gemini-2.5-flash-lite', 'thinking_budget': 0, 'max_output_tokens': 2048,
+             'temperature': 0.2},
+    'balanced': {'model': GEMINI_MODEL, 'thinking_budget': 512, 'max_output_tokens': 4096,
+                 'temperature': 0.4},
+    'quality': {'model': GEMINI_MODEL, 'thinking_budget': None, 'max_output_tokens': None,
+                'temperature': None},
+}
+DEFAULT_PROFILE = 'quality'
+
+# Model cascade (--cascade): captions from cheaper profiles shorter than this are escalated
+DEFAULT_CASCADE_MIN_CAPTION_CHARS = 40
+
 # Configure maximum relaxed safety settings
 SAFETY_SETTINGS = [
     types.SafetySetting(
@@ -119,8 +139,72 @@ IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.bmp')
 DEFAULT_MAX_WORKERS = 10
 DEFAULT_MAX_RETRIES = 30
 DEFAULT_KEY_ROTATION_DELAY = 1.0
-DEFAULT_RATE_LIMIT_CALLS = 1000
-DEFAULT_RATE_LIMIT_PERIOD = 60
+# Per-key Gemini quotas used to pace requests (see your project's rate limit page)
+DEFAULT_KEY_RPM = int(os.getenv('GEMINI_KEY_RPM', '1000'))
+DEFAULT_KEY_TPM = int(os.getenv('GEMINI_KEY_TPM', '1000000'))
+DEFAULT_ESTIMATED_REQUEST_TOKENS = 3000  # Starting guess, refined from response usage metadata
+DEFAULT_QUOTA_BURST_SECONDS = 1.0  # Budget a key can bank while idle
+DEFAULT_RATE_LIMIT_COOLDOWN = 10.0  # Seconds a key gets no requests after a 429
+DEFAULT_CHECKPOINT_COMPACT_EVERY = 5000  # Journal records between background compactions
+DEFAULT_TASK_WINDOW_PER_WORKER = 2  # Threaded mode: tasks submitted ahead per worker thread
+
+# Adaptive (AIMD) in-flight request window per key
+DEFAULT_AIMD_INITIAL_WINDOW = 8
+DEFAULT_AIMD_MIN_WINDOW = 1
+DEFAULT_AIMD_MAX_WINDOW = 512
+DEFAULT_AIMD_DECREASE = 0.5  # Window multiplier on 429/503
+DEFAULT_AIMD_LATENCY_TOLERANCE = 2.0  # Grow only while latency stays within this factor of its average
+
+# Near-duplicate frame detection (--dedupe): 64-bit difference hashes per video
+DEFAULT_DEDUPE_HASH_SIZE = 8
+DEFAULT_DEDUPE_THRESHOLD = 4  # Max differing bits for two frames to share a caption
+DEFAULT_DEDUPE_WORKERS = 8  # Threads loading and hashing a video's frames
+
+# Content-addressed caption cache: image hash + request settings → caption
+DEFAULT_CAPTION_CACHE_DIR = os.getenv('CAPTION_CACHE_DIR', './.cache/captions')
+DEFAULT_CAPTION_CACHE_MEMORY_ENTRIES = 10000  # Captions kept in the in-memory LRU tier
+
+# Prompt context caching: one cached-content handle holding PROMPT per key
+DEFAULT_PROMPT_CACHE_TTL = 3600  # Seconds a handle lives without being extended
+DEFAULT_PROMPT_CACHE_REFRESH_MARGIN = 300  # Extend a handle this many seconds before it expires
+DEFAULT_PROMPT_CACHE_RETRY_SECONDS = 600  # Inline prompts on a key this long after a handle could not be created
+
+# Multi-frame requests: frames of one video sent with a single copy of the prompt
+DEFAULT_BATCH_SIZE = 1  # 1 sends every frame on its own
+BATCH_INDEX_FIELD = 'image_index'
+
+# Image preprocessing settings
+DEFAULT_PREPROCESS_MAX_EDGE = 768  # Longest side in pixels; 768 keeps 16:9 frames to a single image tile
+DEFAULT_PREPROCESS_FORMAT = 'jpeg'
+DEFAULT_PREPROCESS_QUALITY = 85
+DEFAULT_PREPROCESS_WORKERS = os.cpu_count() or 4
+
+# Parallel S3 listing: frames/Kxx/Vyyy/ prefixes are paged concurrently
+DEFAULT_LIST_WORKERS = 16
+DEFAULT_LIST_PARTITION_DEPTH = 2
+DEFAULT_S3_MAX_POOL_CONNECTIONS = 50
+
+# Cached S3 image inventory manifest shared by the S3 helper scripts
+DEFAULT_INVENTORY_FILE = os.getenv('INVENTORY_FILE', './.cache/s3_inventory.tsv.gz')
+
+# Cached caption existence index shared by the S3 helper scripts
+DEFAULT_CAPTION_INDEX_FILE = os.getenv('CAPTION_INDEX_FILE', './.cache/caption_index.txt.gz')
+DEFAULT_CAPTION_INDEX_MAX_AGE = 3600  # Seconds before the cached index is rebuilt
+
+# Shared lease queue for S3 workers (a SQLite file all workers can reach)
+DEFAULT_LEASE_SECONDS = 300.0  # A worker's keys return to the queue if it stops renewing for this long
+DEFAULT_LEASE_BATCH_SIZE = 50  # Keys handed out per lease
+DEFAULT_LEASE_MAX_ATTEMPTS = 3  # Failed or abandoned attempts before a key is given up on
+DEFAULT_LEASE_POLL_SECONDS = 5.0  # Idle wait while other workers still hold keys
+
+# S3 worker pipeline stages (Gemini callers use --max_workers)
+DEFAULT_DOWNLOAD_WORKERS = 4
+DEFAULT_UPLOAD_WORKERS = 4
+DEFAULT_PIPELINE_QUEUE_SIZE = 32
+
+# asyncio mode: Gemini requests in flight on the event loop
+DEFAULT_ASYNC_CONCURRENCY = 256
+DEFAULT_ASYNC_CONNECTIONS_PER_CLIENT = 16  # Connections per SDK client; clients are added to reach the limit
 
 # Define the updated prompt
 PROMPT = """
@@ -223,8 +307,17 @@ PROMPT = """
 - TUYỆT ĐỐI không đề cập đến đồ họa tin tức trong caption cuối cùng
 """
 
-def parse_arguments():
-    """Parse command line arguments."""
+# Appended to PROMPT when several frames share one request
+BATCH_PROMPT = """
+### Nhiều ảnh trong một yêu cầu:
+- Yêu cầu này có {count} ảnh, mỗi ảnh đứng sau nhãn "Ảnh <số>" (số bắt đầu từ 0)
+- Phân tích TỪNG ảnh độc lập theo đúng hướng dẫn trên, không trộn thông tin giữa các ảnh
+- Trả về MỘT mảng JSON gồm đúng {count} đối tượng theo thứ tự ảnh, mỗi đối tượng theo Format JSON ở trên
+- Mỗi đối tượng PHẢI có thêm trường "{index_field}" (số của ảnh) làm trường đầu tiên
+"""
+
+def parse_arguments(argv=None):
+    """Parse command line arguments (``argv`` defaults to sys.argv)."""
     parser = argparse.ArgumentParser(description="Image Captioning Script with Error Recovery and API Key Rotation")
     parser.add_argument("--fix", action="store_true", help="Run in fix mode to correct error files")
     parser.add_argument("--max_workers", type=int, default=DEFAULT_MAX_WORKERS, help="Maximum number of worker threads")
@@ -232,14 +325,38 @@ def parse_arguments():
     parser.add_argument("--retries", type=int, default=DEFAULT_MAX_RETRIES, help="Max retries for Gemini API errors (default: 30)")
     parser.add_argument("--key-rotation-delay", type=float, default=DEFAULT_KEY_ROTATION_DELAY, help="Delay in seconds between key rotations (default: 1.0)")
     parser.add_argument("--show-key-stats", action="store_true", help="Show API key statistics and exit")
+    parser.add_argument("--dedupe", action="store_true", help="Caption one frame per group of near-identical frames in a video and copy its caption to the rest")
+    parser.add_argument("--dedupe-threshold", type=int, default=DEFAULT_DEDUPE_THRESHOLD, help="Max differing hash bits for frames to count as near-duplicates (default: 4)")
+    parser.add_argument("--no-caption-cache", action="store_true", help="Always call Gemini, even for images whose caption is cached")
+    parser.add_argument("--no-prompt-cache", action="store_true", help="Send the prompt inline with every request instead of caching it per API key")
+    parser.add_argument("--profile", choices=sorted(GENERATION_PROFILES), default=DEFAULT_PROFILE, help="Generation profile: model, thinking budget, output limit and temperature (default: quality)")
+    parser.add_argument("--cascade", nargs='+', choices=sorted(GENERATION_PROFILES), default=None, metavar="PROFILE", help="Try these cheaper profiles first and re-run frames whose captions fail local checks with --profile")
+    parser.add_argument("--no-response-schema", action="store_true", help="Don't constrain Gemini output to the caption JSON schema")
+    parser.add_argument("--compact-captions", action="store_true", help="Store captions as minified JSON without empty or \"None\" fields")
+    parser.add_argument("--preprocess", action="store_true", help="Downscale and re-encode images on a process pool before sending them to Gemini")
+    parser.add_argument("--max-edge", type=int, default=DEFAULT_PREPROCESS_MAX_EDGE, help="Longest image side in pixels with --preprocess (default: 768)")
+    parser.add_argument("--image-format", choices=['jpeg', 'webp'], default=DEFAULT_PREPROCESS_FORMAT, help="Format images are re-encoded to with --preprocess (default: jpeg)")
+    parser.add_argument("--image-quality", type=int, default=DEFAULT_PREPROCESS_QUALITY, help="Re-encoding quality with --preprocess (default: 85)")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Frames of one video sent per Gemini request (default: 1, no batching)")
+    parser.add_argument("--rebuild-status-index", action="store_true", help="Rebuild the caption status index from the output directory and exit")
     
     # New arguments for distributed processing
     parser.add_argument("--worker-file", type=str, help="Path to worker file containing list of images to process")
+    parser.add_argument("--shard", type=str, metavar="i/N", help="Process shard i of N (e.g. 2/4) of the cached S3 inventory instead of a worker file")
+    parser.add_argument("--refresh-inventory", action="store_true", help="Pick up new images in the cached S3 inventory before selecting a shard")
+    parser.add_argument("--queue", type=str, help="Pull batches of keys from a shared lease queue file instead of a fixed assignment")
+    parser.add_argument("--lease-seconds", type=float, default=DEFAULT_LEASE_SECONDS, help="Seconds a --queue lease lasts without renewal (default: 300)")
+    parser.add_argument("--lease-batch-size", type=int, default=DEFAULT_LEASE_BATCH_SIZE, help="Keys per --queue lease (default: 50)")
     parser.add_argument("--worker-id", type=str, default="default", help="Worker ID for identification in logs")
     parser.add_argument("--processing-mode", choices=[ProcessingMode.LOCAL, ProcessingMode.S3_FULL, ProcessingMode.S3_WORKER], 
                        default=ProcessingMode.LOCAL, help="Processing mode: local, s3_full, or s3_worker")
+    parser.add_argument("--download-workers", type=int, default=DEFAULT_DOWNLOAD_WORKERS, help="Concurrent S3 downloads in s3_worker mode (default: 4)")
+    parser.add_argument("--upload-workers", type=int, default=DEFAULT_UPLOAD_WORKERS, help="Concurrent S3 uploads in s3_worker mode (default: 4)")
+    parser.add_argument("--pipeline-queue-size", type=int, default=DEFAULT_PIPELINE_QUEUE_SIZE, help="Max images buffered between s3_worker pipeline stages (default: 32)")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="Run Gemini requests on an asyncio event loop instead of worker threads")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_ASYNC_CONCURRENCY, help="Max in-flight requests with --async (default: 256)")
     
-    return parser.parse_args()
+    return parser.parse_args(argv)
 
 def get_image_list_from_worker_file(worker_file_path: str) -> list:
     """Load image paths from worker assignment file."""
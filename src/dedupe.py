@@ -0,0 +1,142 @@
+"""
+Near-duplicate frame detection module.
+Groups visually identical keyframes within each video by perceptual hash so
+only one frame per group is sent to Gemini; the other frames receive a copy of
+its caption marked as propagated.
+"""
+
+import io
+import os
+import logging
+import threading
+from itertools import groupby
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+
+from .config import DEFAULT_DEDUPE_HASH_SIZE, DEFAULT_DEDUPE_THRESHOLD, DEFAULT_DEDUPE_WORKERS
+
+
+def dhash(source, hash_size=DEFAULT_DEDUPE_HASH_SIZE):
+    """Difference hash of an image given as a path, file object or bytes.
+
+    Each bit records whether a pixel of the shrunken greyscale image is
+    brighter than its right neighbour, so re-encoding or small changes flip
+    only a few bits.
+    """
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    with Image.open(source) as image:
+        # JPEG frames are decoded at a reduced scale, which is much faster than a full decode
+        image.draft('L', (hash_size * 4, hash_size * 4))
+        pixels = image.convert('L').resize((hash_size + 1, hash_size), Image.Resampling.BILINEAR).tobytes()
+
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def hamming_distance(a, b):
+    """Number of bits that differ between two hashes."""
+    return bin(a ^ b).count('1')
+
+
+def cluster_hashes(hashes, threshold=DEFAULT_DEDUPE_THRESHOLD):
+    """Group hash indices so every member is within ``threshold`` bits of its cluster's first index.
+
+    Clusters come out in order of their first index. ``None`` (an unhashable
+    frame) always gets a cluster of its own.
+    """
+    clusters = []
+    representatives = []
+    for index, value in enumerate(hashes):
+        if value is None:
+            clusters.append([index])
+            continue
+        for rep_hash, cluster in representatives:
+            if hamming_distance(value, rep_hash) <= threshold:
+                cluster.append(index)
+                break
+        else:
+            cluster = [index]
+            representatives.append((value, cluster))
+            clusters.append(cluster)
+    return clusters
+
+
+class FrameDeduplicator:
+    """Pre-pass that passes on one representative per cluster of near-identical frames.
+
+    Frames are grouped by video (their parent directory) as they stream past,
+    so input must list each video's frames together, as directory scans and
+    sorted S3 listings do.
+    """
+
+    def __init__(self, threshold=DEFAULT_DEDUPE_THRESHOLD, hash_size=DEFAULT_DEDUPE_HASH_SIZE,
+                 workers=DEFAULT_DEDUPE_WORKERS):
+        """Initialize with the Hamming threshold and hashing parallelism."""
+        self.threshold = threshold
+        self.hash_size = hash_size
+        self.workers = max(1, workers)
+        self.duplicates = {}
+        self.lock = threading.Lock()
+        self.stats = {'frames': 0, 'representatives': 0, 'duplicates': 0, 'propagated': 0}
+
+    def _hash(self, load, item):
+        """Return ``(hash, loaded data)``; either is None when loading or hashing fails."""
+        data = None
+        try:
+            data = load(item)
+            return dhash(data, self.hash_size), data
+        except Exception as e:
+            logging.warning(f"⚠️  Could not hash frame {item}: {e}")
+            return None, data
+
+    def iter_representatives(self, items, key=lambda item: item, load=lambda item: item, with_data=False):
+        """Yield the representative frame of each near-duplicate cluster.
+
+        ``key(item)`` is the frame's path or S3 key; ``load(item)`` returns
+        what to hash (a path, file object or bytes). With ``with_data``,
+        ``(item, loaded data)`` pairs are yielded so callers that downloaded a
+        frame to hash it need not download it again. The other members of each
+        cluster are kept until ``pop_duplicates`` is called with the
+        representative's key.
+        """
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="dedupe") as executor:
+            for _, group in groupby(items, key=lambda item: os.path.dirname(key(item))):
+                frames = sorted(group, key=key)
+                hashed = list(executor.map(lambda item: self._hash(load, item), frames))
+                clusters = cluster_hashes([value for value, _ in hashed], self.threshold)
+                # Only representatives' data is passed on; the duplicates' is dropped before yielding
+                data = {cluster[0]: hashed[cluster[0]][1] for cluster in clusters} if with_data else {}
+                del hashed
+
+                with self.lock:
+                    self.stats['frames'] += len(frames)
+                    self.stats['representatives'] += len(clusters)
+                    self.stats['duplicates'] += len(frames) - len(clusters)
+                    for cluster in clusters:
+                        if len(cluster) > 1:
+                            self.duplicates[key(frames[cluster[0]])] = [frames[i] for i in cluster[1:]]
+
+                for cluster in clusters:
+                    first = cluster[0]
+                    yield (frames[first], data.pop(first)) if with_data else frames[first]
+
+    def pop_duplicates(self, representative_key):
+        """Take the frames that should receive the caption of ``representative_key``."""
+        with self.lock:
+            return self.duplicates.pop(representative_key, [])
+
+    def record_propagated(self, count=1):
+        """Count captions written for duplicates instead of calling the API."""
+        with self.lock:
+            self.stats['propagated'] += count
+
+    def log_stats(self):
+        """Log how many API calls near-duplicate detection saved."""
+        stats = dict(self.stats)
+        logging.info(f"🪞 Near-duplicate frames: {stats['duplicates']} of {stats['frames']} frames matched "
+                     f"another frame in their video; {stats['propagated']} API calls saved")
@@ -3,12 +3,15 @@ File management module for handling file operations, checkpoints, and directory
 """
 
 import os
-import pickle
 import logging
+import threading
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from tqdm import tqdm
 
-from .config import INPUT_DIR, OUTPUT_DIR, IMAGE_EXTENSIONS, ERROR_MESSAGES
+from .config import INPUT_DIR, OUTPUT_DIR, IMAGE_EXTENSIONS
+from .checkpoint import CheckpointJournal
+from .status_index import StatusIndex, STATUS_ERROR, STATUS_TERMINAL
+from .results import CaptionResult
 
 
 class FileManager:
@@ -19,60 +22,74 @@ class FileManager:
         self.input_dir = input_dir or INPUT_DIR
         self.output_dir = output_dir or OUTPUT_DIR
 
+    @property
+    def status_index(self):
+        """Shared caption status index for the output directory."""
+        return StatusIndex.for_output_dir(self.output_dir)
+
     def load_checkpoint(self, checkpoint_file='checkpoint.pkl'):
-        """Load processed files from checkpoint."""
-        if os.path.exists(checkpoint_file):
-            with open(checkpoint_file, 'rb') as f:
-                processed_files = pickle.load(f)
+        """Load processed files from checkpoint snapshot and journal."""
+        journal = CheckpointJournal.for_path(checkpoint_file)
+        if journal.exists():
+            processed_files = journal.load()
             logging.info(f"📂 Loaded checkpoint with {len(processed_files)} processed files.")
             return processed_files
         return set()
 
     def save_checkpoint(self, processed_files, checkpoint_file='checkpoint.pkl'):
-        """Save processed files to checkpoint."""
-        with open(checkpoint_file, 'wb') as f:
-            pickle.dump(processed_files, f)
+        """Rewrite the full checkpoint from the given set."""
+        CheckpointJournal.for_path(checkpoint_file).rewrite(processed_files)
+
+    def record_processed(self, relative_path, checkpoint_file='checkpoint.pkl'):
+        """Append a single processed file to the checkpoint journal."""
+        CheckpointJournal.for_path(checkpoint_file).add(relative_path)
 
     def remove_checkpoint(self, checkpoint_file='checkpoint.pkl'):
-        """Remove checkpoint file after completion."""
-        if os.path.exists(checkpoint_file):
-            os.remove(checkpoint_file)
+        """Remove checkpoint files after completion."""
+        journal = CheckpointJournal.for_path(checkpoint_file)
+        CheckpointJournal.release(checkpoint_file)
+        removed = False
+        for path in (journal.checkpoint_file, journal.segment_file, journal.journal_file):
+            if os.path.exists(path):
+                os.remove(path)
+                removed = True
+        if removed:
             logging.info("🗑️  Processing completed. Checkpoint file removed.")
 
     def has_error_content(self, content):
-        """Check if the content contains any error indicators."""
-        content_lower = content.lower()
-        return any(error_msg.lower() in content_lower for error_msg in ERROR_MESSAGES)
+        """Check if the content is an error output rather than a caption."""
+        return not CaptionResult.parse(content).ok
 
     def scan_for_error_files(self):
-        """Scan all output files for errors and return list of files that need reprocessing."""
-        error_files = []
-
+        """Return output files that need reprocessing, from the caption status index."""
         if not os.path.exists(self.output_dir):
-            return error_files
-
-        logging.info("🔍 Scanning existing output files for errors...")
-
-        for root, _, files in os.walk(self.output_dir):
-            for file in files:
-                if file.endswith('.txt'):
-                    file_path = os.path.join(root, file)
-                    try:
-                        with open(file_path, 'r', encoding='utf-8') as f:
-                            content = f.read()
-                            if self.has_error_content(content):
-                                error_files.append(file_path)
-                    except Exception as e:
-                        logging.warning(f"Could not read file {file_path}: {e}")
-                        error_files.append(file_path)  # Treat unreadable files as errors
+            return []
+
+        index = self.status_index
+        if not index.is_complete():
+            self.rebuild_status_index()
+
+        error_files = index.error_paths()
 
         if error_files:
             logging.info(f"📊 Found {len(error_files)} files with errors that need reprocessing")
         else:
             logging.info("✅ No error files found")
+        terminal = index.counts().get(STATUS_TERMINAL, 0)
+        if terminal:
+            logging.info(f"⛔ {terminal} files have terminal errors (e.g. safety blocks) and are not retried")
 
         return error_files
 
+    def rebuild_status_index(self):
+        """Re-read every output file into the caption status index."""
+        logging.info("🔍 Scanning existing output files to build the caption status index...")
+        total = self.status_index.rebuild()
+        counts = self.status_index.counts()
+        errors = counts.get(STATUS_ERROR, 0) + counts.get(STATUS_TERMINAL, 0)
+        logging.info(f"🗂️  Caption status index: {total} captions, {errors} with errors")
+        return total
+
     def mark_error_files_for_retry(self, processed_files, checkpoint_file='checkpoint.pkl'):
         """Mark error files for retry by removing them from processed_files."""
         error_files = self.scan_for_error_files()
@@ -94,42 +111,81 @@ class FileManager:
             self.save_checkpoint(processed_files, checkpoint_file)
             logging.info(f"📝 Updated checkpoint: removed {len(error_files)} error files from processed list")
 
+    def iter_image_files(self):
+        """Yield ``(input_path, relative_path)`` for every image in one os.scandir pass."""
+        stack = [(self.input_dir, '')]
+        while stack:
+            directory, relative_dir = stack.pop()
+            subdirs = []
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        relative_path = os.path.join(relative_dir, entry.name) if relative_dir else entry.name
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirs.append((entry.path, relative_path))
+                        elif entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                            yield entry.path, relative_path
+            except OSError as e:
+                logging.warning(f"⚠️  Could not scan {directory}: {e}")
+            stack.extend(reversed(subdirs))
+
     def get_image_files(self):
         """Get all image files from input directory."""
-        image_files = []
-        for root, dirs, files in os.walk(self.input_dir):
-            for file in files:
-                if file.lower().endswith(IMAGE_EXTENSIONS):
-                    image_files.append(os.path.join(root, file))
-        return image_files
+        return [input_path for input_path, _ in self.iter_image_files()]
 
     def count_total_files(self):
         """Count total image files in input directory."""
-        total_files = sum([len([f for f in files if f.lower().endswith(IMAGE_EXTENSIONS)])
-                          for r, d, files in os.walk(self.input_dir)])
-        return total_files
+        return sum(1 for _ in self.iter_image_files())
+
+    def count_total_files_async(self, callback):
+        """Count image files on a background thread and pass the total to ``callback``."""
+        thread = threading.Thread(target=lambda: callback(self.count_total_files()), daemon=True)
+        thread.start()
+        return thread
+
+    def iter_pending_files(self, processed_files, retry_errors=False, checkpoint_file=None):
+        """Yield files that haven't been processed yet as the input directory is scanned.
+
+        Output directories are created the first time a file needs one. With
+        ``retry_errors``, processed files whose output holds an error are
+        removed from ``processed_files`` (and the checkpoint) and yielded too.
+        They are looked up in the caption status index, rebuilt once up front
+        when incomplete, so output files are not read one by one.
+        """
+        created_dirs = set()
+        retry_paths = set()
+        if retry_errors and os.path.exists(self.output_dir):
+            if not self.status_index.is_complete():
+                self.rebuild_status_index()
+            retry_paths = set(self.status_index.error_paths())
+
+        for input_path, relative_path in self.iter_image_files():
+            output_path = os.path.join(self.output_dir, os.path.splitext(relative_path)[0] + '.txt')
+
+            if relative_path in processed_files:
+                if not retry_errors:
+                    continue
+                if output_path not in retry_paths:
+                    continue
+                processed_files.discard(relative_path)
+                if checkpoint_file:
+                    CheckpointJournal.for_path(checkpoint_file).discard(relative_path)
+                logging.info(f"🔄 Marked for retry: {relative_path}")
+
+            output_dir = os.path.dirname(output_path)
+            if output_dir not in created_dirs:
+                os.makedirs(output_dir, exist_ok=True)
+                created_dirs.add(output_dir)
+
+            yield {
+                'input_path': input_path,
+                'output_path': output_path,
+                'relative_path': relative_path
+            }
 
     def get_pending_files(self, processed_files):
         """Get list of files that haven't been processed yet."""
-        pending_files = []
-
-        for root, dirs, files in os.walk(self.input_dir):
-            for file in files:
-                if file.lower().endswith(IMAGE_EXTENSIONS):
-                    input_path = os.path.join(root, file)
-                    relative_path = os.path.relpath(input_path, self.input_dir)
-
-                    if relative_path not in processed_files:
-                        output_path = os.path.join(self.output_dir, os.path.splitext(relative_path)[0] + '.txt')
-                        os.makedirs(os.path.dirname(output_path), exist_ok=True)
-
-                        pending_files.append({
-                            'input_path': input_path,
-                            'output_path': output_path,
-                            'relative_path': relative_path
-                        })
-
-        return pending_files
+        return list(self.iter_pending_files(processed_files))
 
     def get_error_file_inputs(self):
         """Get input files corresponding to error output files."""
@@ -154,16 +210,17 @@ class FileManager:
 
         return input_files
 
-    def prepare_image_tasks(self, file_list, processed_files=None, checkpoint_file=None, pbar=None):
-        """Prepare image processing tasks from file list."""
-        tasks = []
+    def iter_image_tasks(self, file_list, processed_files=None, checkpoint_file=None, pbar=None):
+        """Yield image processing tasks from file list one at a time."""
         for file_info in file_list:
-            task = {
+            yield {
                 'input_path': file_info['input_path'],
                 'output_path': file_info['output_path'],
                 'processed_files': processed_files,
                 'checkpoint_file': checkpoint_file,
                 'pbar': pbar
             }
-            tasks.append(task)
-        return tasks
+
+    def prepare_image_tasks(self, file_list, processed_files=None, checkpoint_file=None, pbar=None):
+        """Prepare image processing tasks from file list."""
+        return list(self.iter_image_tasks(file_list, processed_files, checkpoint_file, pbar))
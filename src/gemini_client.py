@@ -4,72 +4,185 @@ Handles all interactions with the Google GenAI API.
 """
 
 import json
+import math
 import time
+import asyncio
 import random
+import itertools
 import threading
 import logging
-from functools import wraps
 
+import httpx
 from google import genai
 from google.genai import types
 
 from .config import (
-    GENAI_API_KEYS, SAFETY_SETTINGS, PROMPT, RATE_LIMIT_MESSAGES,
-    DEFAULT_RATE_LIMIT_CALLS, DEFAULT_RATE_LIMIT_PERIOD
+    GENAI_API_KEYS, SAFETY_SETTINGS, PROMPT, RATE_LIMIT_MESSAGES, GENERATION_PROFILES, DEFAULT_PROFILE,
+    DEFAULT_ASYNC_CONCURRENCY, DEFAULT_ASYNC_CONNECTIONS_PER_CLIENT, DEFAULT_KEY_RPM,
+    DEFAULT_KEY_TPM, DEFAULT_RATE_LIMIT_COOLDOWN, DEFAULT_CASCADE_MIN_CAPTION_CHARS
 )
+from .batching import batch_contents, split_batch_response
+from .caption_cache import request_fingerprint
+from .caption_schema import response_schema, schema_fingerprint, parse_caption, format_caption
+from .cascade import CascadeStats, validate_caption
+from .prompt_cache import is_cache_error
+from .preprocess import detect_mime_type
+from .pacing import KeyBudget, QuotaDispatcher
+from .concurrency import AIMDController, SUCCESS, OVERLOAD, FAILURE
+from .results import (
+    CaptionResult, NO_CANDIDATES, NO_CONTENT, SAFETY_BLOCKED, MAX_TOKENS, UNEXPECTED_FINISH,
+    RATE_LIMITED, SERVER_ERROR, INVALID_REQUEST, REQUEST_FAILED, INVALID_OUTPUT, strip_fence
+)
+
 
+class ClientPool:
+    """Long-lived genai.Client instances, one per API key.
 
-class RateLimiter:
-    """Rate limiter decorator for API calls."""
+    Clients are created on first use and kept, so each key reuses its HTTP
+    connections and TLS sessions. Requests pin the client they start with;
+    switching keys never replaces a client another thread is using.
+    """
 
-    def __init__(self, max_calls=DEFAULT_RATE_LIMIT_CALLS, period=DEFAULT_RATE_LIMIT_PERIOD):
-        self.max_calls = max_calls
-        self.period = period
-        self.calls = []
+    def __init__(self, api_keys, http_options=None, async_concurrency=DEFAULT_ASYNC_CONCURRENCY):
+        """Initialize with API keys, optional SDK HttpOptions and the async request limit."""
+        self.api_keys = api_keys
+        self.http_options = http_options
+        self.async_concurrency = async_concurrency
+        self.clients = [None] * len(api_keys)
+        self.async_clients = {}
+        self.async_loop = None
+        self.async_counter = itertools.count()
         self.lock = threading.Lock()
 
-    def __call__(self, func):
-        @wraps(func)
-        def wrapper(*args, **kwargs):
+    def _create(self, key_index, http_options=None):
+        """Create an SDK client for the given key."""
+        http_options = http_options or self.http_options
+        if http_options is None:
+            return genai.Client(api_key=self.api_keys[key_index])
+        return genai.Client(api_key=self.api_keys[key_index], http_options=http_options)
+
+    def get(self, key_index):
+        """Return the key's client, creating it on first use."""
+        client = self.clients[key_index]
+        if client is None:
             with self.lock:
-                now = time.time()
-                self.calls = [call for call in self.calls if call > now - self.period]
-                if len(self.calls) >= self.max_calls:
-                    sleep_time = self.calls[0] - (now - self.period)
-                    time.sleep(sleep_time)
-                self.calls.append(time.time())
-            return func(*args, **kwargs)
-        return wrapper
+                client = self.clients[key_index]
+                if client is None:
+                    client = self.clients[key_index] = self._create(key_index)
+        return client
+
+    def get_async(self, key_index):
+        """Return one of the key's clients for an async request.
+
+        httpx scans its whole connection pool on every request, so one client
+        holding hundreds of connections costs more CPU than the requests
+        themselves. Each key gets several clients with small pools that
+        together hold ``async_concurrency`` connections, used round-robin.
+        Async clients are bound to the event loop they were first used on and
+        are recreated for a new loop.
+        """
+        loop = asyncio.get_running_loop()
+        with self.lock:
+            if self.async_loop is not loop:
+                self.async_clients = {}
+                self.async_loop = loop
+            clients = self.async_clients.get(key_index)
+            if clients is None:
+                per_client = DEFAULT_ASYNC_CONNECTIONS_PER_CLIENT
+                limits = httpx.Limits(max_connections=per_client, max_keepalive_connections=per_client)
+                http_options = (self.http_options.model_copy() if self.http_options is not None
+                                else types.HttpOptions())
+                http_options.async_client_args = {**(http_options.async_client_args or {}), 'limits': limits}
+
+                num_clients = max(1, math.ceil(self.async_concurrency / per_client))
+                clients = self.async_clients[key_index] = [self._create(key_index, http_options)
+                                                           for _ in range(num_clients)]
+        return clients[next(self.async_counter) % len(clients)]
 
 
 class GeminiClient:
     """Manages Gemini API client with key rotation and error handling."""
 
-    def __init__(self, api_keys=None):
-        """Initialize with API keys."""
+    def __init__(self, api_keys=None, http_options=None, async_concurrency=DEFAULT_ASYNC_CONCURRENCY,
+                 rpm=DEFAULT_KEY_RPM, tpm=DEFAULT_KEY_TPM, cache=None, preprocessor=None, prompt_cache=None,
+                 structured_output=False, compact=False, profile=DEFAULT_PROFILE, cascade=None):
+        """Initialize with API keys, optional SDK HttpOptions, the async request limit, per-key quotas,
+        an optional CaptionCache, ImagePreprocessor and PromptCache, whether to constrain output to the
+        caption schema, whether to store captions compactly, the generation profile name and the cheaper
+        profiles to try before it."""
         self.api_keys = api_keys or GENAI_API_KEYS
         if not self.api_keys or not any(self.api_keys):
             raise ValueError("No valid GenAI API keys found.")
 
         self.current_key_index = 0
         self.key_rotation_lock = threading.Lock()
-        self.key_stats = {i: {'requests': 0, 'errors': 0, 'rate_limits': 0}
+        self.key_stats = {i: {'requests': 0, 'errors': 0, 'rate_limits': 0, 'cache_hits': 0}
                          for i in range(len(self.api_keys))}
-
-        # Initialize with first key
-        self.client = genai.Client(api_key=self.api_keys[self.current_key_index])
+        self.budgets = [KeyBudget(rpm, tpm) for _ in self.api_keys]
+        self.dispatcher = QuotaDispatcher(self.budgets)
+        self.controllers = [AIMDController() for _ in self.api_keys]
+        self.usage = {'requests': 0, 'images': 0, 'prompt_tokens': 0, 'cached_tokens': 0,
+                      'output_tokens': 0, 'thinking_tokens': 0}
+        self.prompt_cache = prompt_cache
+        self.batch_stats = {'batches': 0, 'images': 0, 'fallbacks': 0}
+
+        # Cached captions are only reused for identical model, prompt, generation config, output format
+        # and preprocessing
+        self.cache = cache
+        self.preprocessor = preprocessor
+        self.structured_output = structured_output
+        self.compact = compact
+        self.profile_name = profile
+        self.profile = GENERATION_PROFILES[profile]
+        self.model = self.profile['model']
+        # Recorded in every caption so outputs of different profiles can be told apart
+        self.metadata = self._metadata(profile)
+        # Cascade: cheaper profiles are tried first and frames whose captions fail local checks move up a tier
+        self.tiers = list(dict.fromkeys([*(cascade or ()), profile]))
+        self.cascade = CascadeStats(self.tiers) if len(self.tiers) > 1 else None
+        request = self._build_request(b'', 'image/jpeg')
+        settings = [request['config'].model_dump_json(exclude_none=True, exclude={'response_schema'}),
+                    f"profile:{profile}"]
+        if self.cascade is not None:
+            settings.append(f"cascade:{'>'.join(self.tiers)}:{DEFAULT_CASCADE_MIN_CAPTION_CHARS}")
+        if structured_output:
+            settings.append(schema_fingerprint())
+        if compact:
+            settings.append('compact')
+        if preprocessor is not None:
+            settings.append(preprocessor.fingerprint())
+        self.request_fingerprint = request_fingerprint(request['model'], request['contents'][0], *settings)
+        # Multi-frame requests use another prompt and schema, so their captions are cached apart
+        batch_settings = ['batch', schema_fingerprint(batch=True)] if structured_output else ['batch']
+        self.batch_fingerprint = request_fingerprint(request['model'], request['contents'][0], *settings,
+                                                     *batch_settings)
+
+        # One long-lived SDK client per key; rotation only changes the index
+        self.pool = ClientPool(self.api_keys, http_options, async_concurrency)
+        self.pool.get(self.current_key_index)
         logging.info(f"🔑 Initialized with API key #{self.current_key_index + 1} "
                     f"(...{self.api_keys[self.current_key_index][-4:]})")
 
+    @property
+    def client(self):
+        """SDK client for the current key."""
+        return self.pool.get(self.current_key_index)
+
+    @client.setter
+    def client(self, client):
+        self.pool.clients[self.current_key_index] = client
+
+    def _use_key(self, key_index):
+        """Make the dispatched key current and return its pooled client."""
+        self.current_key_index = key_index
+        return self.pool.get(key_index)
+
     def rotate_api_key(self):
         """Rotate to the next available API key."""
         with self.key_rotation_lock:
             old_index = self.current_key_index
             self.current_key_index = (self.current_key_index + 1) % len(self.api_keys)
 
-            # Update client with new key
-            self.client = genai.Client(api_key=self.api_keys[self.current_key_index])
-
             # Log the rotation
             logging.info(f"🔄 Rotated API key: #{old_index + 1} → #{self.current_key_index + 1} "
                         f"(...{self.api_keys[self.current_key_index][-4:]})")
@@ -81,6 +194,15 @@ class GeminiClient:
         error_lower = error_str.lower()
         return any(rate_msg.lower() in error_lower for rate_msg in RATE_LIMIT_MESSAGES)
 
+    def is_overload_error(self, error_str):
+        """Check if error means the key or service is overloaded (429/503)."""
+        return self.is_rate_limit_error(error_str) or any(
+            marker in error_str for marker in ['503', 'UNAVAILABLE', 'Server is overloaded'])
+
+    def is_invalid_request_error(self, error_str):
+        """Check if error means the request itself is invalid (400), so retrying cannot help."""
+        return any(marker in error_str for marker in ['400', 'INVALID_ARGUMENT'])
+
     def exponential_backoff_with_jitter(self, attempt, base_delay=1, max_delay=60, jitter=True):
         """Calculate delay for exponential backoff with optional jitter."""
         delay = min(base_delay * (2 ** attempt), max_delay)
@@ -99,113 +221,594 @@ class GeminiClient:
             rate_limits = stats['rate_limits']
             success_rate = ((total - errors) / total * 100) if total > 0 else 0
             current_marker = " ← CURRENT" if i == self.current_key_index else ""
+            pacing = self.pacing_stats()[i]
             logging.info(f"   Key #{i+1}: {total} requests, {errors} errors, "
-                        f"{rate_limits} rate limits, {success_rate:.1f}% success{current_marker}")
+                        f"{rate_limits} rate limits, {success_rate:.1f}% success, "
+                        f"{stats['cache_hits']} cache hits, "
+                        f"paced at {pacing['effective_rpm']:.0f} req/min, "
+                        f"window {pacing['window']}{current_marker}")
+        usage = dict(self.usage)
+        if usage['images']:
+            images = usage['images']
+            uncached = usage['prompt_tokens'] - usage['cached_tokens']
+            logging.info(f"🧾 Prompt usage: {images} images in {usage['requests']} requests, "
+                         f"{usage['prompt_tokens'] / images:.0f} input tokens per image "
+                         f"({usage['cached_tokens'] / images:.0f} cached, {uncached / images:.0f} uncached), "
+                         f"{usage['output_tokens'] / usage['images']:.0f} output and "
+                         f"{usage['thinking_tokens'] / usage['images']:.0f} thinking tokens per image "
+                         f"[{self.metadata['profile']}: {self.model}]")
+        batch_stats = dict(self.batch_stats)
+        if batch_stats['batches']:
+            logging.info(f"📦 Batched requests: {batch_stats['images']} frames in {batch_stats['batches']} requests, "
+                         f"{batch_stats['fallbacks']} retried one by one")
+        if self.cache is not None:
+            self.cache.log_stats()
+        if self.preprocessor is not None:
+            self.preprocessor.log_stats()
+        if self.prompt_cache is not None:
+            self.prompt_cache.log_stats()
+        if self.cascade is not None:
+            self.cascade.log_stats()
+
+    def close(self):
+        """Shut down the image preprocessing pool, if any."""
+        if self.preprocessor is not None:
+            self.preprocessor.close()
+
+    def pacing_stats(self):
+        """Return the pacing rate, token estimate and concurrency window for each key."""
+        return {i: {'effective_rpm': budget.effective_rpm(),
+                    'tokens_per_request': round(budget.estimated_tokens),
+                    'window': self.controllers[i].limit(),
+                    'in_flight': self.controllers[i].in_flight}
+                for i, budget in enumerate(self.budgets)}
+
+    def _outcome(self, error):
+        """Classify a failed request for the concurrency controller."""
+        return OVERLOAD if self.is_overload_error(str(error)) else FAILURE
+
+    def _record(self, stat, key_index=None):
+        """Increment a statistic for the given key (default: the current key)."""
+        with self.key_rotation_lock:
+            if key_index is None:
+                key_index = self.current_key_index
+            self.key_stats[key_index][stat] += 1
+
+    def _metadata(self, profile):
+        """Generation metadata stored with captions of a profile."""
+        return {'profile': profile, 'model': GENERATION_PROFILES[profile]['model']}
+
+    def _build_request(self, image_bytes, mime_type, profile=None):
+        """Build generate_content arguments for one image with a profile (default: the client's)."""
+        # Create image part using new API
+        image_part = types.Part.from_bytes(
+            data=image_bytes,
+            mime_type=mime_type
+        )
+
+        # Generate content with safety settings
+        profile = GENERATION_PROFILES[profile] if profile else self.profile
+        return {
+            'model': profile['model'],
+            'contents': [PROMPT, image_part],
+            'config': self._generation_config(1, profile)
+        }
+
+    def _build_batch_request(self, images, profile=None):
+        """Build generate_content arguments for several ``(image_bytes, mime_type)`` images."""
+        image_parts = [types.Part.from_bytes(data=image_bytes, mime_type=mime_type)
+                       for image_bytes, mime_type in images]
+        profile = GENERATION_PROFILES[profile] if profile else self.profile
+        return {
+            'model': profile['model'],
+            'contents': batch_contents(PROMPT, image_parts),
+            'config': self._generation_config(len(image_parts), profile)
+        }
+
+    def _generation_config(self, images=1, profile=None):
+        """Generation config shared by single and batched requests, with a profile's settings.
+
+        The profile's output limit is per image, so it scales with the frames in a batch.
+        """
+        profile = profile or self.profile
+        settings = {}
+        if profile['thinking_budget'] is not None:
+            settings['thinking_config'] = types.ThinkingConfig(thinking_budget=profile['thinking_budget'])
+        if profile['max_output_tokens'] is not None:
+            settings['max_output_tokens'] = profile['max_output_tokens'] * images
+        if profile['temperature'] is not None:
+            settings['temperature'] = profile['temperature']
+        if self.structured_output:
+            settings['response_mime_type'] = 'application/json'
+            settings['response_schema'] = response_schema(images > 1)
+        return types.GenerateContentConfig(
+            safety_settings=SAFETY_SETTINGS,
+            **settings
+        )
+
+    def _format_output(self, result, image_path, profile=None, key_index=None):
+        """Validate a single-image caption against the schema and serialize it with the profile metadata.
+
+        Without a schema, output that does not parse as a JSON object is kept
+        as returned. A schema mismatch counts as an error of ``key_index``,
+        the key that served the caption.
+        """
+        if not result.ok:
+            return result
+        if self.structured_output:
+            fields = parse_caption(result)
+            if fields is None:
+                self._record('errors', key_index)
+                logging.warning(f"⚠️  Caption for {image_path} does not match the caption schema")
+                return CaptionResult.failure(INVALID_OUTPUT, f"Caption does not match the schema for {image_path}")
+        else:
+            try:
+                fields = json.loads(strip_fence(result))
+            except ValueError:
+                return result
+            if not isinstance(fields, dict):
+                return result
+        metadata = self._metadata(profile) if profile else self.metadata
+        return CaptionResult.success(format_caption(fields, self.compact, metadata))
+
+    def _accept(self, tier, result, image_path, seconds):
+        """Whether to keep the caption of cascade tier ``tier`` (an index into ``tiers``).
+
+        Without a cascade, and on the strongest tier, every result is kept.
+        Captions failing local checks, and errors a stronger model might not
+        hit, are escalated to the next tier.
+        """
+        if self.cascade is None:
+            return True
+        if result.ok:
+            problems = validate_caption(result, self.compact)
+        else:
+            problems = [] if result.terminal else [result.error_code]
+        accepted = tier == len(self.tiers) - 1 or not problems
+        self.cascade.record(self.tiers[tier], accepted, seconds)
+        if not accepted:
+            logging.info(f"🪜 Escalating {image_path} from {self.tiers[tier]} to {self.tiers[tier + 1]}: "
+                         f"{', '.join(problems)}")
+        return accepted
+
+    def _cache_key(self, image_bytes, batch=False):
+        """Cache key for an image sent alone or, with ``batch``, in a multi-frame request; None when caching is off."""
+        if self.cache is None:
+            return None
+        return self.cache.key(image_bytes, self.batch_fingerprint if batch else self.request_fingerprint)
+
+    def _prepare_image(self, image_bytes, image_path, mime_type):
+        """Return the bytes and MIME type to send, detecting the type when not given."""
+        if self.preprocessor is not None:
+            return self.preprocessor.prepare(image_bytes, image_path)
+        return image_bytes, mime_type or detect_mime_type(image_bytes, image_path)
+
+    def _cache_result(self, cache_key, result):
+        """Store a fresh caption in the cache."""
+        if cache_key is not None and result.ok:
+            self.cache.put(cache_key, result)
+
+    def _record_usage(self, key_index, reserved_tokens, response, images=1, profile=None):
+        """Settle the key's token reservation with the response's usage and tally tokens per image
+        (and per cascade tier when ``profile`` is given)."""
+        usage = getattr(response, 'usage_metadata', None)
+        total_tokens = getattr(usage, 'total_token_count', None)
+        if usage is not None:
+            self.budgets[key_index].settle(reserved_tokens, total_tokens)
+        if self.cascade is not None and profile is not None and isinstance(total_tokens, int):
+            self.cascade.add_tokens(profile, total_tokens)
+        counts = {'prompt_tokens': getattr(usage, 'prompt_token_count', None),
+                  'cached_tokens': getattr(usage, 'cached_content_token_count', None),
+                  'output_tokens': getattr(usage, 'candidates_token_count', None),
+                  'thinking_tokens': getattr(usage, 'thoughts_token_count', None)}
+        with self.key_rotation_lock:
+            self.usage['requests'] += 1
+            self.usage['images'] += images
+            for name, count in counts.items():
+                if isinstance(count, int):
+                    self.usage[name] += count
+
+    def _with_cached_prompt(self, request, cache_name):
+        """Request that references the cached prompt instead of carrying it."""
+        contents = request['contents']
+        prompt = self.prompt_cache.prompt
+        if not isinstance(contents[0], str) or not contents[0].startswith(prompt):
+            return request
+        rest = contents[0][len(prompt):]
+        return {
+            'model': request['model'],
+            'contents': ([rest] if rest else []) + contents[1:],
+            'config': request['config'].model_copy(update={'cached_content': cache_name})
+        }
+
+    def _send(self, client, request, key_index):
+        """Call generate_content through the key's prompt cache, falling back to the inline prompt."""
+        if self.prompt_cache is None:
+            return client.models.generate_content(**request)
+        cache_name = self.prompt_cache.handle(client, key_index, request['model'])
+        if cache_name is None:
+            return client.models.generate_content(**request)
+        try:
+            return client.models.generate_content(**self._with_cached_prompt(request, cache_name))
+        except Exception as e:
+            if not is_cache_error(str(e)):
+                raise
+            logging.warning(f"⚠️  Cached prompt {cache_name} rejected on key #{key_index + 1}, sending it inline: {e}")
+            self.prompt_cache.invalidate(key_index, request['model'])
+            return client.models.generate_content(**request)
+
+    async def _send_async(self, request, key_index):
+        """Async variant of _send; handles are created and extended on a worker thread."""
+        aio = self.pool.get_async(key_index).aio
+        if self.prompt_cache is None:
+            return await aio.models.generate_content(**request)
+        model = request['model']
+        cache_name = self.prompt_cache.current(key_index, model)
+        if cache_name is None and self.prompt_cache.available(key_index, model):
+            cache_name = await asyncio.to_thread(self.prompt_cache.handle, self.pool.get(key_index), key_index, model)
+        if cache_name is None:
+            return await aio.models.generate_content(**request)
+        try:
+            return await aio.models.generate_content(**self._with_cached_prompt(request, cache_name))
+        except Exception as e:
+            if not is_cache_error(str(e)):
+                raise
+            logging.warning(f"⚠️  Cached prompt {cache_name} rejected on key #{key_index + 1}, sending it inline: {e}")
+            self.prompt_cache.invalidate(key_index, model)
+            return await aio.models.generate_content(**request)
+
+    def _parse_response(self, response, image_path, key_index=None):
+        """Return a CaptionResult holding the caption or the reason there is none."""
+        # Check if response has valid parts before accessing text
+        if not response.candidates:
+            self._record('errors', key_index)
+            return CaptionResult.failure(NO_CANDIDATES, f"No candidates returned for {image_path}")
+
+        candidate = response.candidates[0]
+
+        # Check finish reason
+        if candidate.finish_reason == types.FinishReason.STOP:
+            # Normal completion - success!
+            if candidate.content and candidate.content.parts:
+                return CaptionResult.success(candidate.content.parts[0].text)
+            else:
+                self._record('errors', key_index)
+                return CaptionResult.failure(NO_CONTENT, f"No content parts in response for {image_path}")
+        elif candidate.finish_reason == types.FinishReason.SAFETY:
+            self._record('errors', key_index)
+            return CaptionResult.failure(SAFETY_BLOCKED, f"Content blocked by safety filters for {image_path}")
+        elif candidate.finish_reason == types.FinishReason.MAX_TOKENS:
+            self._record('errors', key_index)
+            return CaptionResult.failure(MAX_TOKENS, f"Response truncated due to max tokens for {image_path}")
+        else:
+            self._record('errors', key_index)
+            return CaptionResult.failure(UNEXPECTED_FINISH,
+                                         f"Unexpected finish reason {candidate.finish_reason} for {image_path}")
+
+    def _handle_error(self, error_str, image_path, attempt, max_retries, keys_tried, key_rotation_delay,
+                      key_index=None):
+        """Decide how to react to a failed request.
+
+        Returns ``(delay, None)`` to retry after ``delay`` seconds, or
+        ``(None, error_result)`` to give up. ``key_index`` is the key the failed
+        request was sent with (default: the current key).
+        """
+        if key_index is None:
+            key_index = self.current_key_index
+
+        # Track error for the request's key
+        self._record('errors', key_index)
+
+        # Check if this is a rate limit error
+        if self.is_rate_limit_error(error_str):
+            self._record('rate_limits', key_index)
+            keys_tried.add(key_index)
+            self.budgets[key_index].pause(DEFAULT_RATE_LIMIT_COOLDOWN)
+
+            # If we haven't tried all keys yet, rotate and try immediately
+            if len(keys_tried) < len(self.api_keys):
+                logging.warning(f"🚦 Rate limit hit on key #{key_index + 1} for {image_path}")
+                if self.current_key_index == key_index:
+                    self.rotate_api_key()
+                return key_rotation_delay, None
+
+            # All keys exhausted
+            logging.error(f"❌ All {len(self.api_keys)} API keys rate limited for {image_path}")
+            return None, CaptionResult.failure(RATE_LIMITED, f"All API keys rate limited for {image_path}: {error_str}")
+
+        # Check if this is a retryable server error (non-rate-limit)
+        is_retryable = any(error_code in error_str for error_code in ['500', '503', 'INTERNAL', 'UNAVAILABLE', 'Server is overloaded'])
+
+        if is_retryable and attempt < max_retries:
+            delay = self.exponential_backoff_with_jitter(attempt)
+            logging.warning(f"🔄 Gemini API error (attempt {attempt + 1}/{max_retries + 1}) "
+                          f"on key #{key_index + 1} for {image_path}: {error_str}")
+            logging.info(f"⏱️  Retrying in {delay:.1f}s...")
+            return delay, None
+
+        # Non-retryable error or max retries reached
+        if is_retryable:
+            logging.error(f"❌ Max retries ({max_retries}) reached for {image_path}: {error_str}")
+            error_code = SERVER_ERROR
+        else:
+            logging.error(f"❌ Non-retryable error for {image_path}: {error_str}")
+            error_code = INVALID_REQUEST if self.is_invalid_request_error(error_str) else REQUEST_FAILED
+        return None, CaptionResult.failure(error_code, f"Error processing with Gemini {image_path}: {error_str}")
 
-    @RateLimiter(max_calls=DEFAULT_RATE_LIMIT_CALLS, period=DEFAULT_RATE_LIMIT_PERIOD)
     def process_image_with_gemini(self, image_path, max_retries=5, key_rotation_delay=1.0):
-        """Process image using Gemini API with key rotation on rate limits."""
-        time.sleep(2)
+        """Process image file using Gemini API with key rotation on rate limits."""
+        with open(image_path, 'rb') as f:
+            image_bytes = f.read()
+        return self.process_image_bytes(image_bytes, image_path, max_retries, key_rotation_delay)
+
+    def process_image_bytes(self, image_bytes, image_path, max_retries=5, key_rotation_delay=1.0,
+                            mime_type=None):
+        """Process in-memory image bytes using Gemini API with key rotation on rate limits.
+
+        ``image_path`` only identifies the image in logs and error messages.
+        Images whose caption is cached skip the API. ``mime_type`` is detected
+        from the bytes when not given.
+        """
+        cache_key = self._cache_key(image_bytes)
+        cached = self._cached(cache_key, image_path)
+        if cached is not None:
+            return cached
+        return self._process_uncached(image_bytes, image_path, cache_key, max_retries, key_rotation_delay, mime_type)
+
+    def process_image_batch(self, images, max_retries=5, key_rotation_delay=1.0):
+        """Caption several frames with one request carrying the prompt once.
+
+        ``images`` is a list of ``(image_bytes, image_path)``, normally frames
+        of one video. Returns one CaptionResult per image, in order. Cached
+        images are not sent, and frames the model omitted or malformed are
+        retried as single-image requests, looked up and cached under the
+        single-image fingerprint as well as the batch one. With a cascade the
+        batch goes to the cheapest tier, and frames whose captions fail local
+        checks continue alone on the next one.
+        """
+        cache_keys = [self._cache_key(image_bytes, batch=True) for image_bytes, _ in images]
+        results = [self._cached(cache_key, image_path) for cache_key, (_, image_path) in zip(cache_keys, images)]
+        pending = [i for i, result in enumerate(results) if result is None]
+        escalate = set()
+
+        if len(pending) > 1:
+            prepared = [self._prepare_image(*images[i], None) for i in pending]
+            paths = [images[i][1] for i in pending]
+            started = time.monotonic()
+            batch, _ = self._generate(self._build_batch_request(prepared, self.tiers[0]), self._batch_label(paths),
+                                   max_retries, key_rotation_delay, len(pending), self.tiers[0])
+            escalate = self._fill_batch(results, pending, cache_keys, batch, paths, time.monotonic() - started)
+
+        for i, result in enumerate(results):
+            if result is None:
+                results[i] = self._process_fallback(*images[i], max_retries, key_rotation_delay,
+                                                    first_tier=1 if i in escalate else 0)
+                self._cache_result(cache_keys[i], results[i])
+        return results
+
+    def _process_fallback(self, image_bytes, image_path, max_retries, key_rotation_delay, first_tier=0):
+        """Caption a frame left out of a batch alone, unless its single-image caption is cached."""
+        cache_key = self._cache_key(image_bytes)
+        cached = self._cached(cache_key, image_path)
+        if cached is not None:
+            return cached
+        return self._process_uncached(image_bytes, image_path, cache_key, max_retries, key_rotation_delay,
+                                      first_tier=first_tier)
+
+    def _cached(self, cache_key, image_path):
+        """Return the cached caption for an image, or None."""
+        if cache_key is None:
+            return None
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            self._record('cache_hits')
+            logging.info(f"💾 Cached caption for {image_path}")
+        return cached
+
+    def _process_uncached(self, image_bytes, image_path, cache_key, max_retries, key_rotation_delay,
+                          mime_type=None, first_tier=0):
+        """Send one image on its own, moving up the cascade tiers from ``first_tier``, and cache its caption."""
+        image_bytes, mime_type = self._prepare_image(image_bytes, image_path, mime_type)
+        for tier in range(first_tier, len(self.tiers)):
+            profile = self.tiers[tier]
+            started = time.monotonic()
+            result, key_index = self._generate(self._build_request(image_bytes, mime_type, profile), image_path, max_retries,
+                                    key_rotation_delay, profile=profile)
+            result = self._format_output(result, image_path, profile, key_index)
+            if self._accept(tier, result, image_path, time.monotonic() - started):
+                break
+        self._cache_result(cache_key, result)
+        return result
+
+    def _batch_label(self, image_paths):
+        """Name a batch request in logs and error messages."""
+        return f"batch of {len(image_paths)} ({image_paths[0]} ... {image_paths[-1]})"
+
+    def _fill_batch(self, results, pending, cache_keys, batch, paths, seconds=0.0):
+        """Place a batch response's captions in ``results``; frames left as None fall back to single requests.
+
+        A batch that failed on rate limits or server errors fails all of its
+        frames, since single requests would hit the same errors. Returns the
+        frames whose captions the cascade escalates.
+        """
+        if batch.ok:
+            captions = split_batch_response(batch, len(pending), self.structured_output, self.compact,
+                                            self._metadata(self.tiers[0]))
+        elif batch.error_code in (RATE_LIMITED, SERVER_ERROR):
+            captions = [batch] * len(pending)
+        else:
+            captions = [None] * len(pending)
+
+        fallbacks = 0
+        escalate = set()
+        for i, caption, path in zip(pending, captions, paths):
+            if caption is None:
+                fallbacks += 1
+                continue
+            if batch.ok and not self._accept(0, caption, path, seconds / len(pending)):
+                escalate.add(i)
+                continue
+            results[i] = caption
+            self._cache_result(cache_keys[i], caption)
+        if fallbacks:
+            logging.warning(f"⚠️  {fallbacks} of {len(pending)} frames missing from a batched response, "
+                            f"retrying them one by one")
+
+        with self.key_rotation_lock:
+            self.batch_stats['batches'] += 1
+            self.batch_stats['images'] += len(pending)
+            self.batch_stats['fallbacks'] += fallbacks
+        return escalate
+
+    def _generate(self, request, image_path, max_retries, key_rotation_delay, images=1, profile=None):
+        """Send a request with quota pacing, key rotation and retries.
+
+        Returns ``(model output, index of the key that served it)``; the index
+        is None when no key was dispatched. ``profile`` names the cascade tier
+        the request's tokens are counted against.
+        """
         keys_tried = set()
-        original_key_index = self.current_key_index
 
         for attempt in range(max_retries + 1):
+            key_index = None
             try:
-                # Track request for current key
-                with self.key_rotation_lock:
-                    self.key_stats[self.current_key_index]['requests'] += 1
-
-                with open(image_path, 'rb') as f:
-                    image_bytes = f.read()
-
-                # Create image part using new API
-                image_part = types.Part.from_bytes(
-                    data=image_bytes,
-                    mime_type='image/jpeg'
-                )
-
-                # Generate content with safety settings
-                response = self.client.models.generate_content(
-                    model='gemini-2.5-flash',
-                    contents=[PROMPT, image_part],
-                    config=types.GenerateContentConfig(
-                        safety_settings=SAFETY_SETTINGS
-                    )
-                )
-
-                # Check if response has valid parts before accessing text
-                if not response.candidates:
-                    with self.key_rotation_lock:
-                        self.key_stats[self.current_key_index]['errors'] += 1
-                    return json.dumps({"error": f"No candidates returned for {image_path}"})
-
-                candidate = response.candidates[0]
-
-                # Check finish reason
-                if candidate.finish_reason == types.FinishReason.STOP:
-                    # Normal completion - success!
-                    if candidate.content and candidate.content.parts:
-                        return candidate.content.parts[0].text
-                    else:
-                        with self.key_rotation_lock:
-                            self.key_stats[self.current_key_index]['errors'] += 1
-                        return json.dumps({"error": f"No content parts in response for {image_path}"})
-                elif candidate.finish_reason == types.FinishReason.SAFETY:
-                    with self.key_rotation_lock:
-                        self.key_stats[self.current_key_index]['errors'] += 1
-                    return json.dumps({"error": f"Content blocked by safety filters for {image_path}"})
-                elif candidate.finish_reason == types.FinishReason.MAX_TOKENS:
-                    with self.key_rotation_lock:
-                        self.key_stats[self.current_key_index]['errors'] += 1
-                    return json.dumps({"error": f"Response truncated due to max tokens for {image_path}"})
-                else:
-                    with self.key_rotation_lock:
-                        self.key_stats[self.current_key_index]['errors'] += 1
-                    return json.dumps({"error": f"Unexpected finish reason {candidate.finish_reason} for {image_path}"})
+                # Reserve quota on a key with budget, waiting outside any lock
+                key_index, delay, reserved_tokens = self.dispatcher.acquire(self.current_key_index)
+                if delay > 0:
+                    time.sleep(delay)
+                client = self._use_key(key_index)
+
+                # Track request for the dispatched key
+                self._record('requests', key_index)
+                controller = self.controllers[key_index]
+                token = controller.acquire()
+                started = time.monotonic()
+                try:
+                    response = self._send(client, request, key_index)
+                except BaseException as e:
+                    controller.release(token, self._outcome(e))
+                    self.budgets[key_index].release(reserved_tokens)
+                    raise
+                controller.release(token, SUCCESS, time.monotonic() - started)
+                self._record_usage(key_index, reserved_tokens, response, images, profile)
+                return self._parse_response(response, image_path, key_index), key_index
 
             except Exception as e:
-                error_str = str(e)
-
-                # Track error for current key
-                with self.key_rotation_lock:
-                    self.key_stats[self.current_key_index]['errors'] += 1
-
-                # Check if this is a rate limit error
-                if self.is_rate_limit_error(error_str):
-                    with self.key_rotation_lock:
-                        self.key_stats[self.current_key_index]['rate_limits'] += 1
-
-                    keys_tried.add(self.current_key_index)
-
-                    # If we haven't tried all keys yet, rotate and try immediately
-                    if len(keys_tried) < len(self.api_keys):
-                        logging.warning(f"🚦 Rate limit hit on key #{self.current_key_index + 1} for {image_path}")
-                        self.rotate_api_key()
-                        if key_rotation_delay > 0:
-                            time.sleep(key_rotation_delay)
-                        continue  # Try with new key immediately (don't count as retry)
-                    else:
-                        # All keys exhausted
-                        logging.error(f"❌ All {len(self.api_keys)} API keys rate limited for {image_path}")
-                        return json.dumps({"error": f"All API keys rate limited for {image_path}: {error_str}"})
-
-                # Check if this is a retryable server error (non-rate-limit)
-                is_retryable = any(error_code in error_str for error_code in ['500', '503', 'INTERNAL', 'UNAVAILABLE', 'Server is overloaded'])
-
-                if is_retryable and attempt < max_retries:
-                    delay = self.exponential_backoff_with_jitter(attempt)
-                    logging.warning(f"🔄 Gemini API error (attempt {attempt + 1}/{max_retries + 1}) "
-                                  f"on key #{self.current_key_index + 1} for {image_path}: {error_str}")
-                    logging.info(f"⏱️  Retrying in {delay:.1f}s...")
+                delay, result = self._handle_error(str(e), image_path, attempt, max_retries,
+                                                   keys_tried, key_rotation_delay, key_index)
+                if result is not None:
+                    return result, key_index
+                if delay > 0:
                     time.sleep(delay)
-                    continue
-                else:
-                    # Non-retryable error or max retries reached
-                    if attempt >= max_retries:
-                        logging.error(f"❌ Max retries ({max_retries}) reached for {image_path}: {error_str}")
-                    else:
-                        logging.error(f"❌ Non-retryable error for {image_path}: {error_str}")
-                    return json.dumps({"error": f"Error processing with Gemini {image_path}: {error_str}"})
 
         # Should never reach here, but just in case
-        return json.dumps({"error": f"Unexpected error in retry loop for {image_path}"})
+        return CaptionResult.failure(REQUEST_FAILED, f"Unexpected error in retry loop for {image_path}"), None
+
+    async def process_image_bytes_async(self, image_bytes, image_path, max_retries=5, key_rotation_delay=1.0,
+                                        mime_type=None):
+        """Async variant of process_image_bytes using the SDK's asyncio client.
+
+        Waits yield to the event loop instead of blocking a thread, so many
+        requests can be in flight on a single loop.
+        """
+        cache_key = self._cache_key(image_bytes)
+        cached = await asyncio.to_thread(self._cached, cache_key, image_path)
+        if cached is not None:
+            return cached
+        return await self._process_uncached_async(image_bytes, image_path, cache_key, max_retries,
+                                                  key_rotation_delay, mime_type)
+
+    async def process_image_batch_async(self, images, max_retries=5, key_rotation_delay=1.0):
+        """Async variant of process_image_batch; fallback requests run concurrently."""
+        cache_keys = [self._cache_key(image_bytes, batch=True) for image_bytes, _ in images]
+        results = [await asyncio.to_thread(self._cached, cache_key, image_path)
+                   for cache_key, (_, image_path) in zip(cache_keys, images)]
+        pending = [i for i, result in enumerate(results) if result is None]
+        escalate = set()
+
+        if len(pending) > 1:
+            prepared = [await self._prepare_image_async(*images[i], None) for i in pending]
+            paths = [images[i][1] for i in pending]
+            started = time.monotonic()
+            batch, _ = await self._generate_async(self._build_batch_request(prepared, self.tiers[0]),
+                                               self._batch_label(paths), max_retries, key_rotation_delay,
+                                               len(pending), self.tiers[0])
+            escalate = await asyncio.to_thread(self._fill_batch, results, pending, cache_keys, batch, paths,
+                                               time.monotonic() - started)
+
+        missing = [i for i, result in enumerate(results) if result is None]
+        fallbacks = await asyncio.gather(*(
+            self._process_fallback_async(*images[i], max_retries, key_rotation_delay,
+                                         first_tier=1 if i in escalate else 0)
+            for i in missing))
+        for i, result in zip(missing, fallbacks):
+            results[i] = result
+            await asyncio.to_thread(self._cache_result, cache_keys[i], result)
+        return results
+
+    async def _process_fallback_async(self, image_bytes, image_path, max_retries, key_rotation_delay,
+                                      first_tier=0):
+        """Async variant of _process_fallback."""
+        cache_key = self._cache_key(image_bytes)
+        cached = await asyncio.to_thread(self._cached, cache_key, image_path)
+        if cached is not None:
+            return cached
+        return await self._process_uncached_async(image_bytes, image_path, cache_key, max_retries,
+                                                  key_rotation_delay, first_tier=first_tier)
+
+    async def _prepare_image_async(self, image_bytes, image_path, mime_type):
+        """Async variant of _prepare_image that awaits the preprocessing pool."""
+        if self.preprocessor is not None:
+            return await self.preprocessor.prepare_async(image_bytes, image_path)
+        return self._prepare_image(image_bytes, image_path, mime_type)
+
+    async def _process_uncached_async(self, image_bytes, image_path, cache_key, max_retries, key_rotation_delay,
+                                      mime_type=None, first_tier=0):
+        """Async variant of _process_uncached."""
+        image_bytes, mime_type = await self._prepare_image_async(image_bytes, image_path, mime_type)
+        for tier in range(first_tier, len(self.tiers)):
+            profile = self.tiers[tier]
+            started = time.monotonic()
+            result, key_index = await self._generate_async(self._build_request(image_bytes, mime_type, profile), image_path,
+                                                max_retries, key_rotation_delay, profile=profile)
+            result = self._format_output(result, image_path, profile, key_index)
+            if self._accept(tier, result, image_path, time.monotonic() - started):
+                break
+        await asyncio.to_thread(self._cache_result, cache_key, result)
+        return result
+
+    async def _generate_async(self, request, image_path, max_retries, key_rotation_delay, images=1, profile=None):
+        """Async variant of _generate."""
+        keys_tried = set()
+
+        for attempt in range(max_retries + 1):
+            key_index = None
+            try:
+                key_index, delay, reserved_tokens = self.dispatcher.acquire(self.current_key_index)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                self.current_key_index = key_index
+
+                self._record('requests', key_index)
+                controller = self.controllers[key_index]
+                token = await controller.acquire_async()
+                started = time.monotonic()
+                try:
+                    response = await self._send_async(request, key_index)
+                except BaseException as e:
+                    controller.release(token, self._outcome(e))
+                    self.budgets[key_index].release(reserved_tokens)
+                    raise
+                controller.release(token, SUCCESS, time.monotonic() - started)
+                self._record_usage(key_index, reserved_tokens, response, images, profile)
+                return self._parse_response(response, image_path, key_index), key_index
+
+            except Exception as e:
+                delay, result = self._handle_error(str(e), image_path, attempt, max_retries,
+                                                   keys_tried, key_rotation_delay, key_index)
+                if result is not None:
+                    return result, key_index
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+        return CaptionResult.failure(REQUEST_FAILED, f"Unexpected error in retry loop for {image_path}"), None
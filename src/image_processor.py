@@ -6,29 +6,51 @@ Contains logic for processing images and detecting errors in responses.
 import os
 import threading
 import logging
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from tqdm import tqdm
 
-from .config import ERROR_MESSAGES
+from .config import DEFAULT_TASK_WINDOW_PER_WORKER, DEFAULT_BATCH_SIZE
 from .gemini_client import GeminiClient
+from .checkpoint import CheckpointJournal
+from .results import CaptionResult, REQUEST_FAILED
+from .batching import iter_video_batches
+
+
+def _read_bytes(path):
+    with open(path, 'rb') as f:
+        return f.read()
 
 
 class ImageProcessor:
     """Handles image processing operations."""
 
-    def __init__(self, gemini_client=None):
-        """Initialize with a Gemini client."""
+    def __init__(self, gemini_client=None, status_index=None, deduplicator=None, batch_size=DEFAULT_BATCH_SIZE):
+        """Initialize with a Gemini client, an optional caption status index and frame deduplicator, and the
+        number of frames of one video sent per request."""
         self.gemini_client = gemini_client or GeminiClient()
-        self.shutdown_requested = False
+        self.status_index = status_index
+        self.deduplicator = deduplicator
+        self.batch_size = max(1, batch_size)
+        self.shutdown_flag = False
+        self.shutdown_check = lambda: False
+        self.processed_lock = threading.Lock()
 
     def set_shutdown_flag(self, flag):
         """Set shutdown flag for graceful termination."""
-        self.shutdown_requested = flag
+        self.shutdown_flag = flag
+
+    def set_shutdown_check(self, check):
+        """Set a callable returning True once shutdown has been requested, e.g. by a signal handler."""
+        self.shutdown_check = check
+
+    @property
+    def shutdown_requested(self):
+        """Whether shutdown was requested through the flag or the check."""
+        return self.shutdown_flag or self.shutdown_check()
 
     def has_error_content(self, content):
-        """Check if the content contains any error indicators."""
-        content_lower = content.lower()
-        return any(error_msg.lower() in content_lower for error_msg in ERROR_MESSAGES)
+        """Check if the content is an error output rather than a caption."""
+        return not CaptionResult.parse(content).ok
 
     def process_image(self, image_path, max_retries=5):
         """Process image using Gemini with key rotation."""
@@ -42,69 +64,180 @@ class ImageProcessor:
 
         try:
             result = self.process_image(input_path, max_retries)
-
-            with open(output_path, 'w', encoding='utf-8') as f:
-                f.write(result)
-
-            # Check if final result has errors before marking as processed
-            has_errors = self.has_error_content(result)
-            
-            # Only mark as processed if there are no errors
-            if not has_errors and processed_files is not None:
-                from .config import INPUT_DIR
-                relative_path = os.path.relpath(input_path, INPUT_DIR)
-                with threading.Lock():
-                    processed_files.add(relative_path)
-                    if checkpoint_file:
-                        import pickle
-                        with open(checkpoint_file, 'wb') as f:
-                            pickle.dump(processed_files, f)
-
-            # Log status
-            status = "❌ (still has errors)" if has_errors else "✅"
-            from .config import INPUT_DIR
-            relative_path = os.path.relpath(input_path, INPUT_DIR)
-            logging.info(f"Processed: {relative_path} [Key #{self.gemini_client.current_key_index + 1}] {status}")
-
+        except Exception as e:
+            result = self._caption_failure(input_path, e)
+        try:
+            self.save_result(input_path, output_path, result, processed_files, checkpoint_file, pbar)
         except Exception as e:
             logging.error(f"Error in process_and_save for {input_path}: {str(e)}")
+            self.drop_duplicates(input_path, pbar)
         finally:
             pbar.update(1)
 
+    def process_and_save_batch(self, tasks, max_retries=5):
+        """Caption several frames of one video with a single request and save each result."""
+        if self.shutdown_requested:
+            for task in tasks:
+                task['pbar'].update(1)
+            return
+
+        try:
+            images = [(_read_bytes(task['input_path']), task['input_path']) for task in tasks]
+            results = self.gemini_client.process_image_batch(images, max_retries)
+        except Exception as e:
+            results = [self._caption_failure(task['input_path'], e) for task in tasks]
+
+        for task, result in zip(tasks, results):
+            try:
+                self.save_result(task['input_path'], task['output_path'], result,
+                                 task.get('processed_files'), task.get('checkpoint_file'), task['pbar'])
+            except Exception as e:
+                logging.error(f"Error in process_and_save for {task['input_path']}: {str(e)}")
+                self.drop_duplicates(task['input_path'], task['pbar'])
+            finally:
+                task['pbar'].update(1)
+
+    def _caption_failure(self, input_path, error):
+        """Error output for a frame whose captioning raised; saved like any other so it is retried."""
+        logging.error(f"Error in process_and_save for {input_path}: {str(error)}")
+        return CaptionResult.failure(REQUEST_FAILED, f"Error processing {input_path}: {error}")
+
+    def save_result(self, input_path, output_path, result, processed_files, checkpoint_file, pbar):
+        """Write a caption or error output, record it and copy it to the frame's near-duplicates."""
+        with open(output_path, 'w', encoding='utf-8') as f:
+            f.write(result)
+        if self.status_index is not None:
+            self.status_index.record(output_path, result)
+
+        # Check if final result has errors before marking as processed
+        has_errors = self.has_error_content(result)
+
+        # Only mark as processed if there are no errors
+        from .config import INPUT_DIR
+        relative_path = os.path.relpath(input_path, INPUT_DIR)
+        if not has_errors:
+            self._mark_processed(relative_path, processed_files, checkpoint_file)
+
+        # Log status
+        status = "❌ (still has errors)" if has_errors else "✅"
+        logging.info(f"Processed: {relative_path} [Key #{self.gemini_client.current_key_index + 1}] {status}")
+
+        self.propagate_duplicates(input_path, result, processed_files, checkpoint_file, pbar)
+
+    def _mark_processed(self, relative_path, processed_files, checkpoint_file):
+        """Record a captioned image in the processed set and checkpoint."""
+        if processed_files is None:
+            return
+        with self.processed_lock:
+            processed_files.add(relative_path)
+        if checkpoint_file:
+            CheckpointJournal.for_path(checkpoint_file).add(relative_path)
+
+    def propagate_duplicates(self, input_path, result, processed_files, checkpoint_file, pbar):
+        """Write a copy of a frame's caption for the near-duplicate frames it represents.
+
+        When the frame failed, its error output is written for the duplicates
+        too, so they are retried with it rather than left without a caption.
+        """
+        if self.deduplicator is None:
+            return
+        duplicates = self.deduplicator.pop_duplicates(input_path)
+        if not duplicates:
+            return
+        if self.has_error_content(result):
+            for file_info in duplicates:
+                with open(file_info['output_path'], 'w', encoding='utf-8') as f:
+                    f.write(result)
+                if self.status_index is not None:
+                    self.status_index.record(file_info['output_path'], result)
+            logging.warning(f"⚠️  {len(duplicates)} near-duplicates of {input_path} failed with it and will be retried")
+            pbar.update(len(duplicates))
+            return
+
+        from .config import INPUT_DIR
+        source = os.path.relpath(input_path, INPUT_DIR)
+        caption = CaptionResult.propagated(result, source)
+        for file_info in duplicates:
+            with open(file_info['output_path'], 'w', encoding='utf-8') as f:
+                f.write(caption)
+            if self.status_index is not None:
+                self.status_index.record(file_info['output_path'], caption)
+            self._mark_processed(file_info['relative_path'], processed_files, checkpoint_file)
+            pbar.update(1)
+        self.deduplicator.record_propagated(len(duplicates))
+        logging.info(f"🪞 Copied caption of {source} to {len(duplicates)} near-duplicate frames")
+
+    def drop_duplicates(self, input_path, pbar):
+        """Forget the near-duplicates of a frame whose result could not be saved, counting them as done."""
+        if self.deduplicator is None:
+            return
+        duplicates = self.deduplicator.pop_duplicates(input_path)
+        if duplicates:
+            logging.warning(f"⚠️  {len(duplicates)} near-duplicates of {input_path} were left without a caption")
+            pbar.update(len(duplicates))
+
     def process_images_batch(self, image_tasks, max_workers=10, max_retries=5):
-        """Process a batch of images with threading."""
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            futures = []
+        """Process a batch of images with threading.
+
+        ``image_tasks`` may be any iterable, typically a generator. Tasks are
+        pulled from it only as earlier ones finish, so at most
+        ``max_workers * DEFAULT_TASK_WINDOW_PER_WORKER`` futures exist at once
+        and memory stays flat regardless of the number of images. With a
+        batch size above 1, each future captions a batch of frames of one video.
+        """
+        window = max(1, max_workers) * DEFAULT_TASK_WINDOW_PER_WORKER
+        if self.batch_size > 1:
+            tasks = iter_video_batches(image_tasks, self.batch_size, key=lambda task: task['input_path'])
+        else:
+            tasks = iter(image_tasks)
+        exhausted = False
 
-            for task in image_tasks:
-                if self.shutdown_requested:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            in_flight = set()
+
+            while True:
+                while not exhausted and not self.shutdown_requested and len(in_flight) < window:
+                    task = next(tasks, None)
+                    if task is None:
+                        exhausted = True
+                        break
+                    if self.batch_size > 1:
+                        in_flight.add(executor.submit(self.process_and_save_batch, task, max_retries))
+                        continue
+                    in_flight.add(executor.submit(
+                        self.process_and_save,
+                        task['input_path'],
+                        task['output_path'],
+                        task.get('processed_files'),
+                        task.get('checkpoint_file'),
+                        task['pbar'],
+                        max_retries
+                    ))
+
+                if not in_flight:
                     break
 
-                future = executor.submit(
-                    self.process_and_save,
-                    task['input_path'],
-                    task['output_path'],
-                    task.get('processed_files'),
-                    task.get('checkpoint_file'),
-                    task['pbar'],
-                    max_retries
-                )
-                futures.append(future)
-
-            # Wait for completion or shutdown
-            for future in as_completed(futures):
-                if self.shutdown_requested:
-                    logging.info("⏹️  Cancelling remaining tasks...")
-                    break
-                try:
-                    future.result()
-                except Exception as e:
-                    logging.error(f"Error in future: {str(e)}")
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    try:
+                        future.result()
+                    except Exception as e:
+                        logging.error(f"Error in future: {str(e)}")
+
+                if self.shutdown_requested and not exhausted:
+                    logging.info("⏹️  Shutdown requested, waiting for in-flight tasks...")
+                    exhausted = True
 
     def get_stats(self):
         """Get processing statistics from the Gemini client."""
         return self.gemini_client.key_stats
 
+    def close(self):
+        """Release the Gemini client's resources once processing is done."""
+        self.gemini_client.close()
+
     def log_stats(self):
         """Log current processing statistics."""
         self.gemini_client.log_key_stats()
+        if self.deduplicator is not None:
+            self.deduplicator.log_stats()
@@ -0,0 +1,148 @@
+"""
+Quota-aware request pacing module.
+Per-key token buckets for the requests-per-minute and tokens-per-minute
+quotas, and a dispatcher that sends each request to a key with budget.
+"""
+
+import time
+import threading
+
+from .config import (
+    DEFAULT_KEY_RPM, DEFAULT_KEY_TPM, DEFAULT_ESTIMATED_REQUEST_TOKENS,
+    DEFAULT_QUOTA_BURST_SECONDS
+)
+
+# Weight of the newest response when updating the tokens-per-request estimate
+_TOKEN_ESTIMATE_ALPHA = 0.1
+
+
+class TokenBucket:
+    """Lazily refilled token bucket.
+
+    Takes may overdraw the bucket: the caller is told how long to wait for the
+    debt to refill, so waiters queue in reservation order without anyone
+    sleeping under a lock. Every operation is O(1). A rate of 0 is unlimited.
+    Not thread-safe on its own; KeyBudget serializes access.
+    """
+
+    def __init__(self, per_minute, burst_seconds=DEFAULT_QUOTA_BURST_SECONDS):
+        """Initialize full, holding ``burst_seconds`` worth of budget."""
+        self.per_minute = per_minute
+        self.rate = per_minute / 60.0
+        self.capacity = max(self.rate * burst_seconds, 1.0)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """Seconds until ``amount`` could be taken without debt."""
+        if not self.rate:
+            return 0.0
+        level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        return max(0.0, (amount - level) / self.rate)
+
+    def take(self, amount, now):
+        """Take ``amount`` and return how long the caller must wait before using it."""
+        if not self.rate:
+            return 0.0
+        self._refill(now)
+        self.level -= amount
+        return max(0.0, -self.level / self.rate)
+
+    def give_back(self, amount, now):
+        """Return unused budget (or charge more when ``amount`` is negative)."""
+        if not self.rate:
+            return
+        self._refill(now)
+        self.level = min(self.capacity, self.level + amount)
+
+    def drain(self, seconds, now):
+        """Empty the bucket so nothing is available for ``seconds``."""
+        if not self.rate:
+            return
+        self._refill(now)
+        self.level = min(self.level, -seconds * self.rate)
+
+
+class KeyBudget:
+    """RPM and TPM token buckets for one API key.
+
+    Token use is unknown until a response arrives, so each request reserves a
+    running estimate taken from response usage metadata and settles the
+    difference afterwards.
+    """
+
+    def __init__(self, rpm=DEFAULT_KEY_RPM, tpm=DEFAULT_KEY_TPM,
+                 estimated_tokens=DEFAULT_ESTIMATED_REQUEST_TOKENS,
+                 burst_seconds=DEFAULT_QUOTA_BURST_SECONDS):
+        """Initialize with the key's quotas and an initial tokens-per-request estimate."""
+        self.requests = TokenBucket(rpm, burst_seconds)
+        self.tokens = TokenBucket(tpm, burst_seconds)
+        self.estimated_tokens = float(estimated_tokens)
+        self.lock = threading.Lock()
+
+    def wait_time(self):
+        """Seconds until this key could send a request, without reserving."""
+        now = time.monotonic()
+        return max(self.requests.wait_time(1, now), self.tokens.wait_time(self.estimated_tokens, now))
+
+    def reserve(self):
+        """Reserve one request; return ``(delay, reserved_tokens)``."""
+        with self.lock:
+            now = time.monotonic()
+            reserved = self.estimated_tokens
+            delay = max(self.requests.take(1, now), self.tokens.take(reserved, now))
+            return delay, reserved
+
+    def settle(self, reserved_tokens, total_tokens):
+        """Correct a reservation with the response's actual token count."""
+        if not isinstance(total_tokens, int) or total_tokens <= 0:
+            return
+        with self.lock:
+            self.tokens.give_back(reserved_tokens - total_tokens, time.monotonic())
+            self.estimated_tokens += _TOKEN_ESTIMATE_ALPHA * (total_tokens - self.estimated_tokens)
+
+    def release(self, reserved_tokens):
+        """Refund a reservation whose request failed without reporting token usage."""
+        with self.lock:
+            self.tokens.give_back(reserved_tokens, time.monotonic())
+
+    def pause(self, seconds):
+        """Stop routing requests to this key for ``seconds`` (e.g. after a 429)."""
+        with self.lock:
+            self.requests.drain(seconds, time.monotonic())
+
+    def effective_rpm(self):
+        """Sustained requests per minute the key's quotas allow."""
+        limits = []
+        if self.requests.per_minute:
+            limits.append(float(self.requests.per_minute))
+        if self.tokens.per_minute:
+            limits.append(self.tokens.per_minute / self.estimated_tokens)
+        return min(limits) if limits else float('inf')
+
+
+class QuotaDispatcher:
+    """Routes each request to an API key with budget available."""
+
+    def __init__(self, budgets):
+        """Initialize with one KeyBudget per key."""
+        self.budgets = budgets
+
+    def acquire(self, preferred=None):
+        """Reserve a request slot; return ``(key_index, delay, reserved_tokens)``.
+
+        The preferred key is used while it has budget, which keeps requests on
+        one key's connections; otherwise the key whose budget frees up first
+        is chosen. Waits are read without locking, so two callers may pick the
+        same key; each still gets a correct delay from its reservation.
+        """
+        if preferred is not None and self.budgets[preferred].wait_time() == 0:
+            key_index = preferred
+        else:
+            key_index = min(range(len(self.budgets)), key=lambda i: self.budgets[i].wait_time())
+        delay, reserved = self.budgets[key_index].reserve()
+        return key_index, delay, reserved
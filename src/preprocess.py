@@ -0,0 +1,177 @@
+"""
+Image preprocessing module.
+Detects the real MIME type of each image and, optionally, downscales and
+re-encodes it on a process pool before upload, since upload size and image
+tokens both drive Gemini latency and quota.
+"""
+
+import io
+import math
+import asyncio
+import logging
+import mimetypes
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image
+
+from .config import (
+    DEFAULT_PREPROCESS_MAX_EDGE, DEFAULT_PREPROCESS_FORMAT, DEFAULT_PREPROCESS_QUALITY,
+    DEFAULT_PREPROCESS_WORKERS
+)
+
+# Formats Gemini accepts; anything else is re-encoded when preprocessing
+GEMINI_MIME_TYPES = ('image/jpeg', 'image/png', 'image/webp', 'image/heic', 'image/heif')
+
+_FORMATS = {'jpeg': ('JPEG', 'image/jpeg'), 'webp': ('WEBP', 'image/webp')}
+
+# Gemini bills an image of at most 384 px per side as one 258-token tile and
+# tiles larger images at 768 x 768
+_SMALL_IMAGE_EDGE = 384
+_TILE_EDGE = 768
+_TOKENS_PER_TILE = 258
+
+
+def detect_mime_type(image_bytes, image_path=''):
+    """MIME type from the image's magic bytes, falling back to its file extension."""
+    head = image_bytes[:12]
+    if head.startswith(b'\xff\xd8\xff'):
+        return 'image/jpeg'
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'image/png'
+    if head.startswith((b'GIF87a', b'GIF89a')):
+        return 'image/gif'
+    if head.startswith(b'BM'):
+        return 'image/bmp'
+    if head.startswith(b'RIFF') and head[8:12] == b'WEBP':
+        return 'image/webp'
+    return mimetypes.guess_type(image_path)[0] or 'image/jpeg'
+
+
+def estimate_image_tokens(width, height):
+    """Approximate input tokens Gemini counts for an image of this size."""
+    if width <= _SMALL_IMAGE_EDGE and height <= _SMALL_IMAGE_EDGE:
+        return _TOKENS_PER_TILE
+    return math.ceil(width / _TILE_EDGE) * math.ceil(height / _TILE_EDGE) * _TOKENS_PER_TILE
+
+
+def preprocess_image(image_bytes, max_edge=DEFAULT_PREPROCESS_MAX_EDGE, image_format=DEFAULT_PREPROCESS_FORMAT,
+                     quality=DEFAULT_PREPROCESS_QUALITY):
+    """Downscale to ``max_edge`` and re-encode; runs in a pool worker.
+
+    Returns ``(data, mime_type, original_size, new_size)``. The original
+    bytes are kept when re-encoding would not make them smaller and Gemini
+    accepts their format.
+    """
+    pil_format, mime_type = _FORMATS[image_format]
+    original_mime = detect_mime_type(image_bytes)
+
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        original_size = image.size
+        if image.format == 'JPEG':
+            # JPEG sources are decoded at a reduced scale when they are much larger than max_edge
+            image.draft('RGB', (max_edge, max_edge))
+        image = image.convert('RGBA' if image.mode in ('RGBA', 'LA', 'P') else 'RGB')
+        if image.mode == 'RGBA':
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel('A'))
+            image = background
+        image.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+
+        buffer = io.BytesIO()
+        image.save(buffer, pil_format, quality=quality, optimize=True)
+        new_size = image.size
+
+    data = buffer.getvalue()
+    if len(data) >= len(image_bytes) and new_size == original_size and original_mime in GEMINI_MIME_TYPES:
+        return image_bytes, original_mime, original_size, original_size
+    return data, mime_type, original_size, new_size
+
+
+class ImagePreprocessor:
+    """Runs preprocess_image on a process pool and tallies the bytes and tokens saved."""
+
+    def __init__(self, max_edge=DEFAULT_PREPROCESS_MAX_EDGE, image_format=DEFAULT_PREPROCESS_FORMAT,
+                 quality=DEFAULT_PREPROCESS_QUALITY, workers=DEFAULT_PREPROCESS_WORKERS):
+        """Initialize with the target size, format and quality and the pool size."""
+        if image_format not in _FORMATS:
+            raise ValueError(f"image format must be one of {', '.join(_FORMATS)}, got {image_format!r}")
+        self.max_edge = max_edge
+        self.image_format = image_format
+        self.quality = quality
+        self.workers = workers
+        self._pool = None
+        self.lock = threading.Lock()
+        self.stats = {'images': 0, 'bytes_in': 0, 'bytes_out': 0, 'tokens_in': 0, 'tokens_out': 0, 'failed': 0}
+
+    def fingerprint(self):
+        """Settings that change what is sent to Gemini (part of the caption cache key)."""
+        return f"preprocess:{self.max_edge}:{self.image_format}:{self.quality}"
+
+    @property
+    def pool(self):
+        """Process pool, started on first use."""
+        with self.lock:
+            if self._pool is None:
+                # Spawned, not forked: the parent runs many threads holding locks
+                self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context('spawn'))
+            return self._pool
+
+    def _record(self, image_bytes, image_path, result):
+        """Tally one image and return ``(data, mime_type)`` to send."""
+        data, mime_type, original_size, new_size = result
+        tokens_in, tokens_out = estimate_image_tokens(*original_size), estimate_image_tokens(*new_size)
+        with self.lock:
+            self.stats['images'] += 1
+            self.stats['bytes_in'] += len(image_bytes)
+            self.stats['bytes_out'] += len(data)
+            self.stats['tokens_in'] += tokens_in
+            self.stats['tokens_out'] += tokens_out
+        logging.debug(f"🗜️  {image_path}: {len(image_bytes)} → {len(data)} bytes, "
+                      f"~{tokens_in} → {tokens_out} input tokens")
+        return data, mime_type
+
+    def _fallback(self, image_bytes, image_path, error):
+        """Send the original bytes when the image cannot be decoded."""
+        logging.warning(f"⚠️  Could not preprocess {image_path}, sending it unchanged: {error}")
+        with self.lock:
+            self.stats['failed'] += 1
+        return image_bytes, detect_mime_type(image_bytes, image_path)
+
+    def prepare(self, image_bytes, image_path=''):
+        """Return ``(data, mime_type)`` to send for an image."""
+        try:
+            result = self.pool.submit(preprocess_image, image_bytes, self.max_edge, self.image_format,
+                                      self.quality).result()
+        except Exception as e:
+            return self._fallback(image_bytes, image_path, e)
+        return self._record(image_bytes, image_path, result)
+
+    async def prepare_async(self, image_bytes, image_path=''):
+        """Async variant of prepare that awaits the pool without blocking the event loop."""
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(
+                self.pool, preprocess_image, image_bytes, self.max_edge, self.image_format, self.quality)
+        except Exception as e:
+            return self._fallback(image_bytes, image_path, e)
+        return self._record(image_bytes, image_path, result)
+
+    def log_stats(self):
+        """Log the upload bytes and input tokens saved per image."""
+        stats = dict(self.stats)
+        images = stats['images']
+        if not images:
+            return
+        saved_bytes = (stats['bytes_in'] - stats['bytes_out']) / images
+        saved_tokens = (stats['tokens_in'] - stats['tokens_out']) / images
+        logging.info(f"🗜️  Preprocessed {images} images to {self.image_format} ≤{self.max_edge}px: "
+                     f"{stats['bytes_in'] / 1e6:.1f} → {stats['bytes_out'] / 1e6:.1f} MB, "
+                     f"saved {saved_bytes / 1024:.0f} KB and ~{saved_tokens:.0f} input tokens per image")
+
+    def close(self):
+        """Shut down the process pool."""
+        with self.lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
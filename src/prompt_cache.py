@@ -0,0 +1,113 @@
+"""
+Prompt context cache module.
+Keeps one Gemini cached-content handle holding the static PROMPT per API key
+and model, so requests reference the cached prompt instead of re-sending and
+re-tokenizing it.
+"""
+
+import time
+import logging
+import threading
+
+from google.genai import types
+
+from .config import (
+    PROMPT, DEFAULT_PROMPT_CACHE_TTL, DEFAULT_PROMPT_CACHE_REFRESH_MARGIN, DEFAULT_PROMPT_CACHE_RETRY_SECONDS
+)
+
+
+def is_cache_error(error_str):
+    """Check if a request failed because its cached content is gone or not accessible."""
+    error_lower = error_str.lower()
+    return any(marker in error_lower for marker in ('cachedcontent', 'cached content', 'cached_content'))
+
+
+class PromptCache:
+    """Cached-content handles for the prompt, one per API key and model.
+
+    Cached content belongs to the project of the key that created it, so
+    each key gets its own handle. Handles are extended before their TTL runs
+    out. When a handle cannot be created (e.g. the model does not support
+    caching) the key falls back to inline prompts and creation is retried
+    after ``retry_seconds``.
+    """
+
+    def __init__(self, ttl_seconds=DEFAULT_PROMPT_CACHE_TTL, refresh_margin=DEFAULT_PROMPT_CACHE_REFRESH_MARGIN,
+                 retry_seconds=DEFAULT_PROMPT_CACHE_RETRY_SECONDS, prompt=PROMPT, clock=time.time):
+        """Initialize with the handle TTL, how early to extend it and the retry delay after a failure."""
+        self.ttl_seconds = ttl_seconds
+        self.refresh_margin = refresh_margin
+        self.retry_seconds = retry_seconds
+        self.prompt = prompt
+        self.clock = clock
+        self.handles = {}
+        self.retry_at = {}
+        self.lock = threading.Lock()
+        self.stats = {'created': 0, 'refreshed': 0, 'failures': 0, 'invalidated': 0}
+
+    def _ttl(self):
+        return f"{int(self.ttl_seconds)}s"
+
+    def current(self, key_index, model):
+        """Return the handle name for a key and model if it is not due for refresh, else None."""
+        handle = self.handles.get((key_index, model))
+        if handle is not None and handle[1] - self.clock() > self.refresh_margin:
+            return handle[0]
+        return None
+
+    def available(self, key_index, model):
+        """Whether a handle exists or may be created now (the key is not backing off after a failure)."""
+        return self.retry_at.get((key_index, model), 0) <= self.clock()
+
+    def handle(self, client, key_index, model):
+        """Return a fresh handle name for a key and model, creating or extending it with ``client``.
+
+        Returns None when caching is unavailable for the key, so the caller
+        sends the prompt inline.
+        """
+        name = self.current(key_index, model)
+        if name is not None or not self.available(key_index, model):
+            return name
+
+        with self.lock:
+            # Another thread may have refreshed the handle while this one waited
+            name = self.current(key_index, model)
+            if name is not None or not self.available(key_index, model):
+                return name
+
+            handle = self.handles.get((key_index, model))
+            try:
+                if handle is not None and handle[1] > self.clock():
+                    client.caches.update(name=handle[0], config=types.UpdateCachedContentConfig(ttl=self._ttl()))
+                    name, stat = handle[0], 'refreshed'
+                else:
+                    cached = client.caches.create(model=model, config=types.CreateCachedContentConfig(
+                        contents=[types.Content(role='user', parts=[types.Part(text=self.prompt)])],
+                        display_name='caption-prompt',
+                        ttl=self._ttl()))
+                    name, stat = cached.name, 'created'
+            except Exception as e:
+                self.handles.pop((key_index, model), None)
+                self.retry_at[(key_index, model)] = self.clock() + self.retry_seconds
+                self.stats['failures'] += 1
+                logging.warning(f"⚠️  Prompt caching unavailable on key #{key_index + 1} for {model}, "
+                                f"sending the prompt inline: {e}")
+                return None
+
+            self.handles[(key_index, model)] = (name, self.clock() + self.ttl_seconds)
+            self.stats[stat] += 1
+            if stat == 'created':
+                logging.info(f"🧊 Cached the prompt on key #{key_index + 1} as {name}")
+            return name
+
+    def invalidate(self, key_index, model):
+        """Forget a handle the API no longer accepts; the next request creates a new one."""
+        with self.lock:
+            if self.handles.pop((key_index, model), None) is not None:
+                self.stats['invalidated'] += 1
+
+    def log_stats(self):
+        """Log how many handles were created, extended and lost."""
+        stats = dict(self.stats)
+        logging.info(f"🧊 Prompt cache: {stats['created']} handles created, {stats['refreshed']} extended, "
+                     f"{stats['invalidated']} invalidated, {stats['failures']} creation failures")
@@ -0,0 +1,132 @@
+"""
+Caption result module.
+Typed results returned by GeminiClient, and the machine-readable marker that
+error outputs start with so a caption file is classified from its first bytes
+instead of by scanning its text.
+"""
+
+import json
+
+from .config import ERROR_MESSAGES
+
+# Error outputs are JSON objects whose first key is "error_code"
+ERROR_MARKER = '{"error_code": '
+# Error outputs written before the marker existed
+_LEGACY_ERROR_PREFIX = '{"error": '
+# Captions copied from a near-duplicate frame are JSON objects whose first key is "propagated_from"
+PROPAGATED_MARKER = '{"propagated_from": '
+# Gemini captions are JSON objects, sometimes inside a ```json fence
+_CAPTION_PREFIXES = ('{', '`')
+
+# Error codes
+NO_CANDIDATES = 'NO_CANDIDATES'
+NO_CONTENT = 'NO_CONTENT'
+SAFETY_BLOCKED = 'SAFETY_BLOCKED'
+MAX_TOKENS = 'MAX_TOKENS'
+UNEXPECTED_FINISH = 'UNEXPECTED_FINISH'
+RATE_LIMITED = 'RATE_LIMITED'
+SERVER_ERROR = 'SERVER_ERROR'
+INVALID_REQUEST = 'INVALID_REQUEST'
+REQUEST_FAILED = 'REQUEST_FAILED'
+EMPTY_OUTPUT = 'EMPTY_OUTPUT'
+INVALID_OUTPUT = 'INVALID_OUTPUT'
+LEGACY_ERROR = 'LEGACY_ERROR'
+
+# Errors that will recur no matter how often the image is retried
+TERMINAL_ERRORS = frozenset({SAFETY_BLOCKED, INVALID_REQUEST})
+
+_ERROR_MESSAGES_LOWER = [error_msg.lower() for error_msg in ERROR_MESSAGES]
+
+
+class CaptionResult(str):
+    """Text written to a caption file: the caption itself or an error output.
+
+    Subclasses str so results can be written and compared as before, while
+    ``error_code`` and ``retryable`` classify failures without parsing text.
+    """
+
+    def __new__(cls, text, error_code=None, retryable=False, propagated_from=None):
+        result = super().__new__(cls, text)
+        result.error_code = error_code
+        result.retryable = retryable
+        result.propagated_from = propagated_from
+        return result
+
+    @classmethod
+    def success(cls, text):
+        """A caption returned by the model."""
+        return cls(text)
+
+    @classmethod
+    def failure(cls, error_code, message):
+        """An error output carrying the machine-readable marker."""
+        retryable = error_code not in TERMINAL_ERRORS
+        text = json.dumps({"error_code": error_code, "retryable": retryable, "error": message})
+        return cls(text, error_code, retryable)
+
+    @classmethod
+    def propagated(cls, caption, source):
+        """A copy of the caption of ``source``, a near-duplicate frame, carrying the propagated marker."""
+        try:
+            fields = json.loads(strip_fence(caption))
+        except ValueError:
+            fields = None
+        if not isinstance(fields, dict):
+            fields = {"caption": str(caption)}
+        fields = {key: value for key, value in fields.items() if key != "propagated_from"}
+        text = json.dumps({"propagated_from": source, **fields}, ensure_ascii=False)
+        return cls(text, propagated_from=source)
+
+    @property
+    def ok(self):
+        """Whether this is a caption rather than an error."""
+        return self.error_code is None
+
+    @property
+    def terminal(self):
+        """Whether this is an error that retrying will not fix."""
+        return not self.ok and not self.retryable
+
+    @classmethod
+    def parse(cls, content):
+        """Classify caption file content.
+
+        Marked error outputs and captions are told apart by their first
+        characters. Only plain-text output from older versions falls back to
+        searching for ERROR_MESSAGES.
+        """
+        if isinstance(content, cls):
+            return content
+        if not content:
+            return cls(content or '', EMPTY_OUTPUT, True)
+
+        head = content[:32].lstrip()
+        if head.startswith(ERROR_MARKER):
+            try:
+                parsed = json.loads(content)
+                return cls(content, parsed['error_code'], bool(parsed.get('retryable', True)))
+            except (ValueError, KeyError, TypeError):
+                return cls(content, LEGACY_ERROR, True)
+        if head.startswith(_LEGACY_ERROR_PREFIX):
+            return cls(content, LEGACY_ERROR, True)
+        if head.startswith(PROPAGATED_MARKER):
+            try:
+                return cls(content, propagated_from=json.loads(content)['propagated_from'])
+            except (ValueError, KeyError, TypeError):
+                return cls(content)
+        if head.startswith(_CAPTION_PREFIXES):
+            return cls(content)
+
+        content_lower = content.lower()
+        if any(error_msg in content_lower for error_msg in _ERROR_MESSAGES_LOWER):
+            return cls(content, LEGACY_ERROR, True)
+        return cls(content)
+
+
+def strip_fence(text):
+    """Remove a surrounding ```json fence from model output."""
+    text = text.strip()
+    if text.startswith('```'):
+        text = text.split('\n', 1)[1] if '\n' in text else ''
+        text = text.rsplit('```', 1)[0]
+    return text
@@ -4,16 +4,29 @@ Manages file listing, downloading, and uploading for the image captioning system
 """
 
 import os
+import time
+import queue
+import asyncio
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import boto3
+from botocore.config import Config
 from botocore.exceptions import ClientError, NoCredentialsError
-from typing import List, Tuple, Optional
+from typing import Iterator, List, Tuple, Optional
 from dotenv import load_dotenv
 
-from .config import IMAGE_EXTENSIONS
+from .config import (
+    IMAGE_EXTENSIONS, DEFAULT_LIST_WORKERS, DEFAULT_LIST_PARTITION_DEPTH,
+    DEFAULT_S3_MAX_POOL_CONNECTIONS
+)
+from .caption_index import CaptionIndex
 
 load_dotenv()
 
+# Marks the end of one prefix listing task
+_LISTING_DONE = object()
+
 class S3Client:
     """Handles S3 operations for image processing."""
 
@@ -23,13 +36,17 @@ class S3Client:
         self.bucket_name = bucket_name
         self.images_folder = "frames"
         self.captions_folder = "captions"
+        # boto3 is blocking; async callers run transfers on these threads
+        self._io_executor = ThreadPoolExecutor(max_workers=DEFAULT_S3_MAX_POOL_CONNECTIONS,
+                                               thread_name_prefix="s3-io")
 
         try:
             self.s3_client = boto3.client(
                 's3',
                 region_name=self.region,
                 aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-                aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY')
+                aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
+                config=Config(max_pool_connections=DEFAULT_S3_MAX_POOL_CONNECTIONS)
             )
             self.s3_client.head_bucket(Bucket=self.bucket_name)
             logging.info(f"Successfully connected to S3 bucket: {self.bucket_name}")
@@ -44,34 +61,28 @@ class S3Client:
                 logging.error(f"Error connecting to S3: {e}")
             raise
 
-    def list_all_images(self) -> List[str]:
-        """List all image files in the S3 frames folder."""
-        image_files = []
+    def _iter_pages(self, prefix: str, delimiter: Optional[str] = None,
+                    start_after: Optional[str] = None) -> Iterator[dict]:
+        """Yield raw list_objects_v2 pages under a prefix, following continuation tokens."""
         continuation_token = None
 
-        logging.info(f"Scanning S3 bucket for images...")
-
         while True:
             try:
                 list_params = {
                     'Bucket': self.bucket_name,
-                    'Prefix': f"{self.images_folder}/",
+                    'Prefix': prefix,
                     'MaxKeys': 1000
                 }
 
+                if delimiter:
+                    list_params['Delimiter'] = delimiter
                 if continuation_token:
                     list_params['ContinuationToken'] = continuation_token
+                elif start_after:
+                    list_params['StartAfter'] = start_after
 
                 response = self.s3_client.list_objects_v2(**list_params)
-
-                if 'Contents' in response:
-                    for obj in response['Contents']:
-                        key = obj['Key']
-                        if key.endswith('/'):
-                            continue
-
-                        if any(key.lower().endswith(ext) for ext in IMAGE_EXTENSIONS):
-                            image_files.append(key)
+                yield response
 
                 if response.get('IsTruncated', False):
                     continuation_token = response.get('NextContinuationToken')
@@ -82,9 +93,115 @@ class S3Client:
                 logging.error(f"Error listing S3 objects: {e}")
                 raise
 
-        logging.info(f"Found {len(image_files)} image files in S3 bucket")
+    def iter_objects_parallel(self, prefix: str, max_workers: int = DEFAULT_LIST_WORKERS,
+                              partition_depth: int = DEFAULT_LIST_PARTITION_DEPTH) -> Iterator[dict]:
+        """Yield every object under a prefix, paging sub-prefixes concurrently.
+
+        The first ``partition_depth`` levels below ``prefix`` are discovered with
+        delimiter listings (``frames/Kxx/`` then ``frames/Kxx/Vyyy/``); each leaf
+        prefix is then paged on the thread pool. Objects are yielded page by page
+        as they arrive, in no particular order.
+        """
+        results = queue.Queue()
+        cancelled = threading.Event()
+        pending_lock = threading.Lock()
+        pending = [0]
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+
+        def submit(sub_prefix, depth):
+            with pending_lock:
+                pending[0] += 1
+            executor.submit(list_prefix, sub_prefix, depth)
+
+        def list_prefix(sub_prefix, depth):
+            try:
+                for response in self._iter_pages(sub_prefix, '/' if depth > 0 else None):
+                    if cancelled.is_set():
+                        break
+                    objects = [obj for obj in response.get('Contents', []) if not obj['Key'].endswith('/')]
+                    if objects:
+                        results.put(objects)
+                    for common_prefix in response.get('CommonPrefixes', []):
+                        submit(common_prefix['Prefix'], depth - 1)
+            except Exception as e:
+                results.put(e)
+            finally:
+                results.put(_LISTING_DONE)
+
+        submit(prefix, partition_depth)
+        finished = 0
+        try:
+            while True:
+                item = results.get()
+                if item is _LISTING_DONE:
+                    finished += 1
+                    with pending_lock:
+                        if finished == pending[0]:
+                            break
+                elif isinstance(item, Exception):
+                    raise item
+                else:
+                    yield from item
+        finally:
+            cancelled.set()
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def discover_prefixes(self, prefix: str, max_workers: int = DEFAULT_LIST_WORKERS,
+                          partition_depth: int = DEFAULT_LIST_PARTITION_DEPTH) -> Tuple[List[str], List[dict]]:
+        """Find the leaf prefixes ``partition_depth`` levels below a prefix.
+
+        Only delimiter listings are issued, so leaf contents are never paged.
+        Returns the sorted leaf prefixes and any objects stored above leaf level.
+        """
+        level = [prefix]
+        loose_objects = []
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for _ in range(partition_depth):
+                next_level = []
+                for responses in executor.map(lambda p: list(self._iter_pages(p, '/')), level):
+                    for response in responses:
+                        loose_objects.extend(obj for obj in response.get('Contents', [])
+                                             if not obj['Key'].endswith('/'))
+                        next_level.extend(cp['Prefix'] for cp in response.get('CommonPrefixes', []))
+                level = next_level
+
+        return sorted(level), loose_objects
+
+    def list_prefix(self, prefix: str, start_after: Optional[str] = None) -> List[dict]:
+        """List the objects under a prefix, optionally only those after a given key."""
+        return [obj for response in self._iter_pages(prefix, start_after=start_after)
+                for obj in response.get('Contents', []) if not obj['Key'].endswith('/')]
+
+    def iter_images(self, max_workers: int = DEFAULT_LIST_WORKERS) -> Iterator[str]:
+        """Stream image keys from the S3 frames folder as they are listed."""
+        for obj in self.iter_objects_parallel(f"{self.images_folder}/", max_workers):
+            if obj['Key'].lower().endswith(IMAGE_EXTENSIONS):
+                yield obj['Key']
+
+    def list_all_images(self, max_workers: int = DEFAULT_LIST_WORKERS) -> List[str]:
+        """List all image files in the S3 frames folder."""
+        logging.info("Scanning S3 bucket for images...")
+
+        start_time = time.time()
+        image_files = sorted(self.iter_images(max_workers))
+        elapsed = time.time() - start_time
+
+        rate = len(image_files) / elapsed if elapsed > 0 else 0
+        logging.info(f"Found {len(image_files)} image files in S3 bucket "
+                     f"({elapsed:.1f}s, {rate:,.0f} keys/s)")
         return image_files
 
+    def list_caption_keys(self) -> List[str]:
+        """List all caption files in the S3 captions folder."""
+        logging.info("Scanning S3 bucket for captions...")
+
+        caption_keys = [obj['Key'] for obj in self.iter_objects_parallel(f"{self.captions_folder}/")
+                        if obj['Key'].endswith('.txt')]
+
+        logging.info(f"Found {len(caption_keys)} caption files in S3 bucket")
+        return caption_keys
+
     def check_caption_exists(self, image_s3_key: str) -> bool:
         """Check if a caption file already exists for an image."""
         caption_key = self.get_caption_key_from_image_key(image_s3_key)
@@ -104,17 +221,18 @@ class S3Client:
         base_name = os.path.splitext(relative_path)[0]
         return f"{self.captions_folder}/{base_name}.txt"
 
-    def generate_work_distribution(self, image_files: List[str], num_workers: int = 1) -> List[List[str]]:
+    def generate_work_distribution(self, image_files: List[str], num_workers: int = 1,
+                                   caption_index: Optional['CaptionIndex'] = None) -> List[List[str]]:
         """Distribute image files across multiple workers for parallel processing."""
         if num_workers <= 1:
             return [image_files]
 
         logging.info("Filtering out images that already have captions...")
 
-        images_to_process = []
-        for image_key in image_files:
-            if not self.check_caption_exists(image_key):
-                images_to_process.append(image_key)
+        if caption_index is None:
+            caption_index = CaptionIndex.build(self)
+
+        images_to_process = caption_index.missing(image_files, self.get_caption_key_from_image_key)
 
         logging.info(f"Images needing processing: {len(images_to_process)} out of {len(image_files)} total")
 
@@ -170,7 +288,7 @@ class S3Client:
                     f.write(f"Worker {i+1}: {len(chunk)} images (worker_{i+1}_images.txt)\n")
 
         distribution_files.append(summary_file)
-        logging.info(f"Created summary file: distribution_summary.txt")
+        logging.info("Created summary file: distribution_summary.txt")
 
         return distribution_files
 
@@ -184,6 +302,40 @@ class S3Client:
             logging.error(f"Error downloading {s3_key}: {e}")
             return False
 
+    def download_image_bytes(self, s3_key: str) -> Optional[bytes]:
+        """Download an image from S3 straight into memory."""
+        try:
+            response = self.s3_client.get_object(Bucket=self.bucket_name, Key=s3_key)
+            return response['Body'].read()
+        except ClientError as e:
+            logging.error(f"Error downloading {s3_key}: {e}")
+            return None
+
+    def upload_caption_bytes(self, caption: str, s3_key: str) -> bool:
+        """Upload caption text to S3 straight from memory."""
+        try:
+            self.s3_client.put_object(
+                Bucket=self.bucket_name,
+                Key=s3_key,
+                Body=caption.encode('utf-8'),
+                ContentType='text/plain; charset=utf-8'
+            )
+            logging.debug(f"Uploaded caption to S3: {s3_key}")
+            return True
+        except ClientError as e:
+            logging.error(f"Error uploading {s3_key}: {e}")
+            return False
+
+    async def download_image_bytes_async(self, s3_key: str) -> Optional[bytes]:
+        """Awaitable download_image_bytes running on the S3 I/O threads."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._io_executor, self.download_image_bytes, s3_key)
+
+    async def upload_caption_bytes_async(self, caption: str, s3_key: str) -> bool:
+        """Awaitable upload_caption_bytes running on the S3 I/O threads."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._io_executor, self.upload_caption_bytes, caption, s3_key)
+
     def upload_caption(self, local_file_path: str, s3_key: str) -> bool:
         """Upload a caption file to S3."""
         try:
@@ -0,0 +1,194 @@
+"""
+S3 inventory manifest module.
+Keeps a compact on-disk manifest of image keys, sizes and ETags so helper
+scripts do not have to re-list the whole frames folder on every run.
+"""
+
+import os
+import gzip
+import json
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional, Tuple
+
+from .config import (
+    IMAGE_EXTENSIONS, DEFAULT_INVENTORY_FILE, DEFAULT_LIST_WORKERS,
+    DEFAULT_LIST_PARTITION_DEPTH
+)
+
+# Group holding objects stored above the leaf prefixes (e.g. frames/foo.jpg)
+LOOSE_GROUP = ''
+
+# (key, size, etag)
+Entry = Tuple[str, int, str]
+
+
+class InventoryManifest:
+    """Image inventory grouped by leaf prefix (frames/Kxx/Vyyy/)."""
+
+    def __init__(self, bucket_name: Optional[str] = None, prefix: str = 'frames/',
+                 groups: Optional[Dict[str, List[Entry]]] = None,
+                 created_at: Optional[float] = None, refreshed_at: Optional[float] = None):
+        """Initialize from entries grouped by leaf prefix."""
+        self.bucket_name = bucket_name
+        self.prefix = prefix
+        self.groups = groups or {}
+        self.created_at = created_at if created_at is not None else time.time()
+        self.refreshed_at = refreshed_at if refreshed_at is not None else self.created_at
+
+    def __len__(self) -> int:
+        return sum(len(entries) for entries in self.groups.values())
+
+    @staticmethod
+    def _entry(obj: dict) -> Entry:
+        """Convert a list_objects_v2 item to a manifest entry."""
+        return obj['Key'], int(obj.get('Size', 0)), obj.get('ETag', '').strip('"')
+
+    def _group_for(self, key: str, partition_depth: int) -> str:
+        """Return the leaf prefix a key belongs to, or the loose group."""
+        parts = key[len(self.prefix):].split('/')
+        if len(parts) <= partition_depth:
+            return LOOSE_GROUP
+        return self.prefix + '/'.join(parts[:partition_depth]) + '/'
+
+    @classmethod
+    def build(cls, s3_client, max_workers: int = DEFAULT_LIST_WORKERS,
+              partition_depth: int = DEFAULT_LIST_PARTITION_DEPTH) -> 'InventoryManifest':
+        """Build a manifest from a full parallel listing of the frames folder."""
+        manifest = cls(s3_client.bucket_name, f"{s3_client.images_folder}/")
+        for obj in s3_client.iter_objects_parallel(manifest.prefix, max_workers, partition_depth):
+            if obj['Key'].lower().endswith(IMAGE_EXTENSIONS):
+                group = manifest._group_for(obj['Key'], partition_depth)
+                manifest.groups.setdefault(group, []).append(cls._entry(obj))
+        for entries in manifest.groups.values():
+            entries.sort()
+        return manifest
+
+    def refresh(self, s3_client, max_workers: int = DEFAULT_LIST_WORKERS,
+                partition_depth: int = DEFAULT_LIST_PARTITION_DEPTH) -> Dict[str, int]:
+        """Pick up new images without re-listing unchanged prefixes.
+
+        Leaf prefixes are rediscovered with delimiter listings; each known prefix
+        is then listed with ``StartAfter`` set to its last manifest key, so an
+        unchanged prefix costs one empty page. New prefixes are listed in full and
+        vanished prefixes are dropped. Objects deleted or rewritten below the last
+        known key of a prefix are not detected; rebuild for that.
+        """
+        leaf_prefixes, loose_objects = s3_client.discover_prefixes(self.prefix, max_workers, partition_depth)
+        stats = {'prefixes': len(leaf_prefixes), 'changed_prefixes': 0, 'new_prefixes': 0,
+                 'removed_prefixes': 0, 'new_keys': 0}
+
+        known = set(self.groups) - {LOOSE_GROUP}
+        for removed in known - set(leaf_prefixes):
+            del self.groups[removed]
+            stats['removed_prefixes'] += 1
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {}
+            for leaf_prefix in leaf_prefixes:
+                entries = self.groups.get(leaf_prefix)
+                start_after = entries[-1][0] if entries else None
+                futures[executor.submit(s3_client.list_prefix, leaf_prefix, start_after)] = leaf_prefix
+
+            for future in as_completed(futures):
+                leaf_prefix = futures[future]
+                new_entries = [self._entry(obj) for obj in future.result()
+                               if obj['Key'].lower().endswith(IMAGE_EXTENSIONS)]
+                if leaf_prefix not in self.groups:
+                    stats['new_prefixes'] += 1
+                if new_entries:
+                    stats['changed_prefixes'] += 1
+                    stats['new_keys'] += len(new_entries)
+                self.groups.setdefault(leaf_prefix, []).extend(new_entries)
+
+        loose_entries = sorted(self._entry(obj) for obj in loose_objects
+                               if obj['Key'].lower().endswith(IMAGE_EXTENSIONS))
+        if loose_entries:
+            self.groups[LOOSE_GROUP] = loose_entries
+        else:
+            self.groups.pop(LOOSE_GROUP, None)
+
+        self.refreshed_at = time.time()
+        return stats
+
+    def image_keys(self) -> List[str]:
+        """Return all image keys in sorted order."""
+        return sorted(key for entries in self.groups.values() for key, _, _ in entries)
+
+    def entries(self) -> List[Entry]:
+        """Return all (key, size, etag) entries in sorted order."""
+        return sorted(entry for entries in self.groups.values() for entry in entries)
+
+    def save(self, path: str = DEFAULT_INVENTORY_FILE):
+        """Write the manifest to disk atomically.
+
+        Format: a JSON header line, then for each group a ``#<prefix>`` line
+        followed by ``<name>\\t<size>\\t<etag>`` lines with names relative to it.
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        tmp_path = f"{path}.tmp"
+        with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+            header = {'bucket': self.bucket_name, 'prefix': self.prefix, 'created_at': self.created_at,
+                      'refreshed_at': self.refreshed_at, 'count': len(self)}
+            f.write(json.dumps(header) + '\n')
+            for group in sorted(self.groups):
+                f.write(f"#{group}\n")
+                for key, size, etag in self.groups[group]:
+                    f.write(f"{key[len(group):]}\t{size}\t{etag}\n")
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str = DEFAULT_INVENTORY_FILE) -> 'InventoryManifest':
+        """Load a manifest written by save()."""
+        groups = {}
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            header = json.loads(f.readline())
+            group, entries = LOOSE_GROUP, None
+            for line in f:
+                line = line.rstrip('\n')
+                if line.startswith('#'):
+                    group = line[1:]
+                    entries = groups.setdefault(group, [])
+                    continue
+                name, size, etag = line.split('\t')
+                entries.append((group + name, int(size), etag))
+
+        return cls(header.get('bucket'), header.get('prefix', 'frames/'), groups,
+                   header.get('created_at'), header.get('refreshed_at'))
+
+    @classmethod
+    def load_or_build(cls, s3_client, path: str = DEFAULT_INVENTORY_FILE, refresh: bool = False,
+                      max_workers: int = DEFAULT_LIST_WORKERS) -> 'InventoryManifest':
+        """Load the cached manifest, refreshing or building it as requested."""
+        manifest = None
+        if os.path.exists(path):
+            try:
+                manifest = cls.load(path)
+                if manifest.bucket_name != s3_client.bucket_name:
+                    logging.info(f"Inventory at {path} is for bucket {manifest.bucket_name}, rebuilding...")
+                    manifest = None
+            except (OSError, ValueError) as e:
+                logging.warning(f"Could not read inventory manifest {path}: {e}")
+                manifest = None
+
+        if manifest is None:
+            logging.info("Building S3 inventory manifest...")
+            manifest = cls.build(s3_client, max_workers)
+            manifest.save(path)
+            logging.info(f"💾 Saved inventory of {len(manifest)} images to {path}")
+        elif refresh:
+            stats = manifest.refresh(s3_client, max_workers)
+            manifest.save(path)
+            logging.info(f"🔄 Refreshed inventory: {stats['new_keys']} new images in "
+                         f"{stats['changed_prefixes']}/{stats['prefixes']} prefixes "
+                         f"({stats['new_prefixes']} new, {stats['removed_prefixes']} removed)")
+        else:
+            age_hours = (time.time() - manifest.refreshed_at) / 3600
+            logging.info(f"📂 Loaded inventory of {len(manifest)} images from {path} "
+                         f"(refreshed {age_hours:.1f}h ago, use --refresh to update)")
+
+        return manifest
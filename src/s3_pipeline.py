@@ -0,0 +1,414 @@
+"""
+Pipelined S3 worker module.
+Overlaps S3 downloads, Gemini calls and S3 uploads using stage thread pools
+connected by bounded queues, or as concurrent coroutines on one event loop.
+"""
+
+import queue
+import asyncio
+import logging
+import threading
+
+from .config import (
+    DEFAULT_MAX_WORKERS, DEFAULT_DOWNLOAD_WORKERS, DEFAULT_UPLOAD_WORKERS,
+    DEFAULT_PIPELINE_QUEUE_SIZE, DEFAULT_ASYNC_CONCURRENCY, DEFAULT_BATCH_SIZE
+)
+from .async_image_processor import run_bounded
+from .batching import iter_video_batches
+from .results import CaptionResult
+
+# Marks the end of a stage's input
+_STAGE_DONE = object()
+
+
+def is_error_response(caption):
+    """Check if the caption response is an error output."""
+    return not caption or not CaptionResult.parse(caption).ok
+
+
+class _Stage:
+    """A pool of threads consuming one queue and feeding the next.
+
+    ``on_error(item)`` is called for an item whose handler raised, so the
+    pipeline can count it as failed.
+    """
+
+    def __init__(self, name, handler, num_workers, input_queue, output_queue=None, downstream_workers=0,
+                 on_error=None):
+        self.name = name
+        self.handler = handler
+        self.on_error = on_error
+        self.num_workers = num_workers
+        self.input_queue = input_queue
+        self.output_queue = output_queue
+        self.downstream_workers = downstream_workers
+        self.remaining = self.num_workers
+        self.lock = threading.Lock()
+        self.threads = []
+
+    def start(self):
+        """Start the worker threads for this stage."""
+        for i in range(self.num_workers):
+            thread = threading.Thread(target=self._run, name=f"{self.name}-{i + 1}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def _run(self):
+        """Process items until the end-of-stage marker arrives."""
+        while True:
+            item = self.input_queue.get()
+            if item is _STAGE_DONE:
+                break
+            try:
+                result = self.handler(item)
+                if result is not None and self.output_queue is not None:
+                    self.output_queue.put(result)
+            except Exception as e:
+                logging.error(f"❌ Error in {self.name} stage: {e}")
+                if self.on_error is not None:
+                    self.on_error(item)
+
+        # The last worker to finish closes the downstream stage
+        with self.lock:
+            self.remaining -= 1
+            last_worker = self.remaining == 0
+        if last_worker and self.output_queue is not None:
+            for _ in range(self.downstream_workers):
+                self.output_queue.put(_STAGE_DONE)
+
+    def join(self):
+        """Wait for all worker threads to exit."""
+        for thread in self.threads:
+            thread.join()
+
+
+class S3CaptionPipeline:
+    """Runs download → caption → upload as concurrent pipeline stages.
+
+    With a batch size above 1, each queue item is a batch of frames of one
+    video, captioned with a single Gemini request.
+    """
+
+    def __init__(self, s3_client, gemini_client, file_manager, checkpoint_file='checkpoint.pkl',
+                 download_workers=DEFAULT_DOWNLOAD_WORKERS, caption_workers=DEFAULT_MAX_WORKERS,
+                 upload_workers=DEFAULT_UPLOAD_WORKERS, queue_size=DEFAULT_PIPELINE_QUEUE_SIZE,
+                 max_retries=5, key_rotation_delay=1.0, deduplicator=None, batch_size=DEFAULT_BATCH_SIZE):
+        """Initialize with clients, per-stage concurrency, an optional frame deduplicator and the batch size."""
+        self.s3_client = s3_client
+        self.gemini_client = gemini_client
+        self.file_manager = file_manager
+        self.checkpoint_file = checkpoint_file
+        self.download_workers = max(1, download_workers)
+        self.caption_workers = max(1, caption_workers)
+        self.upload_workers = max(1, upload_workers)
+        self.queue_size = queue_size
+        self.max_retries = max_retries
+        self.key_rotation_delay = key_rotation_delay
+        self.deduplicator = deduplicator
+        self.batch_size = max(1, batch_size)
+
+        self.shutdown_check = lambda: False
+        self.stats_lock = threading.Lock()
+        self.stats = {'processed': 0, 'download_failed': 0, 'caption_failed': 0, 'upload_failed': 0}
+        self.processed_files = None
+        self.pbar = None
+        self.result_callback = None
+        # Bytes of representatives downloaded for near-duplicate hashing, taken by the download stage
+        self.prefetched = {}
+
+    def set_shutdown_check(self, check):
+        """Set a callable returning True once shutdown has been requested."""
+        self.shutdown_check = check
+
+    def set_result_callback(self, callback):
+        """Set a callable receiving ``(img_key, ok)`` as each image leaves the pipeline."""
+        self.result_callback = callback
+
+    def _count(self, stat):
+        """Increment a pipeline statistic."""
+        with self.stats_lock:
+            self.stats[stat] += 1
+
+    def _fail(self, stat, img_key):
+        """Count an image that dropped out of the pipeline, along with any near-duplicates waiting on it."""
+        self._count(stat)
+        duplicates = self._pop_duplicates(img_key)
+        if self.result_callback is not None:
+            self.result_callback(img_key, False)
+            for duplicate_key in duplicates:
+                self.result_callback(duplicate_key, False)
+
+    def _fail_item(self, stat):
+        """``_Stage`` error callback failing every image of a stage item.
+
+        Items are a key, a ``(img_key, ...)`` tuple, or a batch list of either.
+        """
+        def on_error(item):
+            for unit in item if isinstance(item, list) else [item]:
+                self._fail(stat, unit if isinstance(unit, str) else unit[0])
+        return on_error
+
+    def _pop_duplicates(self, img_key):
+        """Take the near-duplicate keys waiting on the caption of ``img_key``."""
+        if self.deduplicator is None:
+            return []
+        return self.deduplicator.pop_duplicates(img_key)
+
+    def _iter_keys(self, image_keys):
+        """Pass on one representative per near-duplicate cluster when deduplicating."""
+        if self.deduplicator is None:
+            return image_keys
+        return self._keep_prefetched(self.deduplicator.iter_representatives(
+            image_keys, load=self.s3_client.download_image_bytes, with_data=True))
+
+    def _keep_prefetched(self, representatives):
+        """Yield representative keys, keeping the bytes already downloaded to hash them."""
+        for img_key, image_bytes in representatives:
+            if image_bytes is not None:
+                self.prefetched[img_key] = image_bytes
+            yield img_key
+
+    def _take_prefetched(self, img_key):
+        """Bytes of an image downloaded during the near-duplicate pre-pass, or None."""
+        return self.prefetched.pop(img_key, None)
+
+    def _iter_units(self, image_keys):
+        """Keys to feed the pipeline: single keys, or lists of keys from one video when batching."""
+        keys = self._iter_keys(image_keys)
+        if self.batch_size > 1:
+            return iter_video_batches(keys, self.batch_size)
+        return keys
+
+    def _propagate(self, img_key, relative_path, caption):
+        """Upload a copy of a caption for the near-duplicate frames of ``img_key``."""
+        duplicates = self._pop_duplicates(img_key)
+        if not duplicates:
+            return
+        propagated = CaptionResult.propagated(caption, relative_path)
+        copied = 0
+        for duplicate_key in duplicates:
+            caption_key = self.s3_client.get_caption_key_from_image_key(duplicate_key)
+            if not self.s3_client.upload_caption_bytes(propagated, caption_key):
+                logging.error(f"❌ Failed to upload caption for {duplicate_key}")
+                self._fail('upload_failed', duplicate_key)
+                continue
+            duplicate_path = duplicate_key.replace(f"{self.s3_client.images_folder}/", '', 1)
+            self._mark_processed(duplicate_key, duplicate_path, caption_key)
+            copied += 1
+        self.deduplicator.record_propagated(copied)
+        logging.info(f"🪞 Copied caption of {img_key} to {copied} near-duplicate frames")
+
+    def _download(self, img_key):
+        """Download stage: fetch an image from S3 into memory."""
+        relative_path = img_key.replace(f"{self.s3_client.images_folder}/", '', 1)
+
+        logging.info(f"🔄 Processing: {img_key}")
+        image_bytes = self._take_prefetched(img_key) or self.s3_client.download_image_bytes(img_key)
+        if image_bytes is None:
+            logging.error(f"❌ Failed to download {img_key}")
+            self._fail('download_failed', img_key)
+            return None
+        return img_key, relative_path, image_bytes
+
+    def _caption(self, item):
+        """Caption stage: run Gemini on the downloaded image bytes."""
+        img_key, relative_path, image_bytes = item
+        caption = self.gemini_client.process_image_bytes(
+            image_bytes, img_key, self.max_retries, self.key_rotation_delay)
+        return self._check_caption(img_key, relative_path, caption)
+
+    def _check_caption(self, img_key, relative_path, caption):
+        """Pass a caption on to the upload stage, or count the image as failed."""
+        if caption and not is_error_response(caption):
+            return img_key, relative_path, caption
+
+        if caption:
+            logging.error(f"❌ Failed to generate caption for {img_key}: {caption}")
+        else:
+            logging.error(f"❌ Failed to generate caption for {img_key}")
+        self._fail('caption_failed', img_key)
+        return None
+
+    def _upload(self, item):
+        """Upload stage: store the caption in S3 and record progress."""
+        img_key, relative_path, caption = item
+        caption_key = self.s3_client.get_caption_key_from_image_key(img_key)
+
+        if not self.s3_client.upload_caption_bytes(caption, caption_key):
+            logging.error(f"❌ Failed to upload caption for {img_key}")
+            self._fail('upload_failed', img_key)
+            return None
+
+        self._mark_processed(img_key, relative_path, caption_key)
+        self._propagate(img_key, relative_path, caption)
+        return None
+
+    def _download_batch(self, img_keys):
+        """Download stage for a batch of frames."""
+        items = [item for item in map(self._download, img_keys) if item is not None]
+        return items or None
+
+    def _caption_batch(self, items):
+        """Caption stage for a batch of frames: one Gemini request for all of them."""
+        captions = self.gemini_client.process_image_batch(
+            [(image_bytes, img_key) for img_key, _, image_bytes in items], self.max_retries, self.key_rotation_delay)
+        checked = [self._check_caption(img_key, relative_path, caption)
+                   for (img_key, relative_path, _), caption in zip(items, captions)]
+        return [item for item in checked if item is not None] or None
+
+    def _upload_batch(self, items):
+        """Upload stage for a batch of frames; an error only fails the frame it happened on."""
+        for item in items:
+            try:
+                self._upload(item)
+            except Exception as e:
+                logging.error(f"❌ Error in upload stage for {item[0]}: {e}")
+                self._fail('upload_failed', item[0])
+
+    def _mark_processed(self, img_key, relative_path, caption_key):
+        """Record a captioned image in the checkpoint, stats and progress bar."""
+        if self.processed_files is not None:
+            with self.stats_lock:
+                self.processed_files.add(relative_path)
+        if self.checkpoint_file:
+            self.file_manager.record_processed(relative_path, self.checkpoint_file)
+        self._count('processed')
+        if self.result_callback is not None:
+            self.result_callback(img_key, True)
+        if self.pbar is not None:
+            self.pbar.update(1)
+        logging.info(f"✅ Processed: {img_key} -> {caption_key}")
+
+    def run(self, image_keys, processed_files=None, pbar=None):
+        """Push image keys through the pipeline and wait for it to drain."""
+        self.processed_files = processed_files
+        self.pbar = pbar
+
+        download_queue = queue.Queue(maxsize=self.queue_size)
+        caption_queue = queue.Queue(maxsize=self.queue_size)
+        upload_queue = queue.Queue(maxsize=self.queue_size)
+
+        batched = self.batch_size > 1
+        stages = [
+            _Stage('download', self._download_batch if batched else self._download, self.download_workers,
+                   download_queue, caption_queue, self.caption_workers, self._fail_item('download_failed')),
+            _Stage('caption', self._caption_batch if batched else self._caption, self.caption_workers,
+                   caption_queue, upload_queue, self.upload_workers, self._fail_item('caption_failed')),
+            _Stage('upload', self._upload_batch if batched else self._upload, self.upload_workers, upload_queue,
+                   on_error=self._fail_item('upload_failed')),
+        ]
+        for stage in stages:
+            stage.start()
+
+        logging.info(f"🚰 Pipeline started: {self.download_workers} downloaders, "
+                     f"{self.caption_workers} Gemini callers, {self.upload_workers} uploaders")
+
+        try:
+            for item in self._iter_units(image_keys):
+                if self.shutdown_check():
+                    logging.info("⏹️  Shutdown requested, draining in-flight images...")
+                    break
+                download_queue.put(item)
+        finally:
+            for _ in range(self.download_workers):
+                download_queue.put(_STAGE_DONE)
+            for stage in stages:
+                stage.join()
+
+        return dict(self.stats)
+
+
+class AsyncS3CaptionPipeline(S3CaptionPipeline):
+    """Runs download → caption → upload per image as bounded concurrent coroutines.
+
+    Gemini calls use the SDK's asyncio client. boto3 has no asyncio API, so S3
+    transfers run on the S3 client's I/O threads and are awaited. Recording
+    results (checkpoint, status index, result callback) may block on shared
+    files, so it runs in a thread too.
+    """
+
+    def __init__(self, s3_client, gemini_client, file_manager, checkpoint_file='checkpoint.pkl',
+                 concurrency=DEFAULT_ASYNC_CONCURRENCY, max_retries=5, key_rotation_delay=1.0, deduplicator=None,
+                 batch_size=DEFAULT_BATCH_SIZE):
+        """Initialize with clients and the number of images in flight."""
+        super().__init__(s3_client, gemini_client, file_manager, checkpoint_file,
+                         max_retries=max_retries, key_rotation_delay=key_rotation_delay,
+                         deduplicator=deduplicator, batch_size=batch_size)
+        self.concurrency = max(1, concurrency)
+
+    async def _download_async(self, img_key):
+        """Download one image, returning ``(img_key, relative_path, image_bytes)`` or None."""
+        relative_path = img_key.replace(f"{self.s3_client.images_folder}/", '', 1)
+
+        logging.info(f"🔄 Processing: {img_key}")
+        image_bytes = self._take_prefetched(img_key) or await self.s3_client.download_image_bytes_async(img_key)
+        if image_bytes is None:
+            logging.error(f"❌ Failed to download {img_key}")
+            await asyncio.to_thread(self._fail, 'download_failed', img_key)
+            return None
+        return img_key, relative_path, image_bytes
+
+    async def _process(self, img_key):
+        """Download, caption and upload one image."""
+        item = await self._download_async(img_key)
+        if item is None:
+            return
+        img_key, relative_path, image_bytes = item
+
+        try:
+            caption = await self.gemini_client.process_image_bytes_async(
+                image_bytes, img_key, self.max_retries, self.key_rotation_delay)
+        except Exception as e:
+            logging.error(f"❌ Error in caption stage: {e}")
+            await asyncio.to_thread(self._fail, 'caption_failed', img_key)
+            return
+        item = await asyncio.to_thread(self._check_caption, img_key, relative_path, caption)
+        if item is not None:
+            await self._upload_async(item)
+
+    async def _process_batch(self, img_keys):
+        """Download a batch of frames, caption them with one request and upload each caption."""
+        items = [item for item in await asyncio.gather(*map(self._download_async, img_keys)) if item is not None]
+        if not items:
+            return
+        try:
+            captions = await self.gemini_client.process_image_batch_async(
+                [(image_bytes, img_key) for img_key, _, image_bytes in items], self.max_retries,
+                self.key_rotation_delay)
+        except Exception as e:
+            logging.error(f"❌ Error in caption stage: {e}")
+            await asyncio.to_thread(self._fail_item('caption_failed'), items)
+            return
+        checked = await asyncio.to_thread(lambda: [self._check_caption(img_key, relative_path, caption)
+                                                   for (img_key, relative_path, _), caption in zip(items, captions)])
+        await asyncio.gather(*(self._upload_async(item) for item in checked if item is not None))
+
+    async def _upload_async(self, item):
+        """Upload one caption and record progress."""
+        img_key, relative_path, caption = item
+        caption_key = self.s3_client.get_caption_key_from_image_key(img_key)
+        if not await self.s3_client.upload_caption_bytes_async(caption, caption_key):
+            logging.error(f"❌ Failed to upload caption for {img_key}")
+            await asyncio.to_thread(self._fail, 'upload_failed', img_key)
+            return
+
+        await asyncio.to_thread(self._mark_processed, img_key, relative_path, caption_key)
+        await asyncio.to_thread(self._propagate, img_key, relative_path, caption)
+
+    async def run_async(self, image_keys, processed_files=None, pbar=None):
+        """Process image keys with at most ``concurrency`` images in flight."""
+        self.processed_files = processed_files
+        self.pbar = pbar
+
+        logging.info(f"🚰 Async pipeline started: up to {self.concurrency} images in flight")
+        if self.batch_size > 1:
+            # Each batch is one request, so fewer batches than images are in flight
+            await run_bounded(self._iter_units(image_keys), self._process_batch,
+                              max(1, self.concurrency // self.batch_size), self.shutdown_check)
+        else:
+            await run_bounded(self._iter_keys(image_keys), self._process, self.concurrency, self.shutdown_check)
+        return dict(self.stats)
+
+    def run(self, image_keys, processed_files=None, pbar=None):
+        """Process image keys on a new event loop and return the stats."""
+        return asyncio.run(self.run_async(image_keys, processed_files, pbar))
@@ -0,0 +1,55 @@
+"""
+Deterministic work sharding module.
+Assigns each video (the directory of its frame keys) to one of N shards by a
+stable hash, so workers select their own images from the shared inventory
+without coordination files, and a video's frames stay together for
+near-duplicate detection and per-video batching.
+"""
+
+import os
+import hashlib
+import argparse
+
+_JUMP_MULTIPLIER = 2862933555777941757
+_UINT64_MASK = (1 << 64) - 1
+
+
+def key_hash(key):
+    """Stable 64-bit hash of a key (unlike hash(), identical across processes)."""
+    return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+def jump_consistent_hash(key, num_buckets):
+    """Map a 64-bit key to a bucket in [0, num_buckets) (Lamping & Veach).
+
+    Growing from N to N + 1 buckets moves only the 1 / (N + 1) of keys that
+    land in the new bucket; every other key keeps its bucket.
+    """
+    bucket, jump = -1, 0
+    while jump < num_buckets:
+        bucket = jump
+        key = (key * _JUMP_MULTIPLIER + 1) & _UINT64_MASK
+        jump = int((bucket + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return bucket
+
+
+def shard_of(key, shard_count):
+    """1-based shard that owns ``key``: the shard of its video's directory."""
+    return jump_consistent_hash(key_hash(os.path.dirname(key)), shard_count) + 1
+
+
+def select_shard(keys, shard):
+    """Yield the keys owned by ``shard``, given as ``(index, count)``."""
+    index, count = shard
+    return (key for key in keys if shard_of(key, count) == index)
+
+
+def shard_spec(spec):
+    """Parse an ``i/N`` shard spec (1-based, e.g. ``2/4``) into ``(i, N)``."""
+    try:
+        index, count = (int(part) for part in spec.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"shard must look like i/N, got {spec!r}")
+    if count < 1 or not 1 <= index <= count:
+        raise argparse.ArgumentTypeError(f"shard index must be between 1 and N, got {spec!r}")
+    return index, count
@@ -0,0 +1,149 @@
+"""
+Caption status index module.
+A small SQLite file next to the captions that records the status of every
+caption written, so error detection is a query instead of re-reading every
+output file.
+"""
+
+import os
+import time
+import sqlite3
+import logging
+import threading
+
+from .config import STATUS_INDEX_NAME
+from .results import CaptionResult
+
+STATUS_OK = 'ok'
+STATUS_ERROR = 'error'  # Retryable error
+STATUS_TERMINAL = 'terminal'  # Error that retrying will not fix
+UNREADABLE = 'UNREADABLE'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS captions (
+    path TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    error_class TEXT,
+    size INTEGER NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS captions_status ON captions (status);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+class StatusIndex:
+    """Per-output-directory index of caption statuses.
+
+    Keys are caption paths relative to the output directory. The index is
+    only trusted for queries once it is complete: it was created for an empty
+    output directory or has been rebuilt from the files on disk.
+    """
+
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, output_dir):
+        """Open (or create) the index file inside ``output_dir``."""
+        self.output_dir = output_dir
+        self.index_file = os.path.join(output_dir, STATUS_INDEX_NAME)
+        self.lock = threading.Lock()
+
+        os.makedirs(output_dir, exist_ok=True)
+        created = not os.path.exists(self.index_file)
+        self.conn = sqlite3.connect(self.index_file, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(_SCHEMA)
+        if created and not self._has_captions_on_disk():
+            self._set_complete()
+
+    @classmethod
+    def for_output_dir(cls, output_dir):
+        """Return the shared index instance for an output directory."""
+        path = os.path.abspath(output_dir)
+        with cls._instances_lock:
+            index = cls._instances.get(path)
+            if index is None:
+                index = cls(output_dir)
+                cls._instances[path] = index
+            return index
+
+    def _has_captions_on_disk(self):
+        """Check whether any caption file already exists in the output tree."""
+        for _, _, files in os.walk(self.output_dir):
+            if any(file.endswith('.txt') for file in files):
+                return True
+        return False
+
+    def _set_complete(self):
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('complete', ?)", (str(time.time()),))
+
+    def is_complete(self):
+        """Whether every caption on disk is known to the index."""
+        with self.lock:
+            return self.conn.execute("SELECT 1 FROM meta WHERE key = 'complete'").fetchone() is not None
+
+    def _row(self, relative_path, content):
+        result = CaptionResult.parse(content)
+        status = STATUS_OK if result.ok else STATUS_ERROR if result.retryable else STATUS_TERMINAL
+        return relative_path, status, result.error_code, len(content.encode('utf-8')), time.time()
+
+    def record(self, output_path, content):
+        """Record the status of a caption that was just written."""
+        row = self._row(os.path.relpath(output_path, self.output_dir), content)
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO captions VALUES (?, ?, ?, ?, ?)", row)
+
+    def error_paths(self):
+        """Absolute paths of captions whose last recorded status is a retryable error."""
+        with self.lock:
+            rows = self.conn.execute("SELECT path FROM captions WHERE status = ?", (STATUS_ERROR,)).fetchall()
+        return [os.path.join(self.output_dir, path) for (path,) in rows]
+
+    def counts(self):
+        """Number of captions per status."""
+        with self.lock:
+            rows = self.conn.execute("SELECT status, COUNT(*) FROM captions GROUP BY status").fetchall()
+        return dict(rows)
+
+    def rebuild(self):
+        """Re-read every caption file in the output tree and replace the index contents."""
+        rows = []
+        for root, _, files in os.walk(self.output_dir):
+            for file in files:
+                if not file.endswith('.txt'):
+                    continue
+                file_path = os.path.join(root, file)
+                relative_path = os.path.relpath(file_path, self.output_dir)
+                try:
+                    with open(file_path, 'r', encoding='utf-8') as f:
+                        rows.append(self._row(relative_path, f.read()))
+                except Exception as e:
+                    logging.warning(f"Could not read file {file_path}: {e}")
+                    rows.append((relative_path, STATUS_ERROR, UNREADABLE, 0, time.time()))
+
+        with self.lock:
+            self.conn.execute("BEGIN")
+            self.conn.execute("DELETE FROM captions")
+            self.conn.executemany("INSERT INTO captions VALUES (?, ?, ?, ?, ?)", rows)
+            self._set_complete()
+            self.conn.execute("COMMIT")
+        return len(rows)
+
+    def close(self):
+        """Close the database connection."""
+        with self.lock:
+            self.conn.close()
+
+    @classmethod
+    def release(cls, output_dir):
+        """Close and forget the shared index instance for an output directory."""
+        path = os.path.abspath(output_dir)
+        with cls._instances_lock:
+            index = cls._instances.pop(path, None)
+        if index is not None:
+            index.close()
@@ -0,0 +1,264 @@
+"""
+Lease-based work queue module.
+A SQLite file shared by S3 workers that hands out batches of image keys under
+time-limited leases, so fast workers keep pulling work instead of idling once a
+fixed chunk is done, and keys held by a crashed worker return to the queue.
+"""
+
+import os
+import time
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+
+from .config import (
+    DEFAULT_LEASE_SECONDS, DEFAULT_LEASE_BATCH_SIZE, DEFAULT_LEASE_MAX_ATTEMPTS,
+    DEFAULT_LEASE_POLL_SECONDS
+)
+
+PENDING = 'pending'
+LEASED = 'leased'    # Handed to a worker but not started, so it can still be stolen
+STARTED = 'started'  # Pulled into a worker's pipeline
+DONE = 'done'
+FAILED = 'failed'    # Gave up after max attempts
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    seq INTEGER PRIMARY KEY,
+    key TEXT NOT NULL UNIQUE,
+    state TEXT NOT NULL,
+    owner TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS items_state ON items (state, seq);
+CREATE INDEX IF NOT EXISTS items_owner ON items (owner, state);
+"""
+
+
+class LeaseQueue:
+    """Shared queue of S3 keys leased to workers in batches.
+
+    Every change runs in an IMMEDIATE transaction, so any number of worker
+    processes can share the file as long as they see the same filesystem.
+    """
+
+    def __init__(self, path, lease_seconds=DEFAULT_LEASE_SECONDS, batch_size=DEFAULT_LEASE_BATCH_SIZE,
+                 max_attempts=DEFAULT_LEASE_MAX_ATTEMPTS, poll_seconds=DEFAULT_LEASE_POLL_SECONDS,
+                 clock=time.time):
+        """Open (or create) the queue file."""
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.batch_size = max(1, batch_size)
+        self.max_attempts = max(1, max_attempts)
+        self.poll_seconds = poll_seconds
+        self.clock = clock
+        self.lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=60, check_same_thread=False, isolation_level=None)
+        # Rollback journal rather than WAL: WAL needs shared memory, which workers on other hosts do not have
+        self.conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def _transaction(self):
+        """Hold the database write lock for the duration of the block."""
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.conn
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+
+    def seed(self, keys):
+        """Queue keys that are not already in the queue; returns how many were added."""
+        with self._transaction() as conn:
+            before = conn.total_changes
+            conn.executemany("INSERT OR IGNORE INTO items (key, state) VALUES (?, ?)",
+                             ((key, PENDING) for key in keys))
+            return conn.total_changes - before
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM items").fetchone()[0]
+
+    def stats(self):
+        """Number of keys per state."""
+        with self.lock:
+            rows = self.conn.execute("SELECT state, COUNT(*) FROM items GROUP BY state").fetchall()
+        return dict(rows)
+
+    def lease(self, worker_id):
+        """Lease the next batch of keys to a worker.
+
+        Keys whose lease expired come first, then pending keys in queue order.
+        With nothing left to hand out, the worker steals the tail half of the
+        unstarted keys held by the worker with the most of them.
+        """
+        now = self.clock()
+        with self._transaction() as conn:
+            expired = conn.execute(
+                "SELECT seq, key, attempts FROM items WHERE state IN (?, ?) AND lease_expires < ? "
+                "ORDER BY seq LIMIT ?", (LEASED, STARTED, now, self.batch_size)).fetchall()
+            # An abandoned lease counts as an attempt, so a key that keeps killing workers is given up on
+            conn.executemany("UPDATE items SET attempts = attempts + 1, state = ?, owner = NULL, "
+                             "lease_expires = NULL WHERE seq = ?",
+                             ((FAILED, seq) for seq, _, attempts in expired if attempts + 1 >= self.max_attempts))
+            rows = [(seq, key) for seq, key, attempts in expired if attempts + 1 < self.max_attempts]
+            conn.executemany("UPDATE items SET attempts = attempts + 1 WHERE seq = ?", ((seq,) for seq, _ in rows))
+            if expired:
+                logging.warning(f"⏰ {worker_id} reclaimed {len(expired)} keys with expired leases")
+
+            if len(rows) < self.batch_size:
+                rows += conn.execute("SELECT seq, key FROM items WHERE state = ? ORDER BY seq LIMIT ?",
+                                     (PENDING, self.batch_size - len(rows))).fetchall()
+            if not rows:
+                rows = self._steal(conn, worker_id)
+
+            conn.executemany("UPDATE items SET state = ?, owner = ?, lease_expires = ? WHERE seq = ?",
+                             ((LEASED, worker_id, now + self.lease_seconds, seq) for seq, _ in rows))
+        return [key for _, key in rows]
+
+    def _steal(self, conn, worker_id):
+        """Pick the tail of the largest backlog of unstarted keys held by another worker."""
+        victim = conn.execute(
+            "SELECT owner, COUNT(*) FROM items WHERE state = ? AND owner != ? "
+            "GROUP BY owner ORDER BY COUNT(*) DESC LIMIT 1", (LEASED, worker_id)).fetchone()
+        if victim is None:
+            return []
+        owner, backlog = victim
+        take = min(self.batch_size, backlog // 2)
+        if take == 0:
+            return []
+        rows = conn.execute("SELECT seq, key FROM items WHERE state = ? AND owner = ? ORDER BY seq DESC LIMIT ?",
+                            (LEASED, owner, take)).fetchall()
+        logging.info(f"🤝 {worker_id} took {len(rows)} of {backlog} queued keys from {owner}")
+        return rows[::-1]
+
+    def start(self, worker_id, key):
+        """Mark a leased key as started; False if it was stolen or reclaimed meanwhile."""
+        with self._transaction() as conn:
+            cursor = conn.execute("UPDATE items SET state = ? WHERE key = ? AND owner = ? AND state = ?",
+                                  (STARTED, key, worker_id, LEASED))
+            return cursor.rowcount == 1
+
+    def complete(self, key):
+        """Mark a key as done, whoever holds it now."""
+        with self._transaction() as conn:
+            conn.execute("UPDATE items SET state = ?, lease_expires = NULL WHERE key = ?", (DONE, key))
+
+    def fail(self, worker_id, key):
+        """Return a failed key to the queue, or give up on it after max attempts."""
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE items SET attempts = attempts + 1, owner = NULL, lease_expires = NULL, "
+                "state = CASE WHEN attempts + 1 >= ? THEN ? ELSE ? END "
+                "WHERE key = ? AND owner = ? AND state IN (?, ?)",
+                (self.max_attempts, FAILED, PENDING, key, worker_id, LEASED, STARTED))
+
+    def renew(self, worker_id):
+        """Extend every lease a worker holds; returns how many keys it holds."""
+        with self._transaction() as conn:
+            cursor = conn.execute("UPDATE items SET lease_expires = ? WHERE owner = ? AND state IN (?, ?)",
+                                  (self.clock() + self.lease_seconds, worker_id, LEASED, STARTED))
+            return cursor.rowcount
+
+    def release(self, worker_id):
+        """Return a worker's keys to the queue once its pipeline has drained.
+
+        Unstarted keys go back as they were. Started keys that never reported
+        a result count as a failed attempt.
+        """
+        with self._transaction() as conn:
+            released = conn.execute(
+                "UPDATE items SET state = ?, owner = NULL, lease_expires = NULL WHERE owner = ? AND state = ?",
+                (PENDING, worker_id, LEASED)).rowcount
+            released += conn.execute(
+                "UPDATE items SET attempts = attempts + 1, owner = NULL, lease_expires = NULL, "
+                "state = CASE WHEN attempts + 1 >= ? THEN ? ELSE ? END WHERE owner = ? AND state = ?",
+                (self.max_attempts, FAILED, PENDING, worker_id, STARTED)).rowcount
+            return released
+
+    def pending(self):
+        """Number of keys waiting to be leased."""
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM items WHERE state = ?", (PENDING,)).fetchone()[0]
+
+    def _held_by_others(self, worker_id):
+        """Number of keys other workers hold leases on."""
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM items WHERE state IN (?, ?) AND owner != ?",
+                                     (LEASED, STARTED, worker_id)).fetchone()[0]
+
+    def iter_keys(self, worker_id, shutdown_check=lambda: False):
+        """Yield leased keys until nothing is left to lease or shutdown is requested.
+
+        While other workers still hold keys that cannot be stolen, waits for
+        them to finish, fail back into the queue or expire. Leasing and waiting
+        block, so async callers pull from it in a thread (as run_bounded does).
+        """
+        while not shutdown_check():
+            batch = self.lease(worker_id)
+            if not batch:
+                if not self._held_by_others(worker_id):
+                    return
+                time.sleep(self.poll_seconds)
+                continue
+            for key in batch:
+                if shutdown_check():
+                    return
+                if self.start(worker_id, key):
+                    yield key
+
+    @contextmanager
+    def heartbeat(self, worker_id):
+        """Renew a worker's leases in the background while the block runs."""
+        stop = threading.Event()
+
+        def renew_loop():
+            while not stop.wait(self.lease_seconds / 3):
+                try:
+                    self.renew(worker_id)
+                except sqlite3.Error as e:
+                    logging.warning(f"⚠️ Failed to renew leases for {worker_id}: {e}")
+
+        thread = threading.Thread(target=renew_loop, name=f"lease-heartbeat-{worker_id}", daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+
+    def close(self):
+        """Close the database connection."""
+        with self.lock:
+            self.conn.close()
+
+
+def run_leased(pipeline, work_queue, worker_id, processed_files=None, pbar=None):
+    """Run an S3 pipeline over keys leased from the queue and return its stats."""
+    def on_result(img_key, ok):
+        if ok:
+            work_queue.complete(img_key)
+        else:
+            work_queue.fail(worker_id, img_key)
+
+    pipeline.set_result_callback(on_result)
+    with work_queue.heartbeat(worker_id):
+        while True:
+            try:
+                stats = pipeline.run(work_queue.iter_keys(worker_id, pipeline.shutdown_check),
+                                     processed_files, pbar)
+            finally:
+                released = work_queue.release(worker_id)
+                if released:
+                    logging.info(f"↩️  Returned {released} unfinished keys to the queue")
+            # Keys this worker failed while finishing its last batch are back in the queue
+            if pipeline.shutdown_check() or not work_queue.pending():
+                return stats
@@ -0,0 +1,177 @@
+"""
+Local stand-in for the Gemini generateContent REST endpoint.
+
+Point a genai.Client at it with
+``http_options=types.HttpOptions(base_url=server.base_url)``. Each request
+sleeps for ``latency`` seconds and returns a fixed caption; a fraction of
+requests can be answered with 429 RESOURCE_EXHAUSTED to exercise rate-limit
+handling. Cached contents can be created and extended, and requests naming
+an unknown one get 404 NOT_FOUND like the real API.
+"""
+
+import json
+import time
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_CAPTION = json.dumps({"caption": "Cảnh quay một con đường với nhiều xe máy."}, ensure_ascii=False)
+
+
+def without_metadata(output):
+    """A stored caption without the generation metadata, serialized like DEFAULT_CAPTION."""
+    fields = json.loads(output)
+    fields.pop('metadata', None)
+    return json.dumps(fields, ensure_ascii=False)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """Handles generateContent POSTs for FakeGeminiServer."""
+
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length', 0))
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def do_PATCH(self):
+        fake = self.server.fake
+        request = self._read_json()
+        fake.record(self.path, request, self.headers)
+        name = self.path.split('?', 1)[0].split('/v1beta/', 1)[-1]
+        if name not in fake.cached_contents:
+            self._send_json(404, {'error': {'code': 404, 'message': 'CachedContent not found',
+                                            'status': 'NOT_FOUND'}})
+            return
+        self._send_json(200, {'name': name, 'model': fake.cached_contents[name]['model']})
+
+    def do_POST(self):
+        fake = self.server.fake
+        request = self._read_json()
+        fake.record(self.path, request, self.headers)
+
+        if self.path.split('?', 1)[0].endswith('/cachedContents'):
+            status, payload = fake.create_cached_content(request)
+            self._send_json(status, payload)
+            return
+        cached_content = request.get('cachedContent')
+        if cached_content and cached_content not in fake.cached_contents:
+            self._send_json(404, {'error': {'code': 404, 'message': 'CachedContent not found (or permission denied)',
+                                            'status': 'NOT_FOUND'}})
+            return
+
+        with fake.lock:
+            fake.in_flight += 1
+            fake.peak_in_flight = max(fake.peak_in_flight, fake.in_flight)
+        try:
+            if fake.latency:
+                time.sleep(fake.latency)
+
+            if fake.rate_limit_ratio and random.random() < fake.rate_limit_ratio:
+                with fake.lock:
+                    fake.rate_limited += 1
+                self._send_json(429, {'error': {'code': 429, 'message': 'Resource has been exhausted',
+                                                'status': 'RESOURCE_EXHAUSTED'}})
+                return
+
+            self._send_json(200, fake.respond(self.path, request))
+        finally:
+            with fake.lock:
+                fake.in_flight -= 1
+
+
+class _Server(ThreadingHTTPServer):
+    """Threaded HTTP server with a listen backlog large enough for bursts."""
+
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+class FakeGeminiServer:
+    """Threaded local HTTP server mimicking models/{model}:generateContent."""
+
+    def __init__(self, latency=0.0, rate_limit_ratio=0.0, caption=DEFAULT_CAPTION, cache_supported=True):
+        self.latency = latency
+        self.rate_limit_ratio = rate_limit_ratio
+        self.caption = caption
+        self.cache_supported = cache_supported
+        self.cached_contents = {}
+        self.lock = threading.Lock()
+        self.requests = []
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.rate_limited = 0
+
+        self.httpd = _Server(('127.0.0.1', 0), _Handler)
+        self.httpd.fake = self
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address
+        return f"http://{host}:{port}"
+
+    def record(self, path, request, headers):
+        """Remember a request for later assertions."""
+        with self.lock:
+            self.requests.append({'path': path, 'body': request, 'api_key': headers.get('x-goog-api-key')})
+
+    def create_cached_content(self, request):
+        """Store a cached content, or refuse like a model without caching support."""
+        if not self.cache_supported:
+            return 400, {'error': {'code': 400, 'message': 'Cached content is too small', 'status': 'INVALID_ARGUMENT'}}
+        with self.lock:
+            name = f"cachedContents/fake-{len(self.cached_contents) + 1}"
+            self.cached_contents[name] = request
+        return 200, {'name': name, 'model': request.get('model')}
+
+    def respond(self, path, request):
+        """Build a successful generateContent response."""
+        if request.get('cachedContent'):
+            return {
+                'candidates': [{
+                    'content': {'parts': [{'text': self.caption}], 'role': 'model'},
+                    'finishReason': 'STOP',
+                    'index': 0,
+                }],
+                'usageMetadata': {'promptTokenCount': 1800, 'cachedContentTokenCount': 1500,
+                                  'candidatesTokenCount': 250, 'totalTokenCount': 2050},
+                'modelVersion': path.rsplit('/', 1)[-1].split(':', 1)[0],
+            }
+        return {
+            'candidates': [{
+                'content': {'parts': [{'text': self.caption}], 'role': 'model'},
+                'finishReason': 'STOP',
+                'index': 0,
+            }],
+            'usageMetadata': {'promptTokenCount': 1800, 'candidatesTokenCount': 250,
+                              'totalTokenCount': 2050},
+            'modelVersion': path.rsplit('/', 1)[-1].split(':', 1)[0],
+        }
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,136 @@
+"""
+In-memory stand-in for the boto3 S3 client used by the S3 tests.
+
+Implements the subset of the S3 API that S3Client relies on, with the same
+listing semantics (sorted keys, MaxKeys pages, continuation tokens, StartAfter
+and Delimiter/CommonPrefixes) and an optional per-request latency.
+"""
+
+import io
+import bisect
+import hashlib
+import threading
+import time
+
+from botocore.exceptions import ClientError
+
+
+class FakeS3:
+    """Thread-safe in-memory bucket speaking a subset of the boto3 S3 client API."""
+
+    def __init__(self, bucket_name="aic-2025-bucket", latency=0.0):
+        self.bucket_name = bucket_name
+        self.latency = latency
+        self.objects = {}
+        self.sorted_keys = []
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def _record(self, operation):
+        with self.lock:
+            self.calls[operation] = self.calls.get(operation, 0) + 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _check_bucket(self, bucket):
+        if bucket != self.bucket_name:
+            raise ClientError({'Error': {'Code': 'NoSuchBucket', 'Message': 'Not Found'}}, 'Bucket')
+
+    @staticmethod
+    def _not_found(operation):
+        return ClientError({'Error': {'Code': '404', 'Message': 'Not Found'}}, operation)
+
+    def put(self, key, data=b""):
+        """Store an object directly (test setup helper)."""
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        with self.lock:
+            if key not in self.objects:
+                bisect.insort(self.sorted_keys, key)
+            self.objects[key] = data
+
+    def delete(self, key):
+        """Remove an object directly (test setup helper)."""
+        with self.lock:
+            del self.objects[key]
+            self.sorted_keys.remove(key)
+
+    def head_bucket(self, Bucket):
+        self._record('head_bucket')
+        self._check_bucket(Bucket)
+        return {}
+
+    def head_object(self, Bucket, Key):
+        self._record('head_object')
+        self._check_bucket(Bucket)
+        with self.lock:
+            if Key not in self.objects:
+                raise self._not_found('HeadObject')
+            return {'ContentLength': len(self.objects[Key]), 'ETag': self._etag(self.objects[Key])}
+
+    @staticmethod
+    def _etag(data):
+        return f'"{hashlib.md5(data).hexdigest()}"'
+
+    def list_objects_v2(self, Bucket, Prefix="", Delimiter=None, MaxKeys=1000,
+                        ContinuationToken=None, StartAfter=None):
+        self._record('list_objects_v2')
+        self._check_bucket(Bucket)
+        with self.lock:
+            start_key = ContinuationToken or StartAfter or ""
+            index = bisect.bisect_right(self.sorted_keys, start_key) if start_key else 0
+            index = max(index, bisect.bisect_left(self.sorted_keys, Prefix))
+
+            contents, prefixes = [], []
+            last_key = None
+            while index < len(self.sorted_keys) and len(contents) + len(prefixes) < MaxKeys:
+                key = self.sorted_keys[index]
+                if not key.startswith(Prefix):
+                    break
+                rest = key[len(Prefix):]
+                if Delimiter and Delimiter in rest:
+                    common = Prefix + rest.split(Delimiter, 1)[0] + Delimiter
+                    prefixes.append({'Prefix': common})
+                    # Skip every key under this common prefix
+                    index = bisect.bisect_left(self.sorted_keys, common + '\uffff')
+                    last_key = self.sorted_keys[index - 1]
+                    continue
+                data = self.objects[key]
+                contents.append({'Key': key, 'Size': len(data), 'ETag': self._etag(data)})
+                last_key = key
+                index += 1
+
+            truncated = index < len(self.sorted_keys) and self.sorted_keys[index].startswith(Prefix)
+
+        response = {'IsTruncated': truncated, 'KeyCount': len(contents) + len(prefixes)}
+        if contents:
+            response['Contents'] = contents
+        if prefixes:
+            response['CommonPrefixes'] = prefixes
+        if truncated:
+            response['NextContinuationToken'] = last_key
+        return response
+
+    def get_object(self, Bucket, Key):
+        self._record('get_object')
+        self._check_bucket(Bucket)
+        with self.lock:
+            if Key not in self.objects:
+                raise ClientError({'Error': {'Code': 'NoSuchKey', 'Message': 'Not Found'}}, 'GetObject')
+            data = self.objects[Key]
+        return {'Body': io.BytesIO(data), 'ContentLength': len(data)}
+
+    def put_object(self, Bucket, Key, Body=b"", **kwargs):
+        self._record('put_object')
+        self._check_bucket(Bucket)
+        self.put(Key, Body if isinstance(Body, (bytes, str)) else Body.read())
+        return {}
+
+    def download_file(self, Bucket, Key, Filename):
+        data = self.get_object(Bucket, Key)['Body'].read()
+        with open(Filename, 'wb') as f:
+            f.write(data)
+
+    def upload_file(self, Filename, Bucket, Key):
+        with open(Filename, 'rb') as f:
+            self.put_object(Bucket=Bucket, Key=Key, Body=f.read())
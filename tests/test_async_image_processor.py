@@ -0,0 +1,169 @@
+"""
+Unit tests for async_image_processor module, run against the local fake
+Gemini endpoint.
+"""
+
+import unittest
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import time
+from unittest.mock import Mock, patch
+
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from google.genai import types
+
+from src.async_image_processor import AsyncImageProcessor, run_bounded
+from src.gemini_client import GeminiClient
+from tests.fake_gemini import FakeGeminiServer, DEFAULT_CAPTION, without_metadata
+
+
+class TestRunBounded(unittest.TestCase):
+    """Test run_bounded helper."""
+
+    def test_limits_in_flight(self):
+        """Test no more than ``concurrency`` workers run at once."""
+        active = [0]
+        peak = [0]
+        done = []
+
+        async def worker(item):
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+            await asyncio.sleep(0.001)
+            active[0] -= 1
+            done.append(item)
+
+        asyncio.run(run_bounded(range(50), worker, 7))
+
+        self.assertEqual(sorted(done), list(range(50)))
+        self.assertEqual(peak[0], 7)
+
+    def test_stop_and_errors(self):
+        """Test failing workers are logged and no items start after a stop."""
+        started = []
+        stopped = [False]
+
+        async def worker(item):
+            started.append(item)
+            if item == 0:
+                stopped[0] = True
+                raise RuntimeError("boom")
+
+        with patch('logging.error') as mock_error, patch('logging.info'):
+            asyncio.run(run_bounded(range(10), worker, 2, lambda: stopped[0]))
+
+        self.assertEqual(started, [0, 1])
+        mock_error.assert_called_once()
+
+    def test_blocking_items_do_not_stall_workers(self):
+        """Test a generator that blocks between items does not hold up workers already running."""
+        finished = []
+
+        def slow_items():
+            yield 0
+            time.sleep(0.3)
+            yield 1
+
+        async def worker(item):
+            for _ in range(10):
+                await asyncio.sleep(0.01)
+            finished.append((item, time.monotonic()))
+
+        start = time.monotonic()
+        asyncio.run(run_bounded(slow_items(), worker, 2))
+
+        self.assertEqual([item for item, _ in finished], [0, 1])
+        self.assertLess(finished[0][1] - start, 0.25)
+
+
+class TestAsyncImageProcessor(unittest.TestCase):
+    """Test AsyncImageProcessor against the fake Gemini endpoint."""
+
+    def setUp(self):
+        """Set up test fixtures."""
+        self.temp_dir = tempfile.mkdtemp()
+        self.server = FakeGeminiServer(latency=0.05).start()
+        self.http_options = types.HttpOptions(base_url=self.server.base_url)
+
+    def tearDown(self):
+        """Clean up test fixtures."""
+        self.server.stop()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def _client(self, api_keys=('test_key_1',), concurrency=16):
+        with patch('logging.info'):
+            return GeminiClient(api_keys=list(api_keys), http_options=self.http_options,
+                                async_concurrency=concurrency, rpm=0, tpm=0)
+
+    def _tasks(self, count, pbar):
+        tasks = []
+        for i in range(count):
+            input_path = os.path.join(self.temp_dir, f"{i:04d}.jpg")
+            with open(input_path, 'wb') as f:
+                f.write(b'\xff\xd8' + bytes([i % 256]) * 100)
+            tasks.append({'input_path': input_path,
+                          'output_path': os.path.join(self.temp_dir, f"{i:04d}.txt"),
+                          'processed_files': set(), 'checkpoint_file': None, 'pbar': pbar})
+        return tasks
+
+    def test_process_images_batch(self):
+        """Test a batch is captioned concurrently within the limit."""
+        processor = AsyncImageProcessor(self._client(concurrency=8), concurrency=8)
+        pbar = Mock()
+        tasks = self._tasks(40, pbar)
+
+        with patch('logging.info'):
+            processor.process_images_batch(tasks, max_retries=0)
+
+        for task in tasks:
+            with open(task['output_path'], encoding='utf-8') as f:
+                self.assertEqual(without_metadata(f.read()), DEFAULT_CAPTION)
+        self.assertEqual(pbar.update.call_count, 40)
+        self.assertEqual(len(self.server.requests), 40)
+        self.assertGreater(self.server.peak_in_flight, 1)
+        self.assertLessEqual(self.server.peak_in_flight, 8)
+
+    def test_request_payload(self):
+        """Test the request carries the prompt, image and API key."""
+        client = self._client()
+
+        caption = asyncio.run(client.process_image_bytes_async(b'image-bytes', 'a.jpg', 0))
+
+        self.assertEqual(without_metadata(caption), DEFAULT_CAPTION)
+        request = self.server.requests[0]
+        self.assertTrue(request['path'].endswith('models/gemini-2.5-flash:generateContent'))
+        self.assertEqual(request['api_key'], 'test_key_1')
+        parts = request['body']['contents'][0]['parts']
+        self.assertEqual(parts[1]['inlineData'], {'data': 'aW1hZ2UtYnl0ZXM=', 'mime_type': 'image/jpeg'})
+
+    def test_connections_spread_over_clients(self):
+        """Test async requests round-robin over small-pool SDK clients."""
+        client = self._client(concurrency=40)
+
+        async def send_all():
+            await asyncio.gather(*[client.process_image_bytes_async(b'x', f"{i}.jpg", 0) for i in range(6)])
+
+        asyncio.run(send_all())
+
+        self.assertEqual(len(client.pool.async_clients[0]), 3)
+        self.assertEqual(client.key_stats[0]['requests'], 6)
+
+    def test_rate_limit_rotates_keys(self):
+        """Test 429 responses rotate through every key before giving up."""
+        self.server.rate_limit_ratio = 1.0
+        client = self._client(api_keys=('test_key_1', 'test_key_2'))
+
+        with patch('logging.warning'), patch('logging.error'), patch('logging.info'):
+            result = asyncio.run(client.process_image_bytes_async(b'x', 'a.jpg', 3, key_rotation_delay=0))
+
+        self.assertIn("All API keys rate limited", json.loads(result)['error'])
+        self.assertEqual([r['api_key'] for r in self.server.requests], ['test_key_1', 'test_key_2'])
+
+
+if __name__ == '__main__':
+    unittest.main()
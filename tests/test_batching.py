@@ -0,0 +1,214 @@
+"""
+Unit tests for batching module.
+"""
+
+import unittest
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+from unittest.mock import Mock, patch
+
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from google.genai import types
+
+from src.batching import iter_video_batches, split_batch_response
+from src.gemini_client import GeminiClient
+from src.image_processor import ImageProcessor
+from src.s3_client import S3Client
+from src.s3_pipeline import S3CaptionPipeline, AsyncS3CaptionPipeline
+from src.results import CaptionResult, SAFETY_BLOCKED
+from tests.fake_gemini import FakeGeminiServer, without_metadata
+from tests.fake_s3 import FakeS3
+
+
+class BatchGeminiServer(FakeGeminiServer):
+    """Fake server answering multi-image requests with a JSON array, optionally leaving images out."""
+
+    def __init__(self, omit=()):
+        super().__init__()
+        self.omit = set(omit)
+
+    def respond(self, path, request):
+        parts = request['contents'][0]['parts']
+        images = sum('inlineData' in part for part in parts)
+        response = super().respond(path, request)
+        response['usageMetadata'].update(promptTokenCount=1500 + 258 * images, totalTokenCount=2000 + 258 * images)
+        if images > 1:
+            entries = [{"image_index": i, "caption": f"Khung hình {i}"} for i in range(images) if i not in self.omit]
+            text = "```json\n" + json.dumps(entries, ensure_ascii=False) + "\n```"
+            response['candidates'][0]['content']['parts'][0]['text'] = text
+        return response
+
+
+class TestBatchHelpers(unittest.TestCase):
+    """Test grouping frames and splitting batched responses."""
+
+    def test_iter_video_batches(self):
+        """Test batches never span videos and hold at most batch_size frames."""
+        keys = ["V001/1.jpg", "V001/2.jpg", "V001/3.jpg", "V002/1.jpg", "V001/4.jpg"]
+
+        self.assertEqual(list(iter_video_batches(keys, 2)),
+                         [["V001/1.jpg", "V001/2.jpg"], ["V001/3.jpg"], ["V002/1.jpg"], ["V001/4.jpg"]])
+        self.assertEqual(list(iter_video_batches(keys[:2], 0)), [["V001/1.jpg"], ["V001/2.jpg"]])
+
+    def test_split_batch_response(self):
+        """Test entries are matched by index and bad or missing entries come back as None."""
+        text = json.dumps([
+            {"image_index": 2, "caption": "C", "setting": {"location": "đường phố"}},
+            {"image_index": 0, "caption": "A"},
+            {"image_index": 1, "caption": ""},
+            {"image_index": 3, "caption": "D"},
+            {"image_index": 3, "caption": "D again"},
+            {"image_index": 9, "caption": "out of range"},
+            "not an object",
+        ], ensure_ascii=False)
+
+        captions = split_batch_response(text, 5)
+
+        self.assertEqual(json.loads(captions[0]), {"caption": "A"})
+        self.assertIsNone(captions[1])
+        self.assertEqual(json.loads(captions[2]), {"caption": "C", "setting": {"location": "đường phố"}})
+        self.assertIsNone(captions[3])
+        self.assertIsNone(captions[4])
+        self.assertTrue(captions[0].ok)
+
+    def test_split_unparseable_response(self):
+        """Test output that is not a JSON array leaves every image to fall back."""
+        self.assertEqual(split_batch_response("Xin lỗi", 2), [None, None])
+        self.assertEqual(split_batch_response('{"caption": "A"}', 2), [None, None])
+
+
+class TestGeminiClientBatch(unittest.TestCase):
+    """Test GeminiClient.process_image_batch against a fake server."""
+
+    def _client(self, server):
+        with patch('logging.info'):
+            return GeminiClient(api_keys=['test_key_1'], rpm=0, tpm=0,
+                                http_options=types.HttpOptions(base_url=server.base_url))
+
+    def test_one_request_per_batch(self):
+        """Test four frames share one request and one copy of the prompt."""
+        with BatchGeminiServer() as server:
+            client = self._client(server)
+            images = [(f"image-{i}".encode(), f"V001/{i}.jpg") for i in range(4)]
+
+            results = client.process_image_batch(images, max_retries=0)
+
+        self.assertEqual([json.loads(result)['caption'] for result in results],
+                         [f"Khung hình {i}" for i in range(4)])
+        self.assertEqual(len(server.requests), 1)
+        parts = server.requests[0]['body']['contents'][0]['parts']
+        self.assertEqual(sum('inlineData' in part for part in parts), 4)
+        self.assertIn("image_index", parts[0]['text'])
+        self.assertEqual(client.usage, {'requests': 1, 'images': 4, 'prompt_tokens': 1500 + 4 * 258, 'cached_tokens': 0,
+                                        'output_tokens': 250, 'thinking_tokens': 0})
+        self.assertEqual(client.batch_stats, {'batches': 1, 'images': 4, 'fallbacks': 0})
+
+    def test_omitted_frames_fall_back(self):
+        """Test frames missing from the array are captioned with single-image requests."""
+        with BatchGeminiServer(omit={1}) as server:
+            client = self._client(server)
+            images = [(f"image-{i}".encode(), f"V001/{i}.jpg") for i in range(3)]
+
+            with patch('logging.warning'):
+                results = asyncio.run(client.process_image_batch_async(images, max_retries=0))
+
+        self.assertEqual(len(server.requests), 2)
+        self.assertEqual(json.loads(results[0])['caption'], "Khung hình 0")
+        self.assertEqual(without_metadata(results[1]), server.caption)
+        self.assertEqual(json.loads(results[2])['caption'], "Khung hình 2")
+        self.assertEqual(client.batch_stats['fallbacks'], 1)
+
+    def test_failed_batch(self):
+        """Test a blocked batch is retried one by one, but a rate-limited one is not."""
+        client = self._client(Mock(base_url="http://127.0.0.1:9"))
+        images = [(b"a", "V001/a.jpg"), (b"b", "V001/b.jpg")]
+
+        with patch.object(client, '_generate', return_value=(CaptionResult.failure(SAFETY_BLOCKED, "blocked"), 0)) as generate, \
+                patch('logging.warning'):
+            results = client.process_image_batch(images, max_retries=0)
+        self.assertEqual(generate.call_count, 3)
+        self.assertEqual([result.error_code for result in results], [SAFETY_BLOCKED] * 2)
+
+        rate_limited = CaptionResult.failure("RATE_LIMITED", "all keys limited")
+        with patch.object(client, '_generate', return_value=(rate_limited, 0)) as generate:
+            results = client.process_image_batch(images, max_retries=0)
+        self.assertEqual(generate.call_count, 1)
+        self.assertEqual(results, [rate_limited] * 2)
+
+
+class TestBatchedProcessing(unittest.TestCase):
+    """Test processors and S3 pipelines group frames of a video into batch requests."""
+
+    def setUp(self):
+        """Set up test fixtures."""
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """Clean up test fixtures."""
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def _batch_client(self):
+        gemini_client = Mock(current_key_index=0)
+        gemini_client.process_image_batch.side_effect = lambda images, *args: [
+            CaptionResult.success(json.dumps({"caption": path})) for _, path in images]
+
+        async def batch_async(images, *args):
+            return gemini_client.process_image_batch(images, *args)
+        gemini_client.process_image_batch_async.side_effect = batch_async
+        return gemini_client
+
+    def test_image_processor_batches_per_video(self):
+        """Test local tasks are sent in batches that never mix videos."""
+        tasks = []
+        pbar = Mock()
+        for video, count in (("V001", 3), ("V002", 2)):
+            os.makedirs(os.path.join(self.temp_dir, video))
+            for i in range(count):
+                input_path = os.path.join(self.temp_dir, video, f"{i}.jpg")
+                with open(input_path, 'wb') as f:
+                    f.write(b"image")
+                tasks.append({'input_path': input_path, 'output_path': input_path + '.txt', 'pbar': pbar,
+                              'processed_files': set()})
+        gemini_client = self._batch_client()
+        processor = ImageProcessor(gemini_client, batch_size=2)
+
+        with patch('src.config.INPUT_DIR', self.temp_dir), patch('logging.info'):
+            processor.process_images_batch(iter(tasks), max_workers=2)
+
+        batches = [[path for _, path in call.args[0]] for call in gemini_client.process_image_batch.call_args_list]
+        self.assertEqual(sorted(len(batch) for batch in batches), [1, 2, 2])
+        self.assertTrue(all(len({os.path.dirname(path) for path in batch}) == 1 for batch in batches))
+        self.assertEqual(pbar.update.call_count, 5)
+        for task in tasks:
+            with open(task['output_path'], encoding='utf-8') as f:
+                self.assertEqual(json.loads(f.read())['caption'], task['input_path'])
+
+    def test_s3_pipelines_batch(self):
+        """Test the threaded and async S3 pipelines caption batches and upload every caption."""
+        for pipeline_class, kwargs in ((S3CaptionPipeline, {}), (AsyncS3CaptionPipeline, {'concurrency': 8})):
+            with self.subTest(pipeline=pipeline_class.__name__):
+                keys = [f"frames/K01/V00{v}/{i:08d}.jpg" for v in (1, 2) for i in range(3)]
+                fake_s3 = FakeS3()
+                for key in keys:
+                    fake_s3.put(key, b"image")
+                with patch('src.s3_client.boto3.client', return_value=fake_s3), patch('logging.info'):
+                    s3_client = S3Client()
+                gemini_client = self._batch_client()
+                pipeline = pipeline_class(s3_client, gemini_client, Mock(), None, batch_size=2, **kwargs)
+
+                with patch('logging.info'):
+                    stats = pipeline.run(keys, set())
+
+                self.assertEqual(stats['processed'], 6)
+                self.assertEqual(gemini_client.process_image_batch.call_count, 4)
+                caption = fake_s3.objects["captions/K01/V002/00000001.txt"].decode('utf-8')
+                self.assertEqual(json.loads(caption)['caption'], "frames/K01/V002/00000001.jpg")
+
+
+if __name__ == '__main__':
+    unittest.main()
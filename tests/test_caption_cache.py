@@ -0,0 +1,168 @@
+"""
+Unit tests for caption_cache module.
+"""
+
+import unittest
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+from unittest.mock import patch
+
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from google.genai import types
+
+from src.caption_cache import CaptionCache, request_fingerprint
+from src.gemini_client import GeminiClient
+from src.results import CaptionResult, SERVER_ERROR
+from tests.fake_gemini import FakeGeminiServer, DEFAULT_CAPTION, without_metadata
+
+
+class TestCaptionCache(unittest.TestCase):
+    """Test CaptionCache class."""
+
+    def setUp(self):
+        """Set up test fixtures."""
+        self.temp_dir = tempfile.mkdtemp()
+        self.fingerprint = request_fingerprint('gemini-2.5-flash', 'prompt')
+
+    def tearDown(self):
+        """Clean up test fixtures."""
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_key_depends_on_image_and_request(self):
+        """Test the same bytes under another prompt or model get another key."""
+        key = CaptionCache.key(b"image", self.fingerprint)
+
+        self.assertEqual(key, CaptionCache.key(b"image", request_fingerprint('gemini-2.5-flash', 'prompt')))
+        self.assertNotEqual(key, CaptionCache.key(b"image2", self.fingerprint))
+        self.assertNotEqual(key, CaptionCache.key(b"image", request_fingerprint('gemini-2.5-flash', 'prompt v2')))
+        self.assertNotEqual(key, CaptionCache.key(b"image", request_fingerprint('gemini-2.5-pro', 'prompt')))
+
+    def test_disk_round_trip(self):
+        """Test a stored caption is found by a new cache instance on the same directory."""
+        key = CaptionCache.key(b"image", self.fingerprint)
+        CaptionCache(self.temp_dir).put(key, CaptionResult.success('{"caption": "Một con đường"}'))
+
+        cache = CaptionCache(self.temp_dir)
+        self.assertEqual(cache.get(key), '{"caption": "Một con đường"}')
+        self.assertEqual(cache.get(key), '{"caption": "Một con đường"}')
+        self.assertIsNone(cache.get(CaptionCache.key(b"other", self.fingerprint)))
+        self.assertEqual(cache.stats, {'memory_hits': 1, 'disk_hits': 1, 'misses': 1, 'stores': 0})
+        self.assertTrue(os.path.exists(os.path.join(self.temp_dir, key[:2], key + '.txt')))
+
+    def test_memory_tier_is_lru(self):
+        """Test the in-memory tier evicts the least recently used caption."""
+        cache = CaptionCache(self.temp_dir, memory_entries=2)
+        for name in ("a", "b"):
+            cache.put(name * 64, f'{{"caption": "{name}"}}')
+        cache.get("a" * 64)
+        cache.put("c" * 64, '{"caption": "c"}')
+
+        self.assertEqual(list(cache.memory), ["a" * 64, "c" * 64])
+        self.assertEqual(cache.get("b" * 64), '{"caption": "b"}')
+        self.assertEqual(cache.stats['disk_hits'], 1)
+
+    def test_errors_not_cached(self):
+        """Test error outputs are never stored."""
+        cache = CaptionCache(self.temp_dir)
+        key = CaptionCache.key(b"image", self.fingerprint)
+        cache.put(key, CaptionResult.failure(SERVER_ERROR, "boom"))
+
+        self.assertIsNone(cache.get(key))
+        self.assertEqual(os.listdir(self.temp_dir), [])
+
+
+class TestGeminiClientCache(unittest.TestCase):
+    """Test GeminiClient answers cached images without calling the API."""
+
+    def setUp(self):
+        """Set up test fixtures."""
+        self.temp_dir = tempfile.mkdtemp()
+        self.server = FakeGeminiServer().start()
+
+    def tearDown(self):
+        """Clean up test fixtures."""
+        self.server.stop()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def _client(self):
+        with patch('logging.info'):
+            return GeminiClient(api_keys=['test_key_1'], rpm=0, tpm=0, cache=CaptionCache(self.temp_dir),
+                                http_options=types.HttpOptions(base_url=self.server.base_url))
+
+    def test_hits_skip_api(self):
+        """Test the same bytes under another name, or in another process, are not sent again."""
+        client = self._client()
+        with patch('logging.info'):
+            first = client.process_image_bytes(b"image", "frames/a.jpg", max_retries=0)
+            second = client.process_image_bytes(b"image", "frames/copy_of_a.jpg", max_retries=0)
+            third = self._client().process_image_bytes(b"image", "frames/a.jpg", max_retries=0)
+            client.process_image_bytes(b"other", "frames/b.jpg", max_retries=0)
+
+        self.assertEqual(without_metadata(first), DEFAULT_CAPTION)
+        self.assertEqual(second, first)
+        self.assertEqual(third, first)
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(client.key_stats[0]['requests'], 2)
+        self.assertEqual(client.key_stats[0]['cache_hits'], 1)
+        self.assertEqual(client.cache.hits(), 1)
+
+    def test_batch_captions_cached_apart(self):
+        """Test batch captions are reused by later batches but not by single-image requests."""
+        self.server.caption = json.dumps([{"image_index": i, "caption": f"Khung hình {i}"} for i in range(2)],
+                                         ensure_ascii=False)
+        client = self._client()
+        images = [(b"image-0", "V001/0.jpg"), (b"image-1", "V001/1.jpg")]
+        with patch('logging.info'):
+            first = client.process_image_batch(images, max_retries=0)
+            again = client.process_image_batch(images, max_retries=0)
+            self.server.caption = DEFAULT_CAPTION
+            single = client.process_image_bytes(b"image-0", "V001/0.jpg", max_retries=0)
+
+        self.assertEqual(again, first)
+        self.assertEqual(without_metadata(single), DEFAULT_CAPTION)
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(client.key_stats[0]['cache_hits'], 2)
+
+    def test_batch_fallback_uses_single_cache(self):
+        """Test a frame missing from a batch response reuses its cached single-image caption."""
+        images = [(b"image-0", "V001/0.jpg"), (b"image-1", "V001/1.jpg")]
+        for use_async in (False, True):
+            self.server.requests.clear()
+            self.server.caption = DEFAULT_CAPTION
+            client = self._client()
+            with patch('logging.info'), patch('logging.warning'):
+                single = client.process_image_bytes(b"image-1", "V001/1.jpg", max_retries=0)
+                # The batch response omits frame 1, so it falls back to a single request
+                self.server.caption = json.dumps([{"image_index": 0, "caption": "Khung hình 0"}], ensure_ascii=False)
+                if use_async:
+                    results = asyncio.run(client.process_image_batch_async(images, max_retries=0))
+                else:
+                    results = client.process_image_batch(images, max_retries=0)
+
+            self.assertEqual(results[1], single)
+            self.assertEqual(len(self.server.requests), 2)
+            self.assertEqual(client.batch_stats['fallbacks'], 1)
+            shutil.rmtree(self.temp_dir)
+
+    def test_async_hits_skip_api(self):
+        """Test the async path reads and fills the same cache."""
+        client = self._client()
+
+        async def run():
+            await client.process_image_bytes_async(b"image", "a.jpg", max_retries=0)
+            return await client.process_image_bytes_async(b"image", "b.jpg", max_retries=0)
+
+        with patch('logging.info'):
+            result = asyncio.run(run())
+
+        self.assertEqual(without_metadata(result), DEFAULT_CAPTION)
+        self.assertEqual(len(self.server.requests), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
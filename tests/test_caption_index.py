@@ -0,0 +1,115 @@
+"""
+Unit tests for caption_index module.
+"""
+
+import unittest
+import os
+import shutil
+import tempfile
+import time
+from unittest.mock import patch
+
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.caption_index import CaptionIndex
+from src.s3_client import S3Client
+from tests.fake_s3 import FakeS3
+
+
+class TestCaptionIndex(unittest.TestCase):
+    """Test CaptionIndex class."""
+
+    def setUp(self):
+        """Set up test fixtures."""
+        self.temp_dir = tempfile.mkdtemp()
+        self.index_file = os.path.join(self.temp_dir, 'cache', 'caption_index.txt.gz')
+
+        self.fake_s3 = FakeS3()
+        for i in range(6):
+            self.fake_s3.put(f"frames/K01/V001/{i:08d}.jpg", b"img")
+        for i in (0, 2, 4):
+            self.fake_s3.put(f"captions/K01/V001/{i:08d}.txt", "{}")
+
+        with patch('src.s3_client.boto3.client', return_value=self.fake_s3), patch('logging.info'):
+            self.s3_client = S3Client()
+
+    def tearDown(self):
+        """Clean up test fixtures."""
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_build_lists_captions_once(self):
+        """Test the index comes from a listing, not per-key HEAD requests."""
+        with patch('logging.info'):
+            index = CaptionIndex.build(self.s3_client)
+
+        self.assertEqual(len(index), 3)
+        self.assertIn("captions/K01/V001/00000000.txt", index)
+        self.assertNotIn("captions/K01/V001/00000001.txt", index)
+        self.assertEqual(self.fake_s3.calls.get('head_object', 0), 0)
+
+    def test_missing(self):
+        """Test diffing image keys against the index."""
+        index = CaptionIndex(["captions/K01/V001/00000000.txt"])
+        images = ["frames/K01/V001/00000001.jpg", "frames/K01/V001/00000000.jpg"]
+
+        missing = index.missing(images, self.s3_client.get_caption_key_from_image_key)
+
+        self.assertEqual(missing, ["frames/K01/V001/00000001.jpg"])
+
+    def test_save_and_load_roundtrip(self):
+        """Test the index survives a save/load cycle."""
+        index = CaptionIndex(["captions/a.txt", "captions/b.txt"], bucket_name="aic-2025-bucket")
+        index.save(self.index_file)
+
+        loaded = CaptionIndex.load(self.index_file)
+
+        self.assertEqual(loaded.caption_keys, index.caption_keys)
+        self.assertEqual(loaded.bucket_name, "aic-2025-bucket")
+        self.assertAlmostEqual(loaded.created_at, index.created_at)
+
+    def test_load_or_build_reuses_fresh_cache(self):
+        """Test a fresh cached index is reused without listing."""
+        CaptionIndex(["captions/cached.txt"], bucket_name="aic-2025-bucket").save(self.index_file)
+
+        with patch('logging.info'):
+            index = CaptionIndex.load_or_build(self.s3_client, self.index_file)
+
+        self.assertEqual(index.caption_keys, {"captions/cached.txt"})
+        self.assertEqual(self.fake_s3.calls.get('list_objects_v2', 0), 0)
+
+    def test_load_or_build_rebuilds_stale_cache(self):
+        """Test stale, foreign-bucket or refreshed caches are rebuilt."""
+        CaptionIndex(["captions/cached.txt"], bucket_name="aic-2025-bucket",
+                     created_at=time.time() - 7200).save(self.index_file)
+
+        with patch('logging.info'):
+            index = CaptionIndex.load_or_build(self.s3_client, self.index_file, max_age=3600)
+        self.assertEqual(len(index), 3)
+
+        CaptionIndex(["captions/cached.txt"], bucket_name="other-bucket").save(self.index_file)
+        with patch('logging.info'):
+            index = CaptionIndex.load_or_build(self.s3_client, self.index_file)
+        self.assertEqual(len(index), 3)
+
+        with patch('logging.info'):
+            index = CaptionIndex.load_or_build(self.s3_client, self.index_file, refresh=True)
+        self.assertEqual(CaptionIndex.load(self.index_file).caption_keys, index.caption_keys)
+
+    def test_generate_work_distribution_uses_index(self):
+        """Test work distribution filters captioned images without HEAD requests."""
+        images = sorted(k for k in self.fake_s3.objects if k.startswith("frames/"))
+
+        with patch('logging.info'):
+            chunks = self.s3_client.generate_work_distribution(images, num_workers=2)
+
+        self.assertEqual(sorted(sum(chunks, [])), [
+            "frames/K01/V001/00000001.jpg",
+            "frames/K01/V001/00000003.jpg",
+            "frames/K01/V001/00000005.jpg",
+        ])
+        self.assertEqual(self.fake_s3.calls.get('head_object', 0), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,159 @@
+"""
+Unit tests for caption_schema module.
+"""
+
+import unittest
+import json
+import os
+from unittest.mock import patch
+
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from google.genai import types
+
+from src.batching import split_batch_response
+from src.caption_schema import parse_caption, format_caption
+from src.gemini_client import GeminiClient
+from src.results import CaptionResult, INVALID_OUTPUT
+from tests.fake_gemini import FakeGeminiServer
+
+
+def schema_caption(caption="Cảnh quay một con đường với 3 xe máy.", **extra):
+    """A model output matching the caption schema."""
+    return {
+        "camera": {"angle": "từ trên cao", "shot_type": "toàn cảnh", "movement": "tĩnh"},
+        "setting": {"location": "đường phố", "environment": "ngoài trời", "venue_type": "công cộng",
+                    "time_of_day": "ban ngày"},
+        "objects": [{"name": "vehicles", "count": 3, "description": "xe máy màu đỏ"}],
+        "spatial": {"left_side": "None", "right_side": "cây xanh", "center": "xe máy", "top": "None",
+                    "bottom": "mặt đường", "foreground": "None", "background": "nhà phố"},
+        "activity": {"primary_action": "xe chạy", "secondary_actions": [], "movement_patterns": "từ trái sang phải"},
+        "text_elements": {"time_display": "None", "channel_logo": "HTV", "news_ticker": "None",
+                          "graphics_overlay": "None",
+                          "scene_text": [{"name": "shop_names", "texts": ["Phở 24"]}]},
+        "caption": caption,
+        **extra,
+    }
+
+
+class TestCaptionSchema(unittest.TestCase):
+    """Test validating and serializing schema captions."""
+
+    def test_parse_restores_keyed_groups(self):
+        """Test object and scene-text lists come back keyed by name, as the prompt describes."""
+        fields = parse_caption("```json\n" + json.dumps(schema_caption(), ensure_ascii=False) + "\n```")
+
+        self.assertEqual(fields['objects'], {"vehicles": {"count": 3, "description": "xe máy màu đỏ"}})
+        self.assertEqual(fields['text_elements']['scene_text'], {"shop_names": ["Phở 24"]})
+        self.assertEqual(list(fields)[-1], "caption")
+
+    def test_parse_rejects_invalid(self):
+        """Test output that is not JSON or misses fields is rejected."""
+        self.assertIsNone(parse_caption("Xin lỗi"))
+        self.assertIsNone(parse_caption('{"caption": "A"}'))
+        broken = schema_caption()
+        broken['objects'][0]['count'] = "nhiều"
+        self.assertIsNone(parse_caption(broken))
+
+    def test_compact_format(self):
+        """Test compact captions are minified and drop empty fields but keep the caption."""
+        fields = parse_caption(schema_caption())
+
+        compact = format_caption(fields, compact=True)
+
+        self.assertNotIn("None", compact)
+        self.assertNotIn(" \"", compact)
+        self.assertNotIn("secondary_actions", compact)
+        self.assertEqual(json.loads(compact)['caption'], fields['caption'])
+        self.assertLess(len(compact.encode()), len(format_caption(fields).encode()) * 0.8)
+        self.assertTrue(CaptionResult.parse(compact).ok)
+
+    def test_split_structured_batch(self):
+        """Test batch entries are validated one by one."""
+        text = json.dumps([schema_caption("A", image_index=0), {"image_index": 1, "caption": "B"}],
+                          ensure_ascii=False)
+
+        captions = split_batch_response(text, 2, structured=True)
+
+        self.assertEqual(json.loads(captions[0])['objects']['vehicles']['count'], 3)
+        self.assertNotIn("image_index", json.loads(captions[0]))
+        self.assertIsNone(captions[1])
+
+
+class TestGeminiClientSchema(unittest.TestCase):
+    """Test GeminiClient requests and validates schema output against a fake server."""
+
+    def _client(self, server, api_keys=('test_key_1',), **kwargs):
+        with patch('logging.info'):
+            return GeminiClient(api_keys=list(api_keys), rpm=0, tpm=0, structured_output=True,
+                                http_options=types.HttpOptions(base_url=server.base_url), **kwargs)
+
+    def test_schema_request(self):
+        """Test the request carries the schema and the caption is stored in the prompt's layout."""
+        caption = json.dumps(schema_caption(), ensure_ascii=False)
+        with FakeGeminiServer(caption=caption) as server:
+            result = self._client(server).process_image_bytes(b"image", "V001/1.jpg", max_retries=0)
+
+        config = server.requests[0]['body']['generationConfig']
+        self.assertEqual(config['responseMimeType'], "application/json")
+        self.assertIn("objects", config['responseSchema']['properties'])
+        self.assertTrue(result.ok)
+        self.assertEqual(json.loads(result)['objects'], {"vehicles": {"count": 3, "description": "xe máy màu đỏ"}})
+
+    def test_structured_batch_request(self):
+        """Test a multi-frame request with the array schema reaches the server and needs no fallbacks."""
+        entries = [schema_caption(f"Khung hình {i}", image_index=i) for i in range(2)]
+        with FakeGeminiServer(caption=json.dumps(entries, ensure_ascii=False)) as server:
+            client = self._client(server)
+            images = [(f"image-{i}".encode(), f"V001/{i}.jpg") for i in range(2)]
+
+            results = client.process_image_batch(images, max_retries=0)
+
+        self.assertEqual(len(server.requests), 1)
+        self.assertEqual(server.requests[0]['body']['generationConfig']['responseSchema']['type'], "ARRAY")
+        self.assertEqual([json.loads(result)['caption'] for result in results], ["Khung hình 0", "Khung hình 1"])
+        self.assertEqual(client.batch_stats['fallbacks'], 0)
+        self.assertEqual(client.key_stats[0]['errors'], 0)
+
+    def test_invalid_output(self):
+        """Test output not matching the schema becomes a retryable error."""
+        with FakeGeminiServer() as server:
+            with patch('logging.warning'):
+                result = self._client(server).process_image_bytes(b"image", "V001/1.jpg", max_retries=0)
+
+        self.assertEqual(result.error_code, INVALID_OUTPUT)
+        self.assertTrue(result.retryable)
+
+    def test_invalid_output_counted_on_serving_key(self):
+        """Test a schema mismatch is an error of the key that served it, even if another thread rotated keys."""
+        with FakeGeminiServer() as server:
+            client = self._client(server, api_keys=('test_key_1', 'test_key_2'))
+            client.current_key_index = 1
+            generate = client._generate
+
+            def generate_then_rotate(*args, **kwargs):
+                output = generate(*args, **kwargs)
+                client.current_key_index = 0
+                return output
+
+            with patch.object(client, '_generate', side_effect=generate_then_rotate), patch('logging.warning'):
+                client.process_image_bytes(b"image", "V001/1.jpg", max_retries=0)
+
+        self.assertEqual([client.key_stats[i]['errors'] for i in range(2)], [0, 1])
+
+    def test_output_settings_change_cache_fingerprint(self):
+        """Test schema and compact captions are cached separately from free-form ones."""
+        server = FakeGeminiServer()
+        try:
+            fingerprints = {self._client(server, compact=compact).request_fingerprint for compact in (False, True)}
+            with patch('logging.info'):
+                fingerprints.add(GeminiClient(api_keys=['test_key_1']).request_fingerprint)
+        finally:
+            server.httpd.server_close()
+
+        self.assertEqual(len(fingerprints), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,165 @@
+"""
+Unit tests for cascade module and the GeminiClient model cascade.
+"""
+
+import unittest
+import asyncio
+import json
+import os
+from unittest.mock import patch, ANY
+
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from google.genai import types
+
+from src.cascade import validate_caption, CascadeStats
+from src.gemini_client import GeminiClient
+from tests.fake_gemini import FakeGeminiServer
+
+
+def good_caption(caption="Cảnh quay một con đường đông đúc với ba chiếc xe máy màu đỏ đang chạy.", **extra):
+    """A caption that passes the cascade's local checks."""
+    return {"camera": {}, "setting": {}, "objects": {"vehicles": {"count": 3, "description": "xe máy"}},
+            "spatial": {}, "activity": {}, "text_elements": {}, "caption": caption, **extra}
+
+
+class TieredGeminiServer(FakeGeminiServer):
+    """Fake server whose flash-lite model answers poorly for frames in ``poor`` and gemini-2.5-flash always well."""
+
+    def __init__(self, poor=(0,), **kwargs):
+        super().__init__(**kwargs)
+        self.poor = set(poor)
+
+    def respond(self, path, request):
+        parts = request['contents'][0]['parts']
+        frames = sum('inlineData' in part for part in parts)
+        lite = 'flash-lite' in path
+        if frames > 1:
+            entries = [dict(good_caption(f"Khung hình {i}: " + good_caption()['caption']), image_index=i)
+                       if not (lite and i in self.poor) else {"image_index": i, "caption": "Xe."}
+                       for i in range(frames)]
+            text = json.dumps(entries, ensure_ascii=False)
+        elif lite and self.poor:
+            text = json.dumps({"caption": "Xe."}, ensure_ascii=False)
+        else:
+            text = json.dumps(good_caption(), ensure_ascii=False)
+        response = super().respond(path, request)
+        response['candidates'][0]['content']['parts'][0]['text'] = text
+        return response
+
+
+class TestValidateCaption(unittest.TestCase):
+    """Test the local caption checks."""
+
+    def test_good_caption(self):
+        """Test a complete caption passes."""
+        self.assertEqual(validate_caption(json.dumps(good_caption())), [])
+
+    def test_problems(self):
+        """Test missing fields, short captions and missing counts are reported."""
+        self.assertEqual(validate_caption("Xin lỗi"), ["not JSON"])
+        problems = validate_caption('{"caption": "Xe.", "objects": {"vehicles": {"count": 0}}}')
+        self.assertIn("caption too short", problems)
+        self.assertIn("no object counts", problems)
+        self.assertTrue(problems[0].startswith("missing camera"))
+
+    def test_compact_caption(self):
+        """Test compact captions only need the caption and object counts."""
+        compact = {"caption": good_caption()['caption'], "objects": {"vehicles": {"count": 3}}}
+        self.assertEqual(validate_caption(json.dumps(compact), compact=True), [])
+        self.assertNotEqual(validate_caption(json.dumps(compact)), [])
+
+
+class TestCascadeStats(unittest.TestCase):
+    """Test per-tier statistics and savings."""
+
+    def test_savings(self):
+        """Test savings are estimated from the strongest tier's cost per frame."""
+        stats = CascadeStats(['fast', 'quality'])
+        for _ in range(3):
+            stats.record('fast', True, 1.0)
+            stats.add_tokens('fast', 1000)
+        stats.record('fast', False, 1.0)
+        stats.add_tokens('fast', 1000)
+        stats.record('quality', True, 4.0)
+        stats.add_tokens('quality', 5000)
+
+        saved = stats.savings()
+
+        self.assertAlmostEqual(saved['seconds'], 4 * 4.0 - 8.0)
+        self.assertEqual(saved['tokens'], 4 * 5000 - 9000)
+        self.assertEqual(saved['requests'], 3)
+
+    def test_no_savings_before_top_tier(self):
+        """Test savings are unknown until the strongest tier answered a frame."""
+        stats = CascadeStats(['fast', 'quality'])
+        stats.record('fast', True, 1.0)
+
+        self.assertIsNone(stats.savings())
+
+
+class TestGeminiClientCascade(unittest.TestCase):
+    """Test GeminiClient escalates frames through cascade tiers against a fake server."""
+
+    def _client(self, server, **kwargs):
+        with patch('logging.info'):
+            return GeminiClient(api_keys=['test_key_1'], rpm=0, tpm=0, cascade=['fast'], profile='quality',
+                                http_options=types.HttpOptions(base_url=server.base_url), **kwargs)
+
+    def test_poor_caption_escalates(self):
+        """Test a caption failing local checks is re-run with the strongest profile."""
+        with TieredGeminiServer() as server:
+            client = self._client(server)
+            with patch('logging.info'):
+                result = client.process_image_bytes(b"image", "V001/1.jpg", max_retries=0)
+
+        self.assertEqual([request['path'].split('/')[-1] for request in server.requests],
+                         ["gemini-2.5-flash-lite:generateContent", "gemini-2.5-flash:generateContent"])
+        self.assertEqual(json.loads(result)['metadata'], {'profile': 'quality', 'model': 'gemini-2.5-flash'})
+        self.assertEqual(client.cascade.stats['fast']['accepted'], 0)
+        self.assertEqual(client.cascade.stats['quality']['tokens'], 2050)
+
+    def test_good_caption_kept(self):
+        """Test a caption passing local checks stays with the cheap profile."""
+        with TieredGeminiServer(poor=()) as server:
+            client = self._client(server)
+            result = client.process_image_bytes(b"image", "V001/1.jpg", max_retries=0)
+
+        self.assertEqual(len(server.requests), 1)
+        self.assertEqual(json.loads(result)['metadata']['profile'], 'fast')
+        self.assertEqual(client.cascade.stats['fast'], {'images': 1, 'accepted': 1, 'seconds': ANY,
+                                                        'tokens': 2050})
+
+    def test_batch_escalates_poor_frames(self):
+        """Test a batch goes to the cheap profile and only its poor frames are re-run alone."""
+        with TieredGeminiServer(poor={1}) as server:
+            client = self._client(server)
+            images = [(f"image-{i}".encode(), f"V001/{i}.jpg") for i in range(3)]
+
+            with patch('logging.info'):
+                results = asyncio.run(client.process_image_batch_async(images, max_retries=0))
+
+        self.assertEqual(len(server.requests), 2)
+        self.assertIn("flash-lite", server.requests[0]['path'])
+        self.assertNotIn("flash-lite", server.requests[1]['path'])
+        self.assertEqual([json.loads(result)['metadata']['profile'] for result in results],
+                         ['fast', 'quality', 'fast'])
+        self.assertEqual(client.batch_stats['fallbacks'], 0)
+
+    def test_cascade_changes_cache_fingerprint(self):
+        """Test cascaded captions are cached separately from single-profile ones."""
+        server = FakeGeminiServer()
+        try:
+            cascaded = self._client(server).request_fingerprint
+            with patch('logging.info'):
+                single = GeminiClient(api_keys=['test_key_1'], profile='quality',
+                                      http_options=types.HttpOptions(base_url=server.base_url)).request_fingerprint
+        finally:
+            server.httpd.server_close()
+
+        self.assertNotEqual(cascaded, single)
+
+
+if __name__ == '__main__':
+    unittest.main()
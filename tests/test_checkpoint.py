@@ -0,0 +1,120 @@
+"""
+Unit tests for checkpoint module.
+"""
+
+import unittest
+import os
+import pickle
+import shutil
+import tempfile
+
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.checkpoint import CheckpointJournal
+
+
+class TestCheckpointJournal(unittest.TestCase):
+    """Test CheckpointJournal class."""
+
+    def setUp(self):
+        """Set up test fixtures."""
+        self.temp_dir = tempfile.mkdtemp()
+        self.checkpoint_file = os.path.join(self.temp_dir, 'checkpoint.pkl')
+        self.journal = CheckpointJournal(self.checkpoint_file, compact_every=0)
+
+    def tearDown(self):
+        """Clean up test fixtures."""
+        self.journal.close()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_load_empty(self):
+        """Test loading when nothing has been written."""
+        self.assertFalse(self.journal.exists())
+        self.assertEqual(self.journal.load(), set())
+
+    def test_add_and_discard_append_records(self):
+        """Test records are appended without touching the snapshot."""
+        self.journal.add('K01/V001/0001.jpg')
+        self.journal.add('K01/V001/0002.jpg')
+        self.journal.discard('K01/V001/0001.jpg')
+
+        self.assertFalse(os.path.exists(self.checkpoint_file))
+        with open(self.journal.journal_file, encoding='utf-8') as f:
+            self.assertEqual(f.read().splitlines(),
+                             ['+K01/V001/0001.jpg', '+K01/V001/0002.jpg', '-K01/V001/0001.jpg'])
+        self.assertEqual(self.journal.load(), {'K01/V001/0002.jpg'})
+
+    def test_load_legacy_snapshot(self):
+        """Test a plain pickled checkpoint is still readable."""
+        with open(self.checkpoint_file, 'wb') as f:
+            pickle.dump({'a.jpg', 'b.jpg'}, f)
+        self.journal.add('c.jpg')
+
+        self.assertEqual(self.journal.load(), {'a.jpg', 'b.jpg', 'c.jpg'})
+
+    def test_torn_last_record_ignored(self):
+        """Test a partially written final record is skipped."""
+        with open(self.journal.journal_file, 'w', encoding='utf-8') as f:
+            f.write('+a.jpg\n+b.j')
+
+        self.assertEqual(self.journal.load(), {'a.jpg'})
+
+    def test_compact(self):
+        """Test compaction folds the journal into the snapshot."""
+        self.journal.add('a.jpg')
+        self.journal.add('b.jpg')
+        self.journal.compact()
+
+        self.assertFalse(os.path.exists(self.journal.journal_file))
+        self.assertFalse(os.path.exists(self.journal.segment_file))
+        with open(self.checkpoint_file, 'rb') as f:
+            self.assertEqual(pickle.load(f), {'a.jpg', 'b.jpg'})
+
+        # Appends after compaction go to a fresh journal
+        self.journal.add('c.jpg')
+        self.assertEqual(self.journal.load(), {'a.jpg', 'b.jpg', 'c.jpg'})
+
+    def test_interrupted_compaction_is_recovered(self):
+        """Test a leftover segment is replayed and merged."""
+        with open(self.journal.segment_file, 'w', encoding='utf-8') as f:
+            f.write('+a.jpg\n')
+        self.journal.add('b.jpg')
+
+        self.assertEqual(self.journal.load(), {'a.jpg', 'b.jpg'})
+
+        self.journal.compact()
+        self.assertFalse(os.path.exists(self.journal.segment_file))
+        self.assertEqual(self.journal.load(), {'a.jpg', 'b.jpg'})
+
+    def test_background_compaction_triggered(self):
+        """Test compaction runs automatically after enough records."""
+        journal = CheckpointJournal(self.checkpoint_file, compact_every=10)
+        for i in range(25):
+            journal.add(f'{i:04d}.jpg')
+        journal.close()
+
+        self.assertTrue(os.path.exists(self.checkpoint_file))
+        self.assertEqual(journal.load(), {f'{i:04d}.jpg' for i in range(25)})
+
+    def test_rewrite(self):
+        """Test rewrite replaces snapshot and drops journal records."""
+        self.journal.add('a.jpg')
+        self.journal.rewrite({'b.jpg'})
+
+        self.assertFalse(os.path.exists(self.journal.journal_file))
+        self.assertEqual(self.journal.load(), {'b.jpg'})
+
+    def test_for_path_shares_instance(self):
+        """Test journals are shared per checkpoint path."""
+        first = CheckpointJournal.for_path(self.checkpoint_file)
+        second = CheckpointJournal.for_path(self.checkpoint_file)
+        self.assertIs(first, second)
+
+        CheckpointJournal.release(self.checkpoint_file)
+        self.assertIsNot(CheckpointJournal.for_path(self.checkpoint_file), first)
+        CheckpointJournal.release(self.checkpoint_file)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,168 @@
+"""
+Unit tests for concurrency module.
+"""
+
+import unittest
+import asyncio
+import os
+import threading
+import time
+from unittest.mock import Mock, patch
+
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from google.genai import types
+
+from src.concurrency import AIMDController, SUCCESS, OVERLOAD, FAILURE
+from src.gemini_client import GeminiClient
+
+
+class TestAIMDController(unittest.TestCase):
+    """Test AIMDController class."""
+
+    def _complete(self, controller, outcome, latency=0.1):
+        controller.release(controller.acquire(), outcome, latency)
+
+    def test_slow_start_then_additive_increase(self):
+        """Test the window grows by one per success until the first cut, then by 1/window."""
+        controller = AIMDController(initial_window=4, max_window=100)
+
+        for _ in range(4):
+            self._complete(controller, SUCCESS)
+        self.assertEqual(controller.limit(), 8)
+
+        self._complete(controller, OVERLOAD)
+        self.assertEqual(controller.limit(), 4)
+        for _ in range(4):
+            self._complete(controller, SUCCESS)
+        self.assertEqual(controller.limit(), 4)
+        self.assertAlmostEqual(controller.window, 4.9, places=1)
+
+    def test_cut_once_per_burst(self):
+        """Test throttled requests already in flight only cut the window once."""
+        controller = AIMDController(initial_window=16)
+        tokens = [controller.acquire() for _ in range(10)]
+
+        for token in tokens:
+            controller.release(token, OVERLOAD)
+
+        self.assertEqual(controller.limit(), 8)
+        self.assertEqual(controller.cuts, 1)
+        self._complete(controller, OVERLOAD)
+        self.assertEqual(controller.limit(), 4)
+
+    def test_slow_responses_hold_window(self):
+        """Test latency well above the average stops growth; failures change nothing."""
+        controller = AIMDController(initial_window=4)
+        self._complete(controller, SUCCESS, latency=0.1)
+        window = controller.window
+
+        self._complete(controller, SUCCESS, latency=1.0)
+        self._complete(controller, FAILURE)
+
+        self.assertEqual(controller.window, window)
+
+    def test_bounds(self):
+        """Test the window stays within min and max."""
+        controller = AIMDController(initial_window=2, min_window=1, max_window=3)
+        for _ in range(10):
+            self._complete(controller, SUCCESS)
+        self.assertEqual(controller.limit(), 3)
+        for _ in range(10):
+            controller.last_cut = 0.0
+            self._complete(controller, OVERLOAD)
+        self.assertEqual(controller.limit(), 1)
+
+    def test_acquire_blocks_at_window(self):
+        """Test threads beyond the window wait for a release."""
+        controller = AIMDController(initial_window=2)
+        tokens = [controller.acquire(), controller.acquire()]
+        acquired = threading.Event()
+
+        thread = threading.Thread(target=lambda: (controller.acquire(), acquired.set()))
+        thread.start()
+        self.assertFalse(acquired.wait(0.05))
+
+        controller.release(tokens[0], FAILURE)
+        self.assertTrue(acquired.wait(1))
+        thread.join()
+        self.assertEqual(controller.in_flight, 2)
+
+    def test_acquire_async_waits_without_blocking_loop(self):
+        """Test coroutines queue for slots while the loop keeps running."""
+        controller = AIMDController(initial_window=3, max_window=3)
+        peak = [0]
+
+        async def request():
+            token = await controller.acquire_async()
+            peak[0] = max(peak[0], controller.in_flight)
+            await asyncio.sleep(0.005)
+            controller.release(token, SUCCESS, 0.005)
+
+        async def run():
+            await asyncio.gather(*[request() for _ in range(20)])
+
+        asyncio.run(run())
+
+        self.assertEqual(peak[0], 3)
+        self.assertEqual(controller.in_flight, 0)
+
+    def test_converges_on_capacity(self):
+        """Test the window settles near a key's real concurrency limit."""
+        capacity = 12
+        controller = AIMDController(initial_window=2, max_window=200)
+        in_flight = [0]
+        lock = threading.Lock()
+        windows = []
+
+        def worker():
+            for _ in range(60):
+                token = controller.acquire()
+                with lock:
+                    in_flight[0] += 1
+                    throttled = in_flight[0] > capacity
+                time.sleep(0.002)
+                with lock:
+                    in_flight[0] -= 1
+                controller.release(token, OVERLOAD if throttled else SUCCESS, 0.002)
+                windows.append(controller.limit())
+
+        threads = [threading.Thread(target=worker) for _ in range(30)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        settled = windows[len(windows) // 2:]
+        average = sum(settled) / len(settled)
+        self.assertGreater(controller.cuts, 0)
+        self.assertLessEqual(average, capacity * 2)
+        self.assertGreaterEqual(average, capacity / 3)
+
+
+class TestGeminiClientConcurrency(unittest.TestCase):
+    """Test GeminiClient integration with AIMDController."""
+
+    @patch('src.gemini_client.genai.Client')
+    def test_rate_limit_cuts_key_window(self, mock_genai_client):
+        """Test a 429 halves the window of the key it came from."""
+        mock_candidate = Mock()
+        mock_candidate.finish_reason = types.FinishReason.STOP
+        mock_candidate.content.parts = [Mock(text="Test response")]
+        generate = mock_genai_client.return_value.models.generate_content
+        generate.side_effect = [Exception("429 RESOURCE_EXHAUSTED"), Mock(candidates=[mock_candidate])]
+
+        with patch('logging.info'), patch('logging.warning'):
+            client = GeminiClient(api_keys=['test_key_1', 'test_key_2'], rpm=0, tpm=0)
+            result = client.process_image_bytes(b"data", "a.jpg", max_retries=1, key_rotation_delay=0)
+
+        self.assertEqual(result, "Test response")
+        stats = client.pacing_stats()
+        self.assertEqual(stats[0]['window'], 4)
+        self.assertEqual(stats[1]['window'], 9)
+        self.assertEqual(stats[0]['in_flight'] + stats[1]['in_flight'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,255 @@
+"""
+Unit tests for dedupe module.
+"""
+
+import unittest
+import io
+import json
+import os
+import random
+import shutil
+import tempfile
+from unittest.mock import AsyncMock, Mock, patch
+
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from PIL import Image, ImageDraw
+
+from src.dedupe import dhash, hamming_distance, cluster_hashes, FrameDeduplicator
+from src.results import CaptionResult
+from src.image_processor import ImageProcessor
+from src.async_image_processor import AsyncImageProcessor
+from src.s3_client import S3Client
+from src.s3_pipeline import S3CaptionPipeline, AsyncS3CaptionPipeline
+from tests.fake_s3 import FakeS3
+
+
+def _scene(seed, shift=0, size=(320, 180)):
+    """A frame of random shapes; the same seed gives the same scene."""
+    rnd = random.Random(seed)
+    image = Image.new('RGB', size, (rnd.randrange(256),) * 3)
+    draw = ImageDraw.Draw(image)
+    for _ in range(12):
+        x, y = rnd.randrange(size[0]), rnd.randrange(size[1])
+        draw.ellipse([x + shift, y, x + shift + rnd.randrange(20, 120), y + rnd.randrange(20, 80)],
+                     fill=tuple(rnd.randrange(256) for _ in range(3)))
+    return image
+
+
+def _jpeg(image, quality=90):
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=quality)
+    return buffer.getvalue()
+
+
+class TestPerceptualHash(unittest.TestCase):
+    """Test dhash and clustering helpers."""
+
+    def test_near_duplicates_hash_close(self):
+        """Test re-encoded, slightly moved frames stay within the threshold and other scenes do not."""
+        original = dhash(_jpeg(_scene(1)))
+        near = dhash(_jpeg(_scene(1, shift=1), quality=60))
+        other = dhash(_jpeg(_scene(2)))
+
+        self.assertLessEqual(hamming_distance(original, near), 4)
+        self.assertGreater(hamming_distance(original, other), 10)
+        self.assertEqual(dhash(io.BytesIO(_jpeg(_scene(1)))), original)
+
+    def test_cluster_hashes(self):
+        """Test frames join the first representative within the threshold."""
+        hashes = [0b0000, 0b0001, 0b1111, None, 0b0011, 0b1110]
+
+        self.assertEqual(cluster_hashes(hashes, threshold=1), [[0, 1], [2, 5], [3], [4]])
+        self.assertEqual(cluster_hashes(hashes, threshold=0), [[0], [1], [2], [3], [4], [5]])
+
+
+class TestFrameDeduplicator(unittest.TestCase):
+    """Test FrameDeduplicator class."""
+
+    def setUp(self):
+        """Set up test fixtures."""
+        self.frames = {
+            "V001/00000010.jpg": _jpeg(_scene(1)),
+            "V001/00000020.jpg": _jpeg(_scene(1, shift=1), quality=70),
+            "V001/00000030.jpg": _jpeg(_scene(2)),
+            "V001/00000040.jpg": _jpeg(_scene(1)),
+            "V002/00000010.jpg": _jpeg(_scene(1)),
+            "V002/00000020.jpg": b"not an image",
+        }
+
+    def test_representatives_per_video(self):
+        """Test one frame per cluster is passed on and clusters never span videos."""
+        deduplicator = FrameDeduplicator(threshold=4, workers=2)
+
+        with patch('logging.warning'):
+            representatives = list(deduplicator.iter_representatives(reversed(list(self.frames)),
+                                                                     load=self.frames.get))
+
+        self.assertEqual(representatives, ["V002/00000010.jpg", "V002/00000020.jpg",
+                                           "V001/00000010.jpg", "V001/00000030.jpg"])
+        self.assertEqual(deduplicator.pop_duplicates("V001/00000010.jpg"),
+                         ["V001/00000020.jpg", "V001/00000040.jpg"])
+        self.assertEqual(deduplicator.pop_duplicates("V001/00000010.jpg"), [])
+        self.assertEqual(deduplicator.pop_duplicates("V002/00000010.jpg"), [])
+        self.assertEqual(deduplicator.stats['duplicates'], 2)
+
+    def test_representatives_with_data(self):
+        """Test representatives can come with the data loaded to hash them."""
+        deduplicator = FrameDeduplicator(threshold=4)
+
+        with patch('logging.warning'):
+            representatives = list(deduplicator.iter_representatives(sorted(self.frames), load=self.frames.get,
+                                                                     with_data=True))
+
+        self.assertEqual([key for key, _ in representatives], ["V001/00000010.jpg", "V001/00000030.jpg",
+                                                               "V002/00000010.jpg", "V002/00000020.jpg"])
+        for key, data in representatives:
+            self.assertIs(data, self.frames[key])
+
+
+class TestDuplicatePropagation(unittest.TestCase):
+    """Test captions are copied to near-duplicates instead of calling Gemini."""
+
+    def setUp(self):
+        """Set up test fixtures."""
+        self.temp_dir = tempfile.mkdtemp()
+        self.input_dir = os.path.join(self.temp_dir, "input")
+        self.output_dir = os.path.join(self.temp_dir, "output")
+        os.makedirs(os.path.join(self.input_dir, "V001"))
+        os.makedirs(os.path.join(self.output_dir, "V001"))
+        self.files = []
+        for name, image in [("a.jpg", _scene(1)), ("b.jpg", _scene(1, shift=1)), ("c.jpg", _scene(2))]:
+            input_path = os.path.join(self.input_dir, "V001", name)
+            with open(input_path, 'wb') as f:
+                f.write(_jpeg(image))
+            self.files.append({'input_path': input_path,
+                               'output_path': os.path.join(self.output_dir, "V001", name[0] + ".txt"),
+                               'relative_path': os.path.join("V001", name)})
+
+    def tearDown(self):
+        """Clean up test fixtures."""
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_image_processor_propagates_caption(self):
+        """Test the representative's caption is written, marked, for its duplicates."""
+        deduplicator = FrameDeduplicator()
+        gemini_client = Mock(current_key_index=0)
+        gemini_client.process_image_with_gemini.side_effect = lambda path, retries: json.dumps({"caption": path})
+        processor = ImageProcessor(gemini_client, deduplicator=deduplicator)
+        processed_files = set()
+        pbar = Mock()
+
+        representatives = deduplicator.iter_representatives(self.files, key=lambda f: f['input_path'],
+                                                            load=lambda f: f['input_path'])
+        with patch('src.config.INPUT_DIR', self.input_dir), patch('logging.info'):
+            for file_info in representatives:
+                processor.process_and_save(file_info['input_path'], file_info['output_path'],
+                                           processed_files, None, pbar)
+
+        self.assertEqual(gemini_client.process_image_with_gemini.call_count, 2)
+        self.assertEqual(pbar.update.call_count, 3)
+        self.assertEqual(processed_files, {os.path.join("V001", name) for name in ("a.jpg", "b.jpg", "c.jpg")})
+        with open(self.files[1]['output_path'], encoding='utf-8') as f:
+            copied = CaptionResult.parse(f.read())
+        self.assertTrue(copied.ok)
+        self.assertEqual(copied.propagated_from, os.path.join("V001", "a.jpg"))
+        self.assertEqual(json.loads(copied)['caption'], self.files[0]['input_path'])
+        self.assertEqual(deduplicator.stats['propagated'], 1)
+
+    def test_failed_representative_fails_duplicates(self):
+        """Test the duplicates of a failed frame get its error output, so they are retried with it."""
+        deduplicator = FrameDeduplicator()
+        gemini_client = Mock(current_key_index=0)
+        gemini_client.process_image_with_gemini.return_value = CaptionResult.failure("SERVER_ERROR", "boom")
+        processor = ImageProcessor(gemini_client, deduplicator=deduplicator)
+        processed_files = set()
+
+        representatives = deduplicator.iter_representatives(self.files[:2], key=lambda f: f['input_path'],
+                                                            load=lambda f: f['input_path'])
+        with patch('src.config.INPUT_DIR', self.input_dir), patch('logging.info'), patch('logging.warning'):
+            for file_info in representatives:
+                processor.process_and_save(file_info['input_path'], file_info['output_path'],
+                                           processed_files, None, Mock())
+
+        with open(self.files[1]['output_path'], encoding='utf-8') as f:
+            self.assertTrue(processor.has_error_content(f.read()))
+        self.assertEqual(processed_files, set())
+        self.assertEqual(deduplicator.stats['propagated'], 0)
+
+    def test_raising_representative_fails_duplicates(self):
+        """Test the duplicates of a frame whose captioning raised get an error output and a progress tick."""
+        deduplicator = FrameDeduplicator()
+        gemini_client = Mock(current_key_index=0)
+        gemini_client.process_image_with_gemini.side_effect = RuntimeError("connection reset")
+        gemini_client.process_image_batch_async = AsyncMock(side_effect=RuntimeError("connection reset"))
+        pbar = Mock()
+
+        for processor in (ImageProcessor(gemini_client, deduplicator=deduplicator),
+                          AsyncImageProcessor(gemini_client, deduplicator=deduplicator, batch_size=2)):
+            pbar.reset_mock()
+            representatives = deduplicator.iter_representatives(self.files[:2], key=lambda f: f['input_path'],
+                                                                load=lambda f: f['input_path'])
+            tasks = [dict(file_info, pbar=pbar) for file_info in representatives]
+            with patch('src.config.INPUT_DIR', self.input_dir), patch('logging.info'), \
+                    patch('logging.warning'), patch('logging.error'):
+                processor.process_images_batch(tasks, max_workers=1, max_retries=0)
+
+            with open(self.files[1]['output_path'], encoding='utf-8') as f:
+                self.assertTrue(processor.has_error_content(f.read()))
+            os.remove(self.files[1]['output_path'])
+            self.assertEqual(sum(call.args[0] for call in pbar.update.call_args_list), 2)
+            self.assertEqual(deduplicator.duplicates, {})
+
+    def test_s3_pipeline_propagates_caption(self):
+        """Test the S3 pipeline uploads copies for duplicates and reports them to the result callback."""
+        keys = [f"frames/K01/V001/{i:08d}.jpg" for i in range(4)]
+        fake_s3 = FakeS3()
+        for key, image in zip(keys, [_scene(1), _scene(1, shift=1), _scene(1), _scene(2)]):
+            fake_s3.put(key, _jpeg(image))
+        with patch('src.s3_client.boto3.client', return_value=fake_s3), patch('logging.info'):
+            s3_client = S3Client()
+        gemini_client = Mock()
+        gemini_client.process_image_bytes.side_effect = lambda data, key, *args: json.dumps({"caption": key})
+        deduplicator = FrameDeduplicator()
+        pipeline = S3CaptionPipeline(s3_client, gemini_client, Mock(), None, deduplicator=deduplicator)
+        results = []
+        pipeline.set_result_callback(lambda key, ok: results.append((key, ok)))
+
+        with patch('logging.info'):
+            stats = pipeline.run(keys, set())
+
+        self.assertEqual(gemini_client.process_image_bytes.call_count, 2)
+        # Representatives are captioned from the bytes downloaded for hashing
+        self.assertEqual(fake_s3.calls['get_object'], 4)
+        self.assertEqual(stats['processed'], 4)
+        self.assertEqual(sorted(results), [(key, True) for key in keys])
+        copied = CaptionResult.parse(fake_s3.objects["captions/K01/V001/00000002.txt"].decode('utf-8'))
+        self.assertEqual(copied.propagated_from, "K01/V001/00000000.jpg")
+        self.assertEqual(deduplicator.stats['propagated'], 2)
+
+    def test_async_s3_pipeline_reuses_downloads(self):
+        """Test the async pipeline captions representatives from the pre-pass downloads."""
+        keys = [f"frames/K01/V001/{i:08d}.jpg" for i in range(3)]
+        fake_s3 = FakeS3()
+        for key, image in zip(keys, [_scene(1), _scene(1, shift=1), _scene(2)]):
+            fake_s3.put(key, _jpeg(image))
+        with patch('src.s3_client.boto3.client', return_value=fake_s3), patch('logging.info'):
+            s3_client = S3Client()
+        gemini_client = Mock()
+        gemini_client.process_image_bytes_async = AsyncMock(
+            side_effect=lambda data, key, *args: json.dumps({"caption": key}))
+        pipeline = AsyncS3CaptionPipeline(s3_client, gemini_client, Mock(), None,
+                                          deduplicator=FrameDeduplicator())
+
+        with patch('logging.info'):
+            stats = pipeline.run(keys, set())
+
+        self.assertEqual(gemini_client.process_image_bytes_async.call_count, 2)
+        self.assertEqual(fake_s3.calls['get_object'], 3)
+        self.assertEqual(stats['processed'], 3)
+        self.assertEqual(pipeline.prefetched, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -45,24 +45,20 @@ class TestFileManager(unittest.TestCase):
         self.assertEqual(self.file_manager.input_dir, self.input_dir)
         self.assertEqual(self.file_manager.output_dir, self.output_dir)
 
-    @patch('os.path.exists')
-    @patch('pickle.load')
-    @patch('builtins.open', create=True)
-    def test_load_checkpoint_exists(self, mock_open_func, mock_pickle_load, mock_exists):
-        """Test loading existing checkpoint."""
-        # Setup mocks
-        mock_exists.return_value = True
-        test_processed_files = {'file1.jpg', 'file2.jpg'}
-        mock_pickle_load.return_value = test_processed_files
+    def test_load_checkpoint_exists(self):
+        """Test loading existing checkpoint snapshot and journal."""
+        checkpoint_file = os.path.join(self.temp_dir, 'test_checkpoint.pkl')
+        with open(checkpoint_file, 'wb') as f:
+            pickle.dump({'file1.jpg', 'file2.jpg'}, f)
+        with open(checkpoint_file + '.journal', 'w', encoding='utf-8') as f:
+            f.write("+file3.jpg\n-file1.jpg\n")
 
         # Test
         with patch('logging.info') as mock_log:
-            result = self.file_manager.load_checkpoint('test_checkpoint.pkl')
+            result = self.file_manager.load_checkpoint(checkpoint_file)
 
         # Verify
-        self.assertEqual(result, test_processed_files)
-        mock_open_func.assert_called_once_with('test_checkpoint.pkl', 'rb')
-        mock_pickle_load.assert_called_once()
+        self.assertEqual(result, {'file2.jpg', 'file3.jpg'})
         mock_log.assert_called_once()
 
     @patch('os.path.exists')
@@ -74,16 +70,27 @@ class TestFileManager(unittest.TestCase):
 
         self.assertEqual(result, set())
 
-    @patch('pickle.dump')
-    @patch('builtins.open', create=True)
-    def test_save_checkpoint(self, mock_open_func, mock_pickle_dump):
-        """Test saving checkpoint."""
+    def test_save_checkpoint(self):
+        """Test saving checkpoint rewrites snapshot and clears journal."""
+        checkpoint_file = os.path.join(self.temp_dir, 'test_checkpoint.pkl')
         test_processed_files = {'file1.jpg', 'file2.jpg'}
+        self.file_manager.record_processed('stale.jpg', checkpoint_file)
+
+        self.file_manager.save_checkpoint(test_processed_files, checkpoint_file)
 
-        self.file_manager.save_checkpoint(test_processed_files, 'test_checkpoint.pkl')
+        with open(checkpoint_file, 'rb') as f:
+            self.assertEqual(pickle.load(f), test_processed_files)
+        self.assertFalse(os.path.exists(checkpoint_file + '.journal'))
 
-        mock_open_func.assert_called_once_with('test_checkpoint.pkl', 'wb')
-        mock_pickle_dump.assert_called_once_with(test_processed_files, mock_open_func.return_value.__enter__.return_value)
+    def test_record_processed(self):
+        """Test recording a processed file appends to the journal."""
+        checkpoint_file = os.path.join(self.temp_dir, 'test_checkpoint.pkl')
+
+        self.file_manager.record_processed('file1.jpg', checkpoint_file)
+
+        with open(checkpoint_file + '.journal', encoding='utf-8') as f:
+            self.assertEqual(f.read(), "+file1.jpg\n")
+        self.assertFalse(os.path.exists(checkpoint_file))
 
     @patch('os.path.exists')
     @patch('os.remove')
@@ -94,7 +101,7 @@ class TestFileManager(unittest.TestCase):
         with patch('logging.info') as mock_log:
             self.file_manager.remove_checkpoint('test_checkpoint.pkl')
 
-        mock_remove.assert_called_once_with('test_checkpoint.pkl')
+        mock_remove.assert_any_call('test_checkpoint.pkl')
         mock_log.assert_called_once()
 
     @patch('os.path.exists')
@@ -215,6 +222,79 @@ class TestFileManager(unittest.TestCase):
         self.assertIn('image3.gif', pending_names)
         self.assertNotIn('image1.jpg', pending_names)
 
+    def _touch(self, *relative_paths):
+        for relative_path in relative_paths:
+            path = os.path.join(self.input_dir, relative_path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w') as f:
+                f.write("test content")
+
+    def test_iter_image_files_nested(self):
+        """Test the scan finds images in nested directories with relative paths."""
+        self._touch(os.path.join('a', 'b', 'x.jpg'), os.path.join('a', 'y.PNG'), 'z.jpg', os.path.join('a', 'notes.txt'))
+
+        found = sorted(relative_path for _, relative_path in self.file_manager.iter_image_files())
+
+        self.assertEqual(found, sorted([os.path.join('a', 'b', 'x.jpg'), os.path.join('a', 'y.PNG'), 'z.jpg']))
+        self.assertEqual(self.file_manager.count_total_files(), 3)
+
+    def test_iter_pending_files_creates_each_dir_once(self):
+        """Test output directories are created lazily, once per directory."""
+        self._touch(*[os.path.join('v1', f'{i}.jpg') for i in range(5)], os.path.join('v2', '0.jpg'))
+
+        with patch('src.file_manager.os.makedirs') as mock_makedirs:
+            pending = self.file_manager.iter_pending_files(set())
+            mock_makedirs.assert_not_called()
+            pending_files = list(pending)
+
+        self.assertEqual(len(pending_files), 6)
+        self.assertEqual(mock_makedirs.call_count, 2)
+
+    def test_iter_pending_files_retries_error_outputs(self):
+        """Test processed files with error output are yielded again and unmarked."""
+        self._touch('good.jpg', 'bad.jpg', 'new.jpg')
+        for name, content in (('good.txt', 'Normal response content'), ('bad.txt', 'Error processing')):
+            with open(os.path.join(self.output_dir, name), 'w', encoding='utf-8') as f:
+                f.write(content)
+        processed_files = {'good.jpg', 'bad.jpg'}
+
+        with patch('src.file_manager.CheckpointJournal') as mock_journal, patch('logging.info'):
+            pending = [f['relative_path'] for f in self.file_manager.iter_pending_files(
+                processed_files, retry_errors=True, checkpoint_file='checkpoint.pkl')]
+
+        self.assertEqual(sorted(pending), ['bad.jpg', 'new.jpg'])
+        self.assertEqual(processed_files, {'good.jpg'})
+        mock_journal.for_path.return_value.discard.assert_called_once_with('bad.jpg')
+
+    def test_iter_pending_files_uses_status_index(self):
+        """Test retries come from the status index, rebuilt once, without reading each output file."""
+        self._touch(*[f'{i}.jpg' for i in range(5)])
+        for i in range(5):
+            with open(os.path.join(self.output_dir, f'{i}.txt'), 'w', encoding='utf-8') as f:
+                f.write('Error processing' if i == 3 else 'Normal response content')
+        processed_files = {f'{i}.jpg' for i in range(5)}
+
+        with patch.object(FileManager, 'rebuild_status_index',
+                          wraps=self.file_manager.rebuild_status_index) as mock_rebuild, patch('logging.info'):
+            pending = [f['relative_path'] for f in self.file_manager.iter_pending_files(processed_files, True)]
+
+        self.assertEqual(pending, ['3.jpg'])
+        mock_rebuild.assert_called_once()
+
+        processed_files.add('3.jpg')
+        with patch('builtins.open', side_effect=AssertionError("output file read")), patch('logging.info'):
+            pending = [f['relative_path'] for f in self.file_manager.iter_pending_files(processed_files, True)]
+        self.assertEqual(pending, ['3.jpg'])
+
+    def test_count_total_files_async(self):
+        """Test the background count reports the total through the callback."""
+        self._touch('a.jpg', 'b.jpg')
+        totals = []
+
+        self.file_manager.count_total_files_async(totals.append).join(5)
+
+        self.assertEqual(totals, [2])
+
     @patch.object(FileManager, 'scan_for_error_files')
     @patch('os.path.exists')
     def test_get_error_file_inputs(self, mock_exists, mock_scan):
@@ -262,6 +342,16 @@ class TestFileManager(unittest.TestCase):
         self.assertEqual(tasks[0]['checkpoint_file'], checkpoint_file)
         self.assertEqual(tasks[0]['pbar'], pbar)
 
+    def test_iter_image_tasks_is_lazy(self):
+        """Test tasks are built only as they are consumed."""
+        def file_list():
+            yield {'input_path': 'input1.jpg', 'output_path': 'output1.txt'}
+            raise AssertionError("consumed too far")
+
+        tasks = self.file_manager.iter_image_tasks(file_list(), pbar=Mock())
+
+        self.assertEqual(next(tasks)['input_path'], 'input1.jpg')
+
     @patch.object(FileManager, 'scan_for_error_files')
     @patch.object(FileManager, 'save_checkpoint')
     def test_mark_error_files_for_retry(self, mock_save, mock_scan):
@@ -3,40 +3,18 @@ Unit tests for gemini_client module (fixed version).
 """
 
 import unittest
+import asyncio
 import json
-import threading
-import time
 from unittest.mock import Mock, patch, MagicMock
 
 import sys
 import os
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 
-from src.gemini_client import GeminiClient, RateLimiter
+from google.genai import types
 
-
-class TestRateLimiter(unittest.TestCase):
-    """Test RateLimiter class."""
-
-    def test_rate_limiter_init(self):
-        """Test RateLimiter initialization."""
-        limiter = RateLimiter(max_calls=10, period=60)
-        self.assertEqual(limiter.max_calls, 10)
-        self.assertEqual(limiter.period, 60)
-        self.assertEqual(len(limiter.calls), 0)
-        self.assertTrue(hasattr(limiter, 'lock'))
-
-    def test_rate_limiter_decorator(self):
-        """Test RateLimiter as decorator."""
-        @RateLimiter(max_calls=2, period=1)
-        def test_func():
-            return "called"
-
-        # Should allow first two calls
-        result1 = test_func()
-        result2 = test_func()
-        self.assertEqual(result1, "called")
-        self.assertEqual(result2, "called")
+from src.gemini_client import GeminiClient, ClientPool
+from src.results import CaptionResult, SAFETY_BLOCKED, INVALID_REQUEST, SERVER_ERROR
 
 
 class TestGeminiClient(unittest.TestCase):
@@ -200,5 +178,137 @@ class TestGeminiClient(unittest.TestCase):
         self.assertIn("No candidates returned", result_dict["error"])
 
 
+class TestGeminiClientBytes(unittest.TestCase):
+    """Test in-memory image processing."""
+
+    @patch('src.gemini_client.time.sleep')
+    @patch('src.gemini_client.genai.Client')
+    def test_process_image_bytes(self, mock_genai_client, mock_sleep):
+        """Test raw bytes are sent without touching the filesystem."""
+        mock_candidate = Mock()
+        mock_candidate.finish_reason = types.FinishReason.STOP
+        mock_candidate.content.parts = [Mock(text="Test response")]
+        mock_genai_client.return_value.models.generate_content.return_value = Mock(candidates=[mock_candidate])
+
+        client = GeminiClient(api_keys=['test_key_1'])
+        with patch('builtins.open') as mock_open:
+            result = client.process_image_bytes(b"fake_image_data", "frames/K01/V001/00000001.jpg",
+                                                max_retries=1, mime_type='image/png')
+
+        self.assertEqual(result, "Test response")
+        mock_open.assert_not_called()
+        contents = mock_genai_client.return_value.models.generate_content.call_args.kwargs['contents']
+        self.assertEqual(contents[1].inline_data.data, b"fake_image_data")
+        self.assertEqual(contents[1].inline_data.mime_type, 'image/png')
+
+
+class TestGeminiClientResults(unittest.TestCase):
+    """Test typed results from GeminiClient."""
+
+    def _client(self):
+        with patch('logging.info'):
+            return GeminiClient(api_keys=['test_key_1'], rpm=0, tpm=0)
+
+    @patch('src.gemini_client.genai.Client')
+    def test_success_and_safety_block(self, mock_genai_client):
+        """Test captions and blocked responses come back as typed results."""
+        mock_candidate = Mock()
+        mock_candidate.finish_reason = types.FinishReason.STOP
+        mock_candidate.content.parts = [Mock(text="Test response")]
+        blocked = Mock()
+        blocked.finish_reason = types.FinishReason.SAFETY
+        generate = mock_genai_client.return_value.models.generate_content
+        generate.side_effect = [Mock(candidates=[mock_candidate]), Mock(candidates=[blocked])]
+        client = self._client()
+
+        result = client.process_image_bytes(b"data", "a.jpg", max_retries=0)
+        self.assertIsInstance(result, CaptionResult)
+        self.assertTrue(result.ok)
+
+        result = client.process_image_bytes(b"data", "b.jpg", max_retries=0)
+        self.assertEqual(result.error_code, SAFETY_BLOCKED)
+        self.assertTrue(result.terminal)
+
+    @patch('src.gemini_client.time.sleep')
+    @patch('src.gemini_client.genai.Client')
+    def test_request_errors_are_classified(self, mock_genai_client, mock_sleep):
+        """Test invalid requests are terminal and exhausted server errors retryable."""
+        generate = mock_genai_client.return_value.models.generate_content
+        generate.side_effect = [Exception("400 INVALID_ARGUMENT"), Exception("500 INTERNAL"), Exception("500 INTERNAL")]
+        client = self._client()
+
+        with patch('logging.error'), patch('logging.warning'), patch('logging.info'):
+            invalid = client.process_image_bytes(b"data", "a.jpg", max_retries=1)
+            server = client.process_image_bytes(b"data", "b.jpg", max_retries=1)
+
+        self.assertEqual((invalid.error_code, invalid.retryable), (INVALID_REQUEST, False))
+        self.assertEqual((server.error_code, server.retryable), (SERVER_ERROR, True))
+        self.assertIn("500 INTERNAL", json.loads(server)['error'])
+
+
+class TestClientPool(unittest.TestCase):
+    """Test per-key client pooling."""
+
+    @patch('src.gemini_client.genai.Client')
+    def test_rotation_reuses_clients(self, mock_genai_client):
+        """Test rotating keys only changes the index once each client exists."""
+        mock_genai_client.side_effect = lambda api_key: Mock(name=api_key)
+        with patch('logging.info'):
+            client = GeminiClient(api_keys=['test_key_1', 'test_key_2'])
+            first = client.client
+            client.rotate_api_key()
+            second = client.client
+            client.rotate_api_key()
+
+        self.assertIs(client.client, first)
+        self.assertIsNot(second, first)
+        self.assertEqual([c.kwargs['api_key'] for c in mock_genai_client.call_args_list],
+                         ['test_key_1', 'test_key_2'])
+
+    @patch('src.gemini_client.genai.Client')
+    def test_request_pins_its_client(self, mock_genai_client):
+        """Test a rotation mid-request does not swap the in-flight request's client."""
+        clients = {}
+
+        def make_client(api_key):
+            clients[api_key] = Mock(name=api_key)
+            return clients[api_key]
+
+        mock_genai_client.side_effect = make_client
+        with patch('logging.info'):
+            client = GeminiClient(api_keys=['test_key_1', 'test_key_2'], rpm=0, tpm=0)
+
+        def generate(**kwargs):
+            with patch('logging.info'):
+                client.rotate_api_key()
+            return Mock(candidates=[])
+
+        clients['test_key_1'].models.generate_content.side_effect = generate
+        with patch('logging.error'):
+            client.process_image_bytes(b"data", "a.jpg", max_retries=0)
+
+        clients['test_key_1'].models.generate_content.assert_called_once()
+        self.assertEqual(client.current_key_index, 1)
+        self.assertEqual(client.key_stats[0]['errors'], 1)
+        self.assertEqual(client.key_stats[1]['errors'], 0)
+        self.assertIs(client.pool.clients[0], clients['test_key_1'])
+
+    @patch('src.gemini_client.genai.Client')
+    def test_async_clients_cached_per_loop(self, mock_genai_client):
+        """Test async clients are reused within a loop and rebuilt for a new one."""
+        pool = ClientPool(['test_key_1'], async_concurrency=32)
+
+        async def get_twice():
+            return pool.get_async(0), pool.get_async(0), pool.get_async(0)
+
+        first = asyncio.run(get_twice())
+        created = mock_genai_client.call_count
+        asyncio.run(get_twice())
+
+        self.assertEqual(created, 2)
+        self.assertIs(first[0], first[2])
+        self.assertEqual(mock_genai_client.call_count, 4)
+
+
 if __name__ == '__main__':
     unittest.main()
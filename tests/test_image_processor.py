@@ -66,9 +66,8 @@ class TestImageProcessor(unittest.TestCase):
 
     @patch('builtins.open', create=True)
     @patch('os.path.relpath')
-    @patch('pickle.dump')
-    @patch('threading.Lock')
-    def test_process_and_save_success(self, mock_lock, mock_pickle_dump, mock_relpath, mock_open):
+    @patch('src.image_processor.CheckpointJournal')
+    def test_process_and_save_success(self, mock_journal_class, mock_relpath, mock_open):
         """Test successful process and save operation."""
         # Setup mocks
         mock_relpath.return_value = "test_image.jpg"
@@ -104,6 +103,10 @@ class TestImageProcessor(unittest.TestCase):
         # Verify processed files was updated
         self.assertIn("test_image.jpg", processed_files)
 
+        # Verify a single journal record was appended
+        mock_journal_class.for_path.assert_called_once_with("checkpoint.pkl")
+        mock_journal_class.for_path.return_value.add.assert_called_once_with("test_image.jpg")
+
     @patch('builtins.open', create=True)
     @patch('os.path.relpath')
     def test_process_and_save_with_shutdown(self, mock_relpath, mock_open):
@@ -135,12 +138,13 @@ class TestImageProcessor(unittest.TestCase):
         # Setup mocks
         mock_relpath.return_value = "test_image.jpg"
         self.mock_gemini_client.process_image_with_gemini.side_effect = Exception("Test error")
+        self.mock_gemini_client.current_key_index = 0
 
         # Mock progress bar
         mock_pbar = Mock()
 
         # Test
-        with patch('logging.error') as mock_log_error:
+        with patch('logging.error') as mock_log_error, patch('logging.info'):
             self.processor.process_and_save(
                 "input/test_image.jpg",
                 "output/test_image.txt",
@@ -149,8 +153,10 @@ class TestImageProcessor(unittest.TestCase):
                 mock_pbar
             )
 
-        # Should log error and update progress bar
+        # Should log error, write an error output for --fix and update progress bar
         mock_log_error.assert_called_once()
+        written = mock_open.return_value.__enter__.return_value.write.call_args[0][0]
+        self.assertTrue(self.processor.has_error_content(written))
         mock_pbar.update.assert_called_once_with(1)
 
     @patch('image_processor.ThreadPoolExecutor')
@@ -193,6 +199,59 @@ class TestImageProcessor(unittest.TestCase):
         # Verify tasks were submitted
         self.assertEqual(mock_executor.submit.call_count, 2)
 
+    def test_process_images_batch_streams_tasks(self):
+        """Test tasks are pulled from a generator only as earlier ones finish."""
+        pulled = [0]
+        finished = [0]
+        peak = [0]
+        lock = threading.Lock()
+
+        def task_source():
+            for i in range(500):
+                with lock:
+                    pulled[0] += 1
+                    peak[0] = max(peak[0], pulled[0] - finished[0])
+                yield {'input_path': f'{i}.jpg', 'output_path': f'{i}.txt', 'pbar': Mock()}
+
+        def process_and_save(*args):
+            with lock:
+                finished[0] += 1
+
+        with patch.object(self.processor, 'process_and_save', side_effect=process_and_save):
+            self.processor.process_images_batch(task_source(), max_workers=4, max_retries=0)
+
+        self.assertEqual(finished[0], 500)
+        self.assertLessEqual(peak[0], 4 * 2 + 1)
+
+    def test_process_images_batch_stops_pulling_on_shutdown(self):
+        """Test no new tasks are pulled once shutdown is requested."""
+        pulled = []
+
+        def task_source():
+            for i in range(100):
+                pulled.append(i)
+                yield {'input_path': f'{i}.jpg', 'output_path': f'{i}.txt', 'pbar': Mock()}
+
+        def process_and_save(input_path, *args):
+            if input_path == '0.jpg':
+                self.processor.set_shutdown_flag(True)
+
+        with patch.object(self.processor, 'process_and_save', side_effect=process_and_save), \
+                patch('logging.info'):
+            self.processor.process_images_batch(task_source(), max_workers=1, max_retries=0)
+
+        self.assertLessEqual(len(pulled), 2)
+
+    def test_shutdown_check(self):
+        """Test a shutdown check set before processing is seen once it turns true."""
+        requested = []
+        self.processor.set_shutdown_check(lambda: bool(requested))
+        self.assertFalse(self.processor.shutdown_requested)
+
+        requested.append(True)
+
+        self.assertTrue(self.processor.shutdown_requested)
+
     def test_get_stats(self):
         """Test getting statistics."""
         mock_stats = {'key1': {'requests': 10, 'errors': 1}}
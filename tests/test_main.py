@@ -4,7 +4,7 @@ Unit tests for main module.
 
 import unittest
 import sys
-from unittest.mock import Mock, patch, MagicMock
+from unittest.mock import Mock, patch, MagicMock, ANY
 
 import sys
 import os
@@ -13,6 +13,11 @@ sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 import main
 
 
+def _args(*argv):
+    """Command-line settings as parsed from ``argv``."""
+    return main.parse_arguments(list(argv))
+
+
 class TestMain(unittest.TestCase):
     """Test main module functions."""
 
@@ -70,11 +75,11 @@ class TestMain(unittest.TestCase):
         # Setup mocks
         mock_file_manager = Mock()
         mock_file_manager.load_checkpoint.return_value = {'file1.jpg', 'file2.jpg'}
-        mock_file_manager.count_total_files.return_value = 2
+        mock_file_manager.iter_pending_files.return_value = iter([])
         mock_file_manager_class.return_value = mock_file_manager
 
         # Test
-        main.process_directory()
+        main.process_directory(_args())
 
         # Should log completion message and return early
         mock_log.assert_any_call("🎉 All files have been processed!")
@@ -89,12 +94,11 @@ class TestMain(unittest.TestCase):
         # Setup mocks
         mock_file_manager = Mock()
         mock_file_manager.load_checkpoint.return_value = set()
-        mock_file_manager.count_total_files.return_value = 2
-        mock_file_manager.get_pending_files.return_value = [
+        mock_file_manager.iter_pending_files.return_value = iter([
             {'input_path': 'input1.jpg', 'output_path': 'output1.txt'},
             {'input_path': 'input2.jpg', 'output_path': 'output2.txt'}
-        ]
-        mock_file_manager.prepare_image_tasks.return_value = []
+        ])
+        mock_file_manager.iter_image_tasks.return_value = iter([])
         mock_file_manager.scan_for_error_files.return_value = []
         mock_file_manager_class.return_value = mock_file_manager
 
@@ -111,17 +115,25 @@ class TestMain(unittest.TestCase):
         main.shutdown_requested = False
 
         # Test
-        main.process_directory()
+        main.process_directory(_args())
 
         # Verify components were created and used
         mock_file_manager_class.assert_called_once()
         mock_gemini_client_class.assert_called_once()
-        mock_image_processor_class.assert_called_once_with(mock_gemini_client)
+        mock_image_processor_class.assert_called_once_with(
+            mock_gemini_client, status_index=mock_file_manager.status_index, deduplicator=None, batch_size=1)
 
         # Verify processing was attempted
         mock_image_processor.process_images_batch.assert_called_once()
         mock_image_processor.log_stats.assert_called_once()
 
+        # A signal arriving during processing reaches the processor
+        shutdown_check = mock_image_processor.set_shutdown_check.call_args[0][0]
+        self.assertFalse(shutdown_check())
+        main.shutdown_requested = True
+        self.assertTrue(shutdown_check())
+        main.shutdown_requested = False
+
     @patch('main.FileManager')
     @patch('main.GeminiClient')
     @patch('main.ImageProcessor')
@@ -134,7 +146,7 @@ class TestMain(unittest.TestCase):
         mock_file_manager_class.return_value = mock_file_manager
 
         # Test
-        main.fix_error_files()
+        main.fix_error_files(_args())
 
         # Should log no errors found and return early
         mock_log.assert_any_call("✅ No error files found to fix.")
@@ -152,7 +164,7 @@ class TestMain(unittest.TestCase):
             {'input_path': 'error1.jpg', 'output_path': 'error1.txt'},
             {'input_path': 'error2.jpg', 'output_path': 'error2.txt'}
         ]
-        mock_file_manager.prepare_image_tasks.return_value = []
+        mock_file_manager.iter_image_tasks.return_value = iter([])
         mock_file_manager.scan_for_error_files.return_value = []
         mock_file_manager_class.return_value = mock_file_manager
 
@@ -169,7 +181,7 @@ class TestMain(unittest.TestCase):
         main.shutdown_requested = False
 
         # Test
-        main.fix_error_files()
+        main.fix_error_files(_args())
 
         # Verify processing was attempted
         mock_image_processor.process_images_batch.assert_called_once()
@@ -185,6 +197,10 @@ class TestMain(unittest.TestCase):
         # Setup mocks
         mock_args = Mock()
         mock_args.show_key_stats = True
+        mock_args.rebuild_status_index = False
+        mock_args.preprocess = False
+        mock_args.batch_size = 1
+        mock_args.no_prompt_cache = False
         mock_parse_args.return_value = mock_args
 
         mock_gemini_client = Mock()
@@ -207,9 +223,19 @@ class TestMain(unittest.TestCase):
         # Setup mocks
         mock_args = Mock()
         mock_args.show_key_stats = False
+        mock_args.rebuild_status_index = False
         mock_args.fix = True
         mock_args.max_workers = 5
         mock_args.retries = 10
+        mock_args.use_async = False
+        mock_args.concurrency = 256
+        mock_args.no_caption_cache = False
+        mock_args.preprocess = False
+        mock_args.batch_size = 1
+        mock_args.no_prompt_cache = False
+        mock_args.no_response_schema = False
+        mock_args.compact_captions = False
+        mock_args.profile = 'quality'
         mock_parse_args.return_value = mock_args
 
         # Reset shutdown flag
@@ -218,8 +244,8 @@ class TestMain(unittest.TestCase):
         # Test
         main.main()
 
-        # Should call fix_error_files
-        mock_fix_error_files.assert_called_once_with(max_workers=5, max_retries=10)
+        # Should call fix_error_files with the parsed settings
+        mock_fix_error_files.assert_called_once_with(mock_args)
 
     @patch('main.setup_signal_handlers')
     @patch('main.validate_api_keys')
@@ -231,11 +257,26 @@ class TestMain(unittest.TestCase):
         # Setup mocks
         mock_args = Mock()
         mock_args.show_key_stats = False
+        mock_args.rebuild_status_index = False
         mock_args.fix = False
         mock_args.max_workers = 5
         mock_args.no_retry_errors = False
         mock_args.retries = 10
         mock_args.key_rotation_delay = 1.5
+        mock_args.use_async = True
+        mock_args.concurrency = 512
+        mock_args.dedupe = True
+        mock_args.dedupe_threshold = 6
+        mock_args.no_caption_cache = True
+        mock_args.preprocess = True
+        mock_args.max_edge = 768
+        mock_args.image_format = 'webp'
+        mock_args.image_quality = 80
+        mock_args.batch_size = 4
+        mock_args.no_prompt_cache = True
+        mock_args.no_response_schema = True
+        mock_args.compact_captions = True
+        mock_args.profile = 'fast'
         mock_parse_args.return_value = mock_args
 
         # Reset shutdown flag
@@ -244,13 +285,51 @@ class TestMain(unittest.TestCase):
         # Test
         main.main()
 
-        # Should call process_directory
-        mock_process_directory.assert_called_once_with(
-            max_workers=5,
-            retry_errors=True,  # Should be inverted from no_retry_errors
-            max_retries=10,
-            key_rotation_delay=1.5
-        )
+        # Should call process_directory with the parsed settings
+        mock_process_directory.assert_called_once_with(mock_args)
+
+    @patch('main.GeminiClient')
+    def test_create_gemini_client_from_args(self, mock_gemini_client_class):
+        """Test the client is built from the command-line settings."""
+        args = _args('--async', '--concurrency', '512', '--no-caption-cache', '--preprocess', '--max-edge', '768',
+                     '--image-format', 'webp', '--image-quality', '80', '--no-prompt-cache',
+                     '--no-response-schema', '--compact-captions', '--profile', 'quality', '--cascade', 'fast')
+
+        with patch('logging.info'):
+            main.create_gemini_client(args)
+
+        mock_gemini_client_class.assert_called_once_with(async_concurrency=512, cache=None, preprocessor=ANY,
+                                                         prompt_cache=None, structured_output=False,
+                                                         compact=True, profile='quality', cascade=['fast'])
+        preprocessor = mock_gemini_client_class.call_args.kwargs['preprocessor']
+        self.assertEqual(preprocessor.fingerprint(), "preprocess:768:webp:80")
+
+    @patch('main.FileManager')
+    @patch('main.GeminiClient')
+    @patch('main.AsyncImageProcessor')
+    @patch('main.tqdm')
+    @patch('logging.info')
+    def test_process_directory_uses_args(self, mock_log, mock_tqdm, mock_async_processor_class,
+                                         mock_gemini_client_class, mock_file_manager_class):
+        """Test process_directory takes its workers, retries and processor settings from args."""
+        mock_file_manager = Mock()
+        mock_file_manager.load_checkpoint.return_value = set()
+        mock_file_manager.iter_pending_files.return_value = iter([{'input_path': 'input1.jpg'}])
+        mock_file_manager.scan_for_error_files.return_value = []
+        mock_file_manager_class.return_value = mock_file_manager
+        mock_image_processor = mock_async_processor_class.return_value
+        main.shutdown_requested = False
+
+        main.process_directory(_args('--async', '--concurrency', '64', '--batch-size', '4', '--max_workers', '3',
+                                     '--retries', '7', '--no-retry-errors', '--no-caption-cache',
+                                     '--no-prompt-cache'))
+
+        mock_async_processor_class.assert_called_once_with(mock_gemini_client_class.return_value, concurrency=64,
+                                                           status_index=mock_file_manager.status_index,
+                                                           deduplicator=None, batch_size=4)
+        self.assertFalse(mock_file_manager.iter_pending_files.call_args[0][1])
+        mock_image_processor.process_images_batch.assert_called_once_with(ANY, 3, 7)
+        mock_image_processor.close.assert_called_once()
 
     @patch('main.setup_signal_handlers')
     @patch('main.validate_api_keys')
@@ -263,7 +342,9 @@ class TestMain(unittest.TestCase):
         # Setup mocks
         mock_args = Mock()
         mock_args.show_key_stats = False
+        mock_args.rebuild_status_index = False
         mock_args.fix = False
+        mock_args.preprocess = False
         mock_parse_args.return_value = mock_args
 
         mock_process_directory.side_effect = KeyboardInterrupt()
@@ -286,7 +367,9 @@ class TestMain(unittest.TestCase):
         # Setup mocks
         mock_args = Mock()
         mock_args.show_key_stats = False
+        mock_args.rebuild_status_index = False
         mock_args.fix = False
+        mock_args.preprocess = False
         mock_parse_args.return_value = mock_args
 
         mock_process_directory.side_effect = Exception("Unexpected error")
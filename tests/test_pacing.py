@@ -0,0 +1,222 @@
+"""
+Unit tests for pacing module.
+"""
+
+import unittest
+import asyncio
+import os
+import time
+import threading
+from unittest.mock import Mock, patch
+
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from google.genai import types
+
+from src.pacing import TokenBucket, KeyBudget, QuotaDispatcher
+from src.gemini_client import GeminiClient
+
+
+class TestTokenBucket(unittest.TestCase):
+    """Test TokenBucket class."""
+
+    def test_burst_then_queue(self):
+        """Test a full bucket serves its burst, then waits grow by one interval each."""
+        with patch('src.pacing.time.monotonic', return_value=100.0):
+            bucket = TokenBucket(per_minute=120, burst_seconds=1.0)
+            delays = [bucket.take(1, 100.0) for _ in range(5)]
+
+        self.assertEqual(bucket.capacity, 2.0)
+        self.assertEqual(delays, [0.0, 0.0, 0.5, 1.0, 1.5])
+
+    def test_refill_is_capped(self):
+        """Test a long idle period banks at most ``capacity``."""
+        with patch('src.pacing.time.monotonic', return_value=100.0):
+            bucket = TokenBucket(per_minute=60, burst_seconds=1.0)
+        bucket.take(1, 100.0)
+
+        self.assertEqual(bucket.wait_time(1, 100.0), 1.0)
+        self.assertEqual(bucket.wait_time(1, 1000.0), 0.0)
+        self.assertEqual([bucket.take(1, 1000.0) for _ in range(2)], [0.0, 1.0])
+
+    def test_give_back_and_drain(self):
+        """Test refunds restore budget and drain blocks for the given time."""
+        with patch('src.pacing.time.monotonic', return_value=0.0):
+            bucket = TokenBucket(per_minute=6000, burst_seconds=1.0)
+
+        self.assertEqual(bucket.take(150, 0.0), 0.5)
+        bucket.give_back(100, 0.0)
+        self.assertEqual(bucket.wait_time(100, 0.0), 0.5)
+        bucket.drain(3.0, 0.0)
+        self.assertEqual(bucket.wait_time(0, 0.0), 3.0)
+
+    def test_unlimited(self):
+        """Test a rate of 0 never waits."""
+        bucket = TokenBucket(per_minute=0)
+        self.assertEqual([bucket.take(10 ** 6, 0.0) for _ in range(3)], [0.0, 0.0, 0.0])
+        self.assertEqual(bucket.wait_time(10 ** 6, 0.0), 0.0)
+
+
+class TestKeyBudget(unittest.TestCase):
+    """Test KeyBudget class."""
+
+    def test_tighter_quota_binds(self):
+        """Test the token quota limits requests when it is the tighter one."""
+        budget = KeyBudget(rpm=600, tpm=60_000, estimated_tokens=2000, burst_seconds=0)
+
+        delays = [budget.reserve()[0] for _ in range(3)]
+
+        self.assertAlmostEqual(delays[1] - delays[0], 2.0, places=2)
+        self.assertAlmostEqual(delays[2] - delays[1], 2.0, places=2)
+        self.assertAlmostEqual(budget.effective_rpm(), 30.0)
+        self.assertEqual(KeyBudget(rpm=0, tpm=0).effective_rpm(), float('inf'))
+
+    def test_settle_updates_estimate_and_refunds(self):
+        """Test settling refunds over-reserved tokens and refines the estimate."""
+        budget = KeyBudget(rpm=0, tpm=60_000, estimated_tokens=3000, burst_seconds=0)
+
+        _, reserved = budget.reserve()
+        budget.settle(reserved, 1000)
+        budget.settle(reserved, None)
+        budget.settle(reserved, Mock())
+
+        self.assertEqual(reserved, 3000)
+        self.assertAlmostEqual(budget.estimated_tokens, 2800)
+        # 2000 of the 3000 reserved tokens came back
+        self.assertAlmostEqual(budget.tokens.wait_time(0, budget.tokens.updated), 1.0, places=2)
+        for _ in range(100):
+            budget.settle(1000, 1000)
+        self.assertAlmostEqual(budget.effective_rpm(), 60.0, delta=0.1)
+
+    def test_threads_release_at_quota_rate(self):
+        """Test concurrent callers are released at the configured rate."""
+        budget = KeyBudget(rpm=1200, tpm=0, burst_seconds=0)
+        released = []
+        lock = threading.Lock()
+
+        def call():
+            delay, _ = budget.reserve()
+            time.sleep(delay)
+            with lock:
+                released.append(time.monotonic())
+
+        threads = [threading.Thread(target=call) for _ in range(11)]
+        start = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertGreaterEqual(max(released) - start, 0.5 - 0.02)
+        self.assertLess(max(released) - start, 1.0)
+
+
+class TestQuotaDispatcher(unittest.TestCase):
+    """Test QuotaDispatcher class."""
+
+    def test_prefers_key_with_budget(self):
+        """Test requests stay on the preferred key until its budget runs out."""
+        dispatcher = QuotaDispatcher([KeyBudget(rpm=120, tpm=0) for _ in range(3)])
+
+        keys = []
+        preferred = 0
+        for _ in range(6):
+            key_index, delay, _ = dispatcher.acquire(preferred)
+            self.assertEqual(delay, 0.0)
+            keys.append(key_index)
+            preferred = key_index
+
+        self.assertEqual(keys, [0, 0, 1, 1, 2, 2])
+        key_index, delay, _ = dispatcher.acquire(preferred)
+        self.assertGreater(delay, 0.0)
+
+    def test_paused_key_is_skipped(self):
+        """Test a key paused after a 429 gets no requests."""
+        budgets = [KeyBudget(rpm=60, tpm=0) for _ in range(2)]
+        dispatcher = QuotaDispatcher(budgets)
+        budgets[0].pause(30)
+
+        self.assertEqual(dispatcher.acquire(0)[0], 1)
+
+
+class TestGeminiClientDispatch(unittest.TestCase):
+    """Test GeminiClient integration with the quota dispatcher."""
+
+    def _response(self, total_tokens=2000):
+        mock_candidate = Mock()
+        mock_candidate.finish_reason = types.FinishReason.STOP
+        mock_candidate.content.parts = [Mock(text="Test response")]
+        response = Mock(candidates=[mock_candidate])
+        response.usage_metadata.total_token_count = total_tokens
+        return response
+
+    @patch('src.gemini_client.genai.Client')
+    def test_requests_follow_key_budget(self, mock_genai_client):
+        """Test requests move to the next key once the current key's budget is spent."""
+        mock_genai_client.return_value.models.generate_content.return_value = self._response()
+
+        with patch('logging.info'):
+            client = GeminiClient(api_keys=['test_key_1', 'test_key_2'], rpm=60, tpm=0)
+
+        with patch('src.gemini_client.time.sleep') as mock_sleep:
+            for i in range(3):
+                client.process_image_bytes(b"data", f"{i}.jpg", max_retries=0)
+
+        self.assertEqual(client.key_stats[0]['requests'] + client.key_stats[1]['requests'], 3)
+        self.assertGreaterEqual(client.key_stats[1]['requests'], 1)
+        mock_sleep.assert_called_once()
+        self.assertAlmostEqual(mock_sleep.call_args.args[0], 1.0, delta=0.05)
+        api_keys = [c.kwargs['api_key'] for c in mock_genai_client.call_args_list]
+        self.assertEqual(api_keys[:2], ['test_key_1', 'test_key_2'])
+
+    @patch('src.gemini_client.genai.Client')
+    def test_usage_feeds_pacing_stats(self, mock_genai_client):
+        """Test response token counts refine the key's effective rate."""
+        mock_genai_client.return_value.models.generate_content.return_value = self._response(2000)
+
+        with patch('logging.info'):
+            client = GeminiClient(api_keys=['test_key_1'], rpm=0, tpm=100_000)
+        client.process_image_bytes(b"data", "a.jpg", max_retries=0)
+
+        stats = client.pacing_stats()
+        self.assertEqual(stats[0]['tokens_per_request'], 2900)
+        self.assertAlmostEqual(stats[0]['effective_rpm'], 100_000 / 2900, places=3)
+
+    @patch('src.gemini_client.genai.Client')
+    def test_rate_limit_pauses_key(self, mock_genai_client):
+        """Test a 429 pauses the key so the retry goes to another key."""
+        generate = mock_genai_client.return_value.models.generate_content
+        generate.side_effect = [Exception("429 RESOURCE_EXHAUSTED"), self._response()]
+
+        with patch('logging.info'), patch('logging.warning'):
+            client = GeminiClient(api_keys=['test_key_1', 'test_key_2'], rpm=1000, tpm=0)
+            result = client.process_image_bytes(b"data", "a.jpg", max_retries=1, key_rotation_delay=0)
+
+        self.assertEqual(result, "Test response")
+        self.assertEqual(client.key_stats[0]['rate_limits'], 1)
+        self.assertEqual(client.key_stats[1]['requests'], 1)
+        self.assertGreater(client.budgets[0].wait_time(), 5)
+
+    @patch('src.gemini_client.genai.Client')
+    def test_failed_request_releases_tokens(self, mock_genai_client):
+        """Test a request that raises gives its token reservation back."""
+        async def fail_async(request, key_index):
+            raise Exception("500 Internal Server Error")
+
+        mock_genai_client.return_value.models.generate_content.side_effect = Exception("500 Internal Server Error")
+
+        with patch('logging.info'):
+            client = GeminiClient(api_keys=['test_key_1'], rpm=0, tpm=60_000)
+        tokens = client.budgets[0].tokens
+
+        with patch('logging.error'), patch('logging.warning'):
+            client.process_image_bytes(b"data", "a.jpg", max_retries=0)
+            self.assertAlmostEqual(tokens.level, tokens.capacity)
+            with patch.object(client, '_send_async', side_effect=fail_async):
+                asyncio.run(client.process_image_bytes_async(b"data", "b.jpg", max_retries=0))
+            self.assertAlmostEqual(tokens.level, tokens.capacity)
+
+
+if __name__ == '__main__':
+    unittest.main()
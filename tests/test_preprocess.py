@@ -0,0 +1,207 @@
+"""
+Unit tests for preprocess module.
+"""
+
+import unittest
+import asyncio
+import base64
+import io
+import os
+import random
+from unittest.mock import patch
+
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from PIL import Image, ImageDraw
+from google.genai import types
+
+from src.preprocess import detect_mime_type, estimate_image_tokens, preprocess_image, ImagePreprocessor
+from src.gemini_client import GeminiClient
+from tests.fake_gemini import FakeGeminiServer, DEFAULT_CAPTION, without_metadata
+
+
+def _encode(image, image_format, **params):
+    buffer = io.BytesIO()
+    image.save(buffer, image_format, **params)
+    return buffer.getvalue()
+
+
+def _photo(size=(1920, 1080), mode='RGB'):
+    """A noisy frame that compresses like a photo."""
+    rnd = random.Random(size[0])
+    image = Image.merge(mode, [Image.effect_noise(size, 64) for _ in mode])
+    draw = ImageDraw.Draw(image)
+    for _ in range(200):
+        x, y = rnd.randrange(size[0]), rnd.randrange(size[1])
+        draw.rectangle([x, y, x + rnd.randrange(10, 200), y + rnd.randrange(10, 200)],
+                       fill=tuple(rnd.randrange(256) for _ in mode))
+    return image
+
+
+class TestPreprocessHelpers(unittest.TestCase):
+    """Test MIME detection and token estimates."""
+
+    def test_detect_mime_type(self):
+        """Test the type comes from the bytes, not the extension."""
+        image = Image.new('RGB', (8, 8))
+        self.assertEqual(detect_mime_type(_encode(image, 'PNG'), 'frame.jpg'), 'image/png')
+        self.assertEqual(detect_mime_type(_encode(image, 'JPEG'), 'frame.png'), 'image/jpeg')
+        self.assertEqual(detect_mime_type(_encode(image, 'GIF')), 'image/gif')
+        self.assertEqual(detect_mime_type(_encode(image, 'BMP')), 'image/bmp')
+        self.assertEqual(detect_mime_type(_encode(image, 'WEBP')), 'image/webp')
+        self.assertEqual(detect_mime_type(b'????', 'frame.png'), 'image/png')
+        self.assertEqual(detect_mime_type(b'????'), 'image/jpeg')
+
+    def test_estimate_image_tokens(self):
+        """Test small images are one tile and larger ones are billed per 768px tile."""
+        self.assertEqual(estimate_image_tokens(384, 200), 258)
+        self.assertEqual(estimate_image_tokens(768, 432), 258)
+        self.assertEqual(estimate_image_tokens(1024, 576), 516)
+        self.assertEqual(estimate_image_tokens(1920, 1080), 1548)
+
+
+class TestPreprocessImage(unittest.TestCase):
+    """Test preprocess_image function."""
+
+    def test_downscales_and_reencodes(self):
+        """Test a large PNG comes back as a smaller JPEG within the max edge."""
+        original = _encode(_photo(), 'PNG')
+
+        data, mime_type, original_size, new_size = preprocess_image(original, max_edge=1024)
+
+        self.assertEqual(mime_type, 'image/jpeg')
+        self.assertEqual((original_size, new_size), ((1920, 1080), (1024, 576)))
+        self.assertLess(len(data), len(original))
+        with Image.open(io.BytesIO(data)) as image:
+            self.assertEqual((image.format, image.size), ('JPEG', (1024, 576)))
+
+    def test_jpeg_source_downscaled(self):
+        """Test a large JPEG, decoded at reduced scale, still comes out at the max edge."""
+        original = _encode(_photo(), 'JPEG', quality=95)
+
+        _, mime_type, _, new_size = preprocess_image(original, max_edge=400)
+
+        self.assertEqual((mime_type, new_size), ('image/jpeg', (400, 225)))
+
+    def test_webp_with_alpha(self):
+        """Test transparent images are flattened before encoding to WebP."""
+        original = _encode(_photo((800, 600), mode='RGBA'), 'PNG')
+
+        data, mime_type, _, new_size = preprocess_image(original, max_edge=400, image_format='webp')
+
+        self.assertEqual((mime_type, new_size), ('image/webp', (400, 300)))
+        with Image.open(io.BytesIO(data)) as image:
+            self.assertEqual((image.format, image.mode), ('WEBP', 'RGB'))
+
+    def test_keeps_smaller_original(self):
+        """Test an already small, compact image is sent unchanged, but unsupported formats never are."""
+        small_jpeg = _encode(_photo((640, 360)), 'JPEG', quality=40)
+        self.assertEqual(preprocess_image(small_jpeg, quality=95)[:2], (small_jpeg, 'image/jpeg'))
+
+        tiny_gif = _encode(Image.new('RGB', (16, 16)), 'GIF')
+        data, mime_type, _, _ = preprocess_image(tiny_gif, quality=95)
+        self.assertNotEqual(data, tiny_gif)
+        self.assertEqual(mime_type, 'image/jpeg')
+
+
+class TestImagePreprocessor(unittest.TestCase):
+    """Test ImagePreprocessor class."""
+
+    def setUp(self):
+        """Set up test fixtures."""
+        self.preprocessor = ImagePreprocessor(max_edge=768, workers=1)
+
+    def tearDown(self):
+        """Clean up test fixtures."""
+        self.preprocessor.close()
+
+    def test_prepare_records_savings(self):
+        """Test images are processed in the pool and bytes and tokens saved are tallied."""
+        original = _encode(_photo(), 'PNG')
+
+        data, mime_type = self.preprocessor.prepare(original, 'frame.png')
+        async_data, _ = asyncio.run(self.preprocessor.prepare_async(original, 'frame.png'))
+
+        self.assertEqual(mime_type, 'image/jpeg')
+        self.assertEqual(async_data, data)
+        stats = self.preprocessor.stats
+        self.assertEqual((stats['images'], stats['tokens_in'], stats['tokens_out']), (2, 2 * 1548, 2 * 258))
+        self.assertEqual(stats['bytes_out'], 2 * len(data))
+        with patch('logging.info') as mock_log:
+            self.preprocessor.log_stats()
+        self.assertIn("~1290 input tokens per image", mock_log.call_args[0][0])
+
+    def test_undecodable_image_sent_unchanged(self):
+        """Test bytes Pillow cannot read fall back to the original with a detected type."""
+        with patch('logging.warning'):
+            result = self.preprocessor.prepare(b'\x89PNG\r\n\x1a\nbroken', 'broken.png')
+
+        self.assertEqual(result, (b'\x89PNG\r\n\x1a\nbroken', 'image/png'))
+        self.assertEqual(self.preprocessor.stats['failed'], 1)
+
+    def test_rejects_unknown_format(self):
+        """Test only JPEG and WebP are accepted as targets."""
+        with self.assertRaises(ValueError):
+            ImagePreprocessor(image_format='png')
+
+
+class TestGeminiClientPreprocessing(unittest.TestCase):
+    """Test GeminiClient sends preprocessed bytes with the right MIME type."""
+
+    def setUp(self):
+        """Set up test fixtures."""
+        self.server = FakeGeminiServer().start()
+
+    def tearDown(self):
+        """Clean up test fixtures."""
+        self.server.stop()
+
+    def _client(self, preprocessor=None):
+        with patch('logging.info'):
+            return GeminiClient(api_keys=['test_key_1'], rpm=0, tpm=0, preprocessor=preprocessor,
+                                http_options=types.HttpOptions(base_url=self.server.base_url))
+
+    def _sent(self, index=0):
+        return self.server.requests[index]['body']['contents'][0]['parts'][1]['inlineData']
+
+    def test_mime_type_detected_without_preprocessing(self):
+        """Test a PNG is no longer labelled as JPEG."""
+        png = _encode(Image.new('RGB', (8, 8)), 'PNG')
+
+        with patch('logging.info'):
+            self._client().process_image_bytes(png, 'frame.png', max_retries=0)
+
+        self.assertEqual(self._sent()['mime_type'], 'image/png')
+
+    def test_preprocessed_bytes_sent(self):
+        """Test the re-encoded image is sent and the cache fingerprint covers the settings."""
+        preprocessor = ImagePreprocessor(max_edge=512, image_format='webp', workers=1)
+        self.addCleanup(preprocessor.close)
+        client = self._client(preprocessor)
+
+        with patch('logging.info'):
+            caption = client.process_image_bytes(_encode(_photo(), 'PNG'), 'frame.png', max_retries=0)
+
+        self.assertEqual(without_metadata(caption), DEFAULT_CAPTION)
+        sent = self._sent()
+        self.assertEqual(sent['mime_type'], 'image/webp')
+        with Image.open(io.BytesIO(base64.urlsafe_b64decode(sent['data'] + '=='))) as image:
+            self.assertEqual(image.size, (512, 288))
+        self.assertNotEqual(client.request_fingerprint, self._client().request_fingerprint)
+
+    def test_close_shuts_down_pool(self):
+        """Test closing the client shuts down the preprocessing pool."""
+        preprocessor = ImagePreprocessor(workers=1)
+        client = self._client(preprocessor)
+        with patch('logging.info'):
+            client.process_image_bytes(_encode(_photo(), 'PNG'), 'frame.png', max_retries=0)
+        self.assertIsNotNone(preprocessor._pool)
+
+        client.close()
+
+        self.assertIsNone(preprocessor._pool)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+"""
+Unit tests for generation profiles and the profile benchmark.
+"""
+
+import unittest
+import json
+import os
+import shutil
+import tempfile
+from unittest.mock import patch
+
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from google.genai import types
+
+from benchmark_profiles import load_sample, run_profile
+from src.gemini_client import GeminiClient
+from tests.fake_gemini import FakeGeminiServer
+
+
+class TestGenerationProfiles(unittest.TestCase):
+    """Test each profile's model and generation settings reach the request and the output."""
+
+    def _client(self, server, profile):
+        with patch('logging.info'):
+            return GeminiClient(api_keys=['test_key_1'], rpm=0, tpm=0, profile=profile,
+                                http_options=types.HttpOptions(base_url=server.base_url))
+
+    def test_fast_profile_request(self):
+        """Test the fast profile's model, thinking budget, output limit and temperature are sent."""
+        with FakeGeminiServer() as server:
+            result = self._client(server, 'fast').process_image_bytes(b"image", "V001/1.jpg", max_retries=0)
+
+        request = server.requests[0]
+        self.assertIn("models/gemini-2.5-flash-lite:generateContent", request['path'])
+        config = request['body']['generationConfig']
+        self.assertEqual(list(config['thinkingConfig'].values()), [0])
+        self.assertEqual(config['maxOutputTokens'], 2048)
+        self.assertEqual(config['temperature'], 0.2)
+        self.assertEqual(json.loads(result)['metadata'], {'profile': 'fast', 'model': 'gemini-2.5-flash-lite'})
+
+    def test_quality_profile_keeps_model_defaults(self):
+        """Test the quality profile sends no generation overrides."""
+        with FakeGeminiServer() as server:
+            self._client(server, 'quality').process_image_bytes(b"image", "V001/1.jpg", max_retries=0)
+
+        config = server.requests[0]['body'].get('generationConfig', {})
+        for setting in ('thinkingConfig', 'maxOutputTokens', 'temperature'):
+            self.assertNotIn(setting, config)
+
+    def test_batch_output_limit_scales(self):
+        """Test a batched request allows the per-image output limit for every frame."""
+        server = FakeGeminiServer()
+        try:
+            client = self._client(server, 'balanced')
+        finally:
+            server.httpd.server_close()
+
+        request = client._build_batch_request([(b"a", "image/jpeg")] * 3)
+
+        self.assertEqual(request['config'].max_output_tokens, 3 * 4096)
+
+    def test_profiles_cached_separately(self):
+        """Test captions of different profiles do not share cache entries."""
+        server = FakeGeminiServer()
+        try:
+            fingerprints = {self._client(server, profile).request_fingerprint
+                            for profile in ('fast', 'balanced', 'quality')}
+        finally:
+            server.httpd.server_close()
+
+        self.assertEqual(len(fingerprints), 3)
+
+
+class TestProfileBenchmark(unittest.TestCase):
+    """Test the profile benchmark against a fake server."""
+
+    def setUp(self):
+        """Set up test fixtures."""
+        self.temp_dir = tempfile.mkdtemp()
+        for video in ("V001", "V002"):
+            os.makedirs(os.path.join(self.temp_dir, video))
+            for i in range(4):
+                with open(os.path.join(self.temp_dir, video, f"{i}.jpg"), 'wb') as f:
+                    f.write(b"image")
+
+    def tearDown(self):
+        """Clean up test fixtures."""
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_load_sample(self):
+        """Test the sample is fixed and spread over the directory."""
+        images = load_sample(self.temp_dir, 4)
+
+        self.assertEqual([os.path.relpath(path, self.temp_dir) for _, path in images],
+                         ["V001/0.jpg", "V001/2.jpg", "V002/0.jpg", "V002/2.jpg"])
+        self.assertEqual(images, load_sample(self.temp_dir, 4))
+
+    def test_run_profile(self):
+        """Test a run reports latency and tokens per image."""
+        images = load_sample(self.temp_dir, 3)
+        with FakeGeminiServer() as server:
+            row = run_profile('fast', images, 0, ['test_key_1'], types.HttpOptions(base_url=server.base_url),
+                              structured_output=False)
+
+        self.assertEqual(row['model'], 'gemini-2.5-flash-lite')
+        self.assertEqual((row['images'], row['failures']), (3, 0))
+        self.assertEqual((row['prompt_tokens'], row['output_tokens']), (1800, 250))
+        self.assertLessEqual(row['p50_latency'], row['p95_latency'])
+
+
+if __name__ == '__main__':
+    unittest.main()
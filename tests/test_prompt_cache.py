@@ -0,0 +1,147 @@
+"""
+Unit tests for prompt_cache module.
+"""
+
+import unittest
+import asyncio
+import json
+import os
+from unittest.mock import Mock, patch
+
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from google.genai import types
+
+from src.config import PROMPT
+from src.gemini_client import GeminiClient
+from src.prompt_cache import PromptCache, is_cache_error
+from tests.fake_gemini import FakeGeminiServer
+
+
+class FakeClock:
+    """Manually advanced clock."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestPromptCache(unittest.TestCase):
+    """Test creating, extending and backing off prompt cache handles."""
+
+    def setUp(self):
+        """Set up test fixtures."""
+        self.clock = FakeClock()
+        self.cache = PromptCache(ttl_seconds=600, refresh_margin=60, retry_seconds=300, clock=self.clock)
+        self.client = Mock()
+        self.client.caches.create.return_value = Mock()
+        self.client.caches.create.return_value.name = "cachedContents/abc"
+
+    def test_create_and_reuse(self):
+        """Test a handle is created once per key and model and then reused."""
+        with patch('logging.info'):
+            self.assertEqual(self.cache.handle(self.client, 0, "m"), "cachedContents/abc")
+            self.assertEqual(self.cache.handle(self.client, 0, "m"), "cachedContents/abc")
+            self.cache.handle(self.client, 1, "m")
+
+        self.assertEqual(self.client.caches.create.call_count, 2)
+        config = self.client.caches.create.call_args.kwargs['config']
+        self.assertEqual(config.contents[0].parts[0].text, PROMPT)
+        self.assertEqual(config.ttl, "600s")
+
+    def test_refresh_before_expiry(self):
+        """Test a handle close to expiry is extended, and an expired one is recreated."""
+        with patch('logging.info'):
+            self.cache.handle(self.client, 0, "m")
+            self.clock.now += 580
+            self.assertIsNone(self.cache.current(0, "m"))
+            self.assertEqual(self.cache.handle(self.client, 0, "m"), "cachedContents/abc")
+            self.clock.now += 1000
+            self.cache.handle(self.client, 0, "m")
+
+        self.client.caches.update.assert_called_once()
+        self.assertEqual(self.client.caches.create.call_count, 2)
+        self.assertEqual(self.cache.stats['refreshed'], 1)
+
+    def test_failure_backs_off(self):
+        """Test a failed creation falls back to inline prompts until the retry delay passes."""
+        self.client.caches.create.side_effect = Exception("400 INVALID_ARGUMENT. Cached content is too small")
+
+        with patch('logging.warning'):
+            self.assertIsNone(self.cache.handle(self.client, 0, "m"))
+            self.assertIsNone(self.cache.handle(self.client, 0, "m"))
+            self.assertEqual(self.client.caches.create.call_count, 1)
+            self.clock.now += 301
+            self.cache.handle(self.client, 0, "m")
+
+        self.assertEqual(self.client.caches.create.call_count, 2)
+        self.assertEqual(self.cache.stats['failures'], 2)
+
+    def test_is_cache_error(self):
+        """Test cache errors are told apart from other failures."""
+        self.assertTrue(is_cache_error("404 NOT_FOUND. CachedContent not found (or permission denied)"))
+        self.assertFalse(is_cache_error("429 RESOURCE_EXHAUSTED"))
+
+
+class TestGeminiClientPromptCache(unittest.TestCase):
+    """Test GeminiClient sends the cached prompt reference against a fake server."""
+
+    def _client(self, server):
+        with patch('logging.info'):
+            return GeminiClient(api_keys=['test_key_1'], rpm=0, tpm=0, prompt_cache=PromptCache(),
+                                http_options=types.HttpOptions(base_url=server.base_url))
+
+    def _generate_requests(self, server):
+        return [request['body'] for request in server.requests if ':generateContent' in request['path']]
+
+    def test_requests_reference_cached_prompt(self):
+        """Test the prompt is cached once and left out of every request."""
+        with FakeGeminiServer() as server:
+            client = self._client(server)
+            with patch('logging.info'):
+                client.process_image_bytes(b"image-1", "V001/1.jpg", max_retries=0)
+                asyncio.run(client.process_image_bytes_async(b"image-2", "V001/2.jpg", max_retries=0))
+
+        self.assertEqual(len(server.cached_contents), 1)
+        requests = self._generate_requests(server)
+        self.assertEqual(len(requests), 2)
+        for body in requests:
+            self.assertEqual(body['cachedContent'], "cachedContents/fake-1")
+            self.assertNotIn(PROMPT, json.dumps(body, ensure_ascii=False))
+        self.assertEqual(client.usage['cached_tokens'], 3000)
+
+        with patch('logging.info') as mock_log:
+            client.log_key_stats()
+        usage_line = next(c.args[0] for c in mock_log.call_args_list if 'Prompt usage' in c.args[0])
+        self.assertIn("(1500 cached, ", usage_line)
+
+    def test_inline_fallback(self):
+        """Test requests carry the prompt when caching is refused or the handle is gone."""
+        with FakeGeminiServer(cache_supported=False) as server:
+            client = self._client(server)
+            with patch('logging.warning'), patch('logging.info'):
+                result = client.process_image_bytes(b"image-1", "V001/1.jpg", max_retries=0)
+
+        self.assertTrue(result.ok)
+        body = self._generate_requests(server)[0]
+        self.assertNotIn('cachedContent', body)
+        self.assertEqual(body['contents'][0]['parts'][0]['text'], PROMPT)
+
+        with FakeGeminiServer() as server:
+            client = self._client(server)
+            with patch('logging.info'):
+                client.process_image_bytes(b"image-1", "V001/1.jpg", max_retries=0)
+            server.cached_contents.clear()
+            with patch('logging.warning'), patch('logging.info'):
+                result = client.process_image_bytes(b"image-2", "V001/2.jpg", max_retries=0)
+
+        self.assertTrue(result.ok)
+        self.assertNotIn('cachedContent', self._generate_requests(server)[-1])
+        self.assertEqual(client.prompt_cache.stats['invalidated'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
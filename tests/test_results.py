@@ -0,0 +1,73 @@
+"""
+Unit tests for results module.
+"""
+
+import unittest
+import json
+import os
+
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.results import (
+    CaptionResult, ERROR_MARKER, RATE_LIMITED, SAFETY_BLOCKED, EMPTY_OUTPUT, LEGACY_ERROR
+)
+
+
+class TestCaptionResult(unittest.TestCase):
+    """Test CaptionResult class."""
+
+    def test_success_is_plain_text(self):
+        """Test a caption result behaves as its text."""
+        result = CaptionResult.success('{"caption": "Một biển báo ghi ERROR"}')
+
+        self.assertEqual(result, '{"caption": "Một biển báo ghi ERROR"}')
+        self.assertTrue(result.ok)
+        self.assertFalse(result.terminal)
+
+    def test_failure_carries_marker(self):
+        """Test error outputs start with the marker and keep the legacy error key."""
+        result = CaptionResult.failure(RATE_LIMITED, "All API keys rate limited")
+
+        self.assertTrue(result.startswith(ERROR_MARKER))
+        self.assertEqual(json.loads(result)['error'], "All API keys rate limited")
+        self.assertTrue(result.retryable)
+        self.assertTrue(CaptionResult.failure(SAFETY_BLOCKED, "blocked").terminal)
+
+    def test_propagated_carries_marker(self):
+        """Test copied captions name their source frame and keep the caption fields."""
+        fenced = '```json\n{"caption": "Một biển báo", "objects": ["sign"]}\n```'
+        result = CaptionResult.propagated(fenced, "K01/V001/00000010.jpg")
+
+        self.assertTrue(result.startswith('{"propagated_from": "K01/V001/00000010.jpg"'))
+        self.assertEqual(json.loads(result)['objects'], ["sign"])
+        parsed = CaptionResult.parse(str(result))
+        self.assertTrue(parsed.ok)
+        self.assertEqual(parsed.propagated_from, "K01/V001/00000010.jpg")
+        self.assertEqual(json.loads(CaptionResult.propagated("plain text", "a.jpg"))['caption'], "plain text")
+
+    def test_parse_round_trip(self):
+        """Test written error outputs are classified from their marker."""
+        parsed = CaptionResult.parse(str(CaptionResult.failure(SAFETY_BLOCKED, "blocked")))
+
+        self.assertEqual(parsed.error_code, SAFETY_BLOCKED)
+        self.assertFalse(parsed.retryable)
+
+    def test_parse_captions_mentioning_error(self):
+        """Test JSON captions are not flagged because their text mentions an error."""
+        caption = json.dumps({"text_elements": {"scene_text": {"signs": ["ERROR 500"]}},
+                              "caption": "Màn hình hiện chữ error"})
+
+        self.assertTrue(CaptionResult.parse(caption).ok)
+        self.assertTrue(CaptionResult.parse("```json\n" + caption + "\n```").ok)
+
+    def test_parse_legacy_outputs(self):
+        """Test outputs written before the marker are still recognised."""
+        self.assertEqual(CaptionResult.parse(json.dumps({"error": "boom"})).error_code, LEGACY_ERROR)
+        self.assertEqual(CaptionResult.parse("Max retries exceeded").error_code, LEGACY_ERROR)
+        self.assertEqual(CaptionResult.parse("").error_code, EMPTY_OUTPUT)
+        self.assertTrue(CaptionResult.parse("Normal response content").ok)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+"""
+Unit tests for s3_client module, run against the in-memory S3 stand-in.
+"""
+
+import unittest
+import os
+import time
+from unittest.mock import patch
+
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.s3_client import S3Client
+from tests.fake_s3 import FakeS3
+
+
+def make_bucket(latency=0.0, batches=3, videos=4, frames=1500):
+    """Create a fake bucket laid out as frames/Kxx/Vyyy/nnnnnnnn.jpg."""
+    fake_s3 = FakeS3(latency=latency)
+    for k in range(1, batches + 1):
+        for v in range(1, videos + 1):
+            for f in range(frames):
+                fake_s3.put(f"frames/K{k:02d}/V{v:03d}/{f:08d}.jpg")
+    fake_s3.put("frames/K01/notes.txt")
+    fake_s3.put("frames/top_level.png")
+    return fake_s3
+
+
+class TestS3ClientListing(unittest.TestCase):
+    """Test prefix-partitioned listing."""
+
+    def _client(self, fake_s3):
+        with patch('src.s3_client.boto3.client', return_value=fake_s3), patch('logging.info'):
+            return S3Client()
+
+    def test_list_all_images_matches_inventory(self):
+        """Test parallel listing returns every image exactly once."""
+        fake_s3 = make_bucket(batches=2, videos=3, frames=1200)
+        s3_client = self._client(fake_s3)
+
+        with patch('logging.info'):
+            images = s3_client.list_all_images(max_workers=8)
+
+        expected = sorted(k for k in fake_s3.objects
+                          if k.startswith("frames/") and k.endswith(('.jpg', '.png')))
+        self.assertEqual(images, expected)
+        self.assertIn("frames/top_level.png", images)
+        self.assertNotIn("frames/K01/notes.txt", images)
+
+    def test_iter_images_streams(self):
+        """Test keys are yielded before the whole listing completes."""
+        fake_s3 = make_bucket(latency=0.01, batches=2, videos=2, frames=3000)
+        s3_client = self._client(fake_s3)
+
+        stream = s3_client.iter_images(max_workers=4)
+        first = next(stream)
+        calls_at_first_key = fake_s3.calls['list_objects_v2']
+        stream.close()
+
+        self.assertTrue(first.startswith("frames/"))
+        self.assertLess(calls_at_first_key, 1 + 2 + 4 * 3)
+
+    def test_listing_error_propagates(self):
+        """Test a failing prefix listing surfaces to the caller."""
+        fake_s3 = make_bucket(batches=1, videos=2, frames=10)
+        s3_client = self._client(fake_s3)
+        original = fake_s3.list_objects_v2
+
+        def failing_list(**kwargs):
+            if kwargs['Prefix'] == "frames/K01/V002/":
+                raise RuntimeError("listing failed")
+            return original(**kwargs)
+
+        fake_s3.list_objects_v2 = failing_list
+        with self.assertRaises(RuntimeError):
+            list(s3_client.iter_images(max_workers=2))
+
+    def test_parallel_listing_throughput(self):
+        """Test concurrent prefix listing beats a single listing chain."""
+        fake_s3 = make_bucket(latency=0.005)
+        s3_client = self._client(fake_s3)
+
+        start = time.time()
+        serial = list(s3_client.iter_images(max_workers=1))
+        serial_elapsed = time.time() - start
+
+        start = time.time()
+        parallel = list(s3_client.iter_images(max_workers=16))
+        parallel_elapsed = time.time() - start
+
+        self.assertEqual(sorted(serial), sorted(parallel))
+        self.assertLess(parallel_elapsed, serial_elapsed)
+
+
+if __name__ == '__main__':
+    unittest.main()
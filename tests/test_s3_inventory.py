@@ -0,0 +1,103 @@
+"""
+Unit tests for s3_inventory module, run against the in-memory S3 stand-in.
+"""
+
+import unittest
+import os
+import shutil
+import tempfile
+from unittest.mock import patch
+
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.s3_client import S3Client
+from src.s3_inventory import InventoryManifest
+from tests.test_s3_client import make_bucket
+
+
+class TestInventoryManifest(unittest.TestCase):
+    """Test InventoryManifest class."""
+
+    def setUp(self):
+        """Set up test fixtures."""
+        self.temp_dir = tempfile.mkdtemp()
+        self.manifest_file = os.path.join(self.temp_dir, 'inventory.tsv.gz')
+        self.fake_s3 = make_bucket(batches=2, videos=3, frames=1200)
+        with patch('src.s3_client.boto3.client', return_value=self.fake_s3), patch('logging.info'):
+            self.s3_client = S3Client()
+
+    def tearDown(self):
+        """Clean up test fixtures."""
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def _expected_images(self):
+        return sorted(k for k in self.fake_s3.objects
+                      if k.startswith("frames/") and k.endswith(('.jpg', '.png')))
+
+    def test_build(self):
+        """Test a full build captures keys, sizes and ETags."""
+        self.fake_s3.put("frames/K01/V001/00000000.jpg", b"12345")
+
+        manifest = InventoryManifest.build(self.s3_client)
+
+        self.assertEqual(manifest.image_keys(), self._expected_images())
+        self.assertEqual(sorted(manifest.groups)[:2], ['', 'frames/K01/V001/'])
+        key, size, etag = manifest.groups['frames/K01/V001/'][0]
+        self.assertEqual((key, size), ("frames/K01/V001/00000000.jpg", 5))
+        self.assertFalse(etag.startswith('"'))
+
+    def test_save_and_load_roundtrip(self):
+        """Test the manifest survives a save/load cycle."""
+        manifest = InventoryManifest.build(self.s3_client)
+        manifest.save(self.manifest_file)
+
+        loaded = InventoryManifest.load(self.manifest_file)
+
+        self.assertEqual(loaded.entries(), manifest.entries())
+        self.assertEqual(loaded.bucket_name, "aic-2025-bucket")
+        self.assertEqual(loaded.prefix, "frames/")
+
+    def test_refresh_lists_only_after_last_key(self):
+        """Test refresh picks up new keys with one StartAfter page per prefix."""
+        manifest = InventoryManifest.build(self.s3_client)
+        self.fake_s3.put("frames/K02/V003/00009999.jpg")
+        self.fake_s3.put("frames/K03/V001/00000001.jpg")
+        self.fake_s3.calls.clear()
+
+        stats = manifest.refresh(self.s3_client)
+
+        self.assertEqual(manifest.image_keys(), self._expected_images())
+        self.assertEqual(stats['new_keys'], 2)
+        self.assertEqual(stats['changed_prefixes'], 2)
+        self.assertEqual(stats['new_prefixes'], 1)
+        # 1 root + 3 batch delimiter listings, then one page per leaf prefix
+        self.assertEqual(self.fake_s3.calls['list_objects_v2'], 1 + 3 + 7)
+
+    def test_refresh_drops_removed_prefixes(self):
+        """Test prefixes that vanished from the bucket are removed."""
+        manifest = InventoryManifest.build(self.s3_client)
+        for key in [k for k in self.fake_s3.sorted_keys if k.startswith("frames/K02/V001/")]:
+            self.fake_s3.delete(key)
+
+        stats = manifest.refresh(self.s3_client)
+
+        self.assertEqual(stats['removed_prefixes'], 1)
+        self.assertNotIn("frames/K02/V001/", manifest.groups)
+        self.assertEqual(manifest.image_keys(), self._expected_images())
+
+    def test_load_or_build(self):
+        """Test the cached manifest is reused without listing."""
+        with patch('logging.info'):
+            InventoryManifest.load_or_build(self.s3_client, self.manifest_file)
+        self.fake_s3.calls.clear()
+
+        with patch('logging.info'):
+            manifest = InventoryManifest.load_or_build(self.s3_client, self.manifest_file)
+
+        self.assertEqual(manifest.image_keys(), self._expected_images())
+        self.assertEqual(self.fake_s3.calls.get('list_objects_v2', 0), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,229 @@
+"""
+Unit tests for s3_pipeline module.
+"""
+
+import unittest
+import asyncio
+import json
+import os
+import threading
+import time
+from unittest.mock import Mock, patch
+
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.s3_client import S3Client
+from src.s3_pipeline import S3CaptionPipeline, AsyncS3CaptionPipeline, is_error_response
+from tests.fake_s3 import FakeS3
+
+
+class TestIsErrorResponse(unittest.TestCase):
+    """Test is_error_response helper."""
+
+    def test_error_detection(self):
+        """Test JSON error payloads and empty captions are errors."""
+        self.assertTrue(is_error_response(""))
+        self.assertTrue(is_error_response(None))
+        self.assertTrue(is_error_response(json.dumps({"error": "boom"})))
+        self.assertFalse(is_error_response(json.dumps({"caption": "ok"})))
+        self.assertFalse(is_error_response("plain caption"))
+
+
+class TestS3CaptionPipeline(unittest.TestCase):
+    """Test S3CaptionPipeline class."""
+
+    pipeline_class = S3CaptionPipeline
+
+    def setUp(self):
+        """Set up test fixtures."""
+        self.keys = [f"frames/K01/V001/{i:08d}.jpg" for i in range(20)]
+        self.file_manager = Mock()
+        self.gemini_client = Mock()
+        self.gemini_client.process_image_bytes.side_effect = self._caption
+        self.raise_for = None
+
+        self.fake_s3 = FakeS3()
+        for key in self.keys:
+            self.fake_s3.put(key, key)
+        with patch('src.s3_client.boto3.client', return_value=self.fake_s3), patch('logging.info'):
+            self.s3_client = S3Client()
+
+    def _caption(self, image_bytes, image_path, max_retries=5, key_rotation_delay=1.0):
+        self.assertEqual(image_bytes, image_path.encode('utf-8'))
+        if image_path == self.raise_for:
+            raise RuntimeError("boom")
+        if image_path.endswith("00000003.jpg"):
+            return json.dumps({"error": "blocked"})
+        return json.dumps({"caption": image_path})
+
+    def _uploaded(self):
+        return {k: v.decode('utf-8') for k, v in self.fake_s3.objects.items() if k.startswith("captions/")}
+
+    def test_run_processes_all_keys(self):
+        """Test every image flows through all three stages."""
+        self.fake_s3.delete(self.keys[5])
+        pipeline = S3CaptionPipeline(self.s3_client, self.gemini_client, self.file_manager,
+                                     'checkpoint.pkl', download_workers=3,
+                                     caption_workers=4, upload_workers=2, queue_size=2)
+        processed_files = set()
+        pbar = Mock()
+
+        stats = pipeline.run(self.keys, processed_files, pbar)
+
+        self.assertEqual(stats['processed'], 18)
+        self.assertEqual(stats['download_failed'], 1)
+        self.assertEqual(stats['caption_failed'], 1)
+        self.assertEqual(stats['upload_failed'], 0)
+        uploaded = self._uploaded()
+        self.assertEqual(len(uploaded), 18)
+        self.assertEqual(uploaded["captions/K01/V001/00000000.txt"],
+                         json.dumps({"caption": self.keys[0]}))
+        self.assertEqual(self.fake_s3.calls['get_object'], 20)
+        self.assertEqual(self.fake_s3.calls['put_object'], 18)
+        self.assertIn("K01/V001/00000000.jpg", processed_files)
+        self.assertNotIn("K01/V001/00000003.jpg", processed_files)
+        self.assertEqual(self.file_manager.record_processed.call_count, 18)
+        self.assertEqual(pbar.update.call_count, 18)
+
+    def test_caption_calls_overlap(self):
+        """Test Gemini calls run concurrently across caption workers."""
+        active = []
+        peak = [0]
+        lock = threading.Lock()
+
+        def slow_caption(image_bytes, image_path, max_retries=5, key_rotation_delay=1.0):
+            with lock:
+                active.append(image_path)
+                peak[0] = max(peak[0], len(active))
+            time.sleep(0.05)
+            with lock:
+                active.remove(image_path)
+            return json.dumps({"caption": "ok"})
+
+        self.gemini_client.process_image_bytes.side_effect = slow_caption
+        pipeline = S3CaptionPipeline(self.s3_client, self.gemini_client, self.file_manager,
+                                     None, caption_workers=5)
+
+        stats = pipeline.run(self.keys)
+
+        self.assertEqual(stats['processed'], 20)
+        self.assertGreater(peak[0], 1)
+        self.file_manager.record_processed.assert_not_called()
+
+    def test_handler_error_fails_image(self):
+        """Test an exception in a stage counts the image as failed and reports it."""
+        self.raise_for = self.keys[7]
+        pipeline = self.pipeline_class(self.s3_client, self.gemini_client, self.file_manager, None)
+        results = []
+        pipeline.set_result_callback(lambda key, ok: results.append((key, ok)))
+
+        with patch('logging.error'):
+            stats = pipeline.run(self.keys)
+
+        self.assertEqual(stats['caption_failed'], 2)
+        self.assertEqual(stats['processed'], 18)
+        self.assertIn((self.keys[7], False), results)
+        self.assertEqual(len(results), 20)
+
+    def test_shutdown_stops_feeding(self):
+        """Test no new images are fed once shutdown is requested."""
+        pipeline = S3CaptionPipeline(self.s3_client, self.gemini_client, self.file_manager, None)
+        pipeline.set_shutdown_check(lambda: True)
+
+        stats = pipeline.run(self.keys)
+
+        self.assertEqual(stats['processed'], 0)
+        self.gemini_client.process_image_bytes.assert_not_called()
+
+
+class TestAsyncS3CaptionPipeline(TestS3CaptionPipeline):
+    """Test AsyncS3CaptionPipeline class."""
+
+    pipeline_class = AsyncS3CaptionPipeline
+
+    def setUp(self):
+        """Set up test fixtures."""
+        super().setUp()
+        self.active = 0
+        self.peak = 0
+        self.gemini_client.process_image_bytes_async = self._caption_async
+
+    async def _caption_async(self, image_bytes, image_path, max_retries=5, key_rotation_delay=1.0):
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        await asyncio.sleep(0.01)
+        self.active -= 1
+        return self._caption(image_bytes, image_path, max_retries, key_rotation_delay)
+
+    def test_run_processes_all_keys(self):
+        """Test every image is downloaded, captioned and uploaded."""
+        self.fake_s3.delete(self.keys[5])
+        pipeline = AsyncS3CaptionPipeline(self.s3_client, self.gemini_client, self.file_manager,
+                                          'checkpoint.pkl', concurrency=6)
+        processed_files = set()
+        pbar = Mock()
+
+        stats = pipeline.run(self.keys, processed_files, pbar)
+
+        self.assertEqual(stats, {'processed': 18, 'download_failed': 1, 'caption_failed': 1, 'upload_failed': 0})
+        self.assertEqual(self._uploaded()["captions/K01/V001/00000000.txt"],
+                         json.dumps({"caption": self.keys[0]}))
+        self.assertIn("K01/V001/00000000.jpg", processed_files)
+        self.assertEqual(self.file_manager.record_processed.call_count, 18)
+        self.assertEqual(pbar.update.call_count, 18)
+        self.assertEqual(self.peak, 6)
+        self.gemini_client.process_image_bytes.assert_not_called()
+
+    def test_caption_calls_overlap(self):
+        """Test Gemini calls overlap on one event loop."""
+        pipeline = AsyncS3CaptionPipeline(self.s3_client, self.gemini_client, self.file_manager,
+                                          None, concurrency=20)
+
+        stats = pipeline.run(self.keys)
+
+        self.assertEqual(stats['processed'], 19)
+        self.assertGreater(self.peak, 1)
+        self.file_manager.record_processed.assert_not_called()
+
+    def test_blocking_result_callback_does_not_stall_loop(self):
+        """Test images keep flowing while the result callback blocks, as a busy lease queue does."""
+        last_captioned = threading.Event()
+        caption = self._caption_async
+
+        async def caption_and_signal(image_bytes, image_path, *args):
+            result = await caption(image_bytes, image_path, *args)
+            if image_path == self.keys[-1]:
+                last_captioned.set()
+            return result
+
+        def on_result(img_key, ok):
+            if img_key == self.keys[0]:
+                waited.append(last_captioned.wait(5))
+
+        waited = []
+        self.gemini_client.process_image_bytes_async = caption_and_signal
+        pipeline = AsyncS3CaptionPipeline(self.s3_client, self.gemini_client, self.file_manager, None,
+                                          concurrency=4)
+        pipeline.set_result_callback(on_result)
+
+        with patch('logging.error'):
+            stats = pipeline.run(self.keys)
+
+        self.assertEqual(waited, [True])
+        self.assertEqual(stats['processed'], 19)
+
+    def test_shutdown_stops_feeding(self):
+        """Test no new images are started once shutdown is requested."""
+        pipeline = AsyncS3CaptionPipeline(self.s3_client, self.gemini_client, self.file_manager, None)
+        pipeline.set_shutdown_check(lambda: True)
+
+        with patch('logging.info'):
+            stats = pipeline.run(self.keys)
+
+        self.assertEqual(stats['processed'], 0)
+        self.assertEqual(self.peak, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+"""
+Unit tests for sharding module.
+"""
+
+import unittest
+import os
+import argparse
+from collections import Counter
+
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.sharding import key_hash, jump_consistent_hash, shard_of, select_shard, shard_spec
+
+
+class TestSharding(unittest.TestCase):
+    """Test hash sharding helpers."""
+
+    def setUp(self):
+        """Set up test fixtures."""
+        self.keys = [f"frames/K{k:02d}/V{v:03d}/{f:08d}.jpg"
+                     for k in range(4) for v in range(250) for f in range(10)]
+
+    def test_hash_is_stable(self):
+        """Test hashes do not depend on the process (unlike hash())."""
+        # Changing either function reshuffles every worker's shard
+        self.assertEqual(key_hash("frames/K01/V001/00000001.jpg"), 0x2ba0f4a1accacb9a)
+        self.assertEqual([jump_consistent_hash(key, 10) for key in (1, 2 ** 32, 2 ** 63 + 7)], [6, 2, 4])
+
+    def test_shards_partition_keys_evenly(self):
+        """Test every key lands in exactly one shard and shards are balanced."""
+        shards = [list(select_shard(self.keys, (i, 4))) for i in range(1, 5)]
+
+        self.assertEqual(sorted(key for shard in shards for key in shard), sorted(self.keys))
+        for shard in shards:
+            self.assertAlmostEqual(len(shard), len(self.keys) / 4, delta=len(self.keys) * 0.03)
+
+    def test_videos_stay_together(self):
+        """Test all frames of a video land in the same shard."""
+        for video in ("frames/K00/V000", "frames/K03/V249"):
+            shards = {shard_of(key, 4) for key in self.keys if key.startswith(video + "/")}
+            self.assertEqual(len(shards), 1)
+
+    def test_adding_a_shard_moves_minimum_keys(self):
+        """Test growing from 4 to 5 shards only moves keys into the new shard."""
+        before = {key: shard_of(key, 4) for key in self.keys}
+        after = {key: shard_of(key, 5) for key in self.keys}
+
+        moved = Counter(after[key] for key in self.keys if before[key] != after[key])
+
+        self.assertEqual(set(moved), {5})
+        self.assertAlmostEqual(moved[5], len(self.keys) / 5, delta=len(self.keys) * 0.03)
+
+    def test_shard_spec(self):
+        """Test shard specs are parsed and validated."""
+        self.assertEqual(shard_spec("2/4"), (2, 4))
+        for spec in ("0/4", "5/4", "2", "a/b", "1/0"):
+            with self.assertRaises(argparse.ArgumentTypeError):
+                shard_spec(spec)
+
+
+if __name__ == '__main__':
+    unittest.main()
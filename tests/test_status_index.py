@@ -0,0 +1,117 @@
+"""
+Unit tests for status_index module.
+"""
+
+import unittest
+import os
+import shutil
+import tempfile
+from unittest.mock import Mock, patch
+
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.status_index import StatusIndex, STATUS_OK, STATUS_ERROR, STATUS_TERMINAL, UNREADABLE
+from src.results import CaptionResult, SAFETY_BLOCKED, LEGACY_ERROR
+from src.file_manager import FileManager
+from src.image_processor import ImageProcessor
+
+
+class TestStatusIndex(unittest.TestCase):
+    """Test StatusIndex class."""
+
+    def setUp(self):
+        """Set up test fixtures."""
+        self.temp_dir = tempfile.mkdtemp()
+        self.output_dir = os.path.join(self.temp_dir, "output")
+
+    def tearDown(self):
+        """Clean up test fixtures."""
+        StatusIndex.release(self.output_dir)
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def _write(self, relative_path, content):
+        path = os.path.join(self.output_dir, relative_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        return path
+
+    def test_record_and_query(self):
+        """Test recorded statuses are queried without reading caption files."""
+        index = StatusIndex.for_output_dir(self.output_dir)
+        self.assertTrue(index.is_complete())
+
+        good = os.path.join(self.output_dir, "v1", "good.txt")
+        bad = os.path.join(self.output_dir, "v1", "bad.txt")
+        index.record(good, "A caption")
+        index.record(bad, "Error processing image")
+        self.assertEqual(index.error_paths(), [bad])
+
+        index.record(bad, "A fixed caption")
+        self.assertEqual(index.error_paths(), [])
+        self.assertEqual(index.counts(), {STATUS_OK: 2})
+
+    def test_terminal_errors_not_retried(self):
+        """Test terminal errors are indexed separately from retryable ones."""
+        index = StatusIndex.for_output_dir(self.output_dir)
+        index.record(os.path.join(self.output_dir, "a.txt"), CaptionResult.failure(SAFETY_BLOCKED, "blocked"))
+
+        self.assertEqual(index.error_paths(), [])
+        self.assertEqual(index.counts(), {STATUS_TERMINAL: 1})
+
+    def test_existing_tree_needs_rebuild(self):
+        """Test an index created over existing captions is incomplete until rebuilt."""
+        self._write("good.txt", "A caption")
+        bad = self._write(os.path.join("v1", "bad.txt"), "500 An internal error has occurred")
+
+        index = StatusIndex.for_output_dir(self.output_dir)
+        self.assertFalse(index.is_complete())
+
+        self.assertEqual(index.rebuild(), 2)
+        self.assertTrue(index.is_complete())
+        self.assertEqual(index.error_paths(), [bad])
+
+        row = index.conn.execute("SELECT error_class, size FROM captions WHERE status = ?",
+                                 (STATUS_ERROR,)).fetchone()
+        self.assertEqual(row, (LEGACY_ERROR, 34))
+
+    def test_rebuild_marks_unreadable_files(self):
+        """Test unreadable captions are indexed as errors."""
+        path = self._write("a.txt", "A caption")
+        index = StatusIndex.for_output_dir(self.output_dir)
+
+        with patch('builtins.open', side_effect=PermissionError("denied")), patch('logging.warning'):
+            index.rebuild()
+
+        self.assertEqual(index.error_paths(), [path])
+        self.assertEqual(index.conn.execute("SELECT error_class FROM captions").fetchone(), (UNREADABLE,))
+
+    def test_file_manager_queries_index(self):
+        """Test error scans come from the index once it is complete."""
+        file_manager = FileManager(os.path.join(self.temp_dir, "input"), self.output_dir)
+        bad = self._write("bad.txt", "Error processing")
+
+        with patch('logging.info'):
+            self.assertEqual(file_manager.scan_for_error_files(), [bad])
+
+            file_manager.status_index.record(bad, "A caption")
+            with patch('builtins.open', side_effect=AssertionError("caption re-read")):
+                self.assertEqual(file_manager.scan_for_error_files(), [])
+
+    def test_process_and_save_records_status(self):
+        """Test every caption write records its status."""
+        index = StatusIndex.for_output_dir(self.output_dir)
+        gemini_client = Mock(current_key_index=0)
+        gemini_client.process_image_with_gemini.return_value = "Error processing image"
+        processor = ImageProcessor(gemini_client, status_index=index)
+        output_path = os.path.join(self.output_dir, "a.txt")
+
+        with patch('logging.info'):
+            processor.process_and_save("a.jpg", output_path, None, None, Mock())
+
+        self.assertEqual(index.error_paths(), [output_path])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,259 @@
+"""
+Unit tests for work_queue module.
+"""
+
+import unittest
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+from unittest.mock import Mock, patch
+
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.work_queue import LeaseQueue, run_leased, PENDING, LEASED, STARTED, DONE, FAILED
+from src.s3_client import S3Client
+from src.s3_pipeline import S3CaptionPipeline
+from tests.fake_s3 import FakeS3
+
+
+class _Captioner:
+    """Gemini client stand-in that captions every image after a fixed delay."""
+
+    def __init__(self, delay=0.0, fail_keys=()):
+        self.delay = delay
+        self.fail_keys = set(fail_keys)
+
+    def process_image_bytes(self, image_bytes, image_path, max_retries=5, key_rotation_delay=1.0):
+        time.sleep(self.delay)
+        if image_path in self.fail_keys:
+            return json.dumps({"error": "blocked"})
+        return json.dumps({"caption": image_path})
+
+
+def _make_pipeline(keys, captioner):
+    fake_s3 = FakeS3()
+    for key in keys:
+        fake_s3.put(key, key)
+    with patch('src.s3_client.boto3.client', return_value=fake_s3), patch('logging.info'):
+        s3_client = S3Client()
+    pipeline = S3CaptionPipeline(s3_client, captioner, Mock(), None, download_workers=2,
+                                 caption_workers=2, upload_workers=1, queue_size=2)
+    return pipeline, fake_s3
+
+
+def _queue_worker(queue_path, worker_id, keys, delay, results):
+    """Worker process: caption leased keys into its own fake bucket and report the uploads."""
+    logging.disable(logging.CRITICAL)
+    work_queue = LeaseQueue(queue_path, lease_seconds=2.0, batch_size=4, poll_seconds=0.05)
+    pipeline, fake_s3 = _make_pipeline(keys, _Captioner(delay))
+    stats = run_leased(pipeline, work_queue, worker_id)
+    uploaded = sorted(key for key in fake_s3.objects if key.startswith("captions/"))
+    results.put((worker_id, uploaded, stats['processed']))
+
+
+def _crashing_worker(queue_path, worker_id):
+    """Worker process that leases a batch and dies without finishing it."""
+    work_queue = LeaseQueue(queue_path, lease_seconds=2.0, batch_size=4)
+    for key in work_queue.lease(worker_id)[:2]:
+        work_queue.start(worker_id, key)
+    os._exit(1)
+
+
+class TestLeaseQueue(unittest.TestCase):
+    """Test LeaseQueue class."""
+
+    def setUp(self):
+        """Set up test fixtures."""
+        self.temp_dir = tempfile.mkdtemp()
+        self.now = 1000.0
+        self.queue = LeaseQueue(os.path.join(self.temp_dir, "queue.sqlite"), lease_seconds=60,
+                                batch_size=3, max_attempts=2, poll_seconds=0, clock=lambda: self.now)
+        self.keys = [f"frames/K01/V001/{i:08d}.jpg" for i in range(10)]
+        self.assertEqual(self.queue.seed(self.keys), 10)
+
+    def tearDown(self):
+        """Clean up test fixtures."""
+        self.queue.close()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def _state(self, key):
+        return self.queue.conn.execute("SELECT state, owner, attempts FROM items WHERE key = ?", (key,)).fetchone()
+
+    def test_seed_is_idempotent(self):
+        """Test re-seeding only adds keys that are not queued yet."""
+        self.assertEqual(self.queue.seed(self.keys + ["frames/new.jpg"]), 1)
+        self.assertEqual(len(self.queue), 11)
+
+    def test_lease_in_order_until_done(self):
+        """Test batches come out in queue order and completed keys are not handed out again."""
+        self.assertEqual(self.queue.lease("a"), self.keys[:3])
+        self.assertEqual(self.queue.lease("b"), self.keys[3:6])
+        for key in self.keys[:3]:
+            self.queue.complete(key)
+
+        self.assertEqual(self.queue.stats(), {DONE: 3, LEASED: 3, PENDING: 4})
+
+    def test_expired_leases_reclaimed(self):
+        """Test keys held by a worker that stopped renewing go to the next worker."""
+        batch = self.queue.lease("crashed")
+        self.queue.start("crashed", batch[0])
+        self.queue.renew("alive")
+
+        self.now += 61
+        with patch('logging.warning'):
+            self.assertEqual(self.queue.lease("alive"), batch)
+        self.assertEqual(self._state(batch[0]), (LEASED, "alive", 1))
+        self.assertFalse(self.queue.start("crashed", batch[1]))
+
+    def test_renew_keeps_lease(self):
+        """Test a heartbeat stops a worker's leases from expiring."""
+        batch = self.queue.lease("a")
+        self.now += 50
+        self.assertEqual(self.queue.renew("a"), 3)
+        self.now += 50
+
+        self.assertNotIn(batch[0], self.queue.lease("b"))
+
+    def test_idle_worker_steals_tail(self):
+        """Test a worker with nothing left takes the unstarted tail of the largest backlog."""
+        queue = LeaseQueue(os.path.join(self.temp_dir, "steal.sqlite"), batch_size=8)
+        queue.seed(self.keys[:8])
+        batch = queue.lease("slow")
+        queue.start("slow", batch[0])
+
+        with patch('logging.info'):
+            stolen = queue.lease("fast")
+
+        self.assertEqual(stolen, batch[5:])
+        self.assertFalse(queue.start("slow", batch[7]))
+        self.assertTrue(queue.start("slow", batch[4]))
+        with patch('logging.info'):
+            self.assertEqual(queue.lease("fast"), batch[3:4])
+            self.assertEqual(queue.lease("fast"), [batch[2]])
+            self.assertEqual(queue.lease("fast"), [])
+        queue.close()
+
+    def test_failures_retried_then_given_up(self):
+        """Test a failed key returns to the queue until it runs out of attempts."""
+        key = self.queue.lease("a")[0]
+        self.queue.fail("a", key)
+        self.assertEqual(self._state(key), (PENDING, None, 1))
+
+        self.assertEqual(self.queue.lease("b")[0], key)
+        self.queue.fail("b", key)
+        self.assertEqual(self._state(key), (FAILED, None, 2))
+
+    def test_release_returns_unfinished_keys(self):
+        """Test releasing requeues unstarted keys and counts started ones as attempts."""
+        batch = self.queue.lease("a")
+        self.queue.start("a", batch[0])
+
+        self.assertEqual(self.queue.release("a"), 3)
+        self.assertEqual(self._state(batch[0]), (PENDING, None, 1))
+        self.assertEqual(self._state(batch[1]), (PENDING, None, 0))
+
+    def test_iter_keys_waits_for_other_workers(self):
+        """Test a worker with nothing to lease keeps polling while others hold keys."""
+        held = []
+        while True:
+            batch = self.queue.lease("other")
+            if not batch:
+                break
+            held += batch
+        for key in held:
+            self.queue.start("other", key)
+        sleeps = []
+
+        def finish_other(seconds):
+            sleeps.append(seconds)
+            self.queue.fail("other", held[0])
+
+        with patch('src.work_queue.time.sleep', side_effect=finish_other), patch('logging.info'):
+            keys = list(self.queue.iter_keys("me", shutdown_check=lambda: len(sleeps) > 1))
+
+        self.assertIn(held[0], keys)
+
+
+class TestRunLeased(unittest.TestCase):
+    """Test running S3 pipelines against a LeaseQueue."""
+
+    def setUp(self):
+        """Set up test fixtures."""
+        self.temp_dir = tempfile.mkdtemp()
+        self.queue_path = os.path.join(self.temp_dir, "queue.sqlite")
+        self.keys = [f"frames/K01/V001/{i:08d}.jpg" for i in range(24)]
+
+    def tearDown(self):
+        """Clean up test fixtures."""
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_pipeline_results_update_queue(self):
+        """Test captioned keys are completed and failed keys retried until given up."""
+        work_queue = LeaseQueue(self.queue_path, batch_size=5, max_attempts=2, poll_seconds=0)
+        work_queue.seed(self.keys)
+        pipeline, fake_s3 = _make_pipeline(self.keys, _Captioner(fail_keys=[self.keys[3]]))
+
+        with patch('logging.info'), patch('logging.error'):
+            stats = run_leased(pipeline, work_queue, "w1", processed_files=set())
+
+        self.assertEqual(stats['processed'], 23)
+        self.assertEqual(stats['caption_failed'], 2)
+        self.assertEqual(work_queue.stats(), {DONE: 23, FAILED: 1})
+        work_queue.close()
+
+    def test_shutdown_returns_leases(self):
+        """Test keys leased but not started are back in the queue after shutdown."""
+        work_queue = LeaseQueue(self.queue_path, batch_size=10, poll_seconds=0)
+        work_queue.seed(self.keys)
+        pipeline, _ = _make_pipeline(self.keys, _Captioner())
+        pipeline.set_shutdown_check(lambda: pipeline.stats['processed'] >= 3)
+
+        with patch('logging.info'):
+            run_leased(pipeline, work_queue, "w1")
+
+        stats = work_queue.stats()
+        self.assertNotIn(LEASED, stats)
+        self.assertNotIn(STARTED, stats)
+        self.assertEqual(stats[DONE] + stats[PENDING], 24)
+        work_queue.close()
+
+    def test_worker_processes_share_queue(self):
+        """Test worker processes drain one queue, including keys a crashed worker held."""
+        work_queue = LeaseQueue(self.queue_path)
+        work_queue.seed(self.keys)
+        context = multiprocessing.get_context('spawn')
+
+        crashed = context.Process(target=_crashing_worker, args=(self.queue_path, "crashed"))
+        crashed.start()
+        crashed.join(60)
+        self.assertEqual(work_queue.stats()[LEASED] + work_queue.stats()[STARTED], 4)
+        # Let the crashed worker's 2s lease expire first, or an idle worker steals its unstarted keys without
+        # counting an attempt
+        time.sleep(2.1)
+
+        results = context.Queue()
+        workers = [context.Process(target=_queue_worker, args=(self.queue_path, f"w{i}", self.keys, delay, results))
+                   for i, delay in enumerate([0.001, 0.001, 0.02])]
+        for worker in workers:
+            worker.start()
+        reports = [results.get(timeout=120) for _ in workers]
+        for worker in workers:
+            worker.join(60)
+
+        uploaded = [key for _, keys, _ in reports for key in keys]
+        self.assertEqual(sorted(set(uploaded)), sorted(f"captions/K01/V001/{i:08d}.txt" for i in range(24)))
+        self.assertEqual(len(uploaded), 24)
+        self.assertEqual(sum(processed for _, _, processed in reports), 24)
+        self.assertEqual(work_queue.stats(), {DONE: 24})
+        reclaimed = work_queue.conn.execute("SELECT COUNT(*) FROM items WHERE attempts = 1").fetchone()[0]
+        self.assertEqual(reclaimed, 4)
+        work_queue.close()
+
+
+if __name__ == '__main__':
+    unittest.main()